@@ -6,6 +6,13 @@ WINDOW_WIDTH = 1400
 WINDOW_HEIGHT = 900
 UPDATE_INTERVAL = 250  # milliseconds
 
+# Sample rate is negotiated per session: the GUI sends "SET_RATE <hz>" and
+# the firmware answers with a "RATE:<hz>,<interval_us>" header. Settings
+# below that count samples are tuned at SAMPLE_RATE and rescaled for others
+SAMPLE_RATE = 1000.0 / UPDATE_INTERVAL  # Hz (firmware default)
+SAMPLE_RATES = [4, 10, 20, 50, 100]     # offered in the GUI; firmware accepts 1-100
+INGEST_INTERVAL = 50  # ms; the network thread hands samples to the GUI in batches
+
 # Sensor configuration
 NUM_SENSORS = 7
 SENSOR_NAMES = [
@@ -18,6 +25,25 @@ SENSOR_NAMES = [
     "MiCS VOC"
 ]
 
+# JSON keys sent by the backend, in SENSOR_NAMES order
+SENSOR_KEYS = ["no2", "eth", "voc", "co", "co_mics", "eth_mics", "voc_mics"]
+
+# Arduino FSM states
+STATE_NAMES = {
+    0: "IDLE",
+    1: "PRE-COND",
+    2: "RAMP_UP",
+    3: "HOLD", 
+    4: "PURGE",
+    5: "RECOVERY",
+    6: "DONE"
+}
+STATE_PRE_COND = 1
+STATE_HOLD = 3
+STATE_DONE = 6
+# Fan levels the FSM steps through (level codes 0..NUM_LEVELS-1)
+NUM_LEVELS = 5
+
 # Sample types
 SAMPLE_TYPES = [
     "jahe",
@@ -39,4 +65,106 @@ PLOT_COLORS = [
 
 # Data settings
 MAX_PLOT_POINTS = 1000
+SAMPLE_RING_CAPACITY = 16384  # shared-memory ring slots (~68 min at 250 ms)
+# Live sessions keep this many bytes of the newest rows in RAM; older
+# chunks are compressed into a temporary file (None: system temp dir)
+SESSION_RAM_BUDGET = 16 * 1024 * 1024
+SESSION_SPILL_CHUNK = 4096     # rows per compressed chunk
+SESSION_SPILL_DIR = None
+# The live plot keeps at most this many points; past that it drops every
+# other point and keeps one in two (then four, ...) of the new ones
+PLOT_BUFFER_POINTS = 20000
+
+# Session CSVs get a .seek.npz sidecar with the byte offset of every Nth row
+CSV_SEEK_ROWS = 256
+
+# Session export: one read of the session feeds every selected format
+EXPORT_FORMATS = ["csv", "archive"]                          # "Save Data"
+EXPORT_ALL_FORMATS = ["csv", "archive", "json", "dataset"]   # "Export All Formats"
+EXPORT_BLOCK_ROWS = 4096    # rows per read (one session spill chunk)
+EXPORT_QUEUE_BLOCKS = 4     # blocks buffered per format writer
+EXPORT_WINDOW_LENGTH = 64   # ML dataset windows (samples), as WindowDataset
+EXPORT_WINDOW_STRIDE = 16
+
+# Analysis pool settings
+ANALYSIS_INTERVAL = 2000  # milliseconds between background analysis runs
+ANALYSIS_WORKERS = 2
+
+# Spectral analysis (sample rate follows UPDATE_INTERVAL: 4 Hz, Nyquist 2 Hz)
+SPECTRAL_WINDOW = 64    # samples per FFT frame (16 s)
+SPECTRAL_HOP = 8        # samples between frames (2 s)
+SPECTRAL_HISTORY = 300  # spectrogram columns kept for display
+SPECTRAL_BANDS = [      # (low Hz, high Hz)
+    (0.0, 0.05),        # drift / phase changes
+    (0.05, 0.25),       # fan ramp and pump cycling
+    (0.25, 2.0),        # fast fluctuations and noise
+]
+
+# Data quality monitor
+QUALITY_BLOCK = 8  # samples per vectorized check
+# Identical consecutive readings before a channel counts as stuck. The MQ
+# channels are quantized to 0.01 and legitimately sit still for many
+# minutes, so only the MiCS channels are checked (0 disables).
+QUALITY_FLATLINE_SAMPLES = [0, 0, 0, 0, 240, 240, 240]
+# Readings outside (low, high] are flagged; the firmware itself reports
+# Grove values up to 30 and MiCS ppm up to 5000 (beyond that it sends -1)
+QUALITY_VALID_RANGE = [(0.0, 30.0)] * 4 + [(0.0, 5000.0)] * 3
+QUALITY_SPIKE_FACTOR = 12.0       # jump vs. mean absolute step over the warm-up
+QUALITY_SPIKE_WARMUP = 120        # clean steps (at the default rate) before spikes are flagged
+QUALITY_SPIKE_MIN_JUMP = 0.1
+QUALITY_GAP_FACTOR = 3.0          # sample interval vs. nominal
+
+# Session similarity search
+SIMILARITY_CURVE_POINTS = 32   # resampled points per level curve
+SIMILARITY_BAND = 4            # DTW warping band (curve points)
+SIMILARITY_TOP_K = 5
+SIMILARITY_CANDIDATES = 64     # feature-distance shortlist refined with DTW
+SIMILARITY_CACHE = "similarity_cache.npz"
+
+# Calibration (profiles are <rig>.json in CALIBRATION_PATH)
+CALIBRATION_PATH = "calibration/"
+CALIBRATION_PROFILE = "default"
+CALIBRATION_TABLE_SIZE = 4096  # lookup-table entries per channel
+CALIBRATION_BLOCK = 8          # samples converted per vectorized call
+
+# Alarm rules (see utils/alarms.py); a JSON list in ALARM_RULES_PATH replaces the defaults
+ALARM_RULES_PATH = "alarms.json"
+ALARM_RULES = [
+    {"name": "CO high in HOLD", "kind": "threshold", "channel": "CO Sensor",
+     "op": ">", "value": 20.0, "for": 5.0, "phases": "HOLD"},
+    {"name": "MiCS VOC rising fast", "kind": "slope", "channel": "MiCS VOC",
+     "op": ">", "value": 100.0, "window": 2.0},
+    {"name": "MiCS CO/Ethanol ratio", "kind": "ratio", "channel": "MiCS CO", "over": "MiCS Ethanol",
+     "op": ">", "value": 5.0, "for": 10.0, "phases": "HOLD"},
+]
+ALARM_SLOPE_WINDOW = 2.0   # seconds, for slope rules without a window
+ALARM_BLOCK = 4            # samples per evaluation (one per second at 4 Hz)
+
+# Adaptive HOLD: ask the firmware to end HOLD once every channel is steady
+HOLD_EARLY_EXIT = False   # default for the GUI checkbox / headless flag
+STEADY_WINDOW = 32        # samples in the rolling slope/spread window (8 s)
+STEADY_SLOPE_TOL = 0.05   # drift over one window, fraction of the response
+STEADY_STD_TOL = 0.05     # spread over one window, fraction of the response
+# Response floors: ~2 quantization steps (MQ 0.01, MiCS ~0.05 ppm)
+STEADY_ABS_TOL = [0.02] * 4 + [0.1] * 3
+STEADY_MIN_HOLD = 10.0    # seconds of HOLD before an early exit is allowed
+STEADY_BLOCK = 4          # samples per check (one check per second)
+STEADY_CONFIRM = 4        # consecutive steady checks required
+
+# Command channel: each command waits this long for the Arduino's ack
+# before it is re-sent with the same id (the firmware runs it once)
+COMMAND_TIMEOUT = 2.0   # seconds
+COMMAND_RETRIES = 2
+
+# Profiling (Tools menu, --profile / --trace-malloc); one directory per session
+PROFILE_PATH = "profiles/"
+PROFILE_INTERVAL = 0.005   # seconds between stack samples
+PROFILE_TOP = 40           # rows in the text summaries
+TRACEMALLOC_FRAMES = 16    # stack depth kept per allocation
+
+# Batch session reports (report.py): one page per session, rendered offscreen
+REPORT_PATH = "reports/"
+REPORT_SIZE = (1600, 1130)   # page in pixels (A4 landscape proportions)
+REPORT_DPI = 150             # PNG metadata / PDF resolution
+REPORT_FORMATS = ["png"]     # any of png, svg, pdf
 DATA_SAVE_PATH = "data/"
\ No newline at end of file
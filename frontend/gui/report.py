@@ -0,0 +1,312 @@
+"""Session report pages drawn with QPainter, without a display
+
+One painting routine serves every output: a QImage for PNG, QSvgGenerator
+for SVG and QPdfWriter for PDF all receive the same drawing commands in
+page coordinates (REPORT_SIZE), so the three formats are identical. The
+page shows the 7 channels in two panels (Grove MQ-style channels and the
+MiCS channels have very different ranges) over the FSM phases, followed
+by per-level HOLD tables.
+
+Runs on Qt's ``offscreen`` platform; ``render_session`` is the entry point
+for worker processes.
+"""
+
+import os
+import numpy as np
+from datetime import datetime
+from typing import List, Sequence
+
+from PySide6.QtCore import Qt, QRectF, QPointF, QSize, QSizeF, QRect, QMarginsF
+from PySide6.QtGui import (
+    QGuiApplication, QImage, QPainter, QPen, QColor, QFont, QPolygonF, QPdfWriter, QPageSize
+)
+from PySide6.QtSvg import QSvgGenerator
+
+from gui.styles import PHASE_COLORS
+from utils.report import summarize_session, nice_ticks
+from config.constants import PLOT_COLORS, STATE_NAMES, STATE_HOLD, REPORT_SIZE, REPORT_DPI, APP_NAME
+
+REPORT_EXTENSIONS = {'png': ".png", 'svg': ".svg", 'pdf': ".pdf"}
+# (title, axis label, channel indices)
+REPORT_PANELS = [
+    ("Grove Multichannel Gas", "Sensor Reading", [0, 1, 2, 3]),
+    ("MiCS-5524", "Concentration (ppm)", [4, 5, 6]),
+]
+TEXT_COLOR = QColor('#212529')
+MUTED_COLOR = QColor('#6c757d')
+GRID_COLOR = QColor(0, 0, 0, 28)
+
+_app = None
+
+
+def ensure_app():
+    """A QGuiApplication on the offscreen platform (fonts and painting need one)"""
+    global _app
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    _app = QGuiApplication.instance() or QGuiApplication([])
+    return _app
+
+
+def _font(pixels: int, bold: bool = False) -> QFont:
+    font = QFont("Sans Serif")
+    font.setPixelSize(pixels)
+    font.setBold(bold)
+    return font
+
+
+def _pen(color, width: float = 1.0) -> QPen:
+    pen = QPen(QColor(color))
+    pen.setWidthF(width)
+    return pen
+
+
+def _format(value: float, signed: bool = True) -> str:
+    if not np.isfinite(value):
+        return "-"
+    return f"{value:+.3f}" if signed else f"{value:.1f}"
+
+
+class ReportPage:
+    """Lay out and paint one session summary (see utils.report.summarize_session)"""
+
+    MARGIN = 40
+
+    def __init__(self, summary: dict, size=REPORT_SIZE):
+        self.summary = summary
+        self.width, self.height = size
+
+    def paint(self, painter: QPainter):
+        painter.setWindow(QRect(0, 0, self.width, self.height))
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.fillRect(QRectF(0, 0, self.width, self.height), Qt.white)
+
+        left, right = self.MARGIN, self.width - self.MARGIN
+        y = self._header(painter, left, right, self.MARGIN)
+        y = self._legend(painter, left, right, y + 8)
+
+        tables_height = 2 * (28 + 7 * 24) + 16
+        panels_bottom = self.height - self.MARGIN - tables_height - 24
+        panel_height = (panels_bottom - y) / len(REPORT_PANELS)
+        for i, (title, label, channels) in enumerate(REPORT_PANELS):
+            self._panel(painter, QRectF(left, y + i * panel_height, right - left, panel_height),
+                        title, label, channels, last=(i == len(REPORT_PANELS) - 1))
+
+        y = panels_bottom + 24
+        s = self.summary
+        y = self._table(painter, left, right, y, "Mean HOLD response above baseline",
+                        s['mean_response'])
+        self._table(painter, left, right, y + 16, "Peak HOLD response above baseline",
+                    s['peak_response'])
+
+        painter.setFont(_font(12))
+        painter.setPen(MUTED_COLOR)
+        painter.drawText(QRectF(left, self.height - self.MARGIN + 8, right - left, 20),
+                         Qt.AlignRight | Qt.AlignVCenter,
+                         f"{APP_NAME} | generated {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+
+    # ---- page parts ----
+
+    def _header(self, painter: QPainter, left: float, right: float, y: float) -> float:
+        s = self.summary
+        painter.setPen(TEXT_COLOR)
+        painter.setFont(_font(30, bold=True))
+        painter.drawText(QRectF(left, y, right - left, 40), Qt.AlignLeft | Qt.AlignVCenter,
+                         f"{s['name']}  ·  {s['type']}")
+        meta = s['metadata']
+        details = [os.path.basename(s['file']), f"{s['num_points']} points",
+                   f"{s['duration']:.1f} s"]
+        if meta.get('sample_rate_hz'):
+            details.append(f"{float(meta['sample_rate_hz']):g} Hz")
+        if meta.get('export_date'):
+            details.append(f"exported {str(meta['export_date'])[:19]}")
+        if meta.get('calibration'):
+            details.append(f"calibration {meta['calibration']}")
+        if s['invalid_fraction'] > 0:
+            details.append(f"{s['invalid_fraction'] * 100:.1f}% invalid readings")
+        painter.setFont(_font(15))
+        painter.setPen(MUTED_COLOR)
+        painter.drawText(QRectF(left, y + 42, right - left, 24), Qt.AlignLeft | Qt.AlignVCenter,
+                         "   |   ".join(details))
+        return y + 70
+
+    def _legend(self, painter: QPainter, left: float, right: float, y: float) -> float:
+        painter.setFont(_font(14))
+        x = left
+        for i, name in enumerate(self.summary['sensor_names']):
+            painter.setPen(_pen(QColor(PLOT_COLORS[i % len(PLOT_COLORS)]), 3))
+            painter.drawLine(QPointF(x, y + 10), QPointF(x + 24, y + 10))
+            painter.setPen(TEXT_COLOR)
+            width = painter.fontMetrics().horizontalAdvance(name)
+            painter.drawText(QRectF(x + 30, y, width + 4, 20), Qt.AlignLeft | Qt.AlignVCenter, name)
+            x += 30 + width + 22
+        x = left
+        y += 26
+        for state in sorted({int(seg[0]) for seg in self.summary['segments']}):
+            name = STATE_NAMES.get(state, str(state))
+            painter.fillRect(QRectF(x, y + 3, 24, 14), QColor(*PHASE_COLORS.get(state, (255, 255, 255))))
+            painter.setPen(TEXT_COLOR)
+            width = painter.fontMetrics().horizontalAdvance(name)
+            painter.drawText(QRectF(x + 30, y, width + 4, 20), Qt.AlignLeft | Qt.AlignVCenter, name)
+            x += 30 + width + 22
+        return y + 30
+
+    def _panel(self, painter: QPainter, rect: QRectF, title: str, label: str,
+               channels: Sequence[int], last: bool):
+        s = self.summary
+        plot = rect.adjusted(84, 30, -8, -(40 if last else 18))
+        times = s['times']
+        channels = [c for c in channels if c < s['values'].shape[1]]
+        values = s['values'][:, channels]
+
+        t0, t1 = (float(times[0]), float(times[-1])) if len(times) else (0.0, 1.0)
+        if t1 <= t0:
+            t1 = t0 + 1.0
+        finite = values[np.isfinite(values)]
+        low, high = (float(finite.min()), float(finite.max())) if finite.size else (0.0, 1.0)
+        y_ticks = nice_ticks(low, high)
+        y0, y1 = float(y_ticks[0]), float(y_ticks[-1])
+        if y1 <= y0:
+            y1 = y0 + 1.0
+
+        def to_x(t):
+            return plot.left() + (np.asarray(t) - t0) / (t1 - t0) * plot.width()
+
+        def to_y(v):
+            return plot.bottom() - (np.asarray(v) - y0) / (y1 - y0) * plot.height()
+
+        # Phase shading, with the fan level on each HOLD
+        painter.setFont(_font(12, bold=True))
+        for (state, level, _, _), (start, end) in zip(s['segments'], s['segment_times']):
+            x0, x1 = float(to_x(start)), float(to_x(end))
+            painter.fillRect(QRectF(x0, plot.top(), max(x1 - x0, 0.5), plot.height()),
+                             QColor(*PHASE_COLORS.get(int(state), (255, 255, 255))))
+            if state == STATE_HOLD and x1 - x0 > 24:
+                painter.setPen(MUTED_COLOR)
+                painter.drawText(QRectF(x0, plot.top() + 2, x1 - x0, 16), Qt.AlignCenter,
+                                 f"L{int(level) + 1}")
+
+        # Grid and tick labels
+        painter.setFont(_font(13))
+        for tick in y_ticks:
+            y = float(to_y(tick))
+            painter.setPen(_pen(GRID_COLOR, 1))
+            painter.drawLine(QPointF(plot.left(), y), QPointF(plot.right(), y))
+            painter.setPen(TEXT_COLOR)
+            painter.drawText(QRectF(rect.left() + 20, y - 10, 58, 20), Qt.AlignRight | Qt.AlignVCenter,
+                             f"{tick:g}")
+        for tick in nice_ticks(t0, t1, 10):
+            if not t0 <= tick <= t1:
+                continue
+            x = float(to_x(tick))
+            painter.setPen(_pen(GRID_COLOR, 1))
+            painter.drawLine(QPointF(x, plot.top()), QPointF(x, plot.bottom()))
+            if last:
+                painter.setPen(TEXT_COLOR)
+                painter.drawText(QRectF(x - 40, plot.bottom() + 4, 80, 18), Qt.AlignCenter, f"{tick:g}")
+
+        # Channel lines, broken where readings are missing
+        painter.save()
+        painter.setClipRect(plot)
+        xs = to_x(times)
+        for column, channel in enumerate(channels):
+            painter.setPen(_pen(QColor(PLOT_COLORS[channel % len(PLOT_COLORS)]), 1.6))
+            ys = to_y(values[:, column])
+            valid = np.isfinite(ys)
+            edges = np.flatnonzero(np.diff(np.concatenate(([False], valid, [False])).astype(np.int8)))
+            for start, end in zip(edges[0::2], edges[1::2]):
+                if end - start > 1:
+                    painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in
+                                                    zip(xs[start:end].tolist(), ys[start:end].tolist())]))
+        painter.restore()
+
+        painter.setPen(_pen(TEXT_COLOR, 1))
+        painter.drawRect(plot)
+        painter.setFont(_font(16, bold=True))
+        painter.drawText(QRectF(plot.left(), rect.top() + 2, plot.width(), 24),
+                         Qt.AlignLeft | Qt.AlignVCenter, title)
+        painter.setFont(_font(13))
+        painter.save()
+        painter.translate(rect.left() + 10, plot.center().y())
+        painter.rotate(-90)
+        painter.drawText(QRectF(-plot.height() / 2, -10, plot.height(), 20), Qt.AlignCenter, label)
+        painter.restore()
+        if last:
+            painter.drawText(QRectF(plot.left(), plot.bottom() + 20, plot.width(), 20),
+                             Qt.AlignCenter, "Time (seconds)")
+
+    def _table(self, painter: QPainter, left: float, right: float, y: float, title: str,
+               data: np.ndarray) -> float:
+        s = self.summary
+        header = ["Level", "HOLD (s)"] + s['sensor_names']
+        column = (right - left) / len(header)
+        row_height = 24
+
+        painter.setPen(TEXT_COLOR)
+        painter.setFont(_font(16, bold=True))
+        painter.drawText(QRectF(left, y, right - left, 24), Qt.AlignLeft | Qt.AlignVCenter, title)
+        y += 28
+        painter.fillRect(QRectF(left, y, right - left, row_height), QColor('#e9ecef'))
+        painter.setFont(_font(13, bold=True))
+        for c, text in enumerate(header):
+            painter.drawText(QRectF(left + c * column, y, column, row_height), Qt.AlignCenter, text)
+        painter.setFont(_font(13))
+        for level in range(len(data)):
+            y += row_height
+            if level % 2:
+                painter.fillRect(QRectF(left, y, right - left, row_height), QColor('#f8f9fa'))
+            cells = [str(level + 1), _format(s['hold_seconds'][level], signed=False)]
+            cells += [_format(v) for v in data[level]]
+            for c, text in enumerate(cells):
+                painter.drawText(QRectF(left + c * column, y, column, row_height), Qt.AlignCenter, text)
+        painter.setPen(_pen(MUTED_COLOR, 1))
+        painter.drawLine(QPointF(left, y + row_height), QPointF(right, y + row_height))
+        return y + row_height
+
+
+def render_report(summary: dict, output_base: str, formats: Sequence[str] = ('png',),
+                  size=REPORT_SIZE, dpi: int = REPORT_DPI) -> List[str]:
+    """Paint one summary into ``output_base`` + .png / .svg / .pdf"""
+    ensure_app()
+    page = ReportPage(summary, size)
+    width, height = size
+    written = []
+    for fmt in formats:
+        if fmt not in REPORT_EXTENSIONS:
+            raise ValueError(f"Unknown report format '{fmt}'")
+        filename = output_base + REPORT_EXTENSIONS[fmt]
+        if fmt == 'png':
+            device = QImage(width, height, QImage.Format_ARGB32)
+            device.setDotsPerMeterX(int(dpi / 0.0254))
+            device.setDotsPerMeterY(int(dpi / 0.0254))
+        elif fmt == 'svg':
+            device = QSvgGenerator()
+            device.setFileName(filename)
+            device.setSize(QSize(width, height))
+            device.setViewBox(QRect(0, 0, width, height))
+            device.setResolution(dpi)
+            device.setTitle(summary['name'])
+        else:
+            device = QPdfWriter(filename)
+            device.setResolution(dpi)
+            device.setPageSize(QPageSize(QSizeF(width / dpi * 25.4, height / dpi * 25.4),
+                                         QPageSize.Millimeter))
+            device.setPageMargins(QMarginsF(0, 0, 0, 0))
+            device.setTitle(summary['name'])
+        painter = QPainter(device)
+        try:
+            page.paint(painter)
+        finally:
+            painter.end()
+        if fmt == 'png' and not device.save(filename, "PNG"):
+            raise IOError(f"could not write {filename}")
+        written.append(filename)
+    return written
+
+
+def render_session(filename: str, output_dir: str, formats: Sequence[str] = ('png',),
+                   size=REPORT_SIZE, dpi: int = REPORT_DPI) -> List[str]:
+    """Load, summarize and render one session file (worker process entry point)"""
+    os.makedirs(output_dir, exist_ok=True)
+    summary = summarize_session(filename, buckets=size[0])
+    base = os.path.join(output_dir, os.path.splitext(os.path.basename(filename))[0])
+    return render_report(summary, base, formats, size, dpi)
@@ -0,0 +1,73 @@
+"""History viewer - browse recorded sessions without loading them whole"""
+
+import os
+from PySide6.QtWidgets import (
+    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
+    QLabel, QFileDialog, QMessageBox
+)
+from PySide6.QtCore import QTimer
+
+from gui.widgets import HistoryPlot
+from gui.styles import STYLESHEET
+from utils.session_pager import SessionPager
+from config.constants import DATA_SAVE_PATH
+
+
+class SessionViewer(QMainWindow):
+    """Pan/zoom through one or more sessions laid end to end
+
+    Data is paged in from disk by a SessionPager with a fixed cache budget.
+    """
+    
+    SESSION_FILTER = "Sessions (*.csv *.aroma);;CSV (*.csv);;AromaSense Archive (*.aroma)"
+    
+    def __init__(self, filenames: list, parent=None):
+        super().__init__(parent)
+        self.pager = SessionPager(filenames)
+        self.setWindowTitle(f"AromaSense History - {len(self.pager.sessions)} session(s)")
+        self.setStyleSheet(STYLESHEET)
+        self.resize(1200, 700)
+        
+        central = QWidget()
+        layout = QVBoxLayout(central)
+        layout.setContentsMargins(10, 10, 10, 10)
+        
+        toolbar = QHBoxLayout()
+        sessions = ", ".join(s['label'] for s in self.pager.sessions)
+        toolbar.addWidget(QLabel(f"📂 {sessions}"))
+        toolbar.addStretch()
+        self.fit_btn = QPushButton("🔍 Show All")
+        toolbar.addWidget(self.fit_btn)
+        layout.addLayout(toolbar)
+        
+        self.plot_widget = HistoryPlot(self.pager)
+        self.fit_btn.clicked.connect(self.plot_widget.show_all)
+        layout.addWidget(self.plot_widget)
+        self.setCentralWidget(central)
+        
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.update_status)
+        self.status_timer.start(500)
+        self.update_status()
+    
+    def update_status(self):
+        info = self.pager.cache_info()
+        self.statusBar().showMessage(
+            f"{self.pager.num_points} points | cache {info['chunks']} chunks, "
+            f"{info['bytes'] / 1e6:.1f}/{info['limit'] / 1e6:.0f} MB | "
+            f"hits {info['hits']} misses {info['misses']}")
+    
+    @classmethod
+    def open_dialog(cls, parent=None) -> 'SessionViewer':
+        """Ask for session files and open a viewer; None if cancelled"""
+        filenames, _ = QFileDialog.getOpenFileNames(
+            parent, "Open Sessions", DATA_SAVE_PATH, cls.SESSION_FILTER)
+        if not filenames:
+            return None
+        try:
+            viewer = cls(sorted(filenames, key=os.path.basename), parent)
+        except Exception as e:
+            QMessageBox.critical(parent, "Open Error", f"Failed to open sessions: {str(e)}")
+            return None
+        viewer.show()
+        return viewer
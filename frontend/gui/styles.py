@@ -284,4 +284,14 @@ STATUS_COLORS = {
     'connected': (40, 167, 69),         # Green
     'sampling': (255, 193, 7),          # Yellow
     'error': (220, 53, 69)              # Red
-}
\ No newline at end of file
+}
+# Background shading of FSM phases in session reports (state code -> RGB)
+PHASE_COLORS = {
+    0: (233, 236, 239),   # IDLE - light gray
+    1: (208, 235, 255),   # PRE-COND - pale blue
+    2: (255, 236, 179),   # RAMP_UP - pale amber
+    3: (255, 201, 201),   # HOLD - pale red
+    4: (211, 249, 216),   # PURGE - pale green
+    5: (229, 219, 255),   # RECOVERY - pale violet
+    6: (233, 236, 239)    # DONE - light gray
+}
@@ -5,13 +5,16 @@ from PySide6.QtWidgets import (
     QPushButton, QLineEdit, QComboBox, QSpinBox,
     QCheckBox, QGroupBox, QFrame, QSizePolicy
 )
-from PySide6.QtCore import Qt, Signal, QSize
+from PySide6.QtCore import Qt, Signal, QSize, QTimer, QRectF
 from PySide6.QtGui import QColor, QFont, QPainter, QBrush, QLinearGradient
 
 import pyqtgraph as pg
 import numpy as np
 import serial.tools.list_ports
-from config.constants import SAMPLE_TYPES, PLOT_COLORS, NUM_SENSORS, SENSOR_NAMES, MAX_PLOT_POINTS
+from config.constants import (
+    SAMPLE_TYPES, PLOT_COLORS, NUM_SENSORS, SENSOR_NAMES, MAX_PLOT_POINTS, PLOT_BUFFER_POINTS, SPECTRAL_BANDS,
+    HOLD_EARLY_EXIT, SAMPLE_RATE, SAMPLE_RATES
+)
 
 class StatusIndicator(QFrame):
     """Modern status indicator with gradient"""
@@ -82,9 +85,13 @@ class SensorPlot(pg.PlotWidget):
         self.getAxis('left').setPen('#495057')
         self.getAxis('bottom').setPen('#495057')
         
-        # Data storage
-        self.time_data = np.array([])
-        self.sensor_data = {i: np.array([]) for i in range(self.num_sensors)}
+        # Data storage: at most PLOT_BUFFER_POINTS points, every ``stride``-th sample
+        self.buffer_points = PLOT_BUFFER_POINTS
+        self._times = np.empty(self.buffer_points)
+        self._values = np.empty((self.buffer_points, self.num_sensors))
+        self._size = 0
+        self._count = 0  # samples received since the last clear
+        self.stride = 1
         self.plot_lines = {}
         
         self.addLegend(offset=(10, 10))
@@ -98,23 +105,68 @@ class SensorPlot(pg.PlotWidget):
             
             self.plot_lines[i] = self.plot([], [], pen=pen, name=name, antialias=True)
     
+    @property
+    def time_data(self) -> np.ndarray:
+        return self._times[:self._size]
+
+    @property
+    def sensor_data(self) -> dict:
+        return {i: self._values[:self._size, i] for i in range(self.num_sensors)}
+
     def add_data_point(self, time: float, sensor_values: list):
-        self.time_data = np.append(self.time_data, time)
-        
-        # Update data per sensor
-        for i, value in enumerate(sensor_values[:self.num_sensors]):
-            self.sensor_data[i] = np.append(self.sensor_data[i], value)
-        
-        # Update plot lines
+        self.append_block([time], [sensor_values[:self.num_sensors]])
+
+    def append_block(self, times, values):
+        """Add an (n, channels) block, thinning the series to the buffer size"""
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        # Sample k of the run is shown while k is a multiple of the stride
+        index = self._count + np.arange(len(times))
+        self._count += len(times)
+        keep = index % self.stride == 0
+        times, values, index = times[keep], values[keep], index[keep]
+        while self._size + len(times) > self.buffer_points:
+            # Full: halve the resolution of everything held and to come
+            half = (self._size + 1) // 2
+            self._times[:half] = self._times[:self._size:2]
+            self._values[:half] = self._values[:self._size:2]
+            self._size = half
+            self.stride *= 2
+            keep = index % self.stride == 0
+            times, values, index = times[keep], values[keep], index[keep]
+        n = len(times)
+        if n == 0:
+            return
+        self._times[self._size:self._size + n] = times
+        self._values[self._size:self._size + n] = values[:, :self.num_sensors]
+        self._size += n
+        self._refresh()
+
+    def _refresh(self):
         for i in range(self.num_sensors):
-            self.plot_lines[i].setData(self.time_data, self.sensor_data[i])
-    
+            self.plot_lines[i].setData(self._times[:self._size], self._values[:self._size, i],
+                                       connect='finite')
+
     def clear_data(self):
-        self.time_data = np.array([])
+        self._size = 0
+        self._count = 0
+        self.stride = 1
         for i in range(self.num_sensors):
-            self.sensor_data[i] = np.array([])
             self.plot_lines[i].setData([], [])
 
+    def set_data(self, times: np.ndarray, values: np.ndarray):
+        """Replace the plotted series with an (n, channels) block"""
+        self.set_blocks([(times, values)])
+
+    def set_blocks(self, blocks):
+        """Replace the plotted series with (times, values, ...) blocks in order"""
+        self.clear_data()
+        for block in blocks:
+            self.append_block(block[0], block[1])
+
+    def set_units(self, label: str):
+        self.setLabel('left', label, color='#495057', **{'font-size': '11pt'})
+
 
 class ControlPanel(QGroupBox):
     """Modern control panel for herbal analysis"""
@@ -122,6 +174,9 @@ class ControlPanel(QGroupBox):
     start_clicked = Signal()
     stop_clicked = Signal()
     save_clicked = Signal()
+    units_toggled = Signal(bool)  # True: calibrated ppm
+    adaptive_toggled = Signal(bool)  # True: end HOLD once readings are steady
+    rate_changed = Signal(float)  # requested sample rate (Hz) for the next run
     
     def __init__(self, parent=None):
         super().__init__("Herbal Analysis Control", parent)
@@ -154,6 +209,18 @@ class ControlPanel(QGroupBox):
         type_layout.addWidget(self.sample_type)
         sample_layout.addLayout(type_layout)
         
+        # Sample rate (sent to the firmware before each run)
+        rate_layout = QHBoxLayout()
+        rate_layout.addWidget(QLabel("Sample Rate:"))
+        self.rate_combo = QComboBox()
+        for rate in SAMPLE_RATES:
+            self.rate_combo.addItem(f"{rate} Hz", float(rate))
+        self.rate_combo.setCurrentIndex(max(self.rate_combo.findData(float(SAMPLE_RATE)), 0))
+        self.rate_combo.currentIndexChanged.connect(
+            lambda _: self.rate_changed.emit(self.get_sample_rate()))
+        rate_layout.addWidget(self.rate_combo)
+        sample_layout.addLayout(rate_layout)
+        
         layout.addLayout(sample_layout)
         
         # Control buttons section
@@ -187,6 +254,15 @@ class ControlPanel(QGroupBox):
         button_layout.addWidget(self.save_btn)
         
         control_layout.addLayout(button_layout)
+        
+        self.ppm_check = QCheckBox("Show calibrated ppm")
+        self.ppm_check.toggled.connect(self.units_toggled.emit)
+        control_layout.addWidget(self.ppm_check)
+        
+        self.adaptive_check = QCheckBox("Adaptive HOLD (end when steady)")
+        self.adaptive_check.setChecked(HOLD_EARLY_EXIT)
+        self.adaptive_check.toggled.connect(self.adaptive_toggled.emit)
+        control_layout.addWidget(self.adaptive_check)
         layout.addLayout(control_layout)
         
         layout.addStretch()
@@ -194,6 +270,7 @@ class ControlPanel(QGroupBox):
     
     def enable_start(self, enabled: bool = True):
         self.start_btn.setEnabled(enabled)
+        self.rate_combo.setEnabled(enabled)
     
     def enable_stop(self, enabled: bool = True):
         self.stop_btn.setEnabled(enabled)
@@ -204,6 +281,9 @@ class ControlPanel(QGroupBox):
             'type': self.sample_type.currentText(),
             'mode': "Auto FSM" 
         }
+    
+    def get_sample_rate(self) -> float:
+        return float(self.rate_combo.currentData())
 
 
 class ConnectionPanel(QGroupBox):
@@ -317,4 +397,173 @@ class ConnectionPanel(QGroupBox):
         }
     
     def set_status(self, status_text: str, color_rgb: tuple):
-        self.status_indicator.set_status(status_text, color_rgb)
\ No newline at end of file
+        self.status_indicator.set_status(status_text, color_rgb)
+
+class HistoryPlot(pg.PlotWidget):
+    """Plot for recorded sessions paged in from disk by a SessionPager
+
+    Only the visible range is requested, at about two points per pixel,
+    whenever the view settles after a pan or zoom.
+    """
+    
+    def __init__(self, pager, title: str = "Session History", parent=None):
+        super().__init__(parent)
+        self.pager = pager
+        self.num_sensors = pager.num_sensors
+        
+        self.setTitle(title, color='#2E8B57', size='14pt', bold=True)
+        self.setBackground('#FFFFFF')
+        self.showGrid(x=True, y=True, alpha=0.3)
+        styles = {'color': '#495057', 'font-size': '11pt'}
+        self.setLabel('left', 'Sensor Reading', **styles)
+        self.setLabel('bottom', 'Time (seconds)', **styles)
+        self.getAxis('left').setPen('#495057')
+        self.getAxis('bottom').setPen('#495057')
+        self.addLegend(offset=(10, 10))
+        
+        self.plot_lines = {}
+        for i in range(self.num_sensors):
+            color = PLOT_COLORS[i % len(PLOT_COLORS)]
+            name = SENSOR_NAMES[i] if i < len(SENSOR_NAMES) else f"Sensor {i+1}"
+            self.plot_lines[i] = self.plot([], [], pen=pg.mkPen(color=color, width=1.5),
+                                           name=name, connect='finite')
+        
+        # Session boundaries
+        for session in pager.sessions:
+            marker = pg.InfiniteLine(pos=session['start'], angle=90,
+                                     pen=pg.mkPen('#ADB5BD', style=Qt.DashLine),
+                                     label=session['label'],
+                                     labelOpts={'position': 0.95, 'color': '#6C757D'})
+            self.addItem(marker)
+        
+        # Coalesce range changes while the user drags
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(40)
+        self._refresh_timer.timeout.connect(self.refresh)
+        self.getViewBox().sigXRangeChanged.connect(self.schedule_refresh)
+        
+        self.show_all()
+    
+    def schedule_refresh(self, *args):
+        self._refresh_timer.start()
+    
+    def show_all(self):
+        t0, t1 = self.pager.time_range()
+        self.setXRange(t0, t1, padding=0.01)
+        self.refresh()
+    
+    def refresh(self):
+        t0, t1 = self.getViewBox().viewRange()[0]
+        max_points = max(500, 2 * self.width())
+        times, values = self.pager.window(t0, t1, max_points)
+        for i in range(self.num_sensors):
+            self.plot_lines[i].setData(times, values[:, i] if len(times) else [])
+
+
+class SpectrogramPlot(QWidget):
+    """Rolling spectrogram of one sensor channel with its latest band powers"""
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        
+        top = QHBoxLayout()
+        top.addWidget(QLabel("Spectrum:"))
+        self.channel_selector = QComboBox()
+        self.channel_selector.addItems(SENSOR_NAMES[:NUM_SENSORS])
+        self.channel_selector.currentIndexChanged.connect(self.redraw)
+        top.addWidget(self.channel_selector)
+        top.addStretch()
+        layout.addLayout(top)
+        
+        self.plot = pg.PlotWidget()
+        self.plot.setBackground('#FFFFFF')
+        styles = {'color': '#495057', 'font-size': '10pt'}
+        self.plot.setLabel('left', 'Frequency (Hz)', **styles)
+        self.plot.setLabel('bottom', 'Time (seconds)', **styles)
+        self.image = pg.ImageItem(axisOrder='row-major')
+        self.image.setLookupTable(pg.colormap.get('viridis').getLookupTable())
+        self.plot.addItem(self.image)
+        layout.addWidget(self.plot)
+        
+        self.band_label = QLabel("Band power: -")
+        self.band_label.setWordWrap(True)
+        layout.addWidget(self.band_label)
+        
+        self.spectrum = None
+    
+    def update_spectrum(self, spectrum):
+        """Show the state of a RollingSpectrum"""
+        self.spectrum = spectrum
+        self.redraw()
+    
+    def redraw(self, *args):
+        spectrum = self.spectrum
+        if spectrum is None or not spectrum.frames:
+            return
+        channel = self.channel_selector.currentIndex()
+        history = spectrum.spectrogram(channel)
+        # log scale so quiet bands stay visible; frequency on the y axis
+        self.image.setImage(np.log10(history.T + 1e-12), autoLevels=True)
+        hop_s = spectrum.hop / spectrum.rate_hz
+        t_end = (spectrum.length + (spectrum.frames - 1) * spectrum.hop) / spectrum.rate_hz
+        width = len(history) * hop_s
+        self.image.setRect(QRectF(t_end - width, 0.0, width, spectrum.rate_hz / 2))
+        
+        powers = spectrum.latest_band_powers()
+        if powers is not None:
+            self.band_label.setText("Band power: " + "  ".join(
+                f"{lo:g}-{hi:g} Hz: {p:.3g}"
+                for (lo, hi), p in zip(SPECTRAL_BANDS, powers[:, channel])))
+    
+    def clear_data(self):
+        self.spectrum = None
+        self.image.clear()
+        self.band_label.setText("Band power: -")
+
+
+class PatternPlot(pg.PlotWidget):
+    """PCA scatter: reference sessions as clouds, the live run as a trace"""
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setTitle("Cross-Sensor Pattern (PCA)", color='#2E8B57', size='12pt', bold=True)
+        self.setBackground('#FFFFFF')
+        self.showGrid(x=True, y=True, alpha=0.3)
+        styles = {'color': '#495057', 'font-size': '10pt'}
+        self.setLabel('left', 'PC 2', **styles)
+        self.setLabel('bottom', 'PC 1', **styles)
+        self.addLegend(offset=(10, 10))
+        self.reference_items = []
+        self.live_trace = self.plot([], [], pen=pg.mkPen('#495057', width=1.5), name="Current run")
+        self.live_head = pg.ScatterPlotItem(size=12, brush=pg.mkBrush('#DC3545'))
+        self.addItem(self.live_head)
+    
+    def set_references(self, references: dict):
+        """{label: (k, 2) points}"""
+        for item in self.reference_items:
+            self.removeItem(item)
+        self.reference_items = []
+        for i, (label, points) in enumerate(references.items()):
+            color = QColor(PLOT_COLORS[i % len(PLOT_COLORS)])
+            color.setAlpha(110)
+            item = pg.ScatterPlotItem(points[:, 0], points[:, 1], size=5, pen=None,
+                                      brush=pg.mkBrush(color), name=label)
+            self.addItem(item)
+            self.reference_items.append(item)
+    
+    def update_projection(self, projector):
+        points = projector.live_points()
+        if not len(points):
+            return
+        self.live_trace.setData(points[:, 0], points[:, 1])
+        self.live_head.setData([points[-1, 0]], [points[-1, 1]])
+        pc1, pc2 = (projector.explained[:2] * 100).tolist() + [0.0] * (2 - len(projector.explained[:2]))
+        self.setLabel('bottom', f'PC 1 ({pc1:.0f}%)')
+        self.setLabel('left', f'PC 2 ({pc2:.0f}%)')
+    
+    def clear_data(self):
+        self.live_trace.setData([], [])
+        self.live_head.setData([], [])
@@ -0,0 +1,578 @@
+"""AromaSense Headless Capture - unattended sampling without the GUI
+
+Runs the same START_SAMPLING / STOP_SAMPLING flow as MainWindow on a plain
+QCoreApplication (no widgets, no plotting) and streams every run straight
+to CSV. Samples are queued back-to-back:
+
+    python headless.py --sample "jahe A:jahe" --sample "kunyit B:kunyit"
+    python headless.py --queue batch.txt --repeat 3 --output-dir data/night
+    python headless.py --sample "jahe A:jahe" --rate 50
+    python headless.py --queue batch.txt --alarms night_alarms.json
+    python headless.py --queue batch.txt --rig a=127.0.0.1:8082 --rig b=serial:/dev/ttyUSB1
+"""
+
+import sys
+import os
+import argparse
+import signal
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Add current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PySide6.QtCore import QCoreApplication, QObject, QTimer, Signal
+
+from utils.network_comm import NetworkWorker
+from utils.rig_manager import RigManager
+from utils.file_handler import SessionCSVWriter
+from utils.protocol import sample_time, missing_sensors, format_rate_command, scale_samples
+from utils.quality import QualityMonitor
+from utils.calibration import CalibrationTable
+from utils.session_store import SpillingSessionStore
+from utils.phase_index import PhaseIndex
+from utils.profiler import Profiler
+from utils.steady_state import HoldEarlyExit
+from utils.alarms import AlarmRules, AlarmMonitor, load_rules, describe_event, ALARMS_SUFFIX
+from utils.resampler import MonotonicClock
+from config.constants import (
+    SENSOR_KEYS, SAMPLE_TYPES, STATE_NAMES, STATE_DONE,
+    DATA_SAVE_PATH, QUALITY_BLOCK, CALIBRATION_PROFILE, HOLD_EARLY_EXIT, STEADY_BLOCK,
+    STEADY_WINDOW, SAMPLE_RATE, ALARM_BLOCK
+)
+
+
+class HeadlessCapture(QObject):
+    """Drive a queue of sampling runs against one rig"""
+
+    def __init__(self, samples: List[dict], host: str = "127.0.0.1", port: int = 8082,
+                 output_dir: str = DATA_SAVE_PATH, serial_port: Optional[str] = None,
+                 baud_rate: int = 9600, settle_time: float = 5.0,
+                 max_duration: Optional[float] = None, calibration: str = CALIBRATION_PROFILE,
+                 adaptive_hold: bool = HOLD_EARLY_EXIT, profile_mode: Optional[str] = None,
+                 trace_memory: bool = False, sample_rate: float = SAMPLE_RATE,
+                 alarm_rules: Optional[AlarmRules] = None):
+        super().__init__()
+        self.queue = list(samples)
+        self.host = host
+        self.port = port
+        self.output_dir = output_dir
+        self.settle_ms = int(settle_time * 1000)
+        self.max_duration = max_duration
+        self.sample_rate = float(sample_rate)  # sent with SET_RATE before every run
+
+        self.network_worker = None
+        self.serial_connection = None
+        self.serial_port = serial_port
+        self.baud_rate = baud_rate
+
+        self.arduino_connected = False
+        self.is_sampling = False
+        self.current_sample = None
+        self.run_number = 0  # identifies the run a max-duration timer belongs to
+        self.writer = None
+        self.run_active = False  # firmware has left IDLE/DONE for this run
+        self.clock = MonotonicClock(1.0 / self.sample_rate)
+        self.quality = QualityMonitor(interval=1.0 / self.sample_rate)
+        self.quality_rows = []  # (t, values, missing) not yet checked
+        self.calibration = CalibrationTable.load(calibration)
+        self.calibrated = SpillingSessionStore()  # ppm rows of the current run
+        self.phases = PhaseIndex()  # (state, level) segments of the current run
+        self.adaptive_hold = adaptive_hold
+        self.hold_exit = HoldEarlyExit(window=scale_samples(STEADY_WINDOW, self.sample_rate))
+        self.hold_block = scale_samples(STEADY_BLOCK, self.sample_rate)
+        self.hold_rows = []  # (t, values, state, level) not yet checked
+        self.alarms = AlarmMonitor(alarm_rules or AlarmRules(load_rules()))
+        self.alarm_block = scale_samples(ALARM_BLOCK, self.sample_rate)
+        self.alarm_rows = []  # (t, values, state, level) not yet evaluated
+        self.completed = []
+        self.failed = []
+        self.shutting_down = False
+        self.profiler = Profiler()
+        self.profile_mode = profile_mode
+        self.trace_memory = trace_memory
+
+    def start(self):
+        """Connect to the backend; the first run starts once the Arduino is up"""
+        print(f"🚀 Headless capture: {len(self.queue)} sample(s) queued")
+
+        if self.serial_port:
+            try:
+                import serial
+                self.serial_connection = serial.Serial(self.serial_port, self.baud_rate, timeout=1)
+                print(f"✅ Serial Connected: {self.serial_port}")
+            except Exception as e:
+                print(f"⚠️ Serial connection failed: {e}")
+
+        self.network_worker = NetworkWorker(host=self.host, port=self.port)
+        self.network_worker.data_received.connect(self.on_data_received)
+        self.network_worker.connection_status.connect(self.on_connection_status)
+        self.network_worker.error_occurred.connect(self.on_error)
+        self.network_worker.sample_rate_changed.connect(self.on_sample_rate_changed)
+        self.network_worker.arduino_status.connect(self.on_arduino_status)
+        self.network_worker.command_acked.connect(self.on_command_acked)
+        self.network_worker.command_failed.connect(self.on_command_failed)
+        self.network_worker.start()
+
+    def send_arduino_command(self, command: str):
+        """Send command to Arduino via backend (and serial, if open)"""
+        if self.network_worker:
+            self.network_worker.send_command(command)
+        if self.serial_connection and self.serial_connection.is_open:
+            try:
+                self.serial_connection.write(f"{command}\n".encode('utf-8'))
+            except Exception as e:
+                print(f"⚠️ Serial write failed: {e}")
+
+    def on_command_acked(self, event: dict):
+        if event['stage'] == 'arduino':
+            print(f"   ✔ {event['command']}: {event['status']} in {event['rtt_ms']:.0f} ms")
+
+    def on_command_failed(self, event: dict):
+        print(f"❌ {event['command']} failed: {event['status']} after {event['attempts']} attempt(s)")
+
+    def on_connection_status(self, connected: bool):
+        """Backend connection lost for good - finish up"""
+        if not connected:
+            if self.is_sampling:
+                self.finish_current(success=False, reason="backend disconnected")
+            self.shutdown()
+
+    def on_error(self, msg: str):
+        print(f"❌ {msg}")
+
+    def on_sample_rate_changed(self, rate_hz: float):
+        if self.is_sampling and rate_hz != self.sample_rate:
+            print(f"⚠️ Firmware reports {rate_hz:g} Hz, requested {self.sample_rate:g} Hz")
+
+    def on_arduino_status(self, connected: bool):
+        """Start the queue when the Arduino appears"""
+        self.arduino_connected = connected
+        if connected:
+            print("✅ Arduino Connected")
+            if not self.is_sampling:
+                self.start_next()
+        else:
+            print("⚠️ Arduino Disconnected")
+            if self.is_sampling:
+                self.finish_current(success=False, reason="arduino disconnected")
+
+    def start_next(self):
+        """Start the next queued sample, or quit when the queue is empty"""
+        if self.is_sampling:
+            return
+        if not self.queue:
+            self.shutdown()
+            return
+        if not self.arduino_connected:
+            print("⏳ Waiting for Arduino...")
+            return
+
+        self.current_sample = self.queue.pop(0)
+        self.run_number += 1
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = os.path.join(
+            self.output_dir, f"{self.current_sample['name'].replace(' ', '_')}_{timestamp}.csv")
+        self.writer = SessionCSVWriter(filename, dict(self.current_sample, sample_rate_hz=self.sample_rate),
+                                       mode="Headless FSM")
+        self.clock.reset()
+        self.quality.reset()
+        self.quality_rows = []
+        self.calibrated.clear()
+        self.phases = PhaseIndex()
+        self.hold_exit.reset()
+        self.hold_rows = []
+        self.alarms.reset()
+        self.alarm_rows = []
+        self.run_active = False
+        self.is_sampling = True
+
+        self.send_arduino_command(format_rate_command(self.sample_rate))
+        self.send_arduino_command("START_SAMPLING")
+        if self.profile_mode:
+            self.profiler.start(self.profile_mode, self.current_sample['name'])
+        if self.trace_memory:
+            self.profiler.begin_memory_session(self.current_sample['name'])
+            self.profiler.snapshot_memory("start")
+        print(f"🔬 Sampling '{self.current_sample['name']}' ({self.current_sample['type']}) "
+              f"-> {filename} [{len(self.queue)} left]")
+
+        if self.max_duration:
+            run = self.run_number
+            QTimer.singleShot(int(self.max_duration * 1000), lambda: self.on_run_timeout(run))
+
+    def on_run_timeout(self, run: int):
+        # --repeat queues the same sample dicts again; only the run number tells them apart
+        if self.is_sampling and self.run_number == run:
+            self.finish_current(success=False, reason="max duration reached")
+
+    def on_data_received(self, data: dict):
+        """Stream one sample to disk and watch for DONE"""
+        if not self.is_sampling:
+            return
+        try:
+            sensor_values = [float(data.get(key, 0.0)) for key in SENSOR_KEYS]
+            state_idx = int(data.get('state', 0))
+            level = int(data.get('level', 0))
+        except (TypeError, ValueError) as e:
+            print(f"❌ Error parsing data: {e}")
+            return
+
+        t = self.clock.stamp(sample_time(data))
+        self.writer.write_row(t, sensor_values)
+        self.phases.append(state_idx, level)
+        self.quality_rows.append((t, sensor_values, missing_sensors(data)))
+        if len(self.quality_rows) >= QUALITY_BLOCK:
+            self.check_quality()
+        if self.adaptive_hold:
+            self.hold_rows.append((t, sensor_values, state_idx, level))
+            if len(self.hold_rows) >= self.hold_block:
+                self.check_hold()
+        if len(self.alarms.rules):
+            self.alarm_rows.append((t, sensor_values, state_idx, level))
+            if len(self.alarm_rows) >= self.alarm_block:
+                self.check_alarms()
+
+        # A DONE left over from the previous run must not stop this one
+        if 0 < state_idx < STATE_DONE:
+            if not self.run_active:
+                print(f"   FSM -> {STATE_NAMES.get(state_idx, 'UNKNOWN')}")
+            self.run_active = True
+        elif state_idx == STATE_DONE and self.run_active:
+            self.finish_current(success=True)
+
+    def check_quality(self):
+        """Run the quality checks over the buffered rows in one block"""
+        if not self.quality_rows:
+            return
+        times, values, missing = zip(*self.quality_rows)
+        self.quality_rows = []
+        self.quality.check(np.array(times), np.array(values), np.array(missing, dtype=bool))
+        # Same block goes through the calibration tables
+        self.calibrated.append_block(np.array(times), self.calibration.apply(np.array(values)))
+
+    def check_hold(self):
+        """End HOLD early once every channel has plateaued"""
+        times, values, states, levels = zip(*self.hold_rows)
+        self.hold_rows = []
+        for level in self.hold_exit.push(np.array(times), np.array(values),
+                                         np.array(states), np.array(levels)):
+            self.send_arduino_command(HoldEarlyExit.command(level))
+            print(f"   ⏩ Level {level+1} steady after {self.hold_exit.exits[-1][1]:.0f} s of HOLD")
+
+    def check_alarms(self):
+        """Evaluate the alarm rules over the buffered rows in one block"""
+        if not self.alarm_rows:
+            return
+        times, values, states, levels = zip(*self.alarm_rows)
+        self.alarm_rows = []
+        for event in self.alarms.push(np.array(times), np.array(values),
+                                      np.array(states), np.array(levels)):
+            print(f"   🚨 {describe_event(event)}")
+
+    def finish_current(self, success: bool, reason: str = ""):
+        """Stop the Arduino, finalize the file and schedule the next run"""
+        self.is_sampling = False
+        self.send_arduino_command("STOP_SAMPLING")
+        if self.profiler.active:
+            print(f"   Profile: {self.profiler.directory}")
+            self.profiler.stop()
+        if self.trace_memory:
+            print(f"   Memory: {self.profiler.snapshot_memory('stop')}")
+
+        filename = self.writer.close() if self.writer else None
+        points = self.writer.num_points if self.writer else 0
+        self.writer = None
+        if filename:
+            self.check_quality()
+            self.quality.save(os.path.splitext(filename)[0] + ".quality.npz")
+            self.phases.save(PhaseIndex.sidecar(filename))
+            print(f"   Quality: {self.quality.flagged_fraction() * 100:.1f}% of samples flagged")
+            if len(self.alarms.rules):
+                self.check_alarms()
+                self.alarms.save(os.path.splitext(filename)[0] + ALARMS_SUFFIX)
+                print(f"   Alarms: {len(self.alarms.events)} event(s)")
+            if len(self.calibrated):
+                self.calibration.save(os.path.splitext(filename)[0] + ".ppm.npz",
+                                      self.calibrated.times, self.calibrated.values)
+            self.calibrated.clear()
+
+        if success and filename:
+            self.completed.append(filename)
+            print(f"✅ Done: {filename} ({points} points)")
+            if self.hold_exit.exits:
+                print(f"   Adaptive HOLD ended {len(self.hold_exit.exits)} level(s) early")
+        else:
+            # A run whose file could not be written is still a failed run
+            self.failed.append(filename or self.current_sample['name'])
+            print(f"⚠️ Run ended early ({reason or 'file not written'}): {filename} ({points} points)")
+
+        if not self.shutting_down:
+            QTimer.singleShot(self.settle_ms, self.start_next)
+
+    def shutdown(self):
+        """Stop workers and leave the event loop"""
+        if self.shutting_down:
+            return
+        self.shutting_down = True
+        if self.is_sampling:
+            self.finish_current(success=False, reason="interrupted")
+        self.queue.clear()
+        if self.network_worker:
+            self.network_worker.running = False
+        if self.serial_connection:
+            self.serial_connection.close()
+            self.serial_connection = None
+        print(f"🔚 Headless capture finished: {len(self.completed)} completed, "
+              f"{len(self.failed)} incomplete")
+        QCoreApplication.instance().exit(0 if not self.failed else 1)
+
+
+class MultiRigCapture(QObject):
+    """Drive a queue of sampling runs on several rigs at once
+
+    Every queued sample starts on all rigs together through one
+    RigManager; the next one starts when every rig has reached DONE (or
+    the run timed out). Each rig streams its own CSV. The quality,
+    calibration, alarm and adaptive-HOLD stages are single-rig only.
+    """
+
+    # RigManager callbacks run on its loop thread; these queue them to ours
+    status_changed = Signal(str, dict)        # rig id, health
+    session_done = Signal(str, object, bool)  # rig id, filename or None, success
+
+    def __init__(self, samples: List[dict], rigs: Dict[str, dict],
+                 output_dir: str = DATA_SAVE_PATH, settle_time: float = 5.0,
+                 max_duration: Optional[float] = None, sample_rate: float = SAMPLE_RATE):
+        super().__init__()
+        self.queue = list(samples)
+        self.settle_ms = int(settle_time * 1000)
+        self.max_duration = max_duration
+        self.sample_rate = float(sample_rate)
+        self.manager = RigManager(output_dir=output_dir,
+                                  on_status=self.status_changed.emit,
+                                  on_session_done=self.session_done.emit)
+        for rig_id, settings in rigs.items():
+            self.manager.add_rig(rig_id, **settings)
+        self.status_changed.connect(self.on_status)
+        self.session_done.connect(self.on_session_done)
+
+        self.ready = set()    # rigs whose Arduino is connected
+        self.running = set()  # rigs still sampling the current run
+        self.waiting = False  # the next run waits for every rig to be ready
+        self.run_number = 0
+        self.completed = []
+        self.failed = []
+        self.shutting_down = False
+
+    def start(self):
+        print(f"🚀 Multi-rig capture: {len(self.queue)} sample(s) on "
+              f"{len(self.manager.rigs)} rig(s): {', '.join(self.manager.rigs)}")
+        self.manager.start()
+        self.start_next()
+
+    def on_status(self, rig_id: str, health: dict):
+        if health['arduino_connected']:
+            self.ready.add(rig_id)
+        else:
+            self.ready.discard(rig_id)
+        if self.waiting and not self.running:
+            self.start_next()
+
+    def start_next(self):
+        """Start the next queued sample on every rig, or quit when the queue is empty"""
+        if self.running or self.shutting_down:
+            return
+        if not self.queue:
+            self.shutdown()
+            return
+        if self.ready != set(self.manager.rigs):
+            if not self.waiting:
+                missing = sorted(set(self.manager.rigs) - self.ready)
+                print(f"⏳ Waiting for Arduino on {', '.join(missing)}...")
+            self.waiting = True
+            return
+
+        self.waiting = False
+        sample = self.queue.pop(0)
+        self.run_number += 1
+        print(f"🔬 Sampling '{sample['name']}' ({sample['type']}) [{len(self.queue)} left]")
+        for rig_id in self.manager.rigs:
+            self.manager.send_command(rig_id, format_rate_command(self.sample_rate))
+            if self.manager.start_sampling(rig_id, sample):
+                self.running.add(rig_id)
+            else:
+                self.failed.append(f"{rig_id}: {sample['name']}")
+                print(f"⚠️ {rig_id}: START_SAMPLING could not be sent")
+        if not self.running:
+            QTimer.singleShot(self.settle_ms, self.start_next)
+        elif self.max_duration:
+            run = self.run_number
+            QTimer.singleShot(int(self.max_duration * 1000), lambda: self.on_run_timeout(run))
+
+    def on_run_timeout(self, run: int):
+        if run == self.run_number:
+            for rig_id in list(self.running):
+                print(f"⚠️ {rig_id}: max duration reached")
+                self.manager.stop_sampling(rig_id)
+
+    def on_session_done(self, rig_id: str, filename: Optional[str], success: bool):
+        if rig_id not in self.running:
+            return
+        self.running.discard(rig_id)
+        if success and filename:
+            self.completed.append(filename)
+            print(f"✅ {rig_id}: {filename}")
+        else:
+            self.failed.append(filename or rig_id)
+            print(f"⚠️ {rig_id}: run ended early: {filename}")
+        if not self.running and not self.shutting_down:
+            QTimer.singleShot(self.settle_ms, self.start_next)
+
+    def shutdown(self):
+        """Finalize the open runs, stop every rig and leave the event loop"""
+        if self.shutting_down:
+            return
+        self.shutting_down = True
+        self.queue.clear()
+        # Open runs are finalized by the manager; their notices arrive too late
+        self.failed.extend(sorted(self.running))
+        self.running.clear()
+        self.manager.stop()
+        print(f"🔚 Multi-rig capture finished: {len(self.completed)} completed, "
+              f"{len(self.failed)} incomplete")
+        QCoreApplication.instance().exit(0 if not self.failed else 1)
+
+
+def parse_rig(spec: str) -> Tuple[str, dict]:
+    """Parse an 'ID=HOST:PORT' (backend) or 'ID=serial:DEVICE[@BAUD]' rig spec"""
+    rig_id, _, target = spec.partition('=')
+    rig_id = rig_id.strip()
+    if not rig_id or not target:
+        raise ValueError(f"Rig '{spec}' is not ID=HOST:PORT or ID=serial:DEVICE")
+    kind, _, device = target.partition(':')
+    if kind == 'serial':
+        device, _, baud = device.partition('@')
+        return rig_id, {'kind': 'serial', 'serial_port': device, 'baud_rate': int(baud or 9600)}
+    host, _, port = target.rpartition(':')
+    return rig_id, {'kind': 'backend', 'host': host or "127.0.0.1", 'port': int(port)}
+
+
+def parse_sample(spec: str) -> dict:
+    """Parse a 'name[:type]' sample spec"""
+    name, _, sample_type = spec.partition(':')
+    name = name.strip()
+    sample_type = sample_type.strip() or name.split()[0].lower()
+    if not name:
+        raise ValueError(f"Empty sample name in '{spec}'")
+    if sample_type not in SAMPLE_TYPES:
+        print(f"⚠️ Unknown herbal type '{sample_type}' (known: {', '.join(SAMPLE_TYPES)})")
+    return {'name': name, 'type': sample_type, 'mode': "Headless FSM"}
+
+
+def load_queue(filename: str) -> List[dict]:
+    """Read one 'name[:type]' spec per line; blank lines and # comments are skipped"""
+    samples = []
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                samples.append(parse_sample(line))
+    return samples
+
+
+def main():
+    """Headless capture entry point"""
+    parser = argparse.ArgumentParser(description="AromaSense headless capture")
+    parser.add_argument("--host", default="127.0.0.1", help="backend host")
+    parser.add_argument("--port", type=int, default=8082, help="backend frontend port")
+    parser.add_argument("--sample", action="append", default=[], metavar="NAME[:TYPE]",
+                        help="queue a sample (repeatable)")
+    parser.add_argument("--queue", help="file with one NAME[:TYPE] per line")
+    parser.add_argument("--repeat", type=int, default=1, help="run the whole queue N times")
+    parser.add_argument("--output-dir", default=DATA_SAVE_PATH, help="where CSV files go")
+    parser.add_argument("--serial-port", help="also send commands over this serial port")
+    parser.add_argument("--baud-rate", type=int, default=9600)
+    parser.add_argument("--settle", type=float, default=5.0,
+                        help="seconds to wait between runs")
+    parser.add_argument("--max-duration", type=float,
+                        help="abort a run after this many seconds")
+    parser.add_argument("--rate", type=float, default=SAMPLE_RATE, metavar="HZ",
+                        help="sample rate sent to the firmware before each run (1-100 Hz)")
+    parser.add_argument("--adaptive-hold", action="store_true", default=HOLD_EARLY_EXIT,
+                        help="end each HOLD once all channels are steady")
+    parser.add_argument("--calibration", default=CALIBRATION_PROFILE,
+                        help="calibration profile (rig name or JSON path)")
+    parser.add_argument("--alarms", metavar="FILE",
+                        help="alarm rules JSON (default: alarms.json if present, else built-in rules)")
+    parser.add_argument("--profile", nargs="?", const="sample", choices=("sample", "cprofile"),
+                        help="profile each run (files under profiles/)")
+    parser.add_argument("--trace-malloc", action="store_true",
+                        help="tracemalloc snapshots at the start and end of each run")
+    parser.add_argument("--rig", action="append", default=[],
+                        metavar="ID=HOST:PORT|ID=serial:DEVICE[@BAUD]",
+                        help="run the queue on this rig (repeatable; all rigs sample together)")
+    args = parser.parse_args()
+
+    try:
+        samples = [parse_sample(s) for s in args.sample]
+        if args.queue:
+            samples += load_queue(args.queue)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not samples:
+        parser.error("nothing to capture - use --sample or --queue")
+    if not 1 <= args.rate <= 100:
+        parser.error("--rate must be between 1 and 100 Hz")
+    try:
+        alarm_rules = AlarmRules(load_rules(args.alarms))
+    except (OSError, ValueError) as e:
+        parser.error(f"alarm rules: {e}")
+    rigs = {}
+    try:
+        for spec in args.rig:
+            rig_id, settings = parse_rig(spec)
+            if rig_id in rigs:
+                raise ValueError(f"Rig '{rig_id}' given twice")
+            rigs[rig_id] = settings
+    except ValueError as e:
+        parser.error(str(e))
+
+    app = QCoreApplication(sys.argv)
+    app.setApplicationName("AromaSense Headless")
+
+    if rigs:
+        capture = MultiRigCapture(
+            samples * max(1, args.repeat), rigs, output_dir=args.output_dir,
+            settle_time=args.settle, max_duration=args.max_duration, sample_rate=args.rate
+        )
+    else:
+        capture = HeadlessCapture(
+            samples * max(1, args.repeat), host=args.host, port=args.port,
+            output_dir=args.output_dir, serial_port=args.serial_port,
+            baud_rate=args.baud_rate, settle_time=args.settle,
+            max_duration=args.max_duration, calibration=args.calibration,
+            adaptive_hold=args.adaptive_hold, profile_mode=args.profile,
+            trace_memory=args.trace_malloc, sample_rate=args.rate, alarm_rules=alarm_rules
+        )
+
+    # Ctrl+C finalizes the current file instead of losing it
+    signal.signal(signal.SIGINT, lambda *_: capture.shutdown())
+    interrupt_timer = QTimer()
+    interrupt_timer.timeout.connect(lambda: None)  # let Python see signals
+    interrupt_timer.start(500)
+
+    capture.start()
+    return_code = app.exec()
+
+    if not rigs:
+        if capture.network_worker:
+            capture.network_worker.stop()
+        for filename in capture.profiler.close():
+            print(f"📊 Profile written: {filename}")
+    return return_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,444 @@
+"""AromaSense Load Test - fake Arduinos and fake GUIs against the backend
+
+Simulated Arduinos connect to the backend's Arduino port (8081) and send
+``SENSOR:`` lines replayed from the bundled captures, with FSM state and
+level following the firmware's timing, at any rate. Headless subscribers
+connect to the frontend port (8082) and parse every JSON line the way the
+GUI does. Each rate stage reports end-to-end throughput, latency
+percentiles, lost samples and CPU per component:
+
+    python loadtest.py --arduinos 4 --subscribers 10 --rate 4,40,400
+    python loadtest.py --arduinos 20 --subscriber-procs 4 --duration 30 --json out.json
+
+To measure without changing the wire format, three MQ fields carry tags
+below the firmware's 3-decimal resolution (send time, sequence number,
+Arduino index). The backend passes them through, so subscribers can work
+out latency and per-Arduino gaps. ``--python-bridge`` starts a minimal
+in-process stand-in for the Rust backend, for checking the harness itself.
+"""
+
+import sys
+import os
+import argparse
+import asyncio
+import glob
+import json
+import multiprocessing
+import resource
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Optional
+
+# Add current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.file_handler import FileHandler
+from utils.protocol import parse_backend_line, is_sensor_message, parse_sensor_line
+from config.constants import SENSOR_KEYS, DATA_SAVE_PATH
+
+# Tags ride below the 3 decimals the firmware prints: value + tag * TAG_UNIT
+TAG_UNIT = 1e-10
+TAG_MODULUS = 4_000_000          # keeps tag * TAG_UNIT under half a 0.001 step
+TIME_TICKS = 10_000              # send-time tag in 0.1 ms (wraps every 400 s)
+TAG_FIELDS = {'time': 0, 'seq': 1, 'rig': 2}  # no2, eth, voc
+
+LATENCY_BIN = 0.1e-3             # histogram resolution (s)
+LATENCY_BINS = 100_000           # up to 10 s; slower deliveries go to overflow
+
+# Firmware FSM timing (main.ino), seconds: state code, duration
+FSM_SCHEDULE = [(2, 3.0), (3, 20.0), (4, 40.0), (5, 5.0)]
+PRE_COND, DONE = (1, 5.0), 6
+
+
+def fsm_states(n: int, interval: float = 0.25, levels: int = 5):
+    """State/level per sample index for a run sampled every ``interval`` s"""
+    ends, states, lv = [PRE_COND[1]], [PRE_COND[0]], [0]
+    for level in range(levels):
+        for state, duration in FSM_SCHEDULE:
+            ends.append(ends[-1] + duration)
+            states.append(state)
+            lv.append(level)
+    states.append(DONE)
+    lv.append(levels - 1)
+    idx = np.searchsorted(np.array(ends), np.arange(n) * interval, side='right')
+    return np.array(states)[idx], np.array(lv)[idx]
+
+
+def load_replay(data_dir: str = DATA_SAVE_PATH, start_time: Optional[float] = None) -> np.ndarray:
+    """Readings of the bundled captures, concatenated (synthetic if none)
+
+    With ``start_time`` each capture is replayed from that second on,
+    read through its seek index instead of parsing the rows before it.
+    """
+    blocks = []
+    for filename in sorted(glob.glob(os.path.join(data_dir, "*.csv"))):
+        try:
+            store = FileHandler.load_session_csv(filename, start_time=start_time)
+            if len(store):
+                blocks.append(store.values)
+        except Exception as e:
+            print(f"⚠️ Skipping {filename}: {e}")
+    if blocks:
+        return np.concatenate(blocks)
+    rng = np.random.default_rng(0)
+    return np.abs(rng.normal(1.0, 0.2, (4096, len(SENSOR_KEYS))))
+
+
+def tag(value: float, t: int) -> float:
+    return round(value, 3) + (t % TAG_MODULUS) * TAG_UNIT
+
+
+def untag(value: float) -> int:
+    return int(round((value - round(value, 3)) / TAG_UNIT))
+
+
+def latency_percentiles(hist: np.ndarray, overflow: int, qs=(50, 90, 99, 99.9)) -> dict:
+    total = int(hist.sum()) + overflow
+    if not total:
+        return {}
+    cumulative = np.cumsum(hist)
+    result = {}
+    for q in qs:
+        rank = q / 100.0 * total
+        i = int(np.searchsorted(cumulative, rank))
+        result[f"p{q:g}_ms"] = None if i >= len(hist) else (i + 1) * LATENCY_BIN * 1000
+    return result
+
+
+# ---- fake Arduinos ----
+
+async def _fake_arduino(index: int, host: str, port: int, rate: float, duration: float,
+                        replay: np.ndarray, states: np.ndarray, levels: np.ndarray,
+                        stats: dict):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b"CONNECTED\n")
+    offset = (index * 997) % len(replay)
+    start = time.time()
+    sent = 0
+    tick = min(0.01, 1.0 / rate)
+    while True:
+        now = time.time()
+        if now - start >= duration:
+            break
+        due = int((now - start) * rate) - sent
+        if due > 0:
+            stamp = int(now * TIME_TICKS)
+            lines = []
+            for k in range(sent, sent + due):
+                row = replay[(offset + k) % len(replay)]
+                values = [float(v) for v in row[:len(SENSOR_KEYS)]]
+                values[TAG_FIELDS['time']] = tag(values[TAG_FIELDS['time']], stamp)
+                values[TAG_FIELDS['seq']] = tag(values[TAG_FIELDS['seq']], k)
+                values[TAG_FIELDS['rig']] = tag(values[TAG_FIELDS['rig']], index)
+                i = k % len(states)
+                lines.append("SENSOR:" + ",".join(repr(v) for v in values)
+                             + f",{states[i]},{levels[i]}\n")
+            writer.write("".join(lines).encode('utf-8'))
+            await writer.drain()
+            sent += due
+        await asyncio.sleep(tick)
+    stats['sent'] += sent
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
+
+
+def run_arduinos(first: int, count: int, host: str, port: int, rate: float,
+                 duration: float, data_dir: str, start_time: Optional[float] = None) -> dict:
+    """Process entry: ``count`` fake Arduinos on one event loop"""
+    replay = load_replay(data_dir, start_time)
+    states, levels = fsm_states(len(replay))
+    stats = {'sent': 0, 'errors': 0}
+
+    async def main():
+        results = await asyncio.gather(
+            *(_fake_arduino(first + i, host, port, rate, duration, replay, states, levels, stats)
+              for i in range(count)), return_exceptions=True)
+        stats['errors'] = sum(isinstance(r, Exception) for r in results)
+        if stats['errors']:
+            stats['error'] = str(next(r for r in results if isinstance(r, Exception)))
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    wall = time.time()
+    asyncio.run(main())
+    end = resource.getrusage(resource.RUSAGE_SELF)
+    stats['cpu_s'] = (end.ru_utime - usage.ru_utime) + (end.ru_stime - usage.ru_stime)
+    stats['wall_s'] = time.time() - wall
+    return stats
+
+
+# ---- fake GUIs ----
+
+async def _subscriber(host: str, port: int, until: float, stats: dict, hist: np.ndarray):
+    reader, writer = await asyncio.open_connection(host, port)
+    last_seq = {}
+    try:
+        while True:
+            remaining = until - time.time()
+            if remaining <= 0:
+                break
+            try:
+                line = await asyncio.wait_for(reader.readline(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not line:
+                stats['disconnects'] += 1
+                break
+            received = time.time()
+            message = parse_backend_line(line.decode('utf-8', errors='replace'))
+            if message is None or not is_sensor_message(message):
+                continue
+            stats['received'] += 1
+            sent = untag(float(message[SENSOR_KEYS[TAG_FIELDS['time']]]))
+            latency = ((int(received * TIME_TICKS) - sent) % TAG_MODULUS) / TIME_TICKS
+            b = int(latency / LATENCY_BIN)
+            if b < len(hist):
+                hist[b] += 1
+            else:
+                stats['overflow'] += 1
+            rig = untag(float(message[SENSOR_KEYS[TAG_FIELDS['rig']]]))
+            seq = untag(float(message[SENSOR_KEYS[TAG_FIELDS['seq']]]))
+            previous = last_seq.get(rig)
+            if previous is not None:
+                gap = (seq - previous - 1) % TAG_MODULUS
+                if gap < TAG_MODULUS // 2:
+                    stats['dropped'] += gap
+                else:
+                    stats['reordered'] += 1
+            last_seq[rig] = seq
+    finally:
+        writer.close()
+
+
+def run_subscribers(count: int, host: str, port: int, duration: float) -> dict:
+    """Process entry: ``count`` subscribers on one event loop"""
+    stats = {'received': 0, 'dropped': 0, 'reordered': 0, 'overflow': 0,
+             'disconnects': 0, 'errors': 0}
+    hist = np.zeros(LATENCY_BINS, dtype=np.int64)
+
+    async def main():
+        until = time.time() + duration
+        results = await asyncio.gather(
+            *(_subscriber(host, port, until, stats, hist) for _ in range(count)),
+            return_exceptions=True)
+        stats['errors'] = sum(isinstance(r, Exception) for r in results)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    wall = time.time()
+    asyncio.run(main())
+    end = resource.getrusage(resource.RUSAGE_SELF)
+    stats['cpu_s'] = (end.ru_utime - usage.ru_utime) + (end.ru_stime - usage.ru_stime)
+    stats['wall_s'] = time.time() - wall
+    stats['hist'] = hist
+    return stats
+
+
+# ---- backend CPU ----
+
+def find_backend_pid(name: str = "e-nose-backend") -> Optional[int]:
+    for comm in glob.glob("/proc/[0-9]*/comm"):
+        try:
+            with open(comm) as f:
+                if f.read().strip() == name[:15]:
+                    return int(comm.split('/')[2])
+        except OSError:
+            continue
+    return None
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """utime + stime of a process from /proc (Linux)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+# ---- stand-in bridge ----
+
+async def _python_bridge(arduino_port: int, frontend_port: int):
+    """Same message flow as src/main.rs (SENSOR: -> JSON fan-out), no DB"""
+    clients = set()
+
+    async def frontend(reader, writer):
+        writer.write(json.dumps({'type': 'connection_status', 'arduino_connected': True,
+                                 'backend_connected': True}).encode('utf-8') + b"\n")
+        clients.add(writer)
+        try:
+            while await reader.readline():
+                pass
+        finally:
+            clients.discard(writer)
+
+    async def arduino(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            data = parse_sensor_line(line.decode('utf-8', errors='replace'))
+            if data is None:
+                continue
+            data['timestamp'] = datetime.now(timezone.utc).isoformat()
+            payload = json.dumps(data).encode('utf-8') + b"\n"
+            for client in list(clients):
+                client.write(payload)
+
+    await asyncio.start_server(arduino, '127.0.0.1', arduino_port)
+    await asyncio.start_server(frontend, '127.0.0.1', frontend_port)
+    await asyncio.Event().wait()
+
+
+def run_python_bridge(arduino_port: int, frontend_port: int):
+    asyncio.run(_python_bridge(arduino_port, frontend_port))
+
+
+# ---- driver ----
+
+def split(total: int, parts: int) -> List[int]:
+    parts = max(1, min(parts, total)) if total else 1
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def run_stage(args, rate: float, backend_pid: Optional[int]) -> dict:
+    """One rate stage: subscribers first, then Arduinos, then collect"""
+    context = multiprocessing.get_context('spawn')
+    sub_counts = split(args.subscribers, args.subscriber_procs)
+    ard_counts = split(args.arduinos, args.arduino_procs)
+    listen = args.duration + args.settle + args.drain
+    with ProcessPoolExecutor(max_workers=len(sub_counts) + len(ard_counts),
+                             mp_context=context) as executor:
+        subs = [executor.submit(run_subscribers, n, args.host, args.frontend_port, listen)
+                for n in sub_counts if n]
+        time.sleep(args.settle)
+        backend_cpu = None if backend_pid is None else process_cpu_seconds(backend_pid)
+        wall = time.time()
+        first, ards = 0, []
+        for n in ard_counts:
+            ards.append(executor.submit(run_arduinos, first, n, args.host, args.arduino_port,
+                                        rate, args.duration, args.data_dir, args.replay_from))
+            first += n
+        ard_stats = [f.result() for f in ards]
+        wall = time.time() - wall
+        if backend_cpu is not None:
+            end = process_cpu_seconds(backend_pid)
+            backend_cpu = None if end is None else end - backend_cpu
+        sub_stats = [f.result() for f in subs]
+
+    # Rates over the sending time, not process start-up
+    active = max((s['wall_s'] for s in ard_stats), default=wall) or wall
+    sent = sum(s['sent'] for s in ard_stats)
+    received = sum(s['received'] for s in sub_stats)
+    hist = sum((s['hist'] for s in sub_stats), np.zeros(LATENCY_BINS, dtype=np.int64))
+    expected = sent * args.subscribers
+    result = {
+        'rate_hz': rate,
+        'arduinos': args.arduinos,
+        'subscribers': args.subscribers,
+        'sent': sent,
+        'sent_per_s': sent / active,
+        'delivered': received,
+        'delivered_per_s': received / active,
+        'delivery_ratio': received / expected if expected else 0.0,
+        'dropped': sum(s['dropped'] for s in sub_stats),
+        'reordered': sum(s['reordered'] for s in sub_stats),
+        'disconnects': sum(s['disconnects'] for s in sub_stats),
+        'connect_errors': sum(s['errors'] for s in ard_stats + sub_stats),
+        'latency': latency_percentiles(hist, sum(s['overflow'] for s in sub_stats)),
+        'cpu_percent': {
+            'arduinos': 100.0 * sum(s['cpu_s'] for s in ard_stats) / active,
+            'subscribers': 100.0 * sum(s['cpu_s'] for s in sub_stats) / listen,
+            'backend': None if backend_cpu is None else 100.0 * backend_cpu / wall,
+        },
+    }
+    return result
+
+
+def print_stage(r: dict):
+    lat = r['latency']
+    fmt = lambda v: "-" if v is None else f"{v:.1f}"
+    cpu = r['cpu_percent']
+    print(f"📈 {r['rate_hz']:g} Hz x {r['arduinos']} Arduino(s) -> {r['subscribers']} subscriber(s)")
+    print(f"   sent {r['sent_per_s']:.0f}/s | delivered {r['delivered_per_s']:.0f}/s "
+          f"({r['delivery_ratio'] * 100:.1f}%) | dropped {r['dropped']} | "
+          f"reordered {r['reordered']} | disconnects {r['disconnects']}")
+    print(f"   latency ms p50 {fmt(lat.get('p50_ms'))} p90 {fmt(lat.get('p90_ms'))} "
+          f"p99 {fmt(lat.get('p99_ms'))} p99.9 {fmt(lat.get('p99.9_ms'))}")
+    print(f"   CPU % arduinos {cpu['arduinos']:.0f} | subscribers {cpu['subscribers']:.0f} | "
+          f"backend {fmt(cpu['backend'])}")
+    if r['connect_errors']:
+        print(f"   ⚠️ {r['connect_errors']} client(s) failed to connect")
+
+
+def main():
+    """Load test entry point"""
+    parser = argparse.ArgumentParser(description="AromaSense backend load test")
+    parser.add_argument("--host", default="127.0.0.1", help="backend host")
+    parser.add_argument("--arduino-port", type=int, default=8081)
+    parser.add_argument("--frontend-port", type=int, default=8082)
+    parser.add_argument("--arduinos", type=int, default=1, help="simulated Arduinos")
+    parser.add_argument("--subscribers", type=int, default=1, help="simulated GUI clients")
+    parser.add_argument("--rate", default="4", help="samples/s per Arduino, comma list = stages")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per stage")
+    parser.add_argument("--arduino-procs", type=int, default=1,
+                        help="processes for the Arduinos")
+    parser.add_argument("--subscriber-procs", type=int, default=1,
+                        help="processes for the subscribers")
+    parser.add_argument("--settle", type=float, default=1.0,
+                        help="seconds between subscribers connecting and sending")
+    parser.add_argument("--drain", type=float, default=2.0,
+                        help="seconds subscribers keep reading after sending stops")
+    parser.add_argument("--backend-pid", type=int, help="backend pid for CPU (default: by name)")
+    parser.add_argument("--data-dir", default=DATA_SAVE_PATH, help="captures to replay")
+    parser.add_argument("--replay-from", type=float, metavar="SECONDS",
+                        help="replay each capture from this point in its run")
+    parser.add_argument("--python-bridge", action="store_true",
+                        help="run a Python stand-in for the backend (harness check)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    try:
+        rates = [float(r) for r in args.rate.split(',') if r.strip()]
+    except ValueError:
+        parser.error(f"bad --rate '{args.rate}'")
+    if not rates or min(rates) <= 0:
+        parser.error("rates must be positive")
+
+    bridge = None
+    if args.python_bridge:
+        bridge = multiprocessing.get_context('spawn').Process(
+            target=run_python_bridge, args=(args.arduino_port, args.frontend_port), daemon=True)
+        bridge.start()
+        time.sleep(1.0)
+        backend_pid = bridge.pid
+    else:
+        backend_pid = args.backend_pid or find_backend_pid()
+    if backend_pid is None:
+        print("⚠️ Backend process not found - backend CPU will not be reported")
+
+    results = []
+    try:
+        for rate in rates:
+            result = run_stage(args, rate, backend_pid)
+            print_stage(result)
+            results.append(result)
+    except KeyboardInterrupt:
+        print("🛑 Interrupted")
+    finally:
+        if bridge is not None:
+            bridge.terminate()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.json}")
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,13 +2,24 @@
 
 import sys
 import os
+import argparse
 import traceback
 
 # Add current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+def parse_args():
+    """Profiling flags; anything else is left for Qt"""
+    parser = argparse.ArgumentParser(description="AromaSense Herbal Analysis System")
+    parser.add_argument("--profile", nargs="?", const="sample", choices=("sample", "cprofile"),
+                        help="profile from launch until exit (Tools menu toggles it too)")
+    parser.add_argument("--trace-malloc", action="store_true",
+                        help="trace allocations; snapshots at launch, per run and at exit")
+    return parser.parse_known_args()
+
 def main():
     """Main application entry point"""
+    args, qt_args = parse_args()
     try:
         from PySide6.QtWidgets import QApplication
         from main_window import MainWindow
@@ -17,7 +28,7 @@ def main():
         print("📦 Initializing application...")
         
         # Create QApplication
-        app = QApplication(sys.argv)
+        app = QApplication(sys.argv[:1] + qt_args)
         app.setApplicationName("AromaSense")
         app.setApplicationVersion("1.0.0")
         
@@ -25,7 +36,7 @@ def main():
         
         # Create and show main window
         print("🖼️ Creating main window...")
-        window = MainWindow()
+        window = MainWindow(profile_mode=args.profile, trace_memory=args.trace_malloc)
         window.show()
         
         print("✅ Main window displayed successfully")
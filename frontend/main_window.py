@@ -5,45 +5,63 @@ from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
     QPushButton, QMessageBox, QTabWidget, QTableWidget,
     QTableWidgetItem, QLabel, QGroupBox, QSplitter,
-    QFrame, QProgressBar
+    QFrame, QProgressBar, QFileDialog, QInputDialog, QProgressDialog
 )
-from PySide6.QtCore import QTimer, Qt
-from PySide6.QtGui import QFont
+from PySide6.QtCore import QTimer, Qt, Signal
+from PySide6.QtGui import QFont, QAction, QKeySequence
 
-from gui.widgets import ControlPanel, ConnectionPanel, SensorPlot
+from gui.widgets import ControlPanel, ConnectionPanel, SensorPlot, SpectrogramPlot, PatternPlot
 from gui.styles import STYLESHEET, STATUS_COLORS
+from gui.session_viewer import SessionViewer
 from utils.network_comm import NetworkWorker
+from utils.file_handler import FileHandler, ARCHIVE_EXTENSION
+from utils.exporter import ExportService, export_targets
+from utils.sample_ring import SampleRing
+from utils.session_store import SpillingSessionStore
+from utils.phase_index import PhaseIndex, parse_selection, describe_selection
+from utils.analysis_pool import AnalysisService
+from utils.data_processor import RunningAnalysis
+from utils.protocol import sample_time, missing_sensors, format_rate_command, scale_samples
+from utils.resampler import MonotonicClock
+from utils.spectral import RollingSpectrum
+from utils.correlation import PCAProjector
+from utils.quality import QualityMonitor, QualityWriter, SENTINEL, MISSING, RANGE, describe
+from utils.calibration import CalibrationTable, CalibratedWriter
+from utils.steady_state import HoldEarlyExit
+from utils.alarms import AlarmRules, AlarmMonitor, AlarmsWriter, load_rules, describe_event, ALARMS_SUFFIX
+from utils.profiler import Profiler
 from config.constants import (
     APP_NAME, WINDOW_WIDTH, WINDOW_HEIGHT, 
-    UPDATE_INTERVAL, SENSOR_NAMES, NUM_SENSORS
+    UPDATE_INTERVAL, SENSOR_NAMES, NUM_SENSORS, SENSOR_KEYS,
+    STATE_NAMES, STATE_DONE, NUM_LEVELS, SAMPLE_RING_CAPACITY,
+    ANALYSIS_INTERVAL, ANALYSIS_WORKERS, SPECTRAL_BANDS, DATA_SAVE_PATH,
+    QUALITY_BLOCK, SIMILARITY_TOP_K, CALIBRATION_PROFILE, CALIBRATION_BLOCK,
+    HOLD_EARLY_EXIT, STEADY_BLOCK, STEADY_WINDOW, SPECTRAL_WINDOW, SPECTRAL_HOP,
+    SAMPLE_RATE, INGEST_INTERVAL, EXPORT_FORMATS, EXPORT_ALL_FORMATS, ALARM_BLOCK
 )
 
+import os
 import numpy as np
-import csv
 from datetime import datetime
-from pathlib import Path
-
-# Mapping state dari Arduino
-STATE_NAMES = {
-    0: "IDLE",
-    1: "PRE-COND",
-    2: "RAMP_UP",
-    3: "HOLD", 
-    4: "PURGE",
-    5: "RECOVERY",
-    6: "DONE"
-}
+from typing import Optional
 
 class MainWindow(QMainWindow):
     """Main application window - Modern Layout"""
     
-    def __init__(self):
+    # Results from the analysis pool, re-emitted on the GUI thread
+    analysis_ready = Signal(dict)
+    # Export thread progress (rows, total) and result
+    export_progress = Signal(int, int)
+    export_ready = Signal(dict)
+    
+    def __init__(self, profile_mode: Optional[str] = None, trace_memory: bool = False):
         super().__init__()
         
         # Initialize variables
         self.is_sampling = False
-        self.sampling_data = {i: [] for i in range(NUM_SENSORS)}
-        self.sampling_times = []
+        self.session = SpillingSessionStore()
+        self.phases = PhaseIndex()  # (state, level) segments, built as samples arrive
+        self.sample_rate = SAMPLE_RATE  # Hz, as confirmed by the firmware's RATE header
         self.current_state = "IDLE"
         self.arduino_connected = False
         self.backend_connected = False
@@ -52,6 +70,70 @@ class MainWindow(QMainWindow):
         self.network_worker = None
         self.serial_connection = None 
         
+        # Shared-memory ring fed by the network thread; other processes
+        # (recorders, analysis) can attach to it by name
+        self.sample_ring = SampleRing.create(SAMPLE_RING_CAPACITY)
+        print(f"🧵 Sample ring: {self.sample_ring.name}")
+        self.stats_cursor = None
+        self.reset_statistics()
+        
+        # Rolling spectra of all channels, fed from its own ring cursor
+        self.spectrum = RollingSpectrum(rate_hz=self.sample_rate)
+        self.spectral_cursor = None
+        
+        # Streaming 7x7 covariance and PCA projection against reference runs
+        self.pattern = PCAProjector()
+        self.pattern_cursor = None
+        
+        # Per-channel quality flags, checked in blocks of session rows
+        self.quality = QualityMonitor(interval=1.0 / self.sample_rate)
+        self.pending_missing = []
+        
+        # Raw readings -> ppm through the rig's compiled lookup tables
+        try:
+            self.calibration = CalibrationTable.load(CALIBRATION_PROFILE)
+        except Exception as e:
+            print(f"⚠️ Calibration profile '{CALIBRATION_PROFILE}' unusable, using defaults: {e}")
+            self.calibration = CalibrationTable()
+        self.calibrated = SpillingSessionStore(metadata={'calibration': self.calibration.rig})
+        self.show_ppm = False
+        
+        # Adaptive HOLD: steady-state detector over the streamed session rows
+        self.hold_exit = HoldEarlyExit()
+        self.hold_exit_rows = 0
+        self.hold_exit_block = STEADY_BLOCK
+        self.adaptive_hold = HOLD_EARLY_EXIT
+        
+        # Operator alarm rules, compiled once and evaluated per block of session rows
+        try:
+            rules = AlarmRules(load_rules())
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Alarm rules unusable, alarms disabled: {e}")
+            rules = AlarmRules([])
+        self.alarms = AlarmMonitor(rules)
+        self.alarm_rows = 0
+        self.alarm_block = ALARM_BLOCK
+        
+        # Heavy analysis runs in worker processes, off the GUI thread; each
+        # job carries only the rows added since the previous one
+        self.analysis_service = AnalysisService(max_workers=ANALYSIS_WORKERS)
+        self.analysis_generation = 0
+        self.reset_analysis()
+        self.analysis_ready.connect(self.on_analysis_ready)
+        self.analysis_timer = QTimer(self)
+        self.analysis_timer.timeout.connect(self.request_analysis)
+        self.analysis_timer.start(ANALYSIS_INTERVAL)
+        
+        # Session exports: one read feeds all formats, off the GUI thread
+        self.export_service = ExportService()
+        self.export_progress.connect(self.on_export_progress)
+        self.export_ready.connect(self.on_export_ready)
+        self.export_dialog = None
+        self.export_base = None
+        
+        # Open history viewer windows (kept alive here)
+        self.history_viewers = []
+        
         # Setup UI
         self.setWindowTitle(APP_NAME)
         self.setGeometry(100, 100, WINDOW_WIDTH, WINDOW_HEIGHT)
@@ -78,22 +160,80 @@ class MainWindow(QMainWindow):
         # Status bar
         self.statusBar().showMessage("AromaSense Ready - Herbal Analysis System")
         
+        # On-demand profiling (Tools menu); --profile / --trace-malloc start it at launch
+        self.profiler = Profiler()
+        self.create_tools_menu()
+        if profile_mode:
+            self.toggle_profiler(profile_mode)
+        if trace_memory:
+            self.take_memory_snapshot("launch")
+        
         self.update_interval = UPDATE_INTERVAL
+        # Device / backend timestamps -> session time; falls back to the nominal interval
+        self.clock = MonotonicClock(1.0 / self.sample_rate)
         
         # Setup connection
         self.setup_network_connection()
         
+    def create_tools_menu(self):
+        """Tools menu: CPU profiling and memory snapshots"""
+        menu = self.menuBar().addMenu("🛠️ Tools")
+        for text, shortcut, slot in (
+                ("Start/Stop Sampling Profiler", "Ctrl+Shift+P", lambda: self.toggle_profiler('sample')),
+                ("Start/Stop cProfile (GUI thread)", "Ctrl+Shift+O", lambda: self.toggle_profiler('cprofile')),
+                ("Memory Snapshot (tracemalloc)", "Ctrl+Shift+M", lambda: self.take_memory_snapshot()),
+                ("Stop Memory Tracing", None, self.stop_memory_tracing)):
+            action = QAction(text, self)
+            if shortcut:
+                action.setShortcut(QKeySequence(shortcut))
+            action.triggered.connect(slot)
+            menu.addAction(action)
+    
+    def profile_session_name(self) -> str:
+        return self.session.metadata.get('name') or "idle"
+    
+    def toggle_profiler(self, mode: str = 'sample'):
+        """Start CPU profiling, or stop it and write the results"""
+        try:
+            if self.profiler.active:
+                files = self.profiler.stop()
+                print(f"📊 Profile written: {', '.join(files)}")
+                self.statusBar().showMessage(f"📊 Profile written to {os.path.dirname(files[0])}")
+            else:
+                directory = self.profiler.start(mode, self.profile_session_name())
+                print(f"⏱️ Profiling ({mode}) -> {directory}")
+                self.statusBar().showMessage(f"⏱️ Profiling ({mode}) - press again to stop")
+        except (RuntimeError, ValueError, OSError) as e:
+            QMessageBox.warning(self, "Profiler", f"Could not toggle the profiler: {e}")
+    
+    def take_memory_snapshot(self, label: str = ""):
+        """tracemalloc snapshot, diffed against the previous one"""
+        try:
+            report = self.profiler.snapshot_memory(label, self.profile_session_name())
+            print(f"🧠 Memory snapshot: {report}")
+            self.statusBar().showMessage(f"🧠 Memory snapshot written to {report}")
+        except OSError as e:
+            QMessageBox.warning(self, "Profiler", f"Could not write the snapshot: {e}")
+    
+    def stop_memory_tracing(self):
+        self.profiler.stop_memory()
+        self.statusBar().showMessage("🧠 Memory tracing stopped")
+    
     def setup_network_connection(self):
         """Setup network connection to backend"""
         if self.network_worker:
             self.network_worker.stop()
             self.network_worker.wait()
         
-        self.network_worker = NetworkWorker()
-        self.network_worker.data_received.connect(self.on_data_received)
+        self.network_worker = NetworkWorker(ring=self.sample_ring,
+                                            batch_interval=INGEST_INTERVAL / 1000.0)
+        self.network_worker.data_batch.connect(self.on_data_batch)
+        self.network_worker.sample_rate_changed.connect(self.on_sample_rate_changed)
         self.network_worker.connection_status.connect(self.on_connection_status)
         self.network_worker.error_occurred.connect(self.handle_network_error)
         self.network_worker.arduino_status.connect(self.on_arduino_status)
+        self.network_worker.command_acked.connect(self.on_command_acked)
+        self.network_worker.command_failed.connect(self.on_command_failed)
         self.network_worker.start()
         
     def create_left_sidebar(self):
@@ -161,6 +301,17 @@ class MainWindow(QMainWindow):
         self.arduino_status_label.setStyleSheet("color: #ff6b6b; font-weight: bold;")
         connection_grid.addWidget(self.arduino_status_label, 1, 1)
         
+        connection_grid.addWidget(QLabel("Command:"), 2, 0)
+        self.command_status_label = QLabel("-")
+        self.command_status_label.setStyleSheet("color: #FFFFFF;")
+        connection_grid.addWidget(self.command_status_label, 2, 1)
+        
+        connection_grid.addWidget(QLabel("Alarms:"), 3, 0)
+        self.alarm_status_label = QLabel("-")
+        self.alarm_status_label.setStyleSheet("color: #FFFFFF;")
+        self.alarm_status_label.setWordWrap(True)
+        connection_grid.addWidget(self.alarm_status_label, 3, 1)
+        
         status_layout.addLayout(connection_grid)
         
         # Sensor status
@@ -187,10 +338,18 @@ class MainWindow(QMainWindow):
         quick_group = QGroupBox("Quick Actions")
         quick_layout = QVBoxLayout()
         
-        self.export_btn = QPushButton("📤 Quick Export CSV")
-        self.export_btn.clicked.connect(self.on_export_csv)
+        self.export_btn = QPushButton("📤 Export All Formats")
+        self.export_btn.clicked.connect(self.on_export_all)
         quick_layout.addWidget(self.export_btn)
         
+        self.export_phases_btn = QPushButton("🧩 Export Phases...")
+        self.export_phases_btn.clicked.connect(self.on_export_phases)
+        quick_layout.addWidget(self.export_phases_btn)
+        
+        self.history_btn = QPushButton("📂 Browse Sessions")
+        self.history_btn.clicked.connect(self.on_browse_sessions)
+        quick_layout.addWidget(self.history_btn)
+        
         self.clear_btn = QPushButton("🗑️ Clear All Data")
         self.clear_btn.clicked.connect(self.on_clear_plot)
         quick_layout.addWidget(self.clear_btn)
@@ -213,6 +372,9 @@ class MainWindow(QMainWindow):
         self.control_panel.start_clicked.connect(self.on_start_sampling)
         self.control_panel.stop_clicked.connect(self.on_stop_sampling)
         self.control_panel.save_clicked.connect(self.on_save_data)
+        self.control_panel.units_toggled.connect(self.on_units_toggled)
+        self.control_panel.adaptive_toggled.connect(self.on_adaptive_toggled)
+        self.control_panel.rate_changed.connect(self.on_rate_selected)
         layout.addWidget(self.control_panel)
         
         # Create splitter for plot and data
@@ -220,9 +382,11 @@ class MainWindow(QMainWindow):
         
         # Top: Plot
         plot_group = QGroupBox("Real-Time Herbal Analysis")
-        plot_layout = QVBoxLayout()
+        plot_layout = QHBoxLayout()
         self.plot_widget = SensorPlot("Herbal Volatile Organic Compounds")
-        plot_layout.addWidget(self.plot_widget)
+        plot_layout.addWidget(self.plot_widget, 3)
+        self.spectrogram_widget = SpectrogramPlot()
+        plot_layout.addWidget(self.spectrogram_widget, 2)
         plot_group.setLayout(plot_layout)
         splitter.addWidget(plot_group)
         
@@ -255,6 +419,46 @@ class MainWindow(QMainWindow):
         info_tab.setLayout(info_layout)
         data_tabs.addTab(info_tab, "📋 Sample Info")
         
+        # Tab 3: Per-level response features from the analysis pool
+        analysis_tab = QWidget()
+        analysis_layout = QVBoxLayout()
+        self.analysis_label = QLabel("Waiting for data...")
+        analysis_layout.addWidget(self.analysis_label)
+        self.analysis_table = QTableWidget(NUM_LEVELS, NUM_SENSORS + 1)
+        self.analysis_table.setHorizontalHeaderLabels(["Level"] + list(SENSOR_NAMES))
+        self.populate_analysis_table()
+        analysis_layout.addWidget(self.analysis_table)
+        analysis_layout.addWidget(QLabel("HOLD band power (mean over fan levels)"))
+        self.band_table = QTableWidget(len(SPECTRAL_BANDS), NUM_SENSORS + 1)
+        self.band_table.setHorizontalHeaderLabels(["Band"] + list(SENSOR_NAMES))
+        self.populate_band_table()
+        analysis_layout.addWidget(self.band_table)
+        analysis_layout.addWidget(QLabel("Most similar earlier runs (after the run ends)"))
+        self.similar_table = QTableWidget(SIMILARITY_TOP_K, 4)
+        self.similar_table.setHorizontalHeaderLabels(
+            ["Session", "Type", "Feature Dist", "DTW Dist"])
+        self.similar_table.setColumnWidth(0, 260)
+        analysis_layout.addWidget(self.similar_table)
+        analysis_tab.setLayout(analysis_layout)
+        data_tabs.addTab(analysis_tab, "🧪 Analysis")
+        
+        # Tab 4: Cross-sensor correlation and PCA scatter
+        pattern_tab = QWidget()
+        pattern_layout = QHBoxLayout()
+        self.correlation_table = QTableWidget(NUM_SENSORS, NUM_SENSORS)
+        self.correlation_table.setHorizontalHeaderLabels(list(SENSOR_NAMES))
+        self.correlation_table.setVerticalHeaderLabels(list(SENSOR_NAMES))
+        pattern_layout.addWidget(self.correlation_table, 1)
+        pattern_side = QVBoxLayout()
+        self.pattern_plot = PatternPlot()
+        pattern_side.addWidget(self.pattern_plot)
+        self.references_btn = QPushButton("📚 Load Reference Sessions")
+        self.references_btn.clicked.connect(self.on_load_references)
+        pattern_side.addWidget(self.references_btn)
+        pattern_layout.addLayout(pattern_side, 1)
+        pattern_tab.setLayout(pattern_layout)
+        data_tabs.addTab(pattern_tab, "🧭 Pattern")
+        
         splitter.addWidget(data_tabs)
         splitter.setSizes([500, 200])
         
@@ -274,6 +478,18 @@ class MainWindow(QMainWindow):
             self.info_table.setItem(row, 0, QTableWidgetItem(key))
             self.info_table.setItem(row, 1, QTableWidgetItem(value))
     
+    def populate_analysis_table(self):
+        for level in range(NUM_LEVELS):
+            self.analysis_table.setItem(level, 0, QTableWidgetItem(f"Level {level+1}"))
+            for col in range(1, NUM_SENSORS + 1):
+                self.analysis_table.setItem(level, col, QTableWidgetItem("-"))
+    
+    def populate_band_table(self):
+        for row, (lo, hi) in enumerate(SPECTRAL_BANDS):
+            self.band_table.setItem(row, 0, QTableWidgetItem(f"{lo:g}-{hi:g} Hz"))
+            for col in range(1, NUM_SENSORS + 1):
+                self.band_table.setItem(row, col, QTableWidgetItem("-"))
+    
     def populate_stats_table(self):
         for row in range(NUM_SENSORS):
             sensor_name = SENSOR_NAMES[row] if row < len(SENSOR_NAMES) else f"Sensor {row+1}"
@@ -325,11 +541,16 @@ class MainWindow(QMainWindow):
             self.connection_panel.connect_btn.setText("Connecting...")
             
             # Create new network worker with settings
-            self.network_worker = NetworkWorker(host=settings['host'], port=settings['port'])
-            self.network_worker.data_received.connect(self.on_data_received)
+            self.network_worker = NetworkWorker(host=settings['host'], port=settings['port'],
+                                                ring=self.sample_ring,
+                                                batch_interval=INGEST_INTERVAL / 1000.0)
+            self.network_worker.data_batch.connect(self.on_data_batch)
+            self.network_worker.sample_rate_changed.connect(self.on_sample_rate_changed)
             self.network_worker.connection_status.connect(self.on_connection_status)
             self.network_worker.error_occurred.connect(self.handle_network_error)
             self.network_worker.arduino_status.connect(self.on_arduino_status)
+            self.network_worker.command_acked.connect(self.on_command_acked)
+            self.network_worker.command_failed.connect(self.on_command_failed)
             self.network_worker.start()
 
             # Setup serial connection for motor control
@@ -407,10 +628,34 @@ class MainWindow(QMainWindow):
     def send_arduino_command(self, command: str):
         """Send command to Arduino via backend"""
         if self.network_worker and self.backend_connected:
-            self.network_worker.send_command(command)
-            print(f"📤 Command sent to Arduino: {command}")
+            if self.network_worker.send_command(command):
+                self.command_status_label.setText(f"⏳ {command}")
+                self.command_status_label.setStyleSheet("color: #FFD166;")
         else:
             print(f"⚠️ Cannot send command: Backend not connected")
+    
+    def on_command_acked(self, event: dict):
+        """Show the acknowledgement and its round-trip time"""
+        if event['stage'] == 'backend':
+            self.command_status_label.setText(
+                f"⏳ {event['command']} (backend {event['backend_ms']:.0f} ms)")
+            return
+        stats = self.network_worker.commands.summary() if self.network_worker else {'count': 0}
+        text = f"✔ {event['command']} {event['status']} in {event['rtt_ms']:.0f} ms"
+        if stats['count'] > 1:
+            text += f" (avg {stats['mean_ms']:.0f} ms)"
+        color = "#90EE90" if event['status'] == 'OK' else "#FFD166"
+        self.command_status_label.setText(text)
+        self.command_status_label.setStyleSheet(f"color: {color};")
+        print(f"✅ Arduino ack {event['command']}: {event['status']} "
+              f"({event['rtt_ms']:.0f} ms, {event['attempts']} attempt(s))")
+    
+    def on_command_failed(self, event: dict):
+        self.command_status_label.setText(f"✖ {event['command']} {event['status']}")
+        self.command_status_label.setStyleSheet("color: #ff6b6b;")
+        self.statusBar().showMessage(
+            f"❌ Command {event['command']} failed: {event['status']} "
+            f"after {event['attempts']} attempt(s)")
 
     def on_start_sampling(self):
         """Handle start sampling"""
@@ -422,6 +667,10 @@ class MainWindow(QMainWindow):
         if not sample_info['name'] or sample_info['name'] == "Unnamed Sample":
             QMessageBox.warning(self, "Warning", "Please enter a sample name!")
             return
+        if self.export_service.busy:
+            QMessageBox.warning(self, "Warning", "An export is still running. Wait for it or cancel it.")
+            return
+        rate_hz = self.control_panel.get_sample_rate()
         
         # Update info table
         self.info_table.setItem(0, 1, QTableWidgetItem(sample_info['name']))
@@ -429,12 +678,25 @@ class MainWindow(QMainWindow):
         self.info_table.setItem(5, 1, QTableWidgetItem("Analyzing..."))
         
         # Reset data
-        self.sampling_data = {i: [] for i in range(NUM_SENSORS)}
-        self.sampling_times = []
+        self.session.close()
+        self.calibrated.close()
+        self.session = SpillingSessionStore(metadata=dict(sample_info, calibration=self.calibration.rig))
+        self.calibrated = SpillingSessionStore(metadata=self.session.metadata)
+        self.set_sample_rate(rate_hz)
+        self.tune_to_sample_rate()
+        self.phases = PhaseIndex()
         self.plot_widget.clear_data()
+        self.reset_statistics()
+        self.stats_cursor = self.sample_ring.cursor()
+        self.spectral_cursor = self.sample_ring.cursor()
+        self.pattern.reset()
+        self.pattern_cursor = self.sample_ring.cursor()
+        self.pattern_plot.clear_data()
+        self.reset_alarms()
         
         self.is_sampling = True
         self.start_time = 0
+        self.clock.reset()
         
         self.control_panel.enable_start(False)
         self.control_panel.enable_stop(True)
@@ -442,71 +704,133 @@ class MainWindow(QMainWindow):
         # Update system status
         self.update_system_status("PRE-COND", 10)
         
-        # Send start command to Arduino
+        # Send the session's rate, then the start command to Arduino
+        self.send_arduino_command(format_rate_command(rate_hz))
         self.send_arduino_command("START_SAMPLING")
+        if self.profiler.tracing_memory:
+            self.profiler.begin_memory_session(sample_info['name'])
+            self.take_memory_snapshot("start")
         
         self.statusBar().showMessage("🔬 Herbal Analysis Started - Sampling in Progress")
         self.connection_panel.set_status("Sampling...", STATUS_COLORS['sampling'])
     
     def on_data_received(self, data: dict):
-        """Handle data received from Backend"""
+        """Handle one sample received from Backend"""
+        self.on_data_batch([data])
+
+    def on_data_batch(self, batch: list):
+        """Handle the samples received from Backend since the last batch"""
         try:
             # Extract sensor values from JSON data
-            sensor_values = [
-                float(data.get('no2', 0.0)),
-                float(data.get('eth', 0.0)), 
-                float(data.get('voc', 0.0)),
-                float(data.get('co', 0.0)),
-                float(data.get('co_mics', 0.0)),
-                float(data.get('eth_mics', 0.0)),
-                float(data.get('voc_mics', 0.0))
-            ]
+            values = np.array([[float(data.get(key, 0.0)) for key in SENSOR_KEYS] for data in batch])
+            states = np.array([int(data.get('state', 0)) for data in batch], dtype=np.int64)
+            levels = np.array([int(data.get('level', 0)) for data in batch], dtype=np.int64)
             
-            state_idx = int(data.get('state', 0))
+            state_idx = int(states[-1])
             state_name = STATE_NAMES.get(state_idx, "UNKNOWN")
-            level = data.get('level', 0)
+            level = int(levels[-1])
             
             # Update system status
             progress = int((state_idx / 6) * 100) if state_idx <= 6 else 100
             self.update_system_status(state_name, progress)
             
             # Update status bar
-            self.statusBar().showMessage(f"🔬 {state_name} | Level: {level+1}/5 | Points: {len(self.sampling_times)}")
+            self.statusBar().showMessage(f"🔬 {state_name} | Level: {level+1}/5 | Points: {len(self.session)}")
             
             if self.is_sampling:
-                self.process_new_data(sensor_values)
+                # Rows after a DONE belong to no run
+                done = np.flatnonzero(states == STATE_DONE)
+                end = int(done[0]) + 1 if len(done) else len(batch)
+                self.process_new_block([sample_time(data) for data in batch[:end]],
+                                       values[:end], states[:end], levels[:end],
+                                       [missing_sensors(data) for data in batch[:end]])
                 
                 # Auto-stop when done
-                if state_idx == 6: # DONE
+                if len(done):
                     self.on_stop_sampling()
-                    self.info_table.setItem(5, 1, QTableWidgetItem("✅ Excellent"))
+                    self.info_table.setItem(5, 1, QTableWidgetItem(self.quality_rating()))
                     QMessageBox.information(self, "Analysis Complete", 
                                          "Herbal analysis completed successfully!\n\n"
                                          f"Sample: {self.control_panel.get_sample_info()['name']}\n"
-                                         f"Data Points: {len(self.sampling_times)}")
+                                         f"Data Points: {len(self.session)}")
                     
         except Exception as e:
             print(f"❌ Error parsing data: {e}")
 
-    def process_new_data(self, sensor_values: list):
+    def process_new_data(self, sensor_values: list, state: int = 0, level: int = 0,
+                         timestamp: Optional[float] = None, missing: Optional[list] = None):
         """Process new sensor data"""
-        if not self.sampling_times:
-            self.start_time = 0.0
-        else:
-            self.start_time += self.update_interval / 1000.0
-            
-        self.plot_widget.add_data_point(self.start_time, sensor_values)
+        self.process_new_block([timestamp], np.array([sensor_values], dtype=np.float64),
+                               np.array([state]), np.array([level]),
+                               [missing or [False] * NUM_SENSORS])
+
+    def process_new_block(self, timestamps: list, values: np.ndarray, states: np.ndarray,
+                          levels: np.ndarray, missing: list):
+        """Process a block of new samples with one pass of every display stage"""
+        times = np.array([self.clock.stamp(t) for t in timestamps])
+        self.start_time = float(times[-1])
+        
+        if not self.show_ppm:
+            self.plot_widget.append_block(times, values)
         
         # Save data
-        for i, val in enumerate(sensor_values[:NUM_SENSORS]):
-            self.sampling_data[i].append(val)
-        self.sampling_times.append(self.start_time)
+        self.session.append_block(times, values, states, levels)
+        self.phases.extend(states, levels)
+        self.pending_missing.extend(missing)
         
         # Update info table
-        self.info_table.setItem(3, 1, QTableWidgetItem(str(len(self.sampling_times))))
+        self.info_table.setItem(3, 1, QTableWidgetItem(str(len(self.session))))
         self.info_table.setItem(4, 1, QTableWidgetItem(f"{self.start_time:.2f} s"))
         
         self.update_statistics()
+        self.update_spectrum()
+        self.update_pattern()
+        self.update_quality()
+        self.update_calibration()
+        self.update_hold_exit()
+        self.update_alarms()
+
+    def on_rate_selected(self, rate_hz: float):
+        """Send a newly selected rate at once; Start sends it again"""
+        if self.arduino_connected and not self.is_sampling:
+            self.send_arduino_command(format_rate_command(rate_hz))
+
+    def on_sample_rate_changed(self, rate_hz: float):
+        """Rate reported by the firmware (RATE header) or by the backend on connect
+
+        Applies to the next session; a finished session keeps the rate it
+        was recorded at. The confirmation of a run's own rate arrives
+        before its first sample and re-tunes that run.
+        """
+        if rate_hz <= 0 or rate_hz == self.sample_rate:
+            return
+        if self.is_sampling and len(self.session):
+            print(f"⚠️ Sample rate changed to {rate_hz:g} Hz during a run - ignored")
+            return
+        self.set_sample_rate(rate_hz)
+        if self.is_sampling:
+            self.tune_to_sample_rate()
+        self.statusBar().showMessage(f"⏱️ Sample rate: {rate_hz:g} Hz")
+
+    def set_sample_rate(self, rate_hz: float):
+        """Rate of the next session's samples"""
+        self.sample_rate = float(rate_hz)
+        self.clock.fallback_step = 1.0 / self.sample_rate
+
+    def tune_to_sample_rate(self):
+        """Re-tune every stage that counts samples for the session being started"""
+        self.session.metadata['sample_rate_hz'] = self.sample_rate
+        self.quality = QualityMonitor(interval=1.0 / self.sample_rate)
+        self.pending_missing = []
+        self.spectrum = RollingSpectrum(rate_hz=self.sample_rate,
+                                        length=scale_samples(SPECTRAL_WINDOW, self.sample_rate),
+                                        hop=scale_samples(SPECTRAL_HOP, self.sample_rate))
+        self.spectrogram_widget.clear_data()
+        self.hold_exit = HoldEarlyExit(window=scale_samples(STEADY_WINDOW, self.sample_rate))
+        self.hold_exit_rows = 0
+        self.hold_exit_block = scale_samples(STEADY_BLOCK, self.sample_rate)
+        self.alarm_block = scale_samples(ALARM_BLOCK, self.sample_rate)
+        self.reset_analysis()
 
     def on_stop_sampling(self):
         """Handle stop sampling"""
@@ -514,60 +838,332 @@ class MainWindow(QMainWindow):
         
         # Send stop command to Arduino
         self.send_arduino_command("STOP_SAMPLING")
+        if self.profiler.tracing_memory:
+            self.take_memory_snapshot("stop")
         
         self.control_panel.enable_start(True)
         self.control_panel.enable_stop(False)
         self.connection_panel.set_status("Connected", STATUS_COLORS['connected'])
         self.update_system_status("IDLE", 0)
         
-        points_count = len(self.sampling_times)
+        points_count = len(self.session)
+        self.update_quality(force=True)
+        self.update_calibration(force=True)
+        self.update_alarms(force=True)
+        self.request_analysis(force=True)
         self.statusBar().showMessage(f"⏹️ Analysis stopped. Collected {points_count} data points.")
     
+    def reset_statistics(self):
+        """Reset running statistics accumulators"""
+        self.stats_count = 0
+        self.stats_min = np.full(NUM_SENSORS, np.inf)
+        self.stats_max = np.full(NUM_SENSORS, -np.inf)
+        self.stats_sum = np.zeros(NUM_SENSORS)
+        self.stats_sumsq = np.zeros(NUM_SENSORS)
+    
     def update_statistics(self):
-        """Update statistics table"""
+        """Update statistics table from new records in the sample ring"""
+        if self.stats_cursor is None:
+            return
+        block = self.stats_cursor.read_all()
+        if len(block) == 0:
+            return
+        
+        values = block['sensors'].astype(np.float64)
+        self.stats_count += len(values)
+        self.stats_min = np.minimum(self.stats_min, values.min(axis=0))
+        self.stats_max = np.maximum(self.stats_max, values.max(axis=0))
+        self.stats_sum += values.sum(axis=0)
+        self.stats_sumsq += (values * values).sum(axis=0)
+        
+        mean = self.stats_sum / self.stats_count
+        std = np.sqrt(np.maximum(self.stats_sumsq / self.stats_count - mean * mean, 0.0))
         for sensor_id in range(NUM_SENSORS):
-            if self.sampling_data[sensor_id]:
-                data = np.array(self.sampling_data[sensor_id])
-                self.stats_table.setItem(sensor_id, 1, QTableWidgetItem(f"{data.min():.2f}"))
-                self.stats_table.setItem(sensor_id, 2, QTableWidgetItem(f"{data.max():.2f}"))
-                self.stats_table.setItem(sensor_id, 3, QTableWidgetItem(f"{data.mean():.2f}"))
-                self.stats_table.setItem(sensor_id, 4, QTableWidgetItem(f"{data.std():.2f}"))
-    
-    def on_save_data(self):
-        """Save data to CSV file"""
-        if not self.sampling_times:
+            self.stats_table.setItem(sensor_id, 1, QTableWidgetItem(f"{self.stats_min[sensor_id]:.2f}"))
+            self.stats_table.setItem(sensor_id, 2, QTableWidgetItem(f"{self.stats_max[sensor_id]:.2f}"))
+            self.stats_table.setItem(sensor_id, 3, QTableWidgetItem(f"{mean[sensor_id]:.2f}"))
+            self.stats_table.setItem(sensor_id, 4, QTableWidgetItem(f"{std[sensor_id]:.2f}"))
+    
+    def update_spectrum(self):
+        """Advance the rolling spectra with new ring records (one FFT batch per call)"""
+        if self.spectral_cursor is None:
+            return
+        block = self.spectral_cursor.read_all()
+        if len(block) and self.spectrum.push(block['sensors']):
+            self.spectrogram_widget.update_spectrum(self.spectrum)
+    
+    def update_pattern(self):
+        """Fold new ring records into the covariance and refresh the PCA view"""
+        if self.pattern_cursor is None:
+            return
+        block = self.pattern_cursor.read_all()
+        if not len(block):
+            return
+        self.pattern.push(block['sensors'])
+        self.pattern_plot.update_projection(self.pattern)
+        corr = self.pattern.live.correlation()
+        for row in range(NUM_SENSORS):
+            for col in range(NUM_SENSORS):
+                self.correlation_table.setItem(row, col, QTableWidgetItem(f"{corr[row, col]:+.2f}"))
+    
+    def on_load_references(self):
+        """Fix the PCA axes on recorded sessions, labelled by herbal type"""
+        filenames, _ = QFileDialog.getOpenFileNames(
+            self, "Reference Sessions", DATA_SAVE_PATH,
+            "Sessions (*.csv *.aroma);;CSV (*.csv);;AromaSense Archive (*.aroma)")
+        if not filenames:
+            return
+        sessions = {}
+        for filename in filenames:
+            try:
+                if filename.endswith(ARCHIVE_EXTENSION):
+                    store = FileHandler.load_archive(filename)
+                else:
+                    store = FileHandler.load_session_csv(filename)
+            except Exception as e:
+                print(f"⚠️ Skipping reference {filename}: {e}")
+                continue
+            if store is None or not len(store):
+                continue
+            label = store.metadata.get('type', 'Unknown')
+            if label == 'Unknown':
+                label = os.path.splitext(os.path.basename(filename))[0]
+            # Several runs of one herb pool into one reference cloud
+            previous = sessions.get(label)
+            sessions[label] = store.values if previous is None else np.concatenate((previous, store.values))
+        if not sessions:
+            QMessageBox.warning(self, "Warning", "No usable reference sessions selected.")
+            return
+        self.pattern.set_references(sessions)
+        self.pattern_plot.set_references(self.pattern.references)
+        self.pattern_plot.update_projection(self.pattern)
+        self.statusBar().showMessage(f"📚 Loaded {len(sessions)} reference pattern(s)")
+    
+    def update_quality(self, force: bool = False):
+        """Check new session rows in one block and show per-channel health"""
+        start = len(self.quality)
+        if len(self.session) - start < (1 if force else QUALITY_BLOCK):
+            return
+        times, values, _, _ = self.session.select(start)
+        mask = self.quality.check(times, values, np.array(self.pending_missing, dtype=bool))
+        self.pending_missing = []
+        flags = np.bitwise_or.reduce(mask, axis=0)
+        for i in range(NUM_SENSORS):
+            if flags[i] & (SENTINEL | MISSING | RANGE):
+                text, color = f"✖ {describe(int(flags[i]))}", "#ff6b6b"
+            elif flags[i]:
+                text, color = f"⚠ {describe(int(flags[i]))}", "#FFD166"
+            else:
+                text, color = "● Active", "#90EE90"
+            self.sensor_status_labels[i].setText(text)
+            self.sensor_status_labels[i].setStyleSheet(f"color: {color}; font-weight: bold;")
+        self.info_table.setItem(5, 1, QTableWidgetItem(self.quality_rating()))
+    
+    def update_calibration(self, force: bool = False):
+        """Convert new session rows to ppm in one lookup-table pass"""
+        start = len(self.calibrated)
+        if len(self.session) - start < (1 if force else CALIBRATION_BLOCK):
+            return
+        times, values, states, levels = self.session.select(start)
+        ppm = self.calibration.apply(values)
+        self.calibrated.append_block(times, ppm, states, levels)
+        if self.show_ppm:
+            self.plot_widget.append_block(times, ppm)
+    
+    def on_units_toggled(self, show_ppm: bool):
+        """Switch the live plot between raw readings and calibrated ppm"""
+        self.show_ppm = show_ppm
+        if show_ppm:
+            self.update_calibration(force=True)
+            self.plot_widget.set_units(f"Concentration (ppm, {self.calibration.rig})")
+            self.plot_widget.set_blocks(self.calibrated.iter_blocks())
+        else:
+            self.plot_widget.set_units("Sensor Reading")
+            self.plot_widget.set_blocks(self.session.iter_blocks())
+    
+    def update_hold_exit(self):
+        """Check new rows for a steady HOLD and ask the firmware to move on"""
+        start = self.hold_exit_rows
+        if len(self.session) - start < self.hold_exit_block:
+            return
+        self.hold_exit_rows = len(self.session)
+        advance = self.hold_exit.push(*self.session.select(start))
+        if not self.adaptive_hold:
+            return
+        for level in advance:
+            self.send_arduino_command(HoldEarlyExit.command(level))
+            held = self.hold_exit.exits[-1][1]
+            self.statusBar().showMessage(
+                f"⏩ Level {level+1} steady after {held:.0f} s of HOLD - advancing to PURGE")
+    
+    def update_alarms(self, force: bool = False):
+        """Evaluate every alarm rule over the new rows in one block"""
+        start = self.alarm_rows
+        if len(self.session) - start < (1 if force else self.alarm_block):
+            return
+        self.alarm_rows = len(self.session)
+        events = self.alarms.push(*self.session.select(start))
+        for event in events:
+            message = describe_event(event)
+            print(f"🚨 {message}")
+            self.statusBar().showMessage(f"🚨 {message}")
+        active = self.alarms.active
+        self.alarm_status_label.setText("🚨 " + ", ".join(active) if active else "-")
+        self.alarm_status_label.setStyleSheet(
+            f"color: {'#ff6b6b' if active else '#FFFFFF'}; font-weight: bold;")
+    
+    def reset_alarms(self):
+        self.alarms.reset()
+        self.alarm_rows = 0
+        self.alarm_status_label.setText("-")
+        self.alarm_status_label.setStyleSheet("color: #FFFFFF;")
+    
+    def on_adaptive_toggled(self, enabled: bool):
+        self.adaptive_hold = enabled
+    
+    def quality_rating(self) -> str:
+        flagged = self.quality.flagged_fraction() * 100
+        if flagged < 1:
+            return f"✅ Excellent ({flagged:.1f}% flagged)"
+        if flagged < 5:
+            return f"⚠️ Fair ({flagged:.1f}% flagged)"
+        return f"❌ Poor ({flagged:.1f}% flagged)"
+    
+    def reset_analysis(self):
+        """Start a new running analysis; jobs still in flight are discarded"""
+        self.analysis = RunningAnalysis(rate_hz=self.sample_rate)
+        self.analysis_generation += 1
+    
+    def request_analysis(self, force: bool = False):
+        """Hand the rows added since the last job to the analysis pool (one job in flight)"""
+        if not len(self.session) or self.analysis_service.pending:
+            return
+        if not (self.is_sampling or force):
+            return
+        if self.is_sampling and self.analysis.num_rows == len(self.session):
+            return
+        tasks, store = ('segmentation', 'features', 'spectral'), None
+        if not self.is_sampling:
+            # Finished run: compare against the recorded catalog (cached there)
+            tasks, store = tasks + ('similarity',), self.session
+        generation = self.analysis_generation
+        try:
+            self.analysis_service.push(
+                self.analysis, self.session.select(self.analysis.num_rows), tasks=tasks,
+                params={'catalog': DATA_SAVE_PATH}, store=store,
+                callback=lambda result: self.analysis_ready.emit(dict(result, generation=generation)))
+        except Exception as e:
+            print(f"⚠️ Analysis submit failed: {e}")
+    
+    def on_analysis_ready(self, result: dict):
+        """Show compact analysis results"""
+        if result['generation'] != self.analysis_generation:
+            return  # a job of an earlier session
+        if 'error' in result:
+            print(f"⚠️ Analysis error: {result['error']}")
+            return
+        self.analysis = result['analysis']
+        features = np.asarray(result['features'], dtype=np.float64)
+        for level in range(min(NUM_LEVELS, len(features))):
+            for sensor_id in range(NUM_SENSORS):
+                value = features[level, 0, sensor_id]
+                text = "-" if np.isnan(value) else f"{value:+.3f}"
+                self.analysis_table.setItem(level, sensor_id + 1, QTableWidgetItem(text))
+        if 'spectral' in result:
+            with np.errstate(all='ignore'):
+                powers = np.nanmean(np.asarray(result['spectral'], dtype=np.float64), axis=0)
+            for row in range(min(len(SPECTRAL_BANDS), len(powers))):
+                for sensor_id in range(NUM_SENSORS):
+                    value = powers[row, sensor_id]
+                    text = "-" if np.isnan(value) else f"{value:.3g}"
+                    self.band_table.setItem(row, sensor_id + 1, QTableWidgetItem(text))
+        if 'similarity' in result:
+            self.similar_table.clearContents()
+            for row, match in enumerate(result['similarity'][:SIMILARITY_TOP_K]):
+                dtw = match['dtw_distance']
+                for col, text in enumerate((match['file'], match['label'],
+                                            f"{match['feature_distance']:.3f}",
+                                            "-" if dtw is None else f"{dtw:.3f}")):
+                    self.similar_table.setItem(row, col, QTableWidgetItem(text))
+        self.analysis_label.setText(
+            f"Mean HOLD response above baseline | {result['num_points']} points | "
+            f"{len(result['segmentation'])} phase segments")
+        if not self.is_sampling and 'similarity' not in result:
+            # The final request was skipped while a periodic job was in flight
+            self.request_analysis(force=True)
+    
+    def on_save_data(self, formats=None):
+        """Export the session to CSV plus an archive copy (or ``formats``) in one pass"""
+        if not len(self.session):
             QMessageBox.warning(self, "Warning", "No herbal data to save!")
             return
+        if self.export_service.busy:
+            self.statusBar().showMessage("⏳ An export is already running")
+            return
         
         sample_info = self.control_panel.get_sample_info()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"data/{sample_info['name'].replace(' ', '_')}_{timestamp}.csv"
+        self.export_base = f"data/{sample_info['name'].replace(' ', '_')}_{timestamp}"
+        targets = export_targets(self.export_base, formats or EXPORT_FORMATS)
+        metadata = dict(self.session.metadata, **sample_info)
+        metadata['sample_rate_hz'] = self.session.metadata.get('sample_rate_hz', self.sample_rate)
+        # A recording session keeps growing and spilling; export a snapshot of it
+        store = self.session.snapshot() if self.is_sampling else self.session
+        # Bring the monitors up to the snapshot; the export thread writes their sidecars
+        self.update_quality(force=True)
+        self.update_alarms(force=True)
+        metadata['alarms'] = list(self.alarms.events)
+        sidecars = {}
+        if 'csv' in targets:
+            sidecars['quality'] = QualityWriter(self.export_base + ".quality.npz",
+                                                self.quality, len(store))
+            sidecars['ppm'] = CalibratedWriter(self.export_base + ".ppm.npz", self.calibration)
+            if len(self.alarms.rules):
+                sidecars['alarms'] = AlarmsWriter(self.export_base + ALARMS_SUFFIX, self.alarms)
         
+        self.export_dialog = QProgressDialog(
+            f"Exporting {len(store)} samples as {', '.join(targets)}...", "Cancel", 0, 1000, self)
+        self.export_dialog.setWindowTitle("Export")
+        self.export_dialog.setMinimumDuration(300)
+        self.export_dialog.canceled.connect(self.export_service.cancel)
+        self.control_panel.save_btn.setEnabled(False)
+        self.export_btn.setEnabled(False)
         try:
-            Path("data").mkdir(exist_ok=True)
-            with open(filename, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(["AromaSense Herbal Analysis Data"])
-                writer.writerow(["Sample Name", sample_info['name']])
-                writer.writerow(["Herbal Type", sample_info['type']])
-                writer.writerow(["Export Date", datetime.now().isoformat()])
-                writer.writerow(["Analysis Mode", "Auto FSM"])
-                writer.writerow(["Total Data Points", len(self.sampling_times)])
-                writer.writerow(["Final Duration", f"{self.start_time:.2f} s"])
-                writer.writerow([])
-                headers = ["Time (s)"] + [SENSOR_NAMES[i] for i in range(NUM_SENSORS)]
-                writer.writerow(headers)
-                for t_idx, t in enumerate(self.sampling_times):
-                    row = [f"{t:.3f}"]
-                    for s_idx in range(NUM_SENSORS):
-                        if t_idx < len(self.sampling_data[s_idx]):
-                            row.append(f"{self.sampling_data[s_idx][t_idx]:.2f}")
-                        else:
-                            row.append("0")
-                    writer.writerow(row)
-            QMessageBox.information(self, "Export Successful", f"Herbal data exported to:\n{filename}")
+            self.export_service.submit(store, targets, metadata,
+                                       progress=self.export_progress.emit,
+                                       callback=self.export_ready.emit, sidecars=sidecars)
         except Exception as e:
-            QMessageBox.critical(self, "Export Error", f"Failed to save data: {str(e)}")
+            self.on_export_ready({'error': str(e)})
+    
+    def on_export_progress(self, rows: int, total: int):
+        if self.export_dialog is not None and total:
+            self.export_dialog.setValue(int(1000 * rows / total))
+    
+    def on_export_ready(self, result: dict):
+        """Close the progress dialog and report the written files"""
+        if self.export_dialog is not None:
+            self.export_dialog.canceled.disconnect(self.export_service.cancel)
+            self.export_dialog.close()
+            self.export_dialog = None
+        self.control_panel.save_btn.setEnabled(True)
+        self.export_btn.setEnabled(True)
+        if 'error' in result:
+            QMessageBox.critical(self, "Export Error", f"Failed to save data: {result['error']}")
+            return
+        if result['cancelled']:
+            self.statusBar().showMessage("⏹️ Export cancelled - files removed")
+            return
+        
+        files = list(result['files'].values())
+        if result['errors']:
+            failed = "\n".join(f"{fmt}: {error}" for fmt, error in result['errors'].items())
+            QMessageBox.critical(self, "Export Error",
+                                 f"Some formats failed:\n{failed}\n\nWritten:\n" + "\n".join(files))
+            return
+        print(f"💾 Exported {result['num_points']} samples to {len(result['files'])} file(s) "
+              f"in {result['elapsed']:.2f} s")
+        QMessageBox.information(self, "Export Successful",
+                                "Herbal data exported to:\n" + "\n".join(files))
     
     def on_clear_plot(self):
         """Clear all plot data"""
@@ -575,17 +1171,80 @@ class MainWindow(QMainWindow):
                                    "Clear all herbal analysis data?\nThis action cannot be undone.", 
                                    QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
+            if self.export_service.busy:
+                QMessageBox.warning(self, "Warning", "An export is still running. Wait for it or cancel it.")
+                return
             self.plot_widget.clear_data()
-            self.sampling_data = {i: [] for i in range(NUM_SENSORS)}
-            self.sampling_times = []
+            self.clock.reset()
+            self.session.close()
+            self.calibrated.close()
+            self.session = SpillingSessionStore()
+            self.calibrated = SpillingSessionStore(metadata={'calibration': self.calibration.rig})
+            self.phases = PhaseIndex()
+            self.stats_cursor = None
+            self.reset_statistics()
+            self.spectral_cursor = None
+            self.spectrum.reset()
+            self.spectrogram_widget.clear_data()
+            self.pattern_cursor = None
+            self.pattern.reset()
+            self.pattern_plot.clear_data()
+            self.quality.reset()
+            self.pending_missing = []
+            self.reset_alarms()
+            self.reset_analysis()
             self.populate_info_table()
             self.populate_stats_table()
+            self.populate_analysis_table()
+            self.populate_band_table()
+            self.similar_table.clearContents()
             self.update_system_status("IDLE", 0)
             self.statusBar().showMessage("✅ All data cleared - Ready for new analysis")
     
-    def on_export_csv(self):
-        """Quick export CSV"""
-        self.on_save_data()
+    def on_browse_sessions(self):
+        """Open recorded sessions in the paged history viewer"""
+        viewer = SessionViewer.open_dialog(self)
+        if viewer:
+            self.history_viewers.append(viewer)
+    
+    def on_export_all(self):
+        """Export the session to every format (CSV, archive, JSON, ML windows)"""
+        self.on_save_data(EXPORT_ALL_FORMATS)
+    
+    def on_export_phases(self):
+        """Export only selected FSM phases of the current session"""
+        if not len(self.session):
+            QMessageBox.warning(self, "Warning", "No herbal data to export!")
+            return
+        text, ok = QInputDialog.getText(
+            self, "Export Phases", "Phases to export (e.g. HOLD:3, PURGE; levels 1-5):",
+            text="HOLD")
+        if not ok or not text.strip():
+            return
+        try:
+            selection = parse_selection(text)
+        except ValueError as e:
+            QMessageBox.warning(self, "Warning", str(e))
+            return
+        rows = sum(end - start for start, end in self.phases.ranges(selection))
+        if not rows:
+            QMessageBox.warning(self, "Warning", f"No samples in {describe_selection(selection)}.")
+            return
+        sample_info = self.control_panel.get_sample_info()
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        default = f"data/{sample_info['name'].replace(' ', '_')}_phases_{timestamp}.csv"
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Export Phases", default,
+            f"CSV (*.csv);;Archive (*{ARCHIVE_EXTENSION});;JSON (*.json *.ndjson)")
+        if not filename:
+            return
+        result = FileHandler.export_phases(filename, self.session, self.phases, selection,
+                                           dict(self.session.metadata, **sample_info))
+        if result:
+            QMessageBox.information(self, "Export Successful",
+                                    f"{rows} samples of {describe_selection(selection)} exported to:\n{result}")
+        else:
+            QMessageBox.critical(self, "Export Error", "Failed to export phases.")
     
     def closeEvent(self, event):
         """Handle application close"""
@@ -603,5 +1262,15 @@ class MainWindow(QMainWindow):
             
         if self.serial_connection:
             self.serial_connection.close()
+        
+        self.analysis_timer.stop()
+        self.analysis_service.shutdown()
+        self.export_service.shutdown(wait=True)  # cancels; its files are removed
+        
+        self.sample_ring.close()
+        self.sample_ring.unlink()
+        
+        for filename in self.profiler.close():
+            print(f"📊 Profile written: {filename}")
             
         event.accept()
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""AromaSense Batch Reports - one report page per recorded session
+
+Renders every session of the given files or folders (all 7 channels over
+the shaded FSM phases, plus per-level HOLD tables) to PNG, SVG and/or PDF
+without a display. Sessions are spread over a process pool:
+
+    python report.py data/
+    python report.py data/night --format png,pdf --workers 8 --output-dir reports/night
+
+A session saved as both CSV and ``.aroma`` archive is rendered once, from
+the archive.
+"""
+
+import sys
+import os
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Add current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.file_handler import find_sessions
+from config.constants import DATA_SAVE_PATH, REPORT_PATH, REPORT_FORMATS, REPORT_DPI, REPORT_SIZE
+
+
+def _init_worker():
+    from gui.report import ensure_app
+    ensure_app()
+
+
+def _render(filename: str, output_dir: str, formats, dpi: int):
+    from gui.report import render_session
+    return render_session(filename, output_dir, formats, REPORT_SIZE, dpi)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render per-session reports without a display")
+    parser.add_argument("paths", nargs="*", default=[DATA_SAVE_PATH],
+                        help="session files or folders (default: %(default)s)")
+    parser.add_argument("--format", default=",".join(REPORT_FORMATS),
+                        help="comma-separated list of png, svg, pdf (default: %(default)s)")
+    parser.add_argument("--output-dir", default=REPORT_PATH, help="where reports go")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="renderer processes (default: one per CPU)")
+    parser.add_argument("--dpi", type=int, default=REPORT_DPI)
+    args = parser.parse_args()
+
+    formats = [f.strip().lower() for f in args.format.split(',') if f.strip()]
+    unknown = set(formats) - {'png', 'svg', 'pdf'}
+    if unknown or not formats:
+        parser.error(f"unknown format(s): {', '.join(sorted(unknown)) or 'none given'}")
+    sessions = find_sessions(args.paths)
+    if not sessions:
+        parser.error("no sessions found")
+
+    workers = max(1, min(args.workers, len(sessions)))
+    print(f"🖨️ Rendering {len(sessions)} session(s) as {', '.join(formats)} "
+          f"with {workers} worker(s) -> {args.output_dir}")
+    started = time.perf_counter()
+    failed = []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker) as executor:
+        futures = {executor.submit(_render, filename, args.output_dir, formats, args.dpi): filename
+                   for filename in sessions}
+        for done, future in enumerate(as_completed(futures), 1):
+            filename = futures[future]
+            try:
+                written = future.result()
+                print(f"   [{done}/{len(sessions)}] ✅ {os.path.basename(filename)} "
+                      f"-> {', '.join(os.path.basename(w) for w in written)}")
+            except Exception as e:
+                failed.append(filename)
+                print(f"   [{done}/{len(sessions)}] ❌ {os.path.basename(filename)}: {e}")
+
+    print(f"🔚 {len(sessions) - len(failed)} report(s) in {time.perf_counter() - started:.1f} s, "
+          f"{len(failed)} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
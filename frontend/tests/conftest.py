@@ -0,0 +1,37 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The frontend modules import each other as top-level packages (config, utils)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import NUM_LEVELS, NUM_SENSORS, STATE_DONE, STATE_HOLD, STATE_PRE_COND  # noqa: E402
+from utils.session_store import SessionStore  # noqa: E402
+
+RAMP_UP, PURGE = 2, 4
+
+
+@pytest.fixture
+def session():
+    """A 4 Hz FSM run: PRE-COND, then RAMP_UP / HOLD / PURGE at every fan level, DONE"""
+    phases = [(STATE_PRE_COND, 0, 200)]
+    for level in range(NUM_LEVELS):
+        phases += [(RAMP_UP, level, 40), (STATE_HOLD, level, 300), (PURGE, level, 80)]
+    phases.append((STATE_DONE, NUM_LEVELS - 1, 20))
+    states = np.concatenate([np.full(n, state) for state, _, n in phases]).astype(np.int8)
+    levels = np.concatenate([np.full(n, level) for _, level, n in phases]).astype(np.int8)
+    rng = np.random.default_rng(7)
+    n = len(states)
+    response = (states == STATE_HOLD)[:, None] * (1.0 + levels[:, None]) * np.arange(1, NUM_SENSORS + 1)
+    values = 10.0 + response + np.cumsum(rng.normal(0.0, 0.05, (n, NUM_SENSORS)), axis=0)
+    store = SessionStore(metadata={'name': "jahe A", 'type': "jahe"})
+    store.append_block(np.arange(n) * 0.25, values, states, levels)
+    return store
+
+
+def blocks(store, size):
+    """``store`` as consecutive ``size``-row blocks"""
+    for start in range(0, len(store), size):
+        yield store.select(start, start + size)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from utils.alarms import AlarmMonitor, AlarmRules, load_alarm_events
+
+from conftest import blocks
+
+RULES = [
+    {"name": "CO high in HOLD", "kind": "threshold", "channel": "CO Sensor",
+     "op": ">", "value": 22.0, "for": 5.0, "phases": "HOLD"},
+    {"name": "NO2 low", "kind": "threshold", "channel": "NO2 Sensor", "op": "<", "value": 10.5},
+    {"name": "VOC rising", "kind": "slope", "channel": "VOC Sensor", "op": ">", "value": 0.5,
+     "window": 2.0},
+    {"name": "CO/NO2", "kind": "ratio", "channel": "CO Sensor", "over": "NO2 Sensor",
+     "op": ">", "value": 1.5, "for": 2.0, "phases": "HOLD:3, HOLD:4"},
+]
+
+
+def _events(session, block):
+    monitor = AlarmMonitor(AlarmRules(RULES))
+    events = []
+    for part in blocks(session, block):
+        events += monitor.push(*part)
+    assert events == monitor.events
+    return events
+
+
+@pytest.mark.parametrize('block', [1, 4, 97, 2000])
+def test_block_splits_give_the_same_events(session, block):
+    assert _events(session, block) == _events(session, len(session))
+
+
+def test_every_rule_kind_fires(session):
+    fired = {event['rule'] for event in _events(session, len(session))}
+    assert fired == {rule['name'] for rule in RULES}
+
+
+def test_save_keeps_events_up_to_until(tmp_path, session):
+    monitor = AlarmMonitor(AlarmRules(RULES))
+    monitor.push(*session.select())
+    until = float(np.median([event['time'] for event in monitor.events]))
+    filename = monitor.save(str(tmp_path / "x.alarms.json"), until=until)
+    assert load_alarm_events(filename) == [e for e in monitor.events if e['time'] <= until]
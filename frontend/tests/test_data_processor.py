@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from utils.data_processor import DataProcessor, RunningAnalysis
+
+from conftest import blocks
+
+
+def _analysis(session, block):
+    analysis = RunningAnalysis(rate_hz=4.0)
+    for part in blocks(session, block):
+        analysis.push(*part)
+    return analysis
+
+
+@pytest.mark.parametrize('block', [1, 13, 256, 10_000])
+def test_running_analysis_matches_the_batch_functions(session, block):
+    analysis = _analysis(session, block)
+    times, values, states, levels = session.select()
+    assert np.array_equal(analysis.segments(), DataProcessor.segment_phases(states, levels))
+    assert np.allclose(analysis.features(),
+                       DataProcessor.extract_features(times, values, states, levels), equal_nan=True)
+    assert np.allclose(analysis.band_powers(),
+                       DataProcessor.extract_band_powers(values, states, levels, 4.0), equal_nan=True)
+    stats = DataProcessor.block_statistics(values)
+    for key in ('mean', 'max', 'std'):
+        assert np.allclose(analysis.statistics()[key], stats[key])
+
+
+def test_levels_never_held_are_nan(session):
+    hold_levels_0_1 = session.select(0, 1000)
+    analysis = RunningAnalysis(rate_hz=4.0)
+    analysis.push(*hold_levels_0_1)
+    features = analysis.features()
+    assert not np.isnan(features[0]).any() and np.isnan(features[3]).all()
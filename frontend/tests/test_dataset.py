@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from config.constants import STATE_HOLD
+from utils.dataset import WindowWriter, session_windows
+
+from conftest import blocks
+
+
+def _written(tmp_path, session, block, **kwargs):
+    filename = str(tmp_path / f"w{block}.windows.npz")
+    writer = WindowWriter(filename, length=64, stride=16, label=session.metadata['type'], **kwargs)
+    for part in blocks(session, block):
+        writer.append_block(*part)
+    with np.load(writer.close()) as data:
+        return {key: data[key] for key in data.files}
+
+
+@pytest.mark.parametrize('block', [1, 50, 333, 10_000])
+@pytest.mark.parametrize('state, levels', [(None, None), (STATE_HOLD, None), (STATE_HOLD, [1, 3])])
+def test_writer_matches_session_windows(tmp_path, session, block, state, levels):
+    written = _written(tmp_path, session, block, state=state, levels=levels)
+    expected = list(session_windows(session, 64, 16, state, levels))
+    windows = np.concatenate([w for w, _, _ in expected])
+    assert np.allclose(written['windows'], windows.astype(np.float32))
+    assert np.array_equal(written['start_times'],
+                          session.times[np.concatenate([starts for _, starts, _ in expected])])
+    assert np.array_equal(written['levels'],
+                          np.concatenate([np.full(len(w), level) for w, _, level in expected]))
+    assert str(written['label']) == "jahe"
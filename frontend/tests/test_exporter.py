@@ -0,0 +1,56 @@
+import json
+import threading
+
+import numpy as np
+
+from utils.alarms import AlarmMonitor, AlarmRules, AlarmsWriter, load_alarm_events
+from utils.calibration import CalibratedWriter, CalibrationTable, load_calibrated
+from utils.exporter import export_session, export_targets
+from utils.quality import QualityMonitor, QualityWriter, load_quality_mask
+from utils.session_store import SessionStore
+
+RULES = [{"name": "NO2 low", "kind": "threshold", "channel": "NO2 Sensor", "op": "<", "value": 10.5}]
+
+
+def _sidecars(base, session, rows):
+    quality = QualityMonitor()
+    quality.check(session.times, session.values)
+    alarms = AlarmMonitor(AlarmRules(RULES))
+    alarms.push(*session.select())
+    return quality, alarms, {
+        'quality': QualityWriter(base + ".quality.npz", quality, rows),
+        'ppm': CalibratedWriter(base + ".ppm.npz", CalibrationTable()),
+        'alarms': AlarmsWriter(base + ".alarms.json", alarms),
+    }
+
+
+def test_sidecars_cover_exactly_the_exported_rows(tmp_path, session):
+    # The monitors are ahead of the export, as with a snapshot of a running session
+    rows = 1500
+    snapshot = SessionStore(metadata=session.metadata)
+    snapshot.append_block(*session.select(0, rows))
+    base = str(tmp_path / "x")
+    quality, alarms, sidecars = _sidecars(base, session, rows)
+    result = export_session(snapshot, export_targets(base, ['csv']), sidecars=sidecars)
+    assert set(result['files']) == {'csv', 'quality', 'ppm', 'alarms'} and not result['errors']
+
+    mask = load_quality_mask(result['files']['quality'])
+    assert np.array_equal(mask['mask'], quality.mask[:rows])
+    assert np.array_equal(mask['times'], session.times[:rows])
+    ppm = load_calibrated(result['files']['ppm'])
+    expected = CalibrationTable().apply(session.values[:rows]).astype(np.float32)
+    assert np.array_equal(ppm['ppm'], expected, equal_nan=True)
+    last = session.times[rows - 1]
+    assert load_alarm_events(result['files']['alarms']) == \
+        json.loads(json.dumps([e for e in alarms.events if e['time'] <= last]))
+
+
+def test_cancelled_export_leaves_no_files(tmp_path, session):
+    base = str(tmp_path / "x")
+    cancel = threading.Event()
+    cancel.set()
+    _, _, sidecars = _sidecars(base, session, len(session))
+    result = export_session(session, export_targets(base, ['csv', 'archive', 'ndjson']),
+                            cancel=cancel, sidecars=sidecars)
+    assert result['cancelled'] and not result['files']
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from utils.csv_index import CSVSeekIndex
+from utils.exporter import export_session, export_targets
+from utils.file_handler import ArchiveReader, ArchiveWriter, FileHandler, JSONExportReader
+
+from conftest import blocks
+
+
+def _assert_same(block, session, start=0, stop=None, decimals=2):
+    times, values, states, levels = block
+    expected = session.select(start, stop)
+    assert np.allclose(times, expected[0], atol=5e-4)
+    assert np.allclose(values, expected[1], atol=0.5 * 10.0 ** -decimals + 1e-9)
+    assert np.array_equal(states, expected[2]) and np.array_equal(levels, expected[3])
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+def test_archive_round_trip(tmp_path, session, codec):
+    writer = ArchiveWriter(str(tmp_path / "x.aroma"), session.metadata, chunk_size=500, codec=codec)
+    for block in blocks(session, 333):
+        writer.append_block(*block)
+    reader = ArchiveReader(writer.close())
+    assert len(reader) == len(session) and reader.metadata['name'] == "jahe A"
+    _assert_same(reader.read_all(), session)
+    for start, stop in [(0, 1), (499, 501), (1234, 4321), (len(session) - 7, len(session))]:
+        _assert_same(reader.read_rows(start, stop), session, start, stop)
+    assert reader.phases.num_rows == len(session)
+
+
+@pytest.mark.parametrize('fmt', ['json', 'ndjson'])
+def test_json_round_trip(tmp_path, session, fmt):
+    result = export_session(session, export_targets(str(tmp_path / "x"), [fmt]), block_rows=777)
+    reader = JSONExportReader(result['files'][fmt])
+    assert reader.layout == ('ndjson' if fmt == 'ndjson' else 'chunked')
+    assert reader.metadata['name'] == "jahe A"
+    loaded = reader.to_store()
+    _assert_same(loaded.select(), session)
+    assert FileHandler.load_session(result['files'][fmt]).metadata['type'] == "jahe"
+
+
+@pytest.fixture
+def csv_file(tmp_path, session):
+    result = export_session(session, export_targets(str(tmp_path / "x"), ['csv']), block_rows=500)
+    return result['files']['csv']
+
+
+@pytest.mark.parametrize('every', [1, 7, 256])
+def test_seek_index_range_reads(csv_file, session, every):
+    index = CSVSeekIndex.build(csv_file, every)
+    assert len(index) == len(session) and index.num_sensors == session.num_sensors
+    n = len(session)
+    ranges = [(0, n), (0, 1), (n - 1, n), (every - 1, every + 1), (3 * every, 5 * every), (1000, 3217)]
+    for start, stop in ranges:
+        _assert_same(index.read_rows(start, stop), session, start, stop)
+    assert len(index.read_rows(n, n + 10)[0]) == 0
+
+
+def test_seek_index_time_reads(csv_file, session):
+    index = CSVSeekIndex.open(csv_file, every=64)
+    t0, t1 = 123.4, 456.7
+    start, stop = index.rows_between(t0, t1)
+    mask = (session.times >= t0) & (session.times <= t1)
+    assert (start, stop) == (np.argmax(mask), np.argmax(mask) + mask.sum())
+    _assert_same(index.read_time(t0, t1), session, start, stop)
+    rows = sum(len(block[0]) for block in index.iter_blocks(start_time=t0, block_rows=100))
+    assert rows == int((session.times >= t0).sum())
+    assert index.last_time == pytest.approx(session.times[-1])
+
+
+def test_seek_index_sidecar_is_reused_until_the_csv_changes(csv_file, session):
+    index = CSVSeekIndex.open(csv_file, every=64)
+    reloaded = CSVSeekIndex.open(csv_file, every=64)
+    assert np.array_equal(reloaded.offsets, index.offsets) and reloaded.header == index.header
+    with open(csv_file, 'a') as f:
+        f.write("999.000" + ",1.00" * session.num_sensors + "\r\n")
+    assert not reloaded.is_current()
+    assert len(CSVSeekIndex.open(csv_file, every=64)) == len(session) + 1
+
+
+def test_load_session_csv_time_range(csv_file, session):
+    store = FileHandler.load_session_csv(csv_file, start_time=100.0, end_time=200.0)
+    mask = (session.times >= 100.0) & (session.times <= 200.0)
+    start = int(np.argmax(mask))
+    _assert_same(store.select(), session, start, start + int(mask.sum()))
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from utils.protocol import FIRMWARE_INVALID
+from utils.quality import QualityMonitor, SENTINEL, SPIKE, GAP
+
+
+def _series(n=4000, seed=0):
+    rng = np.random.default_rng(seed)
+    times = np.arange(n) * 0.25
+    values = np.cumsum(rng.normal(0.0, 0.05, (n, 7)), axis=0) + 10.0
+    values[::97] += 5.0
+    values[1234, 2] = FIRMWARE_INVALID
+    times[2000:] += 3.0  # one gap
+    return times, values
+
+
+def _check(times, values, block):
+    monitor = QualityMonitor()
+    for start in range(0, len(times), block):
+        monitor.check(times[start:start + block], values[start:start + block])
+    return monitor.mask.copy()
+
+
+@pytest.mark.parametrize('block', [1, 8, 64, 333])
+def test_block_splits_give_the_same_mask(block):
+    times, values = _series()
+    assert np.array_equal(_check(times, values, block), _check(times, values, len(times)))
+
+
+def test_single_check_flags_spikes_sentinels_and_gaps():
+    times, values = _series()
+    mask = _check(times, values, len(times))
+    assert (mask[::97] & SPIKE).any(axis=1)[10:].all()
+    assert mask[1234, 2] & SENTINEL
+    assert (mask[2000] & GAP).all()
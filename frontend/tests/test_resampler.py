@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from utils.resampler import StreamingResampler, interpolate
+
+
+def _irregular(n=3000, seed=3):
+    rng = np.random.default_rng(seed)
+    times = np.cumsum(rng.uniform(0.1, 0.4, n))
+    times[1500:] += 5.0  # one long gap
+    values = np.cumsum(rng.normal(0.0, 1.0, (n, 3)), axis=0)
+    return times, values
+
+
+def _stream(times, values, block, **kwargs):
+    resampler = StreamingResampler(4.0, t_start=times[0], **kwargs)
+    parts = [resampler.push(times[s:s + block], values[s:s + block])
+             for s in range(0, len(times), block)]
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+@pytest.mark.parametrize('method', ['linear', 'zoh'])
+@pytest.mark.parametrize('block', [1, 9, 256, 3000])
+def test_streaming_matches_interpolate(block, method):
+    times, values = _irregular()
+    grid, out = _stream(times, values, block, method=method, max_gap=2.0)
+    assert np.allclose(np.diff(grid), 0.25) and grid[0] == times[0] and grid[-1] <= times[-1]
+    expected = interpolate(times, values, grid, method, max_gap=2.0)
+    assert np.allclose(out, expected, equal_nan=True)
+    assert np.isnan(out[(grid > times[1499]) & (grid < times[1500])]).all()
+
+
+def test_interpolate_hits_the_samples():
+    times, values = _irregular()
+    assert np.allclose(interpolate(times, values, times), values)
+    assert np.isnan(interpolate(times, values, [times[0] - 1.0, times[-1] + 1.0])).all()
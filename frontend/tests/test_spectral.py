@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.spectral import RollingSpectrum, frame_psd, hann_window
+
+
+def _spectrogram(values, block, length=32, hop=8):
+    spectrum = RollingSpectrum(rate_hz=4.0, length=length, hop=hop, history=1000)
+    for start in range(0, len(values), block):
+        spectrum.push(values[start:start + block])
+    return spectrum
+
+
+@pytest.mark.parametrize('block', [1, 5, 8, 77])
+def test_block_splits_give_the_same_spectrogram(session, block):
+    whole = _spectrogram(session.values, len(session))
+    split = _spectrogram(session.values, block)
+    assert split.frames == whole.frames
+    for channel in range(session.num_sensors):
+        assert np.allclose(split.spectrogram(channel), whole.spectrogram(channel))
+
+
+def test_frames_are_the_stft_of_the_series(session):
+    length, hop = 32, 8
+    spectrum = _spectrogram(session.values, 50, length, hop)
+    window, norm = hann_window(length)
+    frames = sliding_window_view(session.values, length, axis=0)[::hop]
+    expected = frame_psd(frames.transpose(0, 2, 1), window, norm, 4.0)
+    assert spectrum.frames == len(expected)
+    assert np.allclose(spectrum.spectrogram(3), expected[:, :, 3])
+
+
+def test_history_keeps_the_newest_frames(session):
+    spectrum = RollingSpectrum(rate_hz=4.0, length=32, hop=8, history=10)
+    spectrum.push(session.values)
+    full = _spectrogram(session.values, len(session))
+    assert np.allclose(spectrum.spectrogram(0), full.spectrogram(0)[-10:])
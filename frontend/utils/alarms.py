@@ -0,0 +1,298 @@
+"""Declarative alarm rules evaluated on streamed session blocks
+
+A rule is a small dict, e.g. "CO Sensor above 20 for 5 s during HOLD":
+
+    {"name": "CO high", "kind": "threshold", "channel": "CO Sensor",
+     "op": ">", "value": 20, "for": 5, "phases": "HOLD"}
+
+Kinds are ``threshold`` (the reading), ``slope`` (change per second over
+the last ``window`` seconds) and ``ratio`` (``channel`` / ``over``).
+``phases`` takes the ``parse_selection`` syntax (``"HOLD:3, PURGE"``).
+``AlarmRules`` compiles a rule list into index arrays once, and
+``AlarmMonitor.push`` evaluates every rule over a whole block with a few
+NumPy calls per rule kind. The cost is O(rows x rules) arithmetic with
+no per-rule Python loop. State carried between blocks (open condition
+runs, the slope history) makes the events identical to evaluating the
+whole session at once. An event fires when a rule's condition has held
+for ``for`` seconds and re-arms once the condition clears.
+"""
+
+import json
+import os
+import numpy as np
+from typing import List, Optional, Sequence, Union
+
+from config.constants import (
+    NUM_SENSORS, SENSOR_NAMES, SENSOR_KEYS, STATE_NAMES, ALARM_RULES, ALARM_RULES_PATH,
+    ALARM_SLOPE_WINDOW
+)
+from utils.phase_index import parse_selection, describe_selection
+from utils.protocol import FIRMWARE_INVALID
+
+ALARMS_SUFFIX = ".alarms.json"
+RULE_KINDS = ('threshold', 'slope', 'ratio')
+OPERATORS = {'>': True, 'above': True, '<': False, 'below': False}
+# Phase gate table size (states x fan levels)
+_STATES = max(STATE_NAMES) + 1
+_LEVELS = 16
+
+
+def channel_index(channel: Union[int, str], num_sensors: int = NUM_SENSORS) -> int:
+    """Channel by index, name (``"CO Sensor"``) or JSON key (``"co"``)"""
+    if isinstance(channel, (int, np.integer)) and 0 <= channel < num_sensors:
+        return int(channel)
+    if isinstance(channel, str):
+        wanted = channel.strip().lower()
+        for i in range(num_sensors):
+            if wanted in (SENSOR_NAMES[i].lower(), SENSOR_KEYS[i]):
+                return i
+    raise ValueError(f"Unknown channel '{channel}'")
+
+
+def load_rules(filename: Optional[str] = None) -> List[dict]:
+    """Rules from a JSON file (a list, or ``{"rules": [...]}``)
+
+    Without a file name, ALARM_RULES_PATH is used if it exists, otherwise
+    the ALARM_RULES defaults.
+    """
+    if filename is None:
+        if not os.path.exists(ALARM_RULES_PATH):
+            return [dict(rule) for rule in ALARM_RULES]
+        filename = ALARM_RULES_PATH
+    with open(filename) as f:
+        loaded = json.load(f)
+    return list(loaded['rules'] if isinstance(loaded, dict) else loaded)
+
+
+class AlarmRules:
+    """A rule list compiled to per-kind index and parameter arrays"""
+
+    def __init__(self, rules: Sequence[dict], num_sensors: int = NUM_SENSORS):
+        self.specs = [dict(rule) for rule in rules]
+        self.num_sensors = num_sensors
+        count = len(self.specs)
+        self.names = []
+        self.kind = np.zeros(count, dtype=np.int8)
+        self.channel = np.zeros(count, dtype=np.int64)
+        self.other = np.zeros(count, dtype=np.int64)
+        self.above = np.zeros(count, dtype=bool)
+        self.value = np.zeros(count)
+        self.hold = np.zeros(count)
+        self.window = np.zeros(count)
+        self.phases = []
+        # gate[r, state, level]: rule r applies in that phase
+        self.gate = np.zeros((count, _STATES, _LEVELS), dtype=bool)
+        for r, rule in enumerate(self.specs):
+            self._compile(r, rule)
+        self.threshold_rules = np.flatnonzero(self.kind == 0)
+        self.slope_rules = np.flatnonzero(self.kind == 1)
+        self.ratio_rules = np.flatnonzero(self.kind == 2)
+        self.history = float(self.window.max()) if count else 0.0
+
+    def __len__(self) -> int:
+        return len(self.specs)
+
+    def _compile(self, r: int, rule: dict):
+        kind = rule.get('kind', 'threshold')
+        name = rule.get('name') or f"{kind} {rule.get('channel')}"
+        try:
+            if kind not in RULE_KINDS:
+                raise ValueError(f"unknown kind '{kind}'")
+            op = str(rule.get('op', '>')).strip().lower()
+            if op not in OPERATORS:
+                raise ValueError(f"unknown operator '{op}'")
+            self.kind[r] = RULE_KINDS.index(kind)
+            self.channel[r] = channel_index(rule['channel'], self.num_sensors)
+            if kind == 'ratio':
+                self.other[r] = channel_index(rule['over'], self.num_sensors)
+            self.above[r] = OPERATORS[op]
+            self.value[r] = float(rule['value'])
+            self.hold[r] = max(float(rule.get('for', 0.0)), 0.0)
+            if kind == 'slope':
+                self.window[r] = float(rule.get('window', ALARM_SLOPE_WINDOW))
+                if self.window[r] <= 0:
+                    raise ValueError("window must be positive")
+            selection = parse_selection(rule['phases']) if rule.get('phases') else []
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Alarm rule '{name}': {e}") from None
+        self.names.append(name)
+        self.phases.append(describe_selection(selection))
+        if not selection:
+            self.gate[r] = True
+        for state, level in selection:
+            if 0 <= state < _STATES and (level is None or 0 <= level < _LEVELS):
+                self.gate[r, state, slice(None) if level is None else level] = True
+
+
+class AlarmMonitor:
+    """Evaluate compiled rules over blocks of session rows and collect events
+
+    ``push`` returns the events raised by the block. Every event is kept
+    in ``events`` with the session time it fired at and can be saved as
+    an ``.alarms.json`` sidecar.
+    """
+
+    def __init__(self, rules: AlarmRules):
+        self.rules = rules
+        self.reset()
+
+    def reset(self):
+        count = len(self.rules)
+        self.events = []
+        self._since = np.full(count, np.nan)   # start time of each open condition run
+        self._active = np.zeros(count, dtype=bool)
+        self._first_time = None
+        self._history_times = np.empty(0)
+        self._history_values = np.empty((0, self.rules.num_sensors))
+
+    @property
+    def active(self) -> List[str]:
+        """Names of the rules currently in alarm"""
+        return [self.rules.names[r] for r in np.flatnonzero(self._active)]
+
+    def push(self, times: np.ndarray, values: np.ndarray, states: np.ndarray,
+             levels: np.ndarray) -> List[dict]:
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        n, rules = len(times), self.rules
+        if n == 0 or not len(rules):
+            return []
+        if self._first_time is None:
+            self._first_time = float(times[0])
+        invalid = (values == FIRMWARE_INVALID) | ~np.isfinite(values)
+        quantity = np.full((n, len(rules)), np.nan)
+
+        cols = rules.threshold_rules
+        if len(cols):
+            ch = rules.channel[cols]
+            quantity[:, cols] = np.where(invalid[:, ch], np.nan, values[:, ch])
+
+        cols = rules.ratio_rules
+        if len(cols):
+            a, b = rules.channel[cols], rules.other[cols]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = values[:, a] / values[:, b]
+            quantity[:, cols] = np.where(invalid[:, a] | invalid[:, b] | (values[:, b] == 0),
+                                         np.nan, ratio)
+
+        cols = rules.slope_rules
+        if len(cols):
+            quantity[:, cols] = self._slopes(times, values, invalid, cols)
+        if rules.history > 0:
+            ext_times = np.concatenate([self._history_times, times])
+            keep = ext_times >= times[-1] - rules.history
+            self._history_times = ext_times[keep]
+            self._history_values = np.concatenate([self._history_values, values])[keep]
+
+        # NaN compares False either way
+        with np.errstate(invalid='ignore'):
+            condition = np.where(rules.above, quantity > rules.value, quantity < rules.value)
+        states = np.clip(np.asarray(states, dtype=np.int64), 0, _STATES - 1)
+        levels = np.clip(np.asarray(levels, dtype=np.int64), 0, _LEVELS - 1)
+        condition &= rules.gate[:, states, levels].T
+
+        # Start time of the condition run each row belongs to
+        idx = np.arange(n)[:, None]
+        last_false = np.maximum.accumulate(np.where(condition, -1, idx), axis=0)
+        since = times[np.minimum(last_false + 1, n - 1)]
+        carried = (last_false < 0) & ~np.isnan(self._since)
+        since = np.where(carried, self._since, since)
+        active = condition & (times[:, None] - since >= rules.hold)
+        previous = np.vstack([self._active[None, :], active[:-1]])
+        fired = active & ~previous
+        self._since = np.where(condition[-1], since[-1], np.nan)
+        self._active = active[-1].copy()
+
+        events = [self._event(int(r), times, quantity, since, states, levels, int(c))
+                  for r, c in zip(*np.nonzero(fired))]
+        self.events.extend(events)
+        return events
+
+    def _slopes(self, times, values, invalid, cols) -> np.ndarray:
+        """Change per second over each rule's window, from carried history"""
+        rules, n = self.rules, len(times)
+        ext_times = np.concatenate([self._history_times, times])
+        ext_values = np.concatenate([self._history_values, values])
+        ext_invalid = (ext_values == FIRMWARE_INVALID) | ~np.isfinite(ext_values)
+        window = rules.window[cols]
+        start = times[:, None] - window
+        first = np.searchsorted(ext_times, start.ravel()).reshape(n, len(cols))
+        row = len(self._history_times) + np.arange(n)[:, None]
+        ch = rules.channel[cols]
+        dt = times[:, None] - ext_times[first]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (ext_values[row, ch] - ext_values[first, ch]) / dt
+        # Only once a full window of the session is available
+        bad = (dt <= 0) | ext_invalid[row, ch] | ext_invalid[first, ch] | (start < self._first_time)
+        return np.where(bad, np.nan, slope)
+
+    def _event(self, row, times, quantity, since, states, levels, r) -> dict:
+        rules = self.rules
+        return {
+            'time': float(times[row]),
+            'since': float(since[row, r]),
+            'rule': rules.names[r],
+            'kind': RULE_KINDS[rules.kind[r]],
+            'channel': SENSOR_NAMES[rules.channel[r]],
+            'value': float(quantity[row, r]),
+            'limit': float(rules.value[r]),
+            'above': bool(rules.above[r]),
+            'state': STATE_NAMES.get(int(states[row]), str(int(states[row]))),
+            'level': int(levels[row]),
+        }
+
+    def save(self, filename: str, until: Optional[float] = None) -> Optional[str]:
+        """Write the rules and events (up to session time ``until``) as a JSON sidecar"""
+        return save_alarm_events(filename, self.rules.specs, self.events, until)
+
+
+class AlarmsWriter:
+    """Export block writer for the ``.alarms.json`` sidecar of the exported rows
+
+    Copies the monitor's events when the export starts and keeps those
+    fired up to the last exported sample.
+    """
+
+    def __init__(self, filename: str, monitor: AlarmMonitor):
+        self.filename = filename
+        self.specs = list(monitor.rules.specs)
+        self.events = list(monitor.events)
+        self.until = None
+
+    def append_block(self, times, values, states=None, levels=None):
+        if len(times):
+            self.until = float(times[-1])
+
+    def close(self) -> Optional[str]:
+        until = -np.inf if self.until is None else self.until
+        return save_alarm_events(self.filename, self.specs, self.events, until)
+
+    def abort(self):
+        self.events = []
+
+
+def save_alarm_events(filename: str, specs: List[dict], events: List[dict],
+                      until: Optional[float] = None) -> Optional[str]:
+    events = [e for e in events if until is None or e['time'] <= until]
+    try:
+        with open(filename, 'w') as f:
+            json.dump({'rules': specs, 'events': events}, f, indent=2)
+        return filename
+    except Exception as e:
+        print(f"Error saving alarms: {str(e)}")
+        return None
+
+
+def load_alarm_events(filename: str) -> List[dict]:
+    with open(filename) as f:
+        return json.load(f)['events']
+
+
+def describe_event(event: dict) -> str:
+    """``CO high: CO Sensor 21.3 > 20 for 5 s (HOLD, level 3) at 812.5 s``"""
+    what = {'threshold': event['channel'], 'slope': f"{event['channel']} slope",
+            'ratio': f"{event['channel']} ratio"}[event['kind']]
+    held = event['time'] - event['since']
+    return (f"{event['rule']}: {what} {event['value']:.3g} {'>' if event['above'] else '<'} "
+            f"{event['limit']:g}" + (f" for {held:.0f} s" if held >= 1 else "")
+            + f" ({event['state']}, level {event['level'] + 1}) at {event['time']:.1f} s")
@@ -0,0 +1,305 @@
+"""Out-of-process analysis on a worker pool with shared-memory handoff
+
+Session rows are copied into a ``SharedMemory`` block and workers map
+them as NumPy arrays; only a small descriptor is pickled on the way in
+and compact results (statistics, segments, features, band powers, class
+scores, similar sessions) on the way out. Filtered series are written
+back into the same block.
+
+A live session is analysed incrementally: ``AnalysisService.push`` sends
+only the rows added since the previous job, together with the
+``RunningAnalysis`` that summarizes every row before them, so a job costs
+the same an hour or a day into a run. The copy into shared memory (and
+the streamed signature of a similarity query) runs on a reader thread of
+the service, never on the caller's.
+"""
+
+import multiprocessing
+import os
+import numpy as np
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Iterable, Optional
+
+from config.constants import SIMILARITY_TOP_K
+from utils.data_processor import DataProcessor, RunningAnalysis
+from utils.session_store import Block, SessionStore
+from utils.similarity import find_similar, signature
+from utils.spectral import DEFAULT_RATE
+
+DEFAULT_TASKS = ('statistics', 'segmentation', 'features')
+LIVE_TASKS = ('segmentation', 'features', 'spectral')
+# Tasks over the block's rows themselves; only meaningful for whole sessions
+ROW_TASKS = ('filter', 'statistics')
+
+
+class SharedSessionBlock:
+    """Session columns (and an optional output area) in one shared-memory block"""
+
+    _ALIGN = 64
+
+    def __init__(self, descriptor: dict, shm: shared_memory.SharedMemory, owner: bool):
+        self.descriptor = descriptor
+        self.shm = shm
+        self.owner = owner
+
+    @classmethod
+    def layout(cls, n: int, num_sensors: int, with_output: bool) -> dict:
+        fields = [('times', (n,), 'f8'), ('values', (n, num_sensors), 'f8'),
+                  ('states', (n,), 'i1'), ('levels', (n,), 'i1')]
+        if with_output:
+            fields.append(('filtered', (n, num_sensors), 'f8'))
+        offsets, offset = {}, 0
+        for name, shape, dtype in fields:
+            offsets[name] = (offset, shape, dtype)
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            offset += -(-size // cls._ALIGN) * cls._ALIGN
+        return {'n': n, 'num_sensors': num_sensors, 'fields': offsets, 'size': max(offset, 1)}
+
+    @classmethod
+    def from_store(cls, store: SessionStore, with_output: bool = False) -> 'SharedSessionBlock':
+        """Allocate a block and copy the store's columns into it"""
+        return cls.from_blocks(len(store), store.num_sensors, store.iter_blocks(), with_output)
+
+    @classmethod
+    def from_blocks(cls, n: int, num_sensors: int, blocks: Iterable[Block],
+                    with_output: bool = False) -> 'SharedSessionBlock':
+        """Allocate a block for ``n`` rows and copy ``blocks`` into it"""
+        layout = cls.layout(n, num_sensors, with_output)
+        shm = shared_memory.SharedMemory(create=True, size=layout['size'])
+        layout['name'] = shm.name
+        block = cls(layout, shm, owner=True)
+        arrays = block.arrays()
+        row = 0
+        for times, values, states, levels in blocks:
+            end = row + len(times)
+            arrays['times'][row:end] = times
+            arrays['values'][row:end] = values
+            arrays['states'][row:end] = states
+            arrays['levels'][row:end] = levels
+            row = end
+        return block
+
+    @classmethod
+    def attach(cls, descriptor: dict) -> 'SharedSessionBlock':
+        # Pool workers share the parent's resource tracker, so the default
+        # registration is harmless: the parent's unlink unregisters it
+        return cls(descriptor, shared_memory.SharedMemory(name=descriptor['name']), owner=False)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+                for name, (offset, shape, dtype) in self.descriptor['fields'].items()}
+
+    def release(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# ---- worker side (module-level so the pool can pickle them) ----
+
+# Tasks take the job's rows and the running analysis that already includes them
+
+def _task_statistics(arrays: dict, analysis: RunningAnalysis, params: dict) -> dict:
+    return {k: v.tolist() for k, v in DataProcessor.block_statistics(arrays['values']).items()}
+
+
+def _task_filter(arrays: dict, analysis: RunningAnalysis, params: dict) -> dict:
+    window = int(params.get('filter_window', 5))
+    if 'filtered' in arrays:
+        arrays['filtered'][:] = DataProcessor.moving_average_block(arrays['values'], window)
+    return {'window': window}
+
+
+def _task_segmentation(arrays: dict, analysis: RunningAnalysis, params: dict) -> list:
+    return analysis.segments().tolist()
+
+
+def _task_features(arrays: dict, analysis: RunningAnalysis, params: dict) -> list:
+    return analysis.features().tolist()
+
+
+def _task_spectral(arrays: dict, analysis: RunningAnalysis, params: dict) -> list:
+    return analysis.band_powers().tolist()
+
+
+def _task_classification(arrays: dict, analysis: RunningAnalysis, params: dict) -> Optional[dict]:
+    """Nearest centroid over the mean-response features
+
+    ``params['references']`` maps a label to a (levels, channels) centroid.
+    """
+    references = params.get('references')
+    if not references:
+        return None
+    features = analysis.features()[:, 0, :]
+    distances = {}
+    for label, centroid in references.items():
+        diff = features - np.asarray(centroid, dtype=np.float64)
+        valid = ~np.isnan(diff)
+        if valid.any():
+            distances[label] = float(np.sqrt((diff[valid] ** 2).mean()))
+    if not distances:
+        return None
+    best = min(distances, key=distances.get)
+    return {'label': best, 'distances': distances}
+
+
+def _task_similarity(arrays: dict, analysis: RunningAnalysis, params: dict) -> list:
+    """Top-k sessions in ``params['catalog']`` most similar to ``params['signature']``"""
+    catalog = params.get('catalog')
+    if not catalog or not os.path.isdir(catalog):
+        return []
+    return find_similar(catalog, params['signature'], int(params.get('top_k', SIMILARITY_TOP_K)))
+
+
+TASKS = {
+    'filter': _task_filter,
+    'statistics': _task_statistics,
+    'segmentation': _task_segmentation,
+    'features': _task_features,
+    'spectral': _task_spectral,
+    'classification': _task_classification,
+    'similarity': _task_similarity,
+}
+
+
+def run_analysis(descriptor: dict, tasks: Iterable[str], params: dict,
+                 analysis: Optional[RunningAnalysis] = None) -> dict:
+    """Worker entry point: map the shared block, add it to ``analysis``, run the tasks
+
+    Without ``analysis`` the block is a whole session. The advanced
+    analysis is returned with the results.
+    """
+    block = SharedSessionBlock.attach(descriptor)
+    try:
+        arrays = block.arrays()
+        if analysis is None:
+            analysis = RunningAnalysis(descriptor['num_sensors'],
+                                       rate_hz=float(params.get('rate_hz', DEFAULT_RATE)),
+                                       spectral='spectral' in tasks)
+        analysis.push(arrays['times'], arrays['values'], arrays['states'], arrays['levels'])
+        result = {'num_points': analysis.num_rows, 'analysis': analysis}
+        for task in tasks:
+            result[task] = TASKS[task](arrays, analysis, params)
+        del arrays
+        return result
+    finally:
+        block.release()
+
+
+# ---- GUI side ----
+
+class AnalysisService:
+    """Submit sessions, or the new rows of a live one, to a process pool
+
+    Callbacks run on a pool management or reader thread; GUI code should
+    forward them through a Qt signal.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        # spawn: forking a process that runs Qt threads is not safe
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        # Copies into shared memory and query signatures, off the caller's thread
+        self.reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analysis-reader")
+        self.pending = 0
+
+    @staticmethod
+    def _check(tasks: Iterable[str]) -> tuple:
+        tasks = tuple(tasks)
+        unknown = [t for t in tasks if t not in TASKS]
+        if unknown:
+            raise ValueError(f"Unknown analysis task(s): {', '.join(unknown)}")
+        return tasks
+
+    def submit(self, store: SessionStore, tasks: Iterable[str] = DEFAULT_TASKS,
+               params: Optional[dict] = None,
+               callback: Optional[Callable[[dict], None]] = None) -> Future:
+        """Analyze a whole session, copied once into shared memory
+
+        The copy runs on the reader thread, so ``store`` must not change
+        until the job is done. The returned future resolves to the result
+        dict after ``callback`` has run; failures are reported as
+        ``{'error': ...}``.
+        """
+        tasks = self._check(tasks)
+        return self._start(lambda: SharedSessionBlock.from_store(store, with_output='filter' in tasks),
+                           tasks, params, store, None, callback)
+
+    def push(self, analysis: RunningAnalysis, rows: Block, tasks: Iterable[str] = LIVE_TASKS,
+             params: Optional[dict] = None, store: Optional[SessionStore] = None,
+             callback: Optional[Callable[[dict], None]] = None) -> Future:
+        """Advance ``analysis`` by the rows added since its previous job
+
+        Only ``rows`` cross to the worker, with ``analysis`` pickled
+        alongside; the result's ``analysis`` includes them and is the one
+        to push next. 'similarity' needs the whole ``store``, whose
+        signature is streamed on the reader thread (the store must not
+        change until the job is done).
+        """
+        tasks = self._check(tasks)
+        whole = [t for t in tasks if t in ROW_TASKS]
+        if whole:
+            raise ValueError(f"Task(s) {', '.join(whole)} need the whole session; use submit")
+        if 'similarity' in tasks and store is None:
+            raise ValueError("The similarity task needs the session store")
+        # The caller keeps appending to the buffers these rows may view
+        rows = tuple(np.array(column) for column in rows)
+        return self._start(lambda: SharedSessionBlock.from_blocks(len(rows[0]), rows[1].shape[1], [rows]),
+                           tasks, params, store, analysis, callback)
+
+    def _start(self, make_block: Callable[[], SharedSessionBlock], tasks: tuple,
+               params: Optional[dict], store: Optional[SessionStore],
+               analysis: Optional[RunningAnalysis],
+               callback: Optional[Callable[[dict], None]]) -> Future:
+        """Copy on the reader thread, run on the pool, resolve after ``callback``"""
+        params = dict(params or {})
+        self.pending += 1
+        finished = Future()
+
+        def finish(result: dict):
+            self.pending -= 1
+            if callback:
+                callback(result)
+            finished.set_result(result)
+
+        def prepare():
+            try:
+                if 'similarity' in tasks:
+                    params['signature'] = signature(store)
+                block = make_block()
+            except Exception as e:
+                finish({'error': str(e)})
+                return
+            try:
+                future = self.executor.submit(run_analysis, block.descriptor, tasks, params, analysis)
+            except Exception as e:
+                block.release()
+                finish({'error': str(e)})
+                return
+
+            def done(f: Future):
+                try:
+                    result = f.result()
+                    if 'filter' in tasks:
+                        result['filtered'] = block.arrays()['filtered'].copy()
+                except Exception as e:
+                    result = {'error': str(e)}
+                finally:
+                    block.release()
+                finish(result)
+
+            future.add_done_callback(done)
+
+        self.reader.submit(prepare)
+        return finished
+
+    def map(self, stores: Iterable[SessionStore], tasks: Iterable[str] = DEFAULT_TASKS,
+            params: Optional[dict] = None) -> list:
+        """Analyze many sessions in parallel and wait for all results"""
+        futures = [self.submit(store, tasks, params) for store in stores]
+        return [f.result() for f in futures]
+
+    def shutdown(self, wait: bool = False):
+        self.reader.shutdown(wait=wait, cancel_futures=True)
+        self.executor.shutdown(wait=wait, cancel_futures=True)
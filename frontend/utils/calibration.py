@@ -0,0 +1,223 @@
+"""Sensor calibration: raw firmware readings to concentrations
+
+A calibration profile (JSON, one per rig) describes every channel:
+
+* ``mq`` channels (Grove GM-x02B): the firmware sends ADC counts / 1000.
+  Rs comes from the voltage divider, ``ppm = a * (Rs / R0) ** b`` with
+  R0 derived from the raw reading in clean air (``clean_air``).
+* ``mics`` channels: the firmware already converts with its own curve
+  ``log10(ratio) = m * log10(ppm) + c`` and the R0 measured at boot. That
+  curve is inverted to recover Rs/R0, ``r0_scale`` corrects R0 for the
+  rig and the profile's ``a``/``b`` curve is applied.
+
+Both ratios get a linear temperature term ``1 + temp_coeff * (T - T_ref)``.
+Evaluating the curves per sample is slow, so a profile is compiled once
+into a dense lookup table per channel (uniform in the raw reading, or in
+its log for the wide MiCS range) and blocks are converted with one
+vectorized gather and linear interpolation.
+"""
+
+import copy
+import json
+import os
+import numpy as np
+from typing import Dict, Optional
+
+from config.constants import (
+    SENSOR_KEYS, SENSOR_NAMES, CALIBRATION_PATH, CALIBRATION_TABLE_SIZE
+)
+
+# Readings at or below zero (including the firmware's -1) have no concentration
+INVALID = np.nan
+
+# Nominal datasheet-style curves; clean-air readings are those at the
+# start of the bundled captures. Replace both per rig.
+DEFAULT_PROFILE = {
+    'rig': 'default',
+    'reference_temperature': 20.0,
+    'temperature': 20.0,
+    'channels': [
+        {'key': 'no2', 'model': 'mq', 'a': 0.5, 'b': 1.3, 'clean_air': 0.97,
+         'vcc': 3.3, 'adc_max': 1023, 'temp_coeff': 0.0, 'range': [0.001, 1.023]},
+        {'key': 'eth', 'model': 'mq', 'a': 10.0, 'b': -1.6, 'clean_air': 0.86,
+         'vcc': 3.3, 'adc_max': 1023, 'temp_coeff': 0.0, 'range': [0.001, 1.023]},
+        {'key': 'voc', 'model': 'mq', 'a': 5.0, 'b': -1.5, 'clean_air': 0.41,
+         'vcc': 3.3, 'adc_max': 1023, 'temp_coeff': 0.0, 'range': [0.001, 1.023]},
+        {'key': 'co', 'model': 'mq', 'a': 20.0, 'b': -1.8, 'clean_air': 0.05,
+         'vcc': 3.3, 'adc_max': 1023, 'temp_coeff': 0.0, 'range': [0.001, 1.023]},
+        # MiCS defaults reproduce the firmware curves (identity at T_ref)
+        {'key': 'co_mics', 'model': 'mics', 'm': -0.85, 'c': 0.35,
+         'a': 10 ** (0.35 / 0.85), 'b': -1 / 0.85, 'r0_scale': 1.0,
+         'temp_coeff': 0.0, 'range': [0.001, 5000.0]},
+        {'key': 'eth_mics', 'model': 'mics', 'm': -0.65, 'c': 0.15,
+         'a': 10 ** (0.15 / 0.65), 'b': -1 / 0.65, 'r0_scale': 1.0,
+         'temp_coeff': 0.0, 'range': [0.001, 5000.0]},
+        {'key': 'voc_mics', 'model': 'mics', 'm': -0.75, 'c': -0.1,
+         'a': 10 ** (-0.1 / 0.75), 'b': -1 / 0.75, 'r0_scale': 1.0,
+         'temp_coeff': 0.0, 'range': [0.001, 5000.0]},
+    ],
+}
+
+
+def load_profile(name: Optional[str] = None) -> dict:
+    """Profile from a JSON path or a rig name in CALIBRATION_PATH
+
+    Missing keys (and a missing file for the ``default`` rig) fall back to
+    DEFAULT_PROFILE, matched per channel by ``key``.
+    """
+    profile = copy.deepcopy(DEFAULT_PROFILE)
+    if not name or (name == 'default' and not os.path.exists(_profile_path(name))):
+        return profile
+    path = name if name.endswith('.json') else _profile_path(name)
+    with open(path, 'r') as f:
+        loaded = json.load(f)
+    channels = {c['key']: c for c in profile['channels']}
+    for channel in loaded.pop('channels', []):
+        channels.setdefault(channel['key'], {}).update(channel)
+    profile.update(loaded)
+    profile['channels'] = [channels[key] for key in SENSOR_KEYS if key in channels]
+    return profile
+
+
+def save_profile(profile: dict, filename: Optional[str] = None) -> str:
+    filename = filename or _profile_path(profile.get('rig', 'default'))
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    with open(filename, 'w') as f:
+        json.dump(profile, f, indent=2)
+    return filename
+
+
+def _profile_path(rig: str) -> str:
+    return os.path.join(CALIBRATION_PATH, f"{rig}.json")
+
+
+def _mq_resistance(channel: dict, raw: np.ndarray) -> np.ndarray:
+    """Rs in units of the load resistor from ADC counts / 1000"""
+    vout = raw * 1000.0 / channel['adc_max'] * channel['vcc']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (channel['vcc'] - vout) / vout
+
+
+def channel_response(channel: dict, raw: np.ndarray, temperature: float,
+                     reference_temperature: float) -> np.ndarray:
+    """Exact curve evaluation for one channel (used to build the tables)"""
+    raw = np.asarray(raw, dtype=np.float64)
+    if channel['model'] == 'mq':
+        r0 = _mq_resistance(channel, np.float64(channel['clean_air']))
+        ratio = _mq_resistance(channel, raw) / r0
+    elif channel['model'] == 'mics':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = 10 ** (channel['m'] * np.log10(raw) + channel['c']) * channel['r0_scale']
+    else:
+        raise ValueError(f"Unknown calibration model '{channel['model']}'")
+    ratio = ratio / (1.0 + channel.get('temp_coeff', 0.0) * (temperature - reference_temperature))
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        ppm = channel['a'] * ratio ** channel['b']
+    return np.where((raw > 0) & (ratio > 0) & np.isfinite(ppm), ppm, INVALID)
+
+
+class CalibrationTable:
+    """A profile compiled to per-channel lookup tables
+
+    ``apply`` converts an (n, channels) block of raw readings to ppm with
+    linear interpolation between table entries; readings outside a
+    channel's ``range`` or at/below zero give NaN.
+    """
+
+    def __init__(self, profile: Optional[dict] = None, size: int = CALIBRATION_TABLE_SIZE,
+                 temperature: Optional[float] = None):
+        self.profile = copy.deepcopy(profile or DEFAULT_PROFILE)
+        if temperature is not None:
+            self.profile['temperature'] = float(temperature)
+        channels = self.profile['channels']
+        self.num_sensors = len(channels)
+        self.size = size
+        t = float(self.profile.get('temperature', 20.0))
+        t_ref = float(self.profile.get('reference_temperature', 20.0))
+
+        self.log_axis = np.array([c['model'] == 'mics' for c in channels])
+        ranges = np.array([c['range'] for c in channels], dtype=np.float64)
+        self.low_raw, self.high_raw = ranges[:, 0], ranges[:, 1]
+        self.low = np.where(self.log_axis, np.log10(ranges[:, 0]), ranges[:, 0])
+        high = np.where(self.log_axis, np.log10(ranges[:, 1]), ranges[:, 1])
+        self.inv_step = (size - 1) / (high - self.low)
+
+        self.tables = np.empty((self.num_sensors, size))
+        grid = np.linspace(0.0, 1.0, size)
+        for i, channel in enumerate(channels):
+            u = self.low[i] + grid * (high[i] - self.low[i])
+            raw = 10 ** u if self.log_axis[i] else u
+            self.tables[i] = channel_response(channel, raw, t, t_ref)
+
+    @classmethod
+    def load(cls, name: Optional[str] = None, **kwargs) -> 'CalibrationTable':
+        return cls(load_profile(name), **kwargs)
+
+    @property
+    def rig(self) -> str:
+        return self.profile.get('rig', 'default')
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        """Raw (n, channels) block -> ppm (n, channels)"""
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            return self.apply(values[None, :])[0]
+        valid = (values >= self.low_raw) & (values <= self.high_raw)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u = np.where(self.log_axis, np.log10(np.where(valid, values, 1.0)), values)
+        pos = np.clip((u - self.low) * self.inv_step, 0.0, self.size - 1)
+        idx = np.minimum(pos.astype(np.intp), self.size - 2)
+        frac = pos - idx
+        rows = np.arange(self.num_sensors)
+        lo = self.tables[rows, idx]
+        hi = self.tables[rows, idx + 1]
+        return np.where(valid, lo + (hi - lo) * frac, INVALID)
+
+    def save(self, filename: str, times: np.ndarray, ppm: np.ndarray) -> Optional[str]:
+        """Write calibrated values and the profile as a ``.ppm.npz`` sidecar"""
+        try:
+            np.savez_compressed(
+                filename, times=np.asarray(times), ppm=np.asarray(ppm, dtype=np.float32),
+                profile=np.array(json.dumps(self.profile)),
+                sensor_names=np.array(SENSOR_NAMES[:self.num_sensors]))
+            return filename
+        except Exception as e:
+            print(f"Error saving calibrated data: {str(e)}")
+            return None
+
+
+class CalibratedWriter:
+    """Export block writer for the ``.ppm.npz`` sidecar of the exported rows
+
+    Converts every block with ``table``; the lookup is stateless, so this
+    gives the same values as the live calibrated session.
+    """
+
+    def __init__(self, filename: str, table: CalibrationTable):
+        self.filename = filename
+        self.table = table
+        self._parts = []
+
+    def append_block(self, times, values, states=None, levels=None):
+        self._parts.append((np.array(times, dtype=np.float64),
+                            self.table.apply(values).astype(np.float32)))
+
+    def close(self) -> Optional[str]:
+        if self._parts:
+            times = np.concatenate([part[0] for part in self._parts])
+            ppm = np.concatenate([part[1] for part in self._parts])
+        else:
+            times, ppm = np.empty(0), np.empty((0, self.table.num_sensors), dtype=np.float32)
+        self._parts = []
+        return self.table.save(self.filename, times, ppm)
+
+    def abort(self):
+        self._parts = []
+
+
+def load_calibrated(filename: str) -> Dict[str, object]:
+    """Read a ``.ppm.npz`` sidecar; ``profile`` comes back as a dict"""
+    with np.load(filename) as data:
+        result = {key: data[key] for key in data.files}
+    result['profile'] = json.loads(str(result['profile']))
+    return result
@@ -0,0 +1,132 @@
+"""Acknowledged commands with round-trip timing, timeouts and retries
+
+``submit`` may be called from any thread; everything else runs on the
+network I/O thread. Each command gets an id and is written as
+``#<id> COMMAND``. The backend answers at once (``stage: backend``,
+``accepted``) and relays the firmware's ``ACK:<id>:<status>`` (``stage:
+arduino``). A command without an Arduino ack after ``timeout`` seconds
+is re-sent with the same id, so the firmware acknowledges it again
+without running it twice; after ``retries`` re-sends it fails.
+"""
+
+import itertools
+import os
+import queue
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from config.constants import COMMAND_TIMEOUT, COMMAND_RETRIES
+from utils.protocol import format_command
+
+
+class PendingCommand:
+    """One command in flight"""
+
+    def __init__(self, command_id: str, command: str):
+        self.id = command_id
+        self.command = command
+        self.created = None   # time.monotonic() of the first write
+        self.sent_at = None   # ... of the latest write
+        self.attempts = 0
+        self.backend_rtt = None  # seconds, first write -> backend ack
+
+    def event(self, stage: str, status: str, now: float) -> dict:
+        return {
+            'id': self.id,
+            'command': self.command,
+            'stage': stage,
+            'status': status,
+            'attempts': self.attempts,
+            'rtt_ms': None if self.created is None else (now - self.created) * 1000.0,
+            'backend_ms': None if self.backend_rtt is None else self.backend_rtt * 1000.0,
+        }
+
+
+class CommandTracker:
+    """Ids, retries and latency statistics for commands sent to the backend"""
+
+    def __init__(self, timeout: float = COMMAND_TIMEOUT, retries: int = COMMAND_RETRIES,
+                 history: int = 100):
+        self.timeout = timeout
+        self.retries = retries
+        # Random prefix so acks for another GUI on the same backend do not match
+        self.prefix = os.urandom(2).hex()
+        self._counter = itertools.count(1)
+        self._incoming: "queue.SimpleQueue[PendingCommand]" = queue.SimpleQueue()
+        self.pending: Dict[str, PendingCommand] = {}
+        self.latencies = deque(maxlen=history)  # Arduino round trips (ms)
+
+    def submit(self, command: str) -> str:
+        """Queue a command (any thread); returns its id"""
+        entry = PendingCommand(f"{self.prefix}-{next(self._counter)}", command)
+        self._incoming.put(entry)
+        return entry.id
+
+    def poll(self, now: Optional[float] = None) -> Tuple[List[str], List[dict]]:
+        """Lines to write now (new commands and due retries) and failed commands"""
+        now = time.monotonic() if now is None else now
+        while True:
+            try:
+                entry = self._incoming.get_nowait()
+            except queue.Empty:
+                break
+            self.pending[entry.id] = entry
+
+        lines, failures = [], []
+        for entry in list(self.pending.values()):
+            if entry.sent_at is None or now - entry.sent_at >= self.timeout:
+                if entry.attempts > self.retries:
+                    del self.pending[entry.id]
+                    failures.append(entry.event('timeout', 'TIMEOUT', now))
+                    continue
+                if entry.created is None:
+                    entry.created = now
+                entry.sent_at = now
+                entry.attempts += 1
+                lines.append(format_command(entry.id, entry.command))
+        return lines, failures
+
+    def on_ack(self, message: dict, now: Optional[float] = None) -> Optional[dict]:
+        """Match a ``command_ack``; returns an event dict, or None if not ours"""
+        now = time.monotonic() if now is None else now
+        entry = self.pending.get(str(message.get('id')))
+        if entry is None:
+            return None
+        if message.get('stage') == 'backend':
+            if not message.get('accepted', False):
+                del self.pending[entry.id]
+                return entry.event('rejected', 'NOT_FORWARDED', now)
+            if entry.backend_rtt is None:
+                entry.backend_rtt = now - entry.created
+            return entry.event('backend', 'FORWARDED', now)
+        del self.pending[entry.id]
+        event = entry.event('arduino', str(message.get('status', 'OK')), now)
+        self.latencies.append(event['rtt_ms'])
+        return event
+
+    def fail_all(self, reason: str) -> List[dict]:
+        """Drop every pending command (e.g. on disconnect)"""
+        now = time.monotonic()
+        failures = [entry.event('failed', reason, now) for entry in self.pending.values()]
+        self.pending.clear()
+        return failures
+
+    def next_deadline(self, now: Optional[float] = None) -> float:
+        """Seconds until the next retry is due (``timeout`` when idle)"""
+        now = time.monotonic() if now is None else now
+        due = [entry.sent_at + self.timeout - now for entry in self.pending.values()
+               if entry.sent_at is not None]
+        return max(0.0, min(due, default=self.timeout))
+
+    def summary(self) -> dict:
+        """Arduino round-trip statistics over the recent history"""
+        if not self.latencies:
+            return {'count': 0}
+        values = sorted(self.latencies)
+        return {
+            'count': len(values),
+            'mean_ms': sum(values) / len(values),
+            'median_ms': values[len(values) // 2],
+            'max_ms': values[-1],
+        }
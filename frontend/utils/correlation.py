@@ -0,0 +1,150 @@
+"""Streaming cross-sensor covariance and PCA projection
+
+Covariance is accumulated block by block with the pairwise (Chan et al.)
+update, so each sample costs O(channels^2) once and the session is never
+re-scanned. The PCA basis comes from the 7x7 matrix (standardized, i.e. a
+correlation PCA) of either the reference sessions or the live run.
+"""
+
+import numpy as np
+from typing import Dict
+
+from config.constants import NUM_SENSORS
+
+
+class StreamingCovariance:
+    """Running mean and covariance of an (n, channels) stream"""
+
+    def __init__(self, num_sensors: int = NUM_SENSORS):
+        self.num_sensors = num_sensors
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = np.zeros(self.num_sensors)
+        self._m2 = np.zeros((self.num_sensors, self.num_sensors))
+
+    def update(self, values: np.ndarray):
+        """Fold in a block of samples"""
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[None, :]
+        n = len(values)
+        if n == 0:
+            return
+        block_mean = values.mean(axis=0)
+        centered = values - block_mean
+        self._merge(n, block_mean, centered.T @ centered)
+
+    def merge(self, other: 'StreamingCovariance'):
+        """Combine with another estimator (e.g. several reference sessions)"""
+        if other.count:
+            self._merge(other.count, other.mean, other._m2)
+
+    def _merge(self, n: int, mean: np.ndarray, m2: np.ndarray):
+        total = self.count + n
+        delta = mean - self.mean
+        self._m2 += m2 + np.outer(delta, delta) * (self.count * n / total)
+        self.mean += delta * (n / total)
+        self.count = total
+
+    def covariance(self) -> np.ndarray:
+        if self.count < 2:
+            return np.zeros_like(self._m2)
+        return self._m2 / (self.count - 1)
+
+    def std(self) -> np.ndarray:
+        return np.sqrt(np.maximum(np.diag(self.covariance()), 0.0))
+
+    def correlation(self) -> np.ndarray:
+        """Pearson correlation; channels with zero variance get 0 off-diagonal"""
+        cov = self.covariance()
+        std = np.sqrt(np.maximum(np.diag(cov), 0.0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.outer(std, std)
+        corr[~np.isfinite(corr)] = 0.0
+        np.fill_diagonal(corr, 1.0)
+        return corr
+
+
+class PCAProjector:
+    """Project live samples onto principal axes, optionally fixed by references
+
+    With references loaded the axes (and standardization) come from their
+    pooled covariance and stay put, so the live trace can be compared with
+    the reference clouds. Without references the axes follow the live run.
+    Only the newest ``max_points`` live samples are kept for display.
+    """
+
+    def __init__(self, num_sensors: int = NUM_SENSORS, components: int = 2,
+                 max_points: int = 2000, reference_points: int = 300):
+        self.num_sensors = num_sensors
+        self.components = components
+        self.max_points = max_points
+        self.reference_points = reference_points
+        self.live = StreamingCovariance(num_sensors)
+        self.reference_stats = None
+        self.references = {}  # label -> (k, components) projected points
+        self._recent = np.empty((0, num_sensors))
+        self._basis = None
+        self._center = None
+        self._scale = None
+        self.explained = np.zeros(components)
+
+    def reset(self):
+        """Start a new live run (references are kept)"""
+        self.live.reset()
+        self._recent = np.empty((0, self.num_sensors))
+        if self.reference_stats is None:
+            self._basis = None
+
+    def _fit(self, stats: StreamingCovariance):
+        std = stats.std()
+        std[std == 0] = 1.0
+        corr = stats.covariance() / np.outer(std, std)
+        eigvals, eigvecs = np.linalg.eigh(corr)
+        order = np.argsort(eigvals)[::-1][:self.components]
+        basis = eigvecs[:, order]
+        # Deterministic sign: largest loading positive, so axes don't flip between fits
+        signs = np.sign(basis[np.abs(basis).argmax(axis=0), np.arange(basis.shape[1])])
+        self._basis = basis * np.where(signs == 0, 1.0, signs)
+        self._center = stats.mean.copy()
+        self._scale = std
+        total = eigvals.sum()
+        self.explained = eigvals[order] / total if total > 0 else np.zeros(len(order))
+
+    def set_references(self, sessions: Dict[str, np.ndarray]):
+        """Fit fixed axes on labelled reference sessions ({label: (n, channels)})"""
+        pooled = StreamingCovariance(self.num_sensors)
+        for values in sessions.values():
+            pooled.update(values)
+        if pooled.count < 2:
+            return
+        self.reference_stats = pooled
+        self._fit(pooled)
+        self.references = {}
+        for label, values in sessions.items():
+            values = np.asarray(values, dtype=np.float64)
+            step = max(1, len(values) // self.reference_points)
+            self.references[label] = self.project(values[::step])
+
+    def project(self, values: np.ndarray) -> np.ndarray:
+        if self._basis is None:
+            return np.empty((0, self.components))
+        return ((np.asarray(values, dtype=np.float64) - self._center) / self._scale) @ self._basis
+
+    def push(self, values: np.ndarray):
+        """Add a live block: O(1) per sample for the statistics"""
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[None, :]
+        if not len(values):
+            return
+        self.live.update(values)
+        self._recent = np.concatenate((self._recent, values))[-self.max_points:]
+        if self.reference_stats is None and self.live.count >= 2:
+            self._fit(self.live)
+
+    def live_points(self) -> np.ndarray:
+        """(k, components) projection of the retained live samples"""
+        return self.project(self._recent)
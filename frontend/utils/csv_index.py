@@ -0,0 +1,215 @@
+"""Sparse seek index for session CSV files
+
+A session CSV is a metadata header followed by plain text rows, so
+reaching minute 25 normally means parsing every row before it.
+``CSVSeekIndex`` records the time and byte offset of every
+``CSV_SEEK_ROWS``-th row in one pass and keeps them in a ``.seek.npz``
+sidecar. Later reads look up the nearest entry, ``seek`` to it and parse
+only the rows they need, so a time range costs O(range) instead of
+O(file). The sidecar stores the CSV's size and mtime and is rebuilt when
+they no longer match.
+"""
+
+import json
+import os
+import numpy as np
+from typing import Dict, Iterator, Optional, Tuple
+
+from config.constants import CSV_SEEK_ROWS
+from utils.phase_index import PhaseIndex
+
+SEEK_SUFFIX = ".seek.npz"
+
+Block = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def csv_metadata(header: Dict[str, str]) -> dict:
+    """Header rows of a session CSV -> SessionStore metadata"""
+    metadata = {
+        'name': header.get("Sample Name", "Unknown"),
+        'type': header.get("Herbal Type", header.get("Sample Type", "Unknown")),
+        'export_date': header.get("Export Date", ""),
+        'mode': header.get("Analysis Mode", ""),
+    }
+    if "Sample Rate (Hz)" in header:
+        metadata['sample_rate_hz'] = float(header["Sample Rate (Hz)"])
+    return metadata
+
+
+def _stat(filename: str) -> Tuple[int, int]:
+    info = os.stat(filename)
+    return info.st_size, info.st_mtime_ns
+
+
+class CSVSeekIndex:
+    """Time and byte offset of every ``every``-th data row of a session CSV
+
+    ``times[i]`` and ``offsets[i]`` belong to row ``i * every``; a final
+    offset marks the end of the data. Blank lines are skipped and not
+    counted as rows.
+    """
+
+    def __init__(self, filename: str, every: int, times: np.ndarray, offsets: np.ndarray,
+                 num_rows: int, num_sensors: int, header: Dict[str, str],
+                 size: int, mtime_ns: int):
+        self.filename = filename
+        self.every = every
+        self.times = times
+        self.offsets = offsets
+        self.num_rows = num_rows
+        self.num_sensors = num_sensors
+        self.header = header
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self._phases = None
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    @property
+    def metadata(self) -> dict:
+        return csv_metadata(self.header)
+
+    @property
+    def last_time(self) -> float:
+        if not self.num_rows:
+            return 0.0
+        return float(self.read_rows(self.num_rows - 1, self.num_rows)[0][0])
+
+    # ---- building and persistence ----
+
+    @classmethod
+    def build(cls, filename: str, every: int = CSV_SEEK_ROWS) -> 'CSVSeekIndex':
+        """One pass over the file; only the time column of each row is parsed"""
+        size, mtime_ns = _stat(filename)
+        header = {}
+        times, offsets = [], []
+        rows = 0
+        with open(filename, 'rb') as f:
+            line = f.readline()
+            while line and not line.startswith(b"Time (s)"):
+                fields = line.decode('utf-8', errors='replace').rstrip('\r\n').split(',')
+                if len(fields) >= 2:
+                    header[fields[0]] = fields[1]
+                line = f.readline()
+            if not line:
+                raise ValueError(f"{filename} has no 'Time (s)' header row")
+            num_sensors = max(len(line.split(b',')) - 1, 1)
+
+            offset = f.tell()
+            for line in iter(f.readline, b''):
+                if line.strip():
+                    if rows % every == 0:
+                        times.append(float(line.split(b',', 1)[0]))
+                        offsets.append(offset)
+                    rows += 1
+                offset += len(line)
+            offsets.append(offset)
+        return cls(filename, every, np.array(times, dtype=np.float64),
+                   np.array(offsets, dtype=np.int64), rows, num_sensors, header, size, mtime_ns)
+
+    @staticmethod
+    def sidecar(filename: str) -> str:
+        """``data/x.csv`` -> ``data/x.seek.npz``"""
+        return os.path.splitext(filename)[0] + SEEK_SUFFIX
+
+    def save(self, filename: Optional[str] = None) -> Optional[str]:
+        filename = filename or self.sidecar(self.filename)
+        try:
+            with open(filename, 'wb') as f:
+                np.savez(f, times=self.times, offsets=self.offsets,
+                         info=np.array([self.every, self.num_rows, self.num_sensors,
+                                        self.size, self.mtime_ns], dtype=np.int64),
+                         header=np.array(json.dumps(self.header)))
+            return filename
+        except Exception as e:
+            print(f"Error saving seek index: {str(e)}")
+            return None
+
+    @classmethod
+    def load(cls, filename: str, csv_filename: str) -> 'CSVSeekIndex':
+        with np.load(filename) as data:
+            every, rows, sensors, size, mtime_ns = (int(v) for v in data['info'])
+            return cls(csv_filename, every, data['times'], data['offsets'], rows, sensors,
+                       json.loads(str(data['header'])), size, mtime_ns)
+
+    def is_current(self) -> bool:
+        """False once the CSV has been rewritten since the index was built"""
+        try:
+            return _stat(self.filename) == (self.size, self.mtime_ns)
+        except OSError:
+            return False
+
+    @classmethod
+    def open(cls, filename: str, every: int = CSV_SEEK_ROWS, save: bool = True) -> 'CSVSeekIndex':
+        """The sidecar index if it is current, otherwise a fresh one (saved if possible)"""
+        sidecar = cls.sidecar(filename)
+        if os.path.exists(sidecar):
+            try:
+                index = cls.load(sidecar, filename)
+                if index.is_current() and index.every == every:
+                    return index
+            except Exception as e:
+                print(f"⚠️ Rebuilding seek index {sidecar}: {e}")
+        index = cls.build(filename, every)
+        if save:
+            index.save(sidecar)
+        return index
+
+    # ---- random access ----
+
+    @property
+    def phases(self) -> Optional[PhaseIndex]:
+        """States from the ``.phases.json`` sidecar, if it matches the rows"""
+        if self._phases is None:
+            sidecar = PhaseIndex.sidecar(self.filename)
+            phases = PhaseIndex.load(sidecar) if os.path.exists(sidecar) else None
+            self._phases = phases if phases is not None and phases.num_rows == self.num_rows else False
+        return self._phases or None
+
+    def read_rows(self, start: int, stop: int) -> Block:
+        """Rows ``start:stop`` as (times, values, states, levels), parsing only their entries"""
+        start, stop = max(start, 0), min(stop, self.num_rows)
+        if start >= stop:
+            return (np.empty(0), np.empty((0, self.num_sensors)),
+                    np.empty(0, dtype=np.int8), np.empty(0, dtype=np.int8))
+        first = start // self.every
+        last = min(-(-stop // self.every), len(self.times))
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offsets[first])
+            raw = f.read(self.offsets[last] - self.offsets[first])
+        data = np.loadtxt(raw.decode('utf-8').splitlines(), delimiter=',', ndmin=2)
+        data = data[start - first * self.every:stop - first * self.every]
+        if self.phases is not None:
+            states, levels = self.phases.expand(start, stop)
+        else:
+            states = np.zeros(len(data), dtype=np.int8)
+            levels = np.zeros(len(data), dtype=np.int8)
+        return data[:, 0], data[:, 1:1 + self.num_sensors], states, levels
+
+    def row_at(self, t: float, side: str = 'left') -> int:
+        """First row with time >= t (``side='right'``: time > t)"""
+        if not self.num_rows:
+            return 0
+        i = max(int(np.searchsorted(self.times, t, side='right')) - 1, 0)
+        start = i * self.every
+        times = self.read_rows(start, start + self.every)[0]
+        return start + int(np.searchsorted(times, t, side=side))
+
+    def rows_between(self, t0: float, t1: float) -> Tuple[int, int]:
+        """[start, stop) rows with t0 <= time <= t1"""
+        start = self.row_at(t0)
+        return start, max(start, self.row_at(t1, side='right'))
+
+    def read_time(self, t0: float, t1: float) -> Block:
+        """Rows with t0 <= time <= t1"""
+        return self.read_rows(*self.rows_between(t0, t1))
+
+    def iter_blocks(self, start_time: Optional[float] = None,
+                    block_rows: Optional[int] = None) -> Iterator[Block]:
+        """Blocks of rows from ``start_time`` (or the first row) to the end"""
+        block_rows = block_rows or 8 * self.every
+        row = 0 if start_time is None else self.row_at(start_time)
+        while row < self.num_rows:
+            yield self.read_rows(row, row + block_rows)
+            row += block_rows
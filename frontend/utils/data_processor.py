@@ -1,8 +1,15 @@
 """Data processing utilities"""
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from typing import List
 
+from config.constants import (
+    NUM_SENSORS, SPECTRAL_BANDS, SPECTRAL_WINDOW, STATE_HOLD, STATE_PRE_COND, NUM_LEVELS
+)
+from utils.spectral import welch, band_powers, frame_psd, hann_window, DEFAULT_RATE
+from utils.protocol import scale_samples
+
 class DataProcessor:
     """Process and filter sensor data"""
     
@@ -62,3 +69,279 @@ class DataProcessor:
             'std': float(data_array.std()),
             'variance': float(data_array.var()),
         }
+
+    @staticmethod
+    def moving_average_block(values: np.ndarray, window_size: int = 5) -> np.ndarray:
+        """Trailing moving average down each column of an (n, channels) array"""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0 or window_size <= 1:
+            return values.copy()
+        csum = np.cumsum(values, axis=0)
+        out = np.empty_like(values)
+        w = min(window_size, len(values))
+        # Warm-up rows average over what is available so far
+        out[:w] = csum[:w] / np.arange(1, w + 1)[:, None]
+        out[w:] = (csum[w:] - csum[:-w]) / w
+        return out
+    
+    @staticmethod
+    def block_statistics(values: np.ndarray) -> dict:
+        """Per-channel statistics of an (n, channels) array"""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return {}
+        return {
+            'min': values.min(axis=0),
+            'max': values.max(axis=0),
+            'mean': values.mean(axis=0),
+            'median': np.median(values, axis=0),
+            'std': values.std(axis=0),
+            'variance': values.var(axis=0),
+        }
+    
+    @staticmethod
+    def segment_phases(states: np.ndarray, levels: np.ndarray) -> np.ndarray:
+        """Split a session into runs of constant (state, level)
+        
+        Returns an (m, 4) int array of [state, level, start, end) rows.
+        """
+        states = np.asarray(states)
+        levels = np.asarray(levels)
+        n = len(states)
+        if n == 0:
+            return np.empty((0, 4), dtype=np.int64)
+        changes = np.flatnonzero((np.diff(states) != 0) | (np.diff(levels) != 0)) + 1
+        starts = np.concatenate(([0], changes))
+        ends = np.concatenate((changes, [n]))
+        return np.column_stack((states[starts], levels[starts], starts, ends)).astype(np.int64)
+    
+    @staticmethod
+    def extract_features(times: np.ndarray, values: np.ndarray, states: np.ndarray,
+                         levels: np.ndarray, hold_state: int = STATE_HOLD, baseline_state: int = STATE_PRE_COND,
+                         num_levels: int = NUM_LEVELS) -> np.ndarray:
+        """Per-level HOLD response features
+        
+        For each fan level: mean response above baseline, peak response and
+        slope (per second) of every channel during HOLD. The baseline is the
+        PRE-COND mean, or the first samples when no PRE-COND was recorded.
+        Returns a (num_levels, 3, channels) array; levels never reached are NaN.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        channels = values.shape[1] if values.ndim == 2 else 0
+        features = np.full((num_levels, 3, channels), np.nan)
+        if len(values) == 0:
+            return features
+        
+        baseline_mask = np.asarray(states) == baseline_state
+        if baseline_mask.any():
+            baseline = values[baseline_mask].mean(axis=0)
+        else:
+            baseline = values[:min(10, len(values))].mean(axis=0)
+        
+        hold = np.asarray(states) == hold_state
+        for level in range(num_levels):
+            mask = hold & (np.asarray(levels) == level)
+            if mask.sum() < 2:
+                continue
+            seg = values[mask]
+            t = np.asarray(times)[mask]
+            t = t - t.mean()
+            denom = (t * t).sum()
+            features[level, 0] = seg.mean(axis=0) - baseline
+            features[level, 1] = seg.max(axis=0) - baseline
+            features[level, 2] = (t @ (seg - seg.mean(axis=0))) / denom if denom > 0 else 0.0
+        return features
+    
+    @staticmethod
+    def extract_band_powers(values: np.ndarray, states: np.ndarray, levels: np.ndarray,
+                            rate_hz: float = DEFAULT_RATE, hold_state: int = STATE_HOLD,
+                            num_levels: int = NUM_LEVELS) -> np.ndarray:
+        """Per-level HOLD band power (Welch) of every channel
+        
+        Returns a (num_levels, bands, channels) array over SPECTRAL_BANDS;
+        levels with fewer than two samples in HOLD are NaN.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        channels = values.shape[1] if values.ndim == 2 else 0
+        powers = np.full((num_levels, len(SPECTRAL_BANDS), channels), np.nan)
+        hold = np.asarray(states) == hold_state
+        for level in range(num_levels):
+            mask = hold & (np.asarray(levels) == level)
+            if mask.sum() < 2:
+                continue
+            freqs, psd = welch(values[mask], rate_hz, scale_samples(SPECTRAL_WINDOW, rate_hz))
+            powers[level] = band_powers(freqs, psd)
+        return powers
+
+
+class RunningAnalysis:
+    """Segmentation, HOLD features and band powers of a session fed block by block
+
+    ``push`` takes the rows added since the previous call; ``segments``,
+    ``features`` and ``band_powers`` match ``DataProcessor.segment_phases``
+    / ``extract_features`` / ``extract_band_powers`` over the whole
+    session (up to float rounding). Only sums per fan level, the open
+    phase segment, the first rows (baseline fallback) and, per level, the
+    HOLD rows of the next Welch frame are kept, so the state stays small
+    and pickles cheaply to pool workers whatever the run length.
+    """
+
+    BASELINE_ROWS = 10  # fallback baseline without PRE-COND, as in extract_features
+
+    def __init__(self, num_sensors: int = NUM_SENSORS, rate_hz: float = DEFAULT_RATE,
+                 hold_state: int = STATE_HOLD, baseline_state: int = STATE_PRE_COND,
+                 num_levels: int = NUM_LEVELS, spectral: bool = True):
+        self.num_sensors = num_sensors
+        self.rate_hz = rate_hz
+        self.hold_state = hold_state
+        self.baseline_state = baseline_state
+        self.num_levels = num_levels
+        self.spectral = spectral
+        self.frame_length = scale_samples(SPECTRAL_WINDOW, rate_hz)
+        self.num_rows = 0
+        self.first_time = None
+        self.last_time = None
+        self._segments = []           # closed [state, level, start, end) rows
+        self._open = None             # [state, level, start] of the last segment
+        self._first_rows = np.empty((0, num_sensors))
+        self._base_count = 0
+        self._base_sum = np.zeros(num_sensors)
+        # Whole run: sums of the offset from the first row (keeps the variance precise)
+        self._origin = None
+        self._sum = np.zeros(num_sensors)
+        self._sumsq = np.zeros(num_sensors)
+        self._max = np.full(num_sensors, -np.inf)
+        # Per fan level during HOLD; times relative to the level's first HOLD time
+        shape = (num_levels, num_sensors)
+        self.hold_count = np.zeros(num_levels, dtype=np.int64)
+        self.hold_start = np.full(num_levels, np.nan)
+        self.hold_end = np.full(num_levels, np.nan)
+        self._t_sum = np.zeros(num_levels)
+        self._tt_sum = np.zeros(num_levels)
+        self._v_sum = np.zeros(shape)
+        self._tv_sum = np.zeros(shape)
+        self._v_max = np.full(shape, -np.inf)
+        # Welch: summed frame PSDs and the rows from the next frame start on
+        self._psd_sum = [None] * num_levels
+        self._frames = np.zeros(num_levels, dtype=np.int64)
+        self._pending = [np.empty((0, num_sensors)) for _ in range(num_levels)]
+
+    def push(self, times: np.ndarray, values: np.ndarray, states: np.ndarray, levels: np.ndarray):
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        states = np.asarray(states, dtype=np.int64)
+        levels = np.asarray(levels, dtype=np.int64)
+        n = len(times)
+        if n == 0:
+            return
+        if self.first_time is None:
+            self.first_time = float(times[0])
+            self._origin = values[0].copy()
+        self.last_time = float(times[-1])
+        self._push_segments(states, levels)
+
+        if len(self._first_rows) < self.BASELINE_ROWS:
+            self._first_rows = np.concatenate(
+                (self._first_rows, values[:self.BASELINE_ROWS - len(self._first_rows)]))
+        base = states == self.baseline_state
+        self._base_count += int(base.sum())
+        self._base_sum += values[base].sum(axis=0)
+        offset = values - self._origin
+        self._sum += offset.sum(axis=0)
+        self._sumsq += (offset * offset).sum(axis=0)
+        self._max = np.maximum(self._max, values.max(axis=0))
+
+        hold = states == self.hold_state
+        for level in np.unique(levels[hold]):
+            if not 0 <= level < self.num_levels:
+                continue
+            mask = hold & (levels == level)
+            seg, t = values[mask], times[mask]
+            if not self.hold_count[level]:
+                self.hold_start[level] = t[0]
+            self.hold_end[level] = t[-1]
+            t = t - self.hold_start[level]
+            self.hold_count[level] += len(t)
+            self._t_sum[level] += t.sum()
+            self._tt_sum[level] += (t * t).sum()
+            self._v_sum[level] += seg.sum(axis=0)
+            self._tv_sum[level] += t @ seg
+            self._v_max[level] = np.maximum(self._v_max[level], seg.max(axis=0))
+            if self.spectral:
+                self._push_frames(level, seg)
+        self.num_rows += n
+
+    def _push_segments(self, states: np.ndarray, levels: np.ndarray):
+        runs = DataProcessor.segment_phases(states, levels)
+        runs[:, 2:] += self.num_rows
+        if self._open is not None:
+            if runs[0, 0] == self._open[0] and runs[0, 1] == self._open[1]:
+                runs[0, 2] = self._open[2]
+            else:
+                self._segments.append(self._open + [int(runs[0, 2])])
+        self._segments.extend(runs[:-1].tolist())
+        self._open = runs[-1, :3].tolist()
+
+    def _push_frames(self, level: int, seg: np.ndarray):
+        """Welch frames of this level's HOLD rows that are now complete"""
+        pending = np.concatenate((self._pending[level], seg))
+        length = self.frame_length
+        hop = max(1, length // 2)
+        if len(pending) >= length:
+            count = (len(pending) - length) // hop + 1
+            frames = sliding_window_view(pending, length, axis=0)[:count * hop:hop]
+            window, norm = hann_window(length)
+            psd = frame_psd(frames.transpose(0, 2, 1), window, norm, self.rate_hz).sum(axis=0)
+            self._psd_sum[level] = psd if self._psd_sum[level] is None else self._psd_sum[level] + psd
+            self._frames[level] += count
+            pending = pending[count * hop:]
+        self._pending[level] = pending.copy()
+
+    def segments(self) -> np.ndarray:
+        """(m, 4) [state, level, start, end) rows, as ``segment_phases``"""
+        if self._open is None:
+            return np.empty((0, 4), dtype=np.int64)
+        return np.array(self._segments + [self._open + [self.num_rows]], dtype=np.int64)
+
+    def baseline(self) -> np.ndarray:
+        if self._base_count:
+            return self._base_sum / self._base_count
+        return self._first_rows.mean(axis=0) if len(self._first_rows) else np.full(self.num_sensors, np.nan)
+
+    def statistics(self) -> dict:
+        """Whole-run mean, max and (population) std per channel"""
+        if not self.num_rows:
+            return {}
+        mean = self._sum / self.num_rows
+        with np.errstate(invalid='ignore'):
+            std = np.sqrt(np.maximum(self._sumsq / self.num_rows - mean * mean, 0.0))
+        return {'mean': self._origin + mean, 'max': self._max.copy(), 'std': std}
+
+    def features(self) -> np.ndarray:
+        """(num_levels, 3, channels) as ``extract_features``"""
+        features = np.full((self.num_levels, 3, self.num_sensors), np.nan)
+        if not self.num_rows:
+            return features
+        baseline = self.baseline()
+        for level in np.flatnonzero(self.hold_count >= 2):
+            n = self.hold_count[level]
+            mean = self._v_sum[level] / n
+            denom = self._tt_sum[level] - self._t_sum[level] ** 2 / n
+            features[level, 0] = mean - baseline
+            features[level, 1] = self._v_max[level] - baseline
+            features[level, 2] = ((self._tv_sum[level] - self._t_sum[level] * mean) / denom
+                                  if denom > 0 else 0.0)
+        return features
+
+    def band_powers(self) -> np.ndarray:
+        """(num_levels, bands, channels) as ``extract_band_powers``"""
+        powers = np.full((self.num_levels, len(SPECTRAL_BANDS), self.num_sensors), np.nan)
+        for level in np.flatnonzero(self.hold_count >= 2):
+            if self._frames[level]:
+                freqs = np.fft.rfftfreq(self.frame_length, d=1.0 / self.rate_hz)
+                psd = self._psd_sum[level] / self._frames[level]
+            else:
+                # Fewer HOLD rows than one frame: all of them are still pending
+                freqs, psd = welch(self._pending[level], self.rate_hz, self.frame_length)
+            powers[level] = band_powers(freqs, psd)
+        return powers
@@ -0,0 +1,298 @@
+"""Sliding-window datasets over recorded sessions
+
+Windows are strided NumPy views into a session's value array, so slicing
+a session into thousands of overlapping windows copies nothing. Sessions
+are loaded one at a time while iterating, and a dataset can be split into
+shards that worker processes generate in parallel, keeping memory at
+roughly one session per process regardless of dataset size.
+
+Note: CSV rows carry no FSM state; a CSV's states come from its
+``.phases.json`` sidecar, so phase filters skip CSVs saved without one.
+"""
+
+import json
+import multiprocessing
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Iterator, List, Optional, Sequence, Union
+
+from config.constants import SAMPLE_TYPES, ANALYSIS_WORKERS, STATE_HOLD
+from utils.data_processor import DataProcessor
+from utils.file_handler import FileHandler, find_sessions
+from utils.session_store import SessionStore
+
+
+def count_windows(n: int, length: int, stride: int) -> int:
+    return max(0, (n - length) // stride + 1)
+
+
+def sliding_windows(values: np.ndarray, length: int, stride: int = 1) -> np.ndarray:
+    """(k, length, channels) read-only view of every ``stride``-th window"""
+    values = np.asarray(values)
+    if len(values) < length:
+        return np.empty((0, length) + values.shape[1:], dtype=values.dtype)
+    view = sliding_window_view(values, length, axis=0)[::stride]  # (k, channels, length)
+    return np.moveaxis(view, -1, 1)
+
+
+def session_label(metadata: dict, filename: str = "") -> str:
+    """Herbal type from the metadata, else the file name prefix (``kunyit_2025...``)"""
+    label = (metadata or {}).get('type', 'Unknown')
+    if label in ('', 'Unknown', None) and filename:
+        label = os.path.basename(filename).split('_')[0]
+    return label or 'Unknown'
+
+
+def session_windows(store: SessionStore, length: int, stride: int,
+                    state: Optional[int] = None, levels: Optional[Sequence[int]] = None):
+    """Yield (windows, start_indices, level) per contiguous segment
+
+    Without ``state`` the whole session is one segment (level -1). With a
+    state, windows never cross a phase or fan-level boundary.
+    """
+    values = store.values
+    if state is None:
+        windows = sliding_windows(values, length, stride)
+        yield windows, np.arange(len(windows)) * stride, -1
+        return
+    for seg_state, level, start, end in DataProcessor.segment_phases(store.states, store.levels):
+        if seg_state != state or (levels is not None and level not in levels):
+            continue
+        windows = sliding_windows(values[start:end], length, stride)
+        if len(windows):
+            yield windows, start + np.arange(len(windows)) * stride, int(level)
+
+
+class WindowDataset:
+    """Lazy fixed-length windows over many sessions
+
+    Iterating yields batch dicts with ``windows`` (zero-copy view, up to
+    ``batch_size`` windows from one segment), ``labels`` (class indices into
+    ``classes``), ``session`` (index into ``sources``), ``level`` and
+    ``start_times``. Sources are file paths or SessionStores.
+    """
+
+    def __init__(self, sources: Sequence[Union[str, SessionStore]], length: int = 64,
+                 stride: int = 16, state: Optional[int] = None,
+                 levels: Optional[Sequence[int]] = None, batch_size: int = 1024,
+                 classes: Optional[List[str]] = None):
+        self.sources = list(sources)
+        self.length = length
+        self.stride = stride
+        self.state = state
+        self.levels = None if levels is None else list(levels)
+        self.batch_size = batch_size
+        self.classes = list(classes or SAMPLE_TYPES)
+
+    @classmethod
+    def from_directory(cls, directory: str, **kwargs) -> 'WindowDataset':
+        """All sessions in a directory (CSV, archives, JSON exports), one file per run"""
+        return cls(find_sessions([directory]), **kwargs)
+
+    def hold_only(self, levels: Optional[Sequence[int]] = None) -> 'WindowDataset':
+        """Same dataset restricted to HOLD segments (optionally some fan levels)"""
+        return self._derive(self.sources, state=STATE_HOLD, levels=levels)
+
+    def shard(self, index: int, count: int) -> 'WindowDataset':
+        """Every ``count``-th session starting at ``index``"""
+        return self._derive(self.sources[index::count])
+
+    def _derive(self, sources, **changes) -> 'WindowDataset':
+        settings = dict(length=self.length, stride=self.stride, state=self.state,
+                        levels=self.levels, batch_size=self.batch_size, classes=self.classes)
+        settings.update(changes)
+        return WindowDataset(sources, **settings)
+
+    def label_index(self, label: str) -> int:
+        if label not in self.classes:
+            self.classes.append(label)
+        return self.classes.index(label)
+
+    def load(self, i: int) -> SessionStore:
+        source = self.sources[i]
+        return source if isinstance(source, SessionStore) else FileHandler.load_session(source)
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self.sources)):
+            try:
+                store = self.load(i)
+            except Exception as e:
+                print(f"⚠️ Skipping {self.sources[i]} for the dataset: {e}")
+                continue
+            filename = self.sources[i] if isinstance(self.sources[i], str) else ""
+            label = self.label_index(session_label(store.metadata, filename))
+            times = store.times
+            for windows, starts, level in session_windows(store, self.length, self.stride,
+                                                          self.state, self.levels):
+                for b in range(0, len(windows), self.batch_size):
+                    batch = windows[b:b + self.batch_size]
+                    yield {
+                        'windows': batch,
+                        'labels': np.full(len(batch), label, dtype=np.int16),
+                        'session': i,
+                        'level': level,
+                        'start_times': times[starts[b:b + self.batch_size]],
+                    }
+            del store
+
+    def count(self) -> int:
+        """Total windows (loads each session once, keeps none)"""
+        return sum(len(batch['windows']) for batch in self)
+
+
+# ---- sharded parallel export ----
+
+def _export_shard(dataset: WindowDataset, shard: int, output_dir: str, dtype: str) -> List[dict]:
+    """Worker: write one ``.npz`` per session of the shard"""
+    written = []
+    current, parts = None, []
+
+    def flush():
+        if not parts:
+            return
+        session = current
+        source = dataset.sources[session]
+        name = os.path.splitext(os.path.basename(source))[0] if isinstance(source, str) \
+            else f"session{session}"
+        path = os.path.join(output_dir, f"shard{shard:02d}_{name}.npz")
+        windows = np.concatenate([p['windows'] for p in parts]).astype(dtype)
+        labels = np.concatenate([p['labels'] for p in parts])
+        # Class indices beyond SAMPLE_TYPES are per worker; keep the name too
+        label = dataset.classes[int(labels[0])]
+        np.savez(path, windows=windows, labels=labels, label=np.array(label),
+                 levels=np.concatenate([np.full(len(p['windows']), p['level'], dtype=np.int8)
+                                        for p in parts]),
+                 start_times=np.concatenate([p['start_times'] for p in parts]))
+        written.append({'file': os.path.basename(path), 'label': label, 'windows': len(windows)})
+
+    for batch in dataset:
+        if batch['session'] != current:
+            flush()
+            current, parts = batch['session'], []
+        parts.append(batch)
+    flush()
+    return written
+
+
+def export_shards(dataset: WindowDataset, output_dir: str, workers: int = ANALYSIS_WORKERS,
+                  dtype: str = 'float32') -> str:
+    """Generate the dataset in ``workers`` processes and write a manifest
+
+    Each worker handles every ``workers``-th session and writes one
+    ``.npz`` per session, so memory stays at about one session per worker.
+    Returns the manifest path.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(_export_shard, dataset.shard(k, workers), k, output_dir, dtype)
+                   for k in range(workers)]
+        files = [entry for future in futures for entry in future.result()]
+
+    manifest = {
+        'length': dataset.length,
+        'stride': dataset.stride,
+        'state': dataset.state,
+        'levels': dataset.levels,
+        'classes': dataset.classes + sorted({f['label'] for f in files} - set(dataset.classes)),
+        'total_windows': sum(f['windows'] for f in files),
+        'files': sorted(files, key=lambda f: f['file']),
+    }
+    path = os.path.join(output_dir, "manifest.json")
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+# ---- streaming windows of one session ----
+
+class WindowWriter:
+    """Cut windows from a session fed block by block and save them as ``.npz``
+
+    Produces the same windows and ``.npz`` keys as ``session_windows`` /
+    ``export_shards`` without holding the session: the rows of the open
+    segment that a later window still needs are carried over between
+    blocks (fewer than ``length`` + ``stride``). Only the windows
+    themselves are kept until ``close``.
+    """
+
+    def __init__(self, filename: str, length: int = 64, stride: int = 16,
+                 state: Optional[int] = None, levels: Optional[Sequence[int]] = None,
+                 label: str = 'Unknown', dtype: str = 'float32'):
+        self.filename = filename
+        self.length = length
+        self.stride = stride
+        self.state = state
+        self.levels = None if levels is None else list(levels)
+        self.label = label
+        self.dtype = dtype
+        self.num_points = 0
+        self.num_windows = 0
+        self._parts = []       # (windows, start_times, level) per block and segment
+        self._key = None       # (state, level) of the open segment
+        self._carry = None     # (times, values) of its rows from the next window start on
+        self._skip = 0         # rows still to skip before the next window starts
+
+    def append_block(self, times, values, states=None, levels=None):
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values)
+        n = len(times)
+        if not n:
+            return
+        if self.state is None:
+            runs = [(None, -1, 0, n)]
+        else:
+            runs = DataProcessor.segment_phases(np.asarray(states), np.asarray(levels))
+        for seg_state, level, start, end in runs:
+            key = (seg_state, int(level))
+            if key != self._key:
+                self._key, self._carry, self._skip = key, None, 0
+            if self.state is not None and (seg_state != self.state or (
+                    self.levels is not None and level not in self.levels)):
+                continue
+            self._cut(times[start:end], values[start:end], int(level))
+        self.num_points += n
+
+    def _cut(self, times: np.ndarray, values: np.ndarray, level: int):
+        skip = min(self._skip, len(times))
+        self._skip -= skip
+        times, values = times[skip:], values[skip:]
+        if self._carry is not None:
+            times = np.concatenate([self._carry[0], times])
+            values = np.concatenate([self._carry[1], values])
+        windows = sliding_windows(values, self.length, self.stride)
+        k = len(windows)
+        if k:
+            self._parts.append((windows.astype(self.dtype),
+                                times[np.arange(k) * self.stride], level))
+            self.num_windows += k
+        # The next window starts k * stride rows in, possibly past this block
+        next_start = k * self.stride
+        self._carry = (times[next_start:].copy(), values[next_start:].copy())
+        self._skip = max(next_start - len(times), 0)
+
+    def abort(self):
+        self._parts = []
+
+    def close(self) -> Optional[str]:
+        """Write the windows (possibly none) and return the path"""
+        try:
+            width = self._parts[0][0].shape[2] if self._parts else 0
+            windows = (np.concatenate([p[0] for p in self._parts]) if self._parts
+                       else np.empty((0, self.length, width), dtype=self.dtype))
+            label = SAMPLE_TYPES.index(self.label) if self.label in SAMPLE_TYPES else len(SAMPLE_TYPES)
+            with open(self.filename, 'wb') as f:
+                np.savez(f, windows=windows,
+                         labels=np.full(len(windows), label, dtype=np.int16),
+                         label=np.array(self.label),
+                         levels=np.concatenate([np.full(len(p[0]), p[2], dtype=np.int8)
+                                                for p in self._parts] or [np.empty(0, np.int8)]),
+                         start_times=np.concatenate([p[1] for p in self._parts]
+                                                    or [np.empty(0)]))
+            self._parts = []
+            return self.filename
+        except Exception as e:
+            print(f"Error saving windows: {str(e)}")
+            return None
@@ -0,0 +1,245 @@
+"""Single-pass export of a session to several formats at once
+
+The separate save routines each walk the whole session again. Here the
+session is read once, in blocks of ``EXPORT_BLOCK_ROWS`` rows (one spill
+chunk of a ``SpillingSessionStore``), and every block is handed to all
+selected writers (CSV, JSON/NDJSON, ``.aroma`` archive, ML windows), each
+draining its own bounded queue on a thread of a pool. Formatting,
+compression and file I/O of the formats overlap, so exporting all of
+them costs about as much as the slowest one. Progress is reported as
+rows written by every writer; a failed format deletes its partial file
+and a cancelled export deletes all of its files.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+from config.constants import (
+    EXPORT_BLOCK_ROWS, EXPORT_QUEUE_BLOCKS, EXPORT_WINDOW_LENGTH, EXPORT_WINDOW_STRIDE
+)
+from utils.csv_index import CSVSeekIndex
+from utils.dataset import WindowWriter, session_label
+from utils.file_handler import (
+    ARCHIVE_EXTENSION, ArchiveWriter, JSONExportWriter, SessionCSVWriter
+)
+from utils.phase_index import PhaseIndex
+from utils.session_store import SessionStore
+
+# Format -> file suffix appended to the export's base name
+EXPORT_SUFFIXES = {
+    'csv': ".csv",
+    'json': ".json",
+    'ndjson': ".ndjson",
+    'archive': ARCHIVE_EXTENSION,
+    'dataset': ".windows.npz",
+}
+
+
+def export_targets(base: str, formats: Iterable[str]) -> Dict[str, str]:
+    """``data/x`` + formats -> {format: filename}"""
+    formats = list(formats)
+    unknown = [f for f in formats if f not in EXPORT_SUFFIXES]
+    if unknown:
+        raise ValueError(f"Unknown export format(s): {', '.join(unknown)}")
+    return {f: base + EXPORT_SUFFIXES[f] for f in formats}
+
+
+class _CSVExport(SessionCSVWriter):
+    """SessionCSVWriter that also writes the ``.phases.json`` sidecar"""
+
+    def __init__(self, filename: str, sample_info: Dict):
+        super().__init__(filename, sample_info, mode=sample_info.get('mode') or "Auto FSM")
+        self.phases = PhaseIndex()
+
+    def append_block(self, times, values, states=None, levels=None):
+        super().append_block(times, values)
+        if states is not None:
+            self.phases.extend(states, levels)
+
+    def close(self) -> Optional[str]:
+        result = super().close()
+        if result and self.phases.num_rows:
+            self.phases.save(PhaseIndex.sidecar(result))
+        return result
+
+
+def _remove_output(fmt: str, filename: str):
+    """Delete a finished export file (and the CSV's seek and phase sidecars)"""
+    paths = [filename]
+    if fmt == 'csv':
+        paths += [CSVSeekIndex.sidecar(filename), PhaseIndex.sidecar(filename)]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def open_writer(fmt: str, filename: str, metadata: Dict, num_sensors: int):
+    """A block writer (``append_block`` / ``close`` / ``abort``) for one format"""
+    if fmt == 'csv':
+        return _CSVExport(filename, metadata)
+    if fmt in ('json', 'ndjson'):
+        return JSONExportWriter(filename, metadata, num_sensors,
+                                layout='ndjson' if fmt == 'ndjson' else 'chunked')
+    if fmt == 'archive':
+        return ArchiveWriter(filename, metadata, num_sensors)
+    if fmt == 'dataset':
+        return WindowWriter(filename, EXPORT_WINDOW_LENGTH, EXPORT_WINDOW_STRIDE,
+                            label=session_label(metadata, filename))
+    raise ValueError(f"Unknown export format '{fmt}'")
+
+
+def export_session(store: SessionStore, targets: Dict[str, str], metadata: Optional[Dict] = None,
+                   block_rows: int = EXPORT_BLOCK_ROWS,
+                   progress: Optional[Callable[[int, int], None]] = None,
+                   cancel: Optional[threading.Event] = None,
+                   sidecars: Optional[Dict[str, object]] = None) -> dict:
+    """Read ``store`` once and write every target concurrently
+
+    Exports the rows present when called; the store must not be cleared
+    or closed meanwhile (snapshot a session that is still recording).
+    ``sidecars`` (name -> open block writer) are fed the same blocks and
+    reported under their names like the formats.
+    When cancelled, formats that finished before the cancel are deleted
+    too, so a cancelled export leaves no files.
+    ``progress(rows, total)`` is called from writer threads as the
+    slowest writer advances. Returns ``files`` (format -> path),
+    ``errors`` (format -> message), ``num_points``, ``cancelled`` and
+    ``elapsed`` seconds.
+    """
+    started = time.perf_counter()
+    metadata = dict(store.metadata if metadata is None else metadata)
+    cancel = cancel or threading.Event()
+    total = len(store)
+    writers, errors = {}, {}
+    for fmt, filename in targets.items():
+        try:
+            os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+            writers[fmt] = open_writer(fmt, filename, metadata, store.num_sensors)
+        except Exception as e:
+            errors[fmt] = str(e)
+    writers.update(sidecars or {})
+    queues = {fmt: queue.Queue(maxsize=EXPORT_QUEUE_BLOCKS) for fmt in writers}
+    written = dict.fromkeys(writers, 0)
+    lock = threading.Lock()
+
+    def drain(fmt: str) -> Optional[str]:
+        """Writer thread: consume blocks until the end marker"""
+        writer, blocks = writers[fmt], queues[fmt]
+        failed = False
+        while True:
+            block = blocks.get()
+            if block is None:
+                break
+            if failed or cancel.is_set():
+                continue  # keep draining so the reader never blocks
+            try:
+                writer.append_block(*block)
+                rows = len(block[0])
+            except Exception as e:
+                errors[fmt] = str(e)
+                failed = True
+                rows = total  # no longer holds back progress
+            with lock:
+                written[fmt] += rows
+                done = min(min(written.values()), total)
+            if progress:
+                progress(done, total)
+        if failed or cancel.is_set():
+            writer.abort()
+            return None
+        result = writer.close()
+        if result is None:
+            errors.setdefault(fmt, "could not finalize file")
+        return result
+
+    files = {}
+    if writers:
+        with ThreadPoolExecutor(max_workers=len(writers), thread_name_prefix="export") as pool:
+            futures = {fmt: pool.submit(drain, fmt) for fmt in writers}
+            try:
+                for start in range(0, total, block_rows):
+                    if cancel.is_set():
+                        break
+                    block = store.select(start, min(start + block_rows, total))
+                    for blocks in queues.values():
+                        blocks.put(block)
+            except Exception as e:
+                errors['read'] = str(e)
+                cancel.set()
+            finally:
+                for blocks in queues.values():
+                    blocks.put(None)
+            for fmt, future in futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors[fmt] = str(e)
+                    result = None
+                if result:
+                    files[fmt] = result
+    if cancel.is_set():
+        for fmt, filename in files.items():
+            _remove_output(fmt, filename)
+        files = {}
+    cancelled = cancel.is_set() and 'read' not in errors
+    return {
+        'files': files,
+        'errors': errors,
+        'num_points': total,
+        'cancelled': cancelled,
+        'elapsed': time.perf_counter() - started,
+    }
+
+
+class ExportService:
+    """Run exports on a background thread, one at a time, with cancellation
+
+    Callbacks run on the export thread; GUI code should forward them
+    through a Qt signal.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export-reader")
+        self._cancel = threading.Event()
+        self._future: Optional[Future] = None
+
+    @property
+    def busy(self) -> bool:
+        return self._future is not None and not self._future.done()
+
+    def submit(self, store: SessionStore, targets: Dict[str, str], metadata: Optional[Dict] = None,
+               progress: Optional[Callable[[int, int], None]] = None,
+               callback: Optional[Callable[[dict], None]] = None,
+               sidecars: Optional[Dict[str, object]] = None) -> Future:
+        """Start an export; the future resolves to the result after ``callback`` ran
+
+        Failures are reported as ``{'error': ...}``.
+        """
+        if self.busy:
+            raise RuntimeError("An export is already running")
+        self._cancel = cancel = threading.Event()
+
+        def run() -> dict:
+            try:
+                result = export_session(store, targets, metadata, progress=progress, cancel=cancel,
+                                        sidecars=sidecars)
+            except Exception as e:
+                result = {'error': str(e)}
+            if callback:
+                callback(result)
+            return result
+
+        self._future = self.executor.submit(run)
+        return self._future
+
+    def cancel(self):
+        """Stop the running export; its files are deleted"""
+        self._cancel.set()
+
+    def shutdown(self, wait: bool = False):
+        self.cancel()
+        self.executor.shutdown(wait=wait)
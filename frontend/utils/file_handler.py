@@ -2,9 +2,22 @@
 
 import csv
 import json
+import lzma
+import os
+import shutil
+import struct
+import zlib
+import numpy as np
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config.constants import SENSOR_NAMES, NUM_SENSORS
+from utils.session_store import SessionStore
+from utils.phase_index import PhaseIndex, Selection, describe_selection
+from utils.csv_index import CSVSeekIndex, csv_metadata
+from utils.phase_index import PHASES_SUFFIX
+from utils.alarms import ALARMS_SUFFIX
 
 class FileHandler:
     """Handle file operations"""
@@ -44,33 +57,36 @@ class FileHandler:
     
     @staticmethod
     def save_as_json(filename: str, data: Dict, sensor_data: Dict[int, List[float]], 
-                    times: List[float]) -> bool:
-        """Save data as JSON"""
+                    times: List[float], layout: str = 'chunked') -> bool:
+        """Save data as JSON, streamed one chunk at a time (see JSONExportWriter)"""
         try:
             Path("data").mkdir(exist_ok=True)
-            
-            export_data = {
-                "metadata": {
-                    "name": data.get('name', 'Unknown'),
-                    "type": data.get('type', 'Unknown'),
-                    "export_date": datetime.now().isoformat(),
-                    "num_points": len(times),
-                    "num_sensors": len(sensor_data)
-                },
-                "times": times,
-                "sensors": {
-                    f"sensor_{i}": sensor_data[i] 
-                    for i in range(len(sensor_data))
-                }
-            }
-            
-            with open(f"data/{filename}.json", 'w') as f:
-                json.dump(export_data, f, indent=2)
-            
-            return True
+            extension = ".ndjson" if layout == 'ndjson' else ".json"
+            writer = JSONExportWriter(f"data/{filename}{extension}", data,
+                                      num_sensors=len(sensor_data), layout=layout)
+            step = writer.chunk_size
+            for start in range(0, len(times), step):
+                stop = min(start + step, len(times))
+                block = np.column_stack([sensor_data[i][start:stop]
+                                         for i in range(len(sensor_data))])
+                writer.append_block(times[start:stop], block)
+            return writer.close() is not None
         except Exception as e:
             print(f"Error saving JSON: {str(e)}")
             return False
+
+    @staticmethod
+    def save_session_json(filename: str, store: SessionStore,
+                          layout: str = 'chunked') -> Optional[str]:
+        """Stream a SessionStore to JSON (``chunked``) or NDJSON (``ndjson``)"""
+        try:
+            writer = JSONExportWriter(filename, store.metadata, store.num_sensors, layout=layout)
+            for block in store.iter_blocks():
+                writer.append_block(*block)
+            return writer.close()
+        except Exception as e:
+            print(f"Error saving JSON: {str(e)}")
+            return None
     
     @staticmethod
     def load_csv(filename: str) -> tuple:
@@ -100,3 +116,735 @@ class FileHandler:
         except Exception as e:
             print(f"Error loading CSV: {str(e)}")
             return [], {}
+
+    @staticmethod
+    def load_session_csv(filename: str, start_time: Optional[float] = None,
+                         end_time: Optional[float] = None) -> SessionStore:
+        """Load a ``SessionCSVWriter`` / ``on_save_data`` CSV into a SessionStore
+
+        Metadata rows before the ``Time (s)`` header become ``store.metadata``.
+        CSV rows carry no FSM state; a ``.phases.json`` sidecar restores it.
+        With ``start_time`` / ``end_time`` only that time range is parsed,
+        found through the file's seek index (built and saved on first use).
+        """
+        if start_time is not None or end_time is not None:
+            index = CSVSeekIndex.open(filename)
+            start, stop = index.rows_between(-np.inf if start_time is None else start_time,
+                                             np.inf if end_time is None else end_time)
+            times, values, states, levels = index.read_rows(start, stop)
+            store = SessionStore(index.num_sensors, capacity=max(len(times), 1),
+                                 metadata=index.metadata)
+            if index.phases is None:
+                states = levels = None
+            store.append_block(times, values, states, levels)
+            return store
+
+        header = {}
+        with open(filename, 'r', newline='') as f:
+            header_rows = 0
+            for row in csv.reader(f):
+                header_rows += 1
+                if row and row[0] == "Time (s)":
+                    break
+                if len(row) >= 2:
+                    header[row[0]] = row[1]
+            else:
+                raise ValueError(f"{filename} has no 'Time (s)' header row")
+        data = np.loadtxt(filename, delimiter=',', skiprows=header_rows, ndmin=2)
+        num_sensors = max(data.shape[1] - 1, 1) if data.size else NUM_SENSORS
+        store = SessionStore(num_sensors, capacity=max(len(data), 1), metadata=csv_metadata(header))
+        if data.size:
+            states = levels = None
+            sidecar = PhaseIndex.sidecar(filename)
+            if os.path.exists(sidecar):
+                phases = PhaseIndex.load(sidecar)
+                if phases.num_rows == len(data):
+                    states, levels = phases.expand()
+            store.append_block(data[:, 0], data[:, 1:], states, levels)
+        return store
+
+    @staticmethod
+    def save_as_archive(filename: str, store: SessionStore, codec: str = 'zlib',
+                        chunk_size: int = 4096) -> Optional[str]:
+        """Write a SessionStore to a compressed ``.aroma`` archive"""
+        try:
+            writer = ArchiveWriter(filename, store.metadata, store.num_sensors,
+                                   chunk_size=chunk_size, codec=codec)
+            for block in store.iter_blocks():
+                writer.append_block(*block)
+            return writer.close()
+        except Exception as e:
+            print(f"Error saving archive: {str(e)}")
+            return None
+
+    @staticmethod
+    def load_archive(filename: str) -> Optional[SessionStore]:
+        try:
+            return ArchiveReader(filename).to_store()
+        except Exception as e:
+            print(f"Error loading archive: {str(e)}")
+            return None
+
+    @staticmethod
+    def load_session(filename: str) -> SessionStore:
+        """Load a session from CSV, ``.aroma`` archive or streamed JSON export"""
+        if filename.endswith(ARCHIVE_EXTENSION):
+            return ArchiveReader(filename).to_store()
+        if filename.endswith((".json", ".ndjson")):
+            return JSONExportReader(filename).to_store()
+        return FileHandler.load_session_csv(filename)
+
+    @staticmethod
+    def load_phase_index(filename: str, store: Optional[SessionStore] = None) -> PhaseIndex:
+        """Phase index of a saved session: ``.phases.json`` sidecar, archive
+        index, or rebuilt from the session's states (CSV files without a
+        sidecar carry no states, so they index as one IDLE segment)"""
+        sidecar = PhaseIndex.sidecar(filename)
+        if os.path.exists(sidecar):
+            return PhaseIndex.load(sidecar)
+        if filename.endswith(ARCHIVE_EXTENSION):
+            return ArchiveReader(filename).phases
+        return PhaseIndex.from_store(store if store is not None else FileHandler.load_session(filename))
+
+    @staticmethod
+    def export_phases(filename: str, store: SessionStore, phases: PhaseIndex,
+                      selection: Selection, sample_info: Optional[Dict] = None) -> Optional[str]:
+        """Write only the rows of the selected phases
+
+        The format follows the extension: ``.aroma`` archive, ``.json`` /
+        ``.ndjson`` export or CSV (plus its ``.phases.json`` sidecar).
+        Rows are read per phase segment, never by scanning the session.
+        """
+        metadata = dict(sample_info or store.metadata)
+        metadata['phases'] = describe_selection(selection)
+        try:
+            if filename.endswith(ARCHIVE_EXTENSION):
+                writer = ArchiveWriter(filename, metadata, store.num_sensors)
+            elif filename.endswith((".json", ".ndjson")):
+                writer = JSONExportWriter(filename, metadata, store.num_sensors,
+                                          layout='ndjson' if filename.endswith(".ndjson") else 'chunked')
+            else:
+                writer = SessionCSVWriter(filename, metadata,
+                                          mode=f"Phases: {metadata['phases']}")
+            exported = PhaseIndex()
+            for times, values, states, levels in phases.select(store, selection):
+                if isinstance(writer, SessionCSVWriter):
+                    for t, sensor_values in zip(times, values):
+                        writer.write_row(t, sensor_values)
+                else:
+                    writer.append_block(times, values, states, levels)
+                exported.extend(states, levels)
+            result = writer.close()
+            if result and isinstance(writer, SessionCSVWriter):
+                exported.save(PhaseIndex.sidecar(result))
+            return result
+        except Exception as e:
+            print(f"Error exporting phases: {str(e)}")
+            return None
+
+    @staticmethod
+    def csv_to_archive(csv_filename: str, archive_filename: Optional[str] = None,
+                       codec: str = 'zlib') -> Optional[str]:
+        """Convert a session CSV; the archive goes next to it by default"""
+        try:
+            store = FileHandler.load_session_csv(csv_filename)
+        except Exception as e:
+            print(f"Error loading CSV: {str(e)}")
+            return None
+        if archive_filename is None:
+            archive_filename = os.path.splitext(csv_filename)[0] + ARCHIVE_EXTENSION
+        return FileHandler.save_as_archive(archive_filename, store, codec)
+
+
+class SessionCSVWriter:
+    """Stream a sampling session to CSV row by row
+
+    Rows go to a ``.part`` file as they arrive so memory stays flat for
+    any run length; ``close()`` prepends the metadata header in the same
+    layout as ``MainWindow.on_save_data`` and renames the result.
+    """
+    
+    FLUSH_EVERY = 40  # rows (10 s at the default 250 ms cadence)
+    
+    def __init__(self, filename: str, sample_info: Dict, mode: str = "Auto FSM"):
+        self.filename = filename
+        self.sample_info = sample_info
+        self.mode = mode
+        self.num_points = 0
+        self.last_time = 0.0
+        
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        self.part_filename = f"{filename}.part"
+        self._file = open(self.part_filename, 'w', newline='')
+        self._writer = csv.writer(self._file)
+    
+    def write_row(self, t: float, sensor_values: List[float]):
+        """Append one sample"""
+        self._writer.writerow([f"{t:.3f}"] + [f"{v:.2f}" for v in sensor_values])
+        self.num_points += 1
+        self.last_time = t
+        if self.num_points % self.FLUSH_EVERY == 0:
+            self._file.flush()
+    
+    def append_block(self, times, values, states=None, levels=None):
+        """Append many samples at once, formatted like ``write_row``
+        
+        States and levels are accepted for symmetry with the other writers;
+        the CSV layout has no column for them.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if not len(times):
+            return
+        values = np.asarray(values, dtype=np.float64)
+        np.savetxt(self._file, np.column_stack([times, values]), delimiter=',', newline='\r\n',
+                   fmt=['%.3f'] + ['%.2f'] * values.shape[1])
+        self.num_points += len(times)
+        self.last_time = float(times[-1])
+        self._file.flush()
+    
+    def abort(self):
+        """Stop writing and delete the partial rows"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self.part_filename)
+    
+    def close(self) -> Optional[str]:
+        """Write the header, append the streamed rows and return the final path"""
+        if self._file is None:
+            return self.filename
+        self._file.close()
+        self._file = None
+        
+        try:
+            with open(self.filename, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(["AromaSense Herbal Analysis Data"])
+                writer.writerow(["Sample Name", self.sample_info.get('name', 'Unknown')])
+                writer.writerow(["Herbal Type", self.sample_info.get('type', 'Unknown')])
+                writer.writerow(["Export Date", datetime.now().isoformat()])
+                writer.writerow(["Analysis Mode", self.mode])
+                if self.sample_info.get('sample_rate_hz'):
+                    writer.writerow(["Sample Rate (Hz)", f"{float(self.sample_info['sample_rate_hz']):g}"])
+                writer.writerow(["Total Data Points", self.num_points])
+                writer.writerow(["Final Duration", f"{self.last_time:.2f} s"])
+                writer.writerow([])
+                writer.writerow(["Time (s)"] + list(SENSOR_NAMES))
+                with open(self.part_filename, 'r', newline='') as part:
+                    shutil.copyfileobj(part, f)
+            os.remove(self.part_filename)
+            # Seek index while the rows are still in the page cache
+            CSVSeekIndex.build(self.filename).save()
+            return self.filename
+        except Exception as e:
+            print(f"Error finalizing CSV: {str(e)}")
+            return None
+
+
+# ---- Compressed session archive (.aroma) ----
+#
+#   magic "AROMAZ01" | chunk 0 | chunk 1 | ... | index JSON | u64 index offset | magic
+#
+# Every chunk holds up to ``chunk_size`` rows and decodes on its own. Each
+# column is quantized to integers (time in ms, readings in 1/100 - the CSV
+# precision), delta-coded from the chunk's first value, run-length coded
+# (plateaus become one zero-delta run, the fixed sample period one run) and
+# written as zigzag LEB128 varints, optionally compressed with zlib/lzma.
+
+ARCHIVE_EXTENSION = ".aroma"
+ARCHIVE_MAGIC = b"AROMAZ01"
+ARCHIVE_CODECS = ('none', 'zlib', 'lzma')
+_ARCHIVE_TAIL = struct.Struct('<Q8s')
+
+
+def _varint_encode(values: np.ndarray) -> bytes:
+    """Unsigned LEB128 for a whole uint64 array at once"""
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b""
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        nbytes += values >= (np.uint64(1) << np.uint64(7 * k))
+    owner = np.repeat(np.arange(len(values)), nbytes)
+    starts = np.cumsum(nbytes) - nbytes
+    position = np.arange(len(owner)) - starts[owner]
+    out = ((values[owner] >> (7 * position).astype(np.uint64)) & np.uint64(0x7F)).astype(np.uint8)
+    # Continuation bit on every byte but the last of each value
+    out[position < nbytes[owner] - 1] |= 0x80
+    return out.tobytes()
+
+
+def _varint_decode(data: bytes) -> np.ndarray:
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if len(raw) == 0:
+        return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    owner = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    position = np.arange(len(raw)) - starts[owner]
+    parts = (raw & 0x7F).astype(np.uint64) << (7 * position).astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _unzigzag(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.uint64)
+    return ((values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64))
+
+
+def _encode_column(q: np.ndarray) -> np.ndarray:
+    """Delta + run-length code one quantized column -> [runs, values..., lengths...]"""
+    deltas = np.diff(q, prepend=0)
+    if len(deltas) == 0:
+        return np.zeros(1, dtype=np.uint64)
+    change = np.flatnonzero(np.diff(deltas)) + 1
+    starts = np.concatenate(([0], change))
+    lengths = np.diff(np.append(starts, len(deltas)))
+    return np.concatenate(([len(starts)], _zigzag(deltas[starts]),
+                           lengths)).astype(np.uint64)
+
+
+def _decode_column(words: np.ndarray, pos: int) -> Tuple[np.ndarray, int]:
+    runs = int(words[pos])
+    pos += 1
+    deltas = _unzigzag(words[pos:pos + runs])
+    lengths = words[pos + runs:pos + 2 * runs].astype(np.int64)
+    return np.cumsum(np.repeat(deltas, lengths)), pos + 2 * runs
+
+
+class ArchiveWriter:
+    """Write a session to a chunked, compressed ``.aroma`` archive
+
+    Rows can be appended one at a time (``append``) or in blocks
+    (``append_block``); full chunks are encoded and written immediately.
+    Values are stored to ``1/sensor_scale`` (default 0.01, the CSV
+    precision) and times to ``1/time_scale`` seconds.
+    """
+
+    def __init__(self, filename: str, metadata: Optional[Dict] = None,
+                 num_sensors: int = NUM_SENSORS, chunk_size: int = 4096,
+                 codec: str = 'zlib', time_scale: int = 1000, sensor_scale: int = 100):
+        if codec not in ARCHIVE_CODECS:
+            raise ValueError(f"Unknown archive codec '{codec}'")
+        self.filename = filename
+        self.metadata = dict(metadata or {})
+        self.num_sensors = num_sensors
+        self.chunk_size = chunk_size
+        self.codec = codec
+        self.time_scale = time_scale
+        self.sensor_scale = sensor_scale
+        self.num_points = 0
+        self.chunks = []
+        self.phases = PhaseIndex()
+        self._buffer = SessionStore(num_sensors, capacity=chunk_size)
+
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(filename, 'wb')
+        self._file.write(ARCHIVE_MAGIC)
+
+    def append(self, t: float, sensor_values, state: int = 0, level: int = 0):
+        self._buffer.append(t, sensor_values, state, level)
+        if len(self._buffer) >= self.chunk_size:
+            self._flush_chunk()
+
+    def append_block(self, times, values, states=None, levels=None):
+        times = np.asarray(times, dtype=np.float64)
+        n = len(times)
+        states = np.zeros(n, dtype=np.int8) if states is None else np.asarray(states)
+        levels = np.zeros(n, dtype=np.int8) if levels is None else np.asarray(levels)
+        start = 0
+        while start < n:
+            take = min(n - start, self.chunk_size - len(self._buffer))
+            stop = start + take
+            self._buffer.append_block(times[start:stop], values[start:stop],
+                                      states[start:stop], levels[start:stop])
+            if len(self._buffer) >= self.chunk_size:
+                self._flush_chunk()
+            start = stop
+
+    def _flush_chunk(self):
+        n = len(self._buffer)
+        if not n:
+            return
+        buf = self._buffer
+        columns = [np.rint(buf.times * self.time_scale).astype(np.int64)]
+        columns += [np.rint(buf.values[:, i] * self.sensor_scale).astype(np.int64)
+                    for i in range(self.num_sensors)]
+        columns += [buf.states.astype(np.int64), buf.levels.astype(np.int64)]
+        payload = _varint_encode(np.concatenate([_encode_column(c) for c in columns]))
+        if self.codec == 'zlib':
+            payload = zlib.compress(payload, 6)
+        elif self.codec == 'lzma':
+            payload = lzma.compress(payload)
+
+        offset = self._file.tell()
+        self._file.write(payload)
+        self.chunks.append({'offset': offset, 'length': len(payload), 'rows': n,
+                            't_start': float(buf.times[0]), 't_end': float(buf.times[-1])})
+        self.phases.extend(buf.states, buf.levels)
+        self.num_points += n
+        buf.clear()
+
+    def close(self) -> Optional[str]:
+        """Flush the last chunk, write the index and return the path"""
+        if self._file is None:
+            return self.filename
+        try:
+            self._flush_chunk()
+            index = {
+                'version': 1,
+                'metadata': self.metadata,
+                'sensor_names': list(SENSOR_NAMES[:self.num_sensors]),
+                'num_sensors': self.num_sensors,
+                'num_points': self.num_points,
+                'codec': self.codec,
+                'time_scale': self.time_scale,
+                'sensor_scale': self.sensor_scale,
+                'chunks': self.chunks,
+                'phases': self.phases.to_dict(),
+            }
+            offset = self._file.tell()
+            self._file.write(json.dumps(index).encode('utf-8'))
+            self._file.write(_ARCHIVE_TAIL.pack(offset, ARCHIVE_MAGIC))
+            return self.filename
+        except Exception as e:
+            print(f"Error finalizing archive: {str(e)}")
+            return None
+        finally:
+            self._file.close()
+            self._file = None
+
+    def abort(self):
+        """Stop writing and delete the partial archive"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self.filename)
+
+
+class ArchiveReader:
+    """Random access to the chunks of an ``.aroma`` archive"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                raise ValueError(f"{filename} is not an AromaSense archive")
+            f.seek(-_ARCHIVE_TAIL.size, os.SEEK_END)
+            end = f.tell()
+            offset, magic = _ARCHIVE_TAIL.unpack(f.read(_ARCHIVE_TAIL.size))
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError(f"{filename} is truncated (no archive index)")
+            f.seek(offset)
+            self.index = json.loads(f.read(end - offset).decode('utf-8'))
+        self.metadata = self.index['metadata']
+        self.num_sensors = self.index['num_sensors']
+        self.num_points = self.index['num_points']
+        self.chunks = self.index['chunks']
+        self.chunk_starts = np.array([c['t_start'] for c in self.chunks])
+        self.row_offsets = np.concatenate(([0], np.cumsum([c['rows'] for c in self.chunks])))
+
+    def __len__(self) -> int:
+        return self.num_points
+
+    def chunk_for_time(self, t: float) -> int:
+        """Index of the chunk that holds time ``t``"""
+        return max(0, int(np.searchsorted(self.chunk_starts, t, side='right')) - 1)
+
+    def read_chunk(self, i: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Decode chunk ``i`` -> (times, values, states, levels)"""
+        chunk = self.chunks[i]
+        with open(self.filename, 'rb') as f:
+            f.seek(chunk['offset'])
+            payload = f.read(chunk['length'])
+        codec = self.index['codec']
+        if codec == 'zlib':
+            payload = zlib.decompress(payload)
+        elif codec == 'lzma':
+            payload = lzma.decompress(payload)
+
+        words, pos, columns = _varint_decode(payload), 0, []
+        for _ in range(self.num_sensors + 3):
+            column, pos = _decode_column(words, pos)
+            columns.append(column)
+        times = columns[0] / self.index['time_scale']
+        values = np.column_stack(columns[1:1 + self.num_sensors]) / self.index['sensor_scale']
+        return (times, values, columns[-2].astype(np.int8), columns[-1].astype(np.int8))
+
+    def read_rows(self, start: int, stop: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Rows ``start:stop``, decoding only the chunks that hold them"""
+        stop = min(stop, self.num_points)
+        if start >= stop:
+            return (np.empty(0), np.empty((0, self.num_sensors)),
+                    np.empty(0, dtype=np.int8), np.empty(0, dtype=np.int8))
+        first = int(np.searchsorted(self.row_offsets, start, side='right')) - 1
+        last = int(np.searchsorted(self.row_offsets, stop, side='left')) - 1
+        parts = [self.read_chunk(i) for i in range(first, last + 1)]
+        lo = start - self.row_offsets[first]
+        return tuple(np.concatenate(column)[lo:lo + stop - start] for column in zip(*parts))
+
+    @property
+    def phases(self) -> PhaseIndex:
+        """Phase index from the archive index (rebuilt for older archives)"""
+        if 'phases' in self.index:
+            return PhaseIndex.from_dict(self.index['phases'])
+        index = PhaseIndex()
+        for i in range(len(self.chunks)):
+            _, _, states, levels = self.read_chunk(i)
+            index.extend(states, levels)
+        return index
+
+    def read_all(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if not self.chunks:
+            return (np.empty(0), np.empty((0, self.num_sensors)),
+                    np.empty(0, dtype=np.int8), np.empty(0, dtype=np.int8))
+        parts = [self.read_chunk(i) for i in range(len(self.chunks))]
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def to_store(self) -> SessionStore:
+        store = SessionStore(self.num_sensors, capacity=max(self.num_points, 1),
+                             metadata=self.metadata)
+        store.append_block(*self.read_all())
+        return store
+
+
+# ---- Streaming JSON export ----
+#
+# ``chunked``: one valid JSON document, laid out one chunk per line so it can
+# also be read line by line:
+#     {"metadata": {...}, "chunks": [
+#     {"start": 0, "times": [...], "sensors": {"sensor_0": [...], ...}, ...}
+#     ,{"start": 1024, ...}
+#     ], "num_points": 2048}
+# ``ndjson``: a ``{"type": "metadata", "metadata": {...}}`` line, one compact
+# record per sample, an end line.
+
+JSON_LAYOUTS = ('chunked', 'ndjson')
+_JSON_COMPACT = (',', ':')
+
+
+class JSONExportWriter:
+    """Write a session as JSON with memory bounded by ``chunk_size`` rows"""
+
+    def __init__(self, filename: str, metadata: Optional[Dict] = None,
+                 num_sensors: int = NUM_SENSORS, layout: str = 'chunked',
+                 chunk_size: int = 1024, time_decimals: int = 3, sensor_decimals: int = 2):
+        if layout not in JSON_LAYOUTS:
+            raise ValueError(f"Unknown JSON layout '{layout}'")
+        self.filename = filename
+        self.num_sensors = num_sensors
+        self.layout = layout
+        self.chunk_size = chunk_size
+        self.time_decimals = time_decimals
+        self.sensor_decimals = sensor_decimals
+        self.num_points = 0
+        self.num_chunks = 0
+        self._buffer = SessionStore(num_sensors, capacity=chunk_size)
+
+        header = dict(metadata or {})
+        header.setdefault('export_date', datetime.now().isoformat())
+        header['num_sensors'] = num_sensors
+        header['sensor_names'] = list(SENSOR_NAMES[:num_sensors])
+
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(filename, 'w')
+        if layout == 'chunked':
+            self._file.write('{"metadata": ' + json.dumps(header) + ', "chunks": [\n')
+        else:
+            # Nested: the session metadata has a ``type`` of its own (the herbal type)
+            self._file.write(json.dumps({'type': 'metadata', 'metadata': header},
+                                        separators=_JSON_COMPACT) + '\n')
+
+    def append(self, t: float, sensor_values, state: int = 0, level: int = 0):
+        self._buffer.append(t, sensor_values, state, level)
+        if len(self._buffer) >= self.chunk_size:
+            self._flush_chunk()
+
+    def append_block(self, times, values, states=None, levels=None):
+        times = np.asarray(times, dtype=np.float64)
+        n = len(times)
+        start = 0
+        while start < n:
+            stop = start + min(n - start, self.chunk_size - len(self._buffer))
+            self._buffer.append_block(
+                times[start:stop], np.asarray(values)[start:stop],
+                None if states is None else np.asarray(states)[start:stop],
+                None if levels is None else np.asarray(levels)[start:stop])
+            if len(self._buffer) >= self.chunk_size:
+                self._flush_chunk()
+            start = stop
+
+    def _flush_chunk(self):
+        n = len(self._buffer)
+        if not n:
+            return
+        buf = self._buffer
+        times = np.round(buf.times, self.time_decimals).tolist()
+        values = np.round(buf.values, self.sensor_decimals)
+        states, levels = buf.states.tolist(), buf.levels.tolist()
+
+        if self.layout == 'chunked':
+            chunk = {
+                'start': self.num_points,
+                'times': times,
+                'sensors': {f"sensor_{i}": values[:, i].tolist() for i in range(self.num_sensors)},
+                'states': states,
+                'levels': levels,
+            }
+            prefix = ',' if self.num_chunks else ''
+            self._file.write(prefix + json.dumps(chunk, separators=_JSON_COMPACT) + '\n')
+        else:
+            rows = values.tolist()
+            self._file.writelines(
+                json.dumps({'t': times[k], 'sensors': rows[k], 'state': states[k],
+                            'level': levels[k]}, separators=_JSON_COMPACT) + '\n'
+                for k in range(n))
+        self.num_points += n
+        self.num_chunks += 1
+        buf.clear()
+
+    def close(self) -> Optional[str]:
+        if self._file is None:
+            return self.filename
+        try:
+            self._flush_chunk()
+            if self.layout == 'chunked':
+                self._file.write(f'], "num_points": {self.num_points}}}\n')
+            else:
+                self._file.write(json.dumps({'type': 'end', 'num_points': self.num_points},
+                                            separators=_JSON_COMPACT) + '\n')
+            return self.filename
+        except Exception as e:
+            print(f"Error finalizing JSON: {str(e)}")
+            return None
+        finally:
+            self._file.close()
+            self._file = None
+
+    def abort(self):
+        """Stop writing and delete the partial export"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self.filename)
+
+
+class JSONExportReader:
+    """Stream a JSONExportWriter file (either layout) back in NumPy blocks
+
+    Only the metadata and one block are held in memory at a time.
+    """
+
+    _CHUNKED_PREFIX = '{"metadata": '
+    _CHUNKED_SUFFIX = ', "chunks": ['
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'r') as f:
+            first = f.readline().strip()
+        if first.startswith(self._CHUNKED_PREFIX) and first.endswith(self._CHUNKED_SUFFIX):
+            self.layout = 'chunked'
+            self.metadata = json.loads(first[len(self._CHUNKED_PREFIX):-len(self._CHUNKED_SUFFIX)])
+        else:
+            header = json.loads(first)
+            if header.get('type') != 'metadata':
+                raise ValueError(f"{filename} is not a streamed JSON export")
+            self.layout = 'ndjson'
+            if 'metadata' in header:
+                self.metadata = header['metadata']
+            else:  # older files: flat, with the herbal type overwritten
+                self.metadata = {k: v for k, v in header.items() if k != 'type'}
+        self.num_sensors = self.metadata.get('num_sensors', NUM_SENSORS)
+
+    def iter_blocks(self, block_size: int = 1024):
+        """Yield (times, values, states, levels) blocks
+
+        Chunked files yield their stored chunks; NDJSON rows are batched
+        into ``block_size`` blocks.
+        """
+        with open(self.filename, 'r') as f:
+            f.readline()
+            if self.layout == 'chunked':
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith(']'):
+                        break
+                    chunk = json.loads(line.lstrip(','))
+                    values = np.column_stack([chunk['sensors'][f"sensor_{i}"]
+                                              for i in range(self.num_sensors)])
+                    yield (np.asarray(chunk['times'], dtype=np.float64), values,
+                           np.asarray(chunk['states'], dtype=np.int8),
+                           np.asarray(chunk['levels'], dtype=np.int8))
+                return
+
+            rows = []
+            for line in f:
+                record = json.loads(line)
+                if record.get('type') == 'end':
+                    break
+                rows.append(record)
+                if len(rows) >= block_size:
+                    yield self._rows_to_block(rows)
+                    rows = []
+            if rows:
+                yield self._rows_to_block(rows)
+
+    @staticmethod
+    def _rows_to_block(rows: List[Dict]):
+        return (np.fromiter((r['t'] for r in rows), dtype=np.float64, count=len(rows)),
+                np.array([r['sensors'] for r in rows], dtype=np.float64),
+                np.fromiter((r.get('state', 0) for r in rows), dtype=np.int8, count=len(rows)),
+                np.fromiter((r.get('level', 0) for r in rows), dtype=np.int8, count=len(rows)))
+
+    def iter_records(self):
+        """Yield one dict per sample"""
+        for times, values, states, levels in self.iter_blocks():
+            for k in range(len(times)):
+                yield {'t': float(times[k]), 'sensors': values[k].tolist(),
+                       'state': int(states[k]), 'level': int(levels[k])}
+
+    def to_store(self, max_samples: Optional[int] = None) -> SessionStore:
+        """Load into a SessionStore (``max_samples`` keeps only the newest rows)"""
+        store = SessionStore(self.num_sensors, max_samples=max_samples, metadata=self.metadata)
+        for block in self.iter_blocks():
+            store.append_block(*block)
+        return store
+
+
+# ---- Session catalogs ----
+
+# Session formats, most preferred first when a run was saved in several
+SESSION_EXTENSIONS = (ARCHIVE_EXTENSION, ".csv", ".ndjson", ".json")
+# Written next to sessions with a session extension, but not sessions
+SIDECAR_SUFFIXES = (PHASES_SUFFIX, ALARMS_SUFFIX)
+
+
+def is_session_file(filename: str) -> bool:
+    return filename.endswith(SESSION_EXTENSIONS) and not filename.endswith(SIDECAR_SUFFIXES)
+
+
+def find_sessions(paths: Sequence[str]) -> List[str]:
+    """Session files among ``paths`` (files or folders), one per session stem
+
+    A run saved in several formats (Save Data writes a CSV and an archive)
+    is listed once, in the first format of SESSION_EXTENSIONS.
+    """
+    chosen: Dict[str, str] = {}
+    for path in paths:
+        if os.path.isdir(path):
+            names = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+        else:
+            names = [path]
+        for name in names:
+            stem, ext = os.path.splitext(name)
+            if not is_session_file(name):
+                continue
+            previous = chosen.get(stem)
+            if previous is None or (SESSION_EXTENSIONS.index(ext)
+                                    < SESSION_EXTENSIONS.index(os.path.splitext(previous)[1])):
+                chosen[stem] = name
+    return sorted(chosen.values())
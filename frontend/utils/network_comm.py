@@ -1,4 +1,5 @@
 """Enhanced Network Communication for AromaSense"""
+import select
 import socket
 import threading
 import json
@@ -6,23 +7,46 @@ import time
 from PySide6.QtCore import QThread, Signal
 from typing import Optional
 
+from utils.command_channel import CommandTracker
+from utils.protocol import sensor_values, sample_time, is_ack_message, is_rate_message
+from utils.sample_ring import SampleRing
+
 class NetworkWorker(QThread):
     """Enhanced network worker with bidirectional communication"""
     
     data_received = Signal(dict)
+    data_batch = Signal(list)      # sensor samples gathered over batch_interval
+    sample_rate_changed = Signal(float)  # Hz, from the firmware's RATE header
     connection_status = Signal(bool)
     error_occurred = Signal(str)
     arduino_status = Signal(bool)
+    command_acked = Signal(dict)   # backend / Arduino acknowledgement with timing
+    command_failed = Signal(dict)  # rejected, timed out after retries, or disconnected
     
-    def __init__(self, host: str = "127.0.0.1", port: int = 8082):
+    def __init__(self, host: str = "127.0.0.1", port: int = 8082,
+                 ring: Optional[SampleRing] = None, batch_interval: Optional[float] = None):
         super().__init__()
         self.host = host
         self.port = port
+        self.ring = ring  # shared-memory sample ring; this thread is its only producer
+        # None: one data_received per sample. Otherwise samples are emitted
+        # as one data_batch every batch_interval seconds, so high sample
+        # rates cost the GUI thread one slot call per batch
+        self.batch_interval = batch_interval
+        self._batch = []
+        self._batch_due = 0.0
         self.socket: Optional[socket.socket] = None
         self.running = False
         self.reconnect_attempts = 0
         self.max_reconnect_attempts = 5
         
+        # Commands are written by this thread only; send_command just queues
+        # them and wakes the select() in _listen_for_data
+        self.commands = CommandTracker()
+        self._wake_recv, self._wake_send = socket.socketpair()
+        self._wake_recv.setblocking(False)
+        self._wake_send.setblocking(False)
+        
     def run(self):
         """Main connection loop"""
         self.running = True
@@ -40,6 +64,8 @@ class NetworkWorker(QThread):
                 
                 # Start listening for data
                 self._listen_for_data()
+                for failure in self.commands.fail_all("DISCONNECTED"):
+                    self.command_failed.emit(failure)
                 
             except socket.timeout:
                 error_msg = "Connection timeout - Backend not responding"
@@ -70,12 +96,24 @@ class NetworkWorker(QThread):
         self.running = False
     
     def _listen_for_data(self):
-        """Listen for incoming data from backend"""
+        """Listen for incoming data from backend and write queued commands"""
         buffer = ""
-        self.socket.settimeout(1.0)  # Shorter timeout for listening
+        self.socket.settimeout(1.0)  # Bounds a sendall on a stalled link
         
         while self.running and self.socket:
             try:
+                self._flush_commands()
+                self._flush_batch()
+                timeout = min(1.0, self.commands.next_deadline())
+                if self._batch:
+                    timeout = min(timeout, max(self._batch_due - time.monotonic(), 0.0))
+                readable, _, _ = select.select(
+                    [self.socket, self._wake_recv], [], [], timeout)
+                if self._wake_recv in readable:
+                    self._drain_wakeups()
+                if self.socket not in readable:
+                    continue
+                
                 data = self.socket.recv(4096).decode('utf-8')
                 if not data:
                     print("⚠️ Backend disconnected")
@@ -98,48 +136,108 @@ class NetworkWorker(QThread):
                     self.error_occurred.emit(error_msg)
                     print(f"❌ {error_msg}")
                 break
+        self._flush_batch(force=True)
+    
+    def _flush_commands(self):
+        """Write new commands and due retries; report commands that gave up"""
+        lines, failures = self.commands.poll()
+        for line in lines:
+            self.socket.sendall(f"{line}\n".encode('utf-8'))
+            print(f"📤 Sent command: {line}")
+        for failure in failures:
+            print(f"❌ Command {failure['command']} not acknowledged "
+                  f"after {failure['attempts']} attempt(s)")
+            self.command_failed.emit(failure)
+    
+    def _flush_batch(self, force: bool = False):
+        """Emit the gathered samples once the batch interval has passed"""
+        if self._batch and (force or time.monotonic() >= self._batch_due):
+            batch, self._batch = self._batch, []
+            self.data_batch.emit(batch)
+
+    def _drain_wakeups(self):
+        try:
+            while self._wake_recv.recv(64):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
     
     def _process_received_data(self, data: str):
         """Process received JSON data"""
         try:
             json_data = json.loads(data)
             
+            if isinstance(json_data, dict) and is_ack_message(json_data):
+                event = self.commands.on_ack(json_data)
+                if event is None:
+                    return  # another client's command
+                if event['stage'] == 'rejected':
+                    self.command_failed.emit(event)
+                else:
+                    self.command_acked.emit(event)
+                return
+            
             # Handle connection status messages
             if isinstance(json_data, dict) and json_data.get('type') == 'connection_status':
                 arduino_connected = json_data.get('arduino_connected', False)
                 print(f"🔌 Arduino connection status: {arduino_connected}")
                 self.arduino_status.emit(arduino_connected)
+                if 'sample_rate_hz' in json_data:
+                    self.sample_rate_changed.emit(float(json_data['sample_rate_hz']))
+                return
+            
+            if isinstance(json_data, dict) and is_rate_message(json_data):
+                print(f"⏱️ Sample rate: {json_data['rate_hz']} Hz")
+                self.sample_rate_changed.emit(float(json_data['rate_hz']))
                 return
                 
             # Handle sensor data (regular data without 'type' field)
             if isinstance(json_data, dict) and 'no2' in json_data:
-                self.data_received.emit(json_data)
+                if self.ring is not None:
+                    timestamp = sample_time(json_data)
+                    self.ring.push(time.time() if timestamp is None else timestamp,
+                                   sensor_values(json_data),
+                                   int(json_data.get('state', 0)), int(json_data.get('level', 0)))
+                if self.batch_interval is None:
+                    self.data_received.emit(json_data)
+                    return
+                if not self._batch:
+                    self._batch_due = time.monotonic() + self.batch_interval
+                self._batch.append(json_data)
             
         except json.JSONDecodeError:
             print(f"⚠️ Invalid JSON received: {data}")
         except Exception as e:
             print(f"❌ Error processing data: {e}")
     
-    def send_command(self, command: str):
-        """Send command to backend"""
+    def send_command(self, command: str) -> Optional[str]:
+        """Queue a command for the I/O thread (never blocks); returns its id
+        
+        Progress is reported through ``command_acked`` / ``command_failed``.
+        """
         if self.socket and self.running:
+            command_id = self.commands.submit(command)
             try:
-                full_command = f"{command}\n"
-                self.socket.sendall(full_command.encode('utf-8'))
-                print(f"📤 Sent command: {command}")
-            except Exception as e:
-                error_msg = f"Send command error: {str(e)}"
-                self.error_occurred.emit(error_msg)
-                print(f"❌ {error_msg}")
-        else:
-            print(f"⚠️ Cannot send command: Socket not connected")
+                self._wake_send.send(b'\0')
+            except OSError:
+                pass  # wake-up buffer full: the loop is already due to run
+            return command_id
+        print(f"⚠️ Cannot send command: Socket not connected")
+        return None
     
     def stop(self):
         """Stop the network worker"""
         self.running = False
+        try:
+            self._wake_send.send(b'\0')
+        except OSError:
+            pass
         if self.socket:
             try:
                 self.socket.close()
             except:
                 pass
-        self.wait(2000)  # Wait for thread to finish
\ No newline at end of file
+        self.wait(2000)  # Wait for thread to finish
+        if not self.isRunning():
+            self._wake_recv.close()
+            self._wake_send.close()
\ No newline at end of file
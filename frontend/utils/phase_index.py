@@ -0,0 +1,206 @@
+"""Index of the FSM phases in a session
+
+Every sample carries the firmware's state and fan level. ``PhaseIndex``
+records the runs of constant (state, level) as [start, end) row ranges
+while samples arrive, so "HOLD at level 3" is a dictionary lookup and a
+slice instead of a scan. Indexes are saved as a ``.phases.json`` sidecar
+next to CSV files, inside the index of ``.aroma`` archives, and rebuilt
+from the states when a session has neither.
+"""
+
+import json
+import os
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config.constants import STATE_NAMES
+from utils.data_processor import DataProcessor
+
+PHASES_SUFFIX = ".phases.json"
+
+
+def _key(name: str) -> str:
+    return name.upper().replace('-', '').replace('_', '').replace(' ', '')
+
+
+STATE_CODES = {_key(name): code for code, name in STATE_NAMES.items()}
+
+# (state, level) pairs to select; level None means every level
+Selection = Sequence[Tuple[int, Optional[int]]]
+
+
+def parse_selection(text: str) -> List[Tuple[int, Optional[int]]]:
+    """``"HOLD:3, PURGE"`` -> [(3, 2), (4, None)]
+
+    Levels are 1-based as shown in the GUI; states are names from
+    STATE_NAMES or their numeric codes.
+    """
+    selection = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, level = part.partition(':')
+        name = name.strip()
+        state = int(name) if name.isdigit() else STATE_CODES.get(_key(name))
+        if state is None:
+            raise ValueError(f"Unknown phase '{part}'")
+        selection.append((state, int(level) - 1 if level.strip() else None))
+    return selection
+
+
+def describe_selection(selection: Selection) -> str:
+    return ", ".join(STATE_NAMES.get(state, str(state)) + ("" if level is None else f":{level + 1}")
+                     for state, level in selection)
+
+
+class PhaseIndex:
+    """Segments of constant (state, level) as [start, end) row ranges
+
+    ``append``/``extend`` take samples in arrival order; the last segment
+    stays open and grows until the phase changes.
+    """
+
+    def __init__(self):
+        self._segments = np.empty((64, 4), dtype=np.int64)  # state, level, start, end
+        self._count = 0
+        self._by_key: Dict[Tuple[int, int], List[int]] = {}
+        self.num_rows = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def segments(self) -> np.ndarray:
+        """(m, 4) array of [state, level, start, end) rows"""
+        return self._segments[:self._count]
+
+    def append(self, state: int, level: int):
+        """Add one sample"""
+        if self._count:
+            last = self._segments[self._count - 1]
+            if last[0] == state and last[1] == level:
+                last[3] += 1
+                self.num_rows += 1
+                return
+        self._add(state, level, self.num_rows, self.num_rows + 1)
+        self.num_rows += 1
+
+    def extend(self, states: np.ndarray, levels: np.ndarray):
+        """Add a block of samples"""
+        runs = DataProcessor.segment_phases(states, levels)
+        if not len(runs):
+            return
+        runs[:, 2:] += self.num_rows
+        if self._count:
+            last = self._segments[self._count - 1]
+            if last[0] == runs[0, 0] and last[1] == runs[0, 1]:
+                last[3] = runs[0, 3]
+                runs = runs[1:]
+        for state, level, start, end in runs:
+            self._add(int(state), int(level), int(start), int(end))
+        self.num_rows = int(self._segments[self._count - 1, 3])
+
+    def _add(self, state: int, level: int, start: int, end: int):
+        if self._count == len(self._segments):
+            grown = np.empty((2 * len(self._segments), 4), dtype=np.int64)
+            grown[:self._count] = self._segments[:self._count]
+            self._segments = grown
+        self._segments[self._count] = (state, level, start, end)
+        self._by_key.setdefault((state, level), []).append(self._count)
+        self._count += 1
+
+    @classmethod
+    def build(cls, states: np.ndarray, levels: np.ndarray) -> 'PhaseIndex':
+        index = cls()
+        index.extend(states, levels)
+        return index
+
+    @classmethod
+    def from_store(cls, store) -> 'PhaseIndex':
+        """Rebuild from a session's states, block by block"""
+        index = cls()
+        for _, _, states, levels in store.iter_blocks():
+            index.extend(states, levels)
+        return index
+
+    # ---- queries ----
+
+    def find(self, state: Optional[int] = None, level: Optional[int] = None) -> np.ndarray:
+        """Segments of a phase, in row order; None matches any state / level"""
+        if state is not None and level is not None:
+            ids = self._by_key.get((int(state), int(level)), [])
+        else:
+            ids = sorted(i for (s, l), rows in self._by_key.items()
+                         if (state is None or s == state) and (level is None or l == level)
+                         for i in rows)
+        return self._segments[ids]
+
+    def ranges(self, selection: Selection) -> List[Tuple[int, int]]:
+        """Sorted, merged [start, end) row ranges covering a selection"""
+        found = [self.find(state, level) for state, level in selection]
+        rows = np.concatenate(found) if found else np.empty((0, 4), dtype=np.int64)
+        merged = []
+        for start, end in sorted(map(tuple, rows[:, 2:].tolist())):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def phase_at(self, row: int) -> Optional[Tuple[int, int]]:
+        """(state, level) of a row"""
+        if not self._count or not 0 <= row < self.num_rows:
+            return None
+        i = int(np.searchsorted(self._segments[:self._count, 2], row, side='right')) - 1
+        state, level = self._segments[i, :2]
+        return int(state), int(level)
+
+    def expand(self, start: int = 0, stop: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-row (states, levels) of rows ``start:stop``"""
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        segments = self.segments
+        lengths = np.minimum(segments[:, 3], stop) - np.maximum(segments[:, 2], start)
+        keep = lengths > 0
+        return (np.repeat(segments[keep, 0], lengths[keep]).astype(np.int8),
+                np.repeat(segments[keep, 1], lengths[keep]).astype(np.int8))
+
+    def select(self, store, selection: Selection) -> Iterator[Tuple[np.ndarray, ...]]:
+        """(times, values, states, levels) blocks of the selected phases"""
+        for start, end in self.ranges(selection):
+            yield store.select(start, end)
+
+    # ---- persistence ----
+
+    def to_dict(self) -> dict:
+        return {'version': 1, 'num_rows': self.num_rows,
+                'columns': ['state', 'level', 'start', 'end'],
+                'segments': self.segments.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'PhaseIndex':
+        index = cls()
+        for state, level, start, end in data.get('segments', []):
+            index._add(int(state), int(level), int(start), int(end))
+        index.num_rows = int(data.get('num_rows', index._segments[index._count - 1, 3]
+                                      if index._count else 0))
+        return index
+
+    def save(self, filename: str) -> Optional[str]:
+        try:
+            with open(filename, 'w') as f:
+                json.dump(self.to_dict(), f)
+            return filename
+        except Exception as e:
+            print(f"Error saving phase index: {str(e)}")
+            return None
+
+    @classmethod
+    def load(cls, filename: str) -> 'PhaseIndex':
+        with open(filename, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    @staticmethod
+    def sidecar(filename: str) -> str:
+        """``data/x.csv`` -> ``data/x.phases.json``"""
+        return os.path.splitext(filename)[0] + PHASES_SUFFIX
@@ -0,0 +1,243 @@
+"""On-demand CPU profiling and allocation tracing for the running app
+
+Two CPU modes, started and stopped at runtime:
+
+* ``sample``: a daemon thread records the Python stack of every thread
+  (Qt event loop, network worker, timers) every ``interval`` seconds.
+  Overhead is low enough for production runs. Writes ``cpu.folded``
+  (one ``thread;outer;...;inner count`` line per stack, the input format
+  of flamegraph.pl, speedscope and inferno) and a ``cpu.txt`` summary.
+* ``cprofile``: deterministic cProfile of the thread that starts it (the
+  GUI thread, where ``on_data_received``, ``SensorPlot`` and
+  ``update_statistics`` run). Writes ``cpu.pstats`` (for pstats, snakeviz or
+  gprof2dot) and ``cpu.txt``. It also runs the sampler so the worker
+  threads still show up in ``cpu.folded``.
+
+``snapshot_memory`` takes ``tracemalloc`` snapshots (tracing starts on the
+first call). Each snapshot is dumped, and diffed against the previous one
+into ``mem_NN_diff.txt``.
+
+Every profiling run writes into its own directory under PROFILE_PATH,
+named after the session.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+
+from config.constants import PROFILE_PATH, PROFILE_INTERVAL, PROFILE_TOP, TRACEMALLOC_FRAMES
+
+PROFILE_MODES = ('sample', 'cprofile')
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    """Count the folded Python stacks of all other threads at a fixed interval"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, max_depth: int = 128):
+        super().__init__(name="aromasense-profiler", daemon=True)
+        self.interval = interval
+        self.max_depth = max_depth
+        self.counts = Counter()
+        self.samples = 0
+        self._halt = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        labels = {}  # code object -> label, avoids re-formatting hot frames
+        while not self._halt.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = _frame_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+    def write_folded(self, filename: str) -> str:
+        with open(filename, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+        return filename
+
+    def summary(self, top: int = PROFILE_TOP) -> str:
+        """Functions by samples on-CPU-stack (self = innermost frame)"""
+        own, total = Counter(), Counter()
+        for stack, count in self.counts.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        all_samples = max(sum(self.counts.values()), 1)
+        lines = [f"{self.samples} ticks every {self.interval * 1000:.1f} ms, "
+                 f"{all_samples} thread stacks",
+                 "", f"{'self %':>7} {'total %':>8}  function"]
+        for label, count in total.most_common(top):
+            lines.append(f"{100.0 * own[label] / all_samples:7.1f} "
+                         f"{100.0 * count / all_samples:8.1f}  {label}")
+        return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    """Start/stop CPU profiling and take memory snapshots, one directory per session"""
+
+    def __init__(self, output_dir: str = PROFILE_PATH, interval: float = PROFILE_INTERVAL):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.mode = None
+        self.directory = None
+        self.started = None
+        self._sampler = None
+        self._cprofile = None
+        self._snapshot = None
+        self._snapshot_count = 0
+        self._memory_dir = None
+
+    @property
+    def active(self) -> bool:
+        return self.mode is not None
+
+    @property
+    def tracing_memory(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def _session_dir(self, session: str) -> str:
+        name = re.sub(r'[^\w.-]+', '_', session or "session").strip('_') or "session"
+        directory = os.path.join(self.output_dir,
+                                 f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    # ---- CPU ----
+
+    def start(self, mode: str = 'sample', session: str = "session") -> str:
+        """Begin CPU profiling; returns the output directory"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'")
+        if self.active:
+            raise RuntimeError(f"Profiler already running ({self.mode})")
+        if mode == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()  # ValueError if another profiler is active
+            self._cprofile = profile
+        self.directory = self._session_dir(session)
+        self._sampler = StackSampler(self.interval)
+        self._sampler.start()
+        self.mode = mode
+        self.started = time.perf_counter()
+        return self.directory
+
+    def stop(self) -> List[str]:
+        """End CPU profiling and write the results; returns the files written"""
+        if not self.active:
+            return []
+        elapsed = time.perf_counter() - self.started
+        written = []
+        self._sampler.stop()
+        written.append(self._sampler.write_folded(os.path.join(self.directory, "cpu.folded")))
+        text = [f"AromaSense profile ({self.mode}), {elapsed:.1f} s wall\n",
+                self._sampler.summary()]
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            stats_file = os.path.join(self.directory, "cpu.pstats")
+            self._cprofile.dump_stats(stats_file)
+            written.append(stats_file)
+            out = io.StringIO()
+            pstats.Stats(self._cprofile, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            text += ["\ncProfile (GUI thread), by cumulative time:\n", out.getvalue()]
+        summary = os.path.join(self.directory, "cpu.txt")
+        with open(summary, 'w') as f:
+            f.write("".join(text))
+        written.append(summary)
+        self.mode = None
+        self._sampler = None
+        self._cprofile = None
+        return written
+
+    def toggle(self, mode: str = 'sample', session: str = "session") -> Optional[List[str]]:
+        """Start if idle (returns None), stop if running (returns the files)"""
+        if self.active:
+            return self.stop()
+        self.start(mode, session)
+        return None
+
+    # ---- memory ----
+
+    def snapshot_memory(self, label: str = "", session: str = "session") -> str:
+        """Dump a tracemalloc snapshot and its diff against the previous one
+
+        The first call starts tracing, so its snapshot is the baseline.
+        Returns the path of the diff report (or of the first snapshot).
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._snapshot = None
+        if self._memory_dir is None:
+            self._memory_dir = self.directory or self._session_dir(session)
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        self._snapshot_count += 1
+        stem = os.path.join(self._memory_dir, f"mem_{self._snapshot_count:02d}")
+        if label:
+            stem += "_" + re.sub(r'[^\w.-]+', '_', label)
+        snapshot.dump(stem + ".snapshot")
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced {current / 1e6:.2f} MB, peak {peak / 1e6:.2f} MB"]
+        if self._snapshot is None:
+            lines.append("baseline; largest allocation sites:")
+            lines += [str(stat) for stat in snapshot.statistics('lineno')[:PROFILE_TOP]]
+        else:
+            lines.append("growth since the previous snapshot:")
+            lines += [str(stat) for stat in snapshot.compare_to(self._snapshot, 'lineno')[:PROFILE_TOP]]
+        self._snapshot = snapshot
+        with open(stem + "_diff.txt", 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        return stem + "_diff.txt"
+
+    def begin_memory_session(self, session: str):
+        """Put the following snapshots in a new directory (diffs continue)"""
+        self._memory_dir = self._session_dir(session)
+        self._snapshot_count = 0
+
+    def stop_memory(self):
+        """Stop tracing; the next snapshot starts a new series"""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._snapshot = None
+        self._memory_dir = None
+
+    def close(self) -> List[str]:
+        """Flush everything (application exit)"""
+        written = self.stop()
+        if tracemalloc.is_tracing():
+            written.append(self.snapshot_memory("exit"))
+            self.stop_memory()
+        return written
@@ -0,0 +1,137 @@
+"""Wire protocol helpers shared by the GUI, headless and multi-rig paths
+
+Qt-free so it can run inside asyncio loops and worker processes.
+"""
+
+import json
+import re
+from datetime import datetime
+from typing import Optional, List
+
+from config.constants import SENSOR_KEYS, SAMPLE_RATE
+
+RATE_COMMAND = "SET_RATE"
+
+# The firmware sends -1 for readings it could not take, on every channel
+FIRMWARE_INVALID = -1.0
+# Fallbacks used by the Rust backend (process_sensor_data) for unparsable fields
+MQ_FALLBACK = -1.0
+MICS_FALLBACK = 0.0
+
+
+def parse_backend_line(line: str) -> Optional[dict]:
+    """Decode one JSON line from the backend; None if it is not a JSON object"""
+    try:
+        message = json.loads(line)
+    except (json.JSONDecodeError, ValueError):
+        return None
+    return message if isinstance(message, dict) else None
+
+
+_FRACTION = re.compile(r'\.(\d+)')
+
+
+def parse_timestamp(value) -> Optional[float]:
+    """RFC 3339 timestamp from the backend (chrono, up to ns precision) -> epoch seconds"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str) or not value:
+        return None
+    text = value.strip().replace('Z', '+00:00')
+    # datetime only keeps microseconds; trim longer fractions
+    text = _FRACTION.sub(lambda m: '.' + m.group(1)[:6].ljust(6, '0'), text, count=1)
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+def is_sensor_message(message: dict) -> bool:
+    """True for sensor samples (no 'type' field, carries readings)"""
+    return 'type' not in message and 'no2' in message
+
+
+def is_rate_message(message: dict) -> bool:
+    """Backend ``sample_rate`` message relayed from the firmware's RATE header"""
+    return message.get('type') == 'sample_rate' and 'rate_hz' in message
+
+
+def sample_time(message: dict) -> Optional[float]:
+    """Acquisition time of a sample in seconds
+
+    Prefers the firmware's ``device_ms`` (exact sample spacing, unaffected
+    by WiFi batching) over the backend's receive timestamp. Only
+    differences matter: MonotonicClock makes the axis session-relative.
+    """
+    device_ms = message.get('device_ms')
+    if isinstance(device_ms, (int, float)) and not isinstance(device_ms, bool):
+        return device_ms / 1000.0
+    return parse_timestamp(message.get('timestamp'))
+
+
+def parse_sensor_line(line: str) -> Optional[dict]:
+    """Parse a raw firmware line ``SENSOR:no2,eth,voc,co,co_mics,eth_mics,voc_mics,state,level[,ms]``
+
+    Mirrors the backend: MQ fields fall back to -1.0, MiCS fields to 0.0.
+    The optional 10th field is the firmware's millis() (``device_ms``).
+    """
+    line = line.strip()
+    if not line.startswith("SENSOR:"):
+        return None
+    parts = line[len("SENSOR:"):].split(',')
+    if len(parts) < 9:
+        return None
+
+    data = {}
+    for idx, key in enumerate(SENSOR_KEYS):
+        try:
+            data[key] = float(parts[idx])
+        except ValueError:
+            data[key] = MQ_FALLBACK if idx < 4 else MICS_FALLBACK
+    for idx, key in ((7, 'state'), (8, 'level')):
+        try:
+            data[key] = int(parts[idx])
+        except ValueError:
+            data[key] = 0
+    if len(parts) > 9:
+        try:
+            data['device_ms'] = int(parts[9])
+        except ValueError:
+            pass
+    return data
+
+
+def format_command(command_id: str, command: str) -> str:
+    """Command line with an id the backend and firmware acknowledge: ``#<id> COMMAND``"""
+    return f"#{command_id} {command}"
+
+
+def format_rate_command(rate_hz: float) -> str:
+    """``SET_RATE <hz>``; the firmware takes whole Hz and refuses it mid-run"""
+    return f"{RATE_COMMAND} {int(round(rate_hz))}"
+
+
+def scale_samples(count: int, rate_hz: float, base_hz: float = SAMPLE_RATE) -> int:
+    """A sample count tuned at ``base_hz``, covering the same time at ``rate_hz``
+
+    0 stays 0 (it disables checks such as the flatline test).
+    """
+    if count <= 0:
+        return count
+    return max(1, int(round(count * rate_hz / base_hz)))
+
+
+def is_ack_message(message: dict) -> bool:
+    """Backend ``command_ack`` (stage 'backend' on receipt, 'arduino' once run)"""
+    return message.get('type') == 'command_ack' and 'id' in message
+
+
+def sensor_values(data: dict) -> List[float]:
+    """Sensor readings in SENSOR_NAMES order"""
+    return [float(data.get(key, 0.0)) for key in SENSOR_KEYS]
+
+
+def missing_sensors(data: dict) -> List[bool]:
+    """Per channel: True if the key is absent or not a number"""
+    return [not isinstance(data.get(key), (int, float)) or isinstance(data.get(key), bool)
+            for key in SENSOR_KEYS]
@@ -0,0 +1,195 @@
+"""Streaming per-channel data quality flags
+
+Samples are checked in blocks with NumPy; state carried between blocks
+(last value, current run length, warm-up step sums, last time) makes the
+result identical to checking the whole session at once, at O(1) cost per
+sample. Spikes are steps far above the channel's mean absolute step over
+its first QUALITY_SPIKE_WARMUP clean steps; none are flagged before that.
+Flags are bits in a (samples, channels) uint8 mask that is saved next to
+the session data.
+"""
+
+import numpy as np
+from typing import Dict, Optional
+
+from config.constants import (
+    NUM_SENSORS, SENSOR_NAMES, UPDATE_INTERVAL, QUALITY_FLATLINE_SAMPLES,
+    QUALITY_VALID_RANGE, QUALITY_SPIKE_FACTOR, QUALITY_SPIKE_MIN_JUMP, QUALITY_SPIKE_WARMUP,
+    QUALITY_GAP_FACTOR
+)
+from utils.protocol import FIRMWARE_INVALID, MQ_FALLBACK, MICS_FALLBACK, scale_samples
+
+SENTINEL = 1   # -1 from the firmware or a backend parse fallback
+MISSING = 2    # key absent from the JSON sample
+FLATLINE = 4   # stuck: identical readings for too long
+SPIKE = 8      # single step far larger than usual for the channel
+RANGE = 16     # outside QUALITY_VALID_RANGE
+GAP = 32       # time since the previous sample far above nominal
+
+FLAG_NAMES = {SENTINEL: "sentinel", MISSING: "missing", FLATLINE: "flatline",
+              SPIKE: "spike", RANGE: "range", GAP: "gap"}
+
+# The backend substitutes MQ_FALLBACK / MICS_FALLBACK for unparsable fields
+BACKEND_FALLBACKS = np.array([MQ_FALLBACK] * 4 + [MICS_FALLBACK] * 3)
+
+
+class QualityMonitor:
+    """Flag sentinel, missing, stuck, spiking and late samples per channel"""
+
+    def __init__(self, num_sensors: int = NUM_SENSORS, interval: float = UPDATE_INTERVAL / 1000.0,
+                 capacity: int = 1024):
+        self.num_sensors = num_sensors
+        self.interval = interval
+        self.fallbacks = BACKEND_FALLBACKS[:num_sensors]
+        ranges = np.array(QUALITY_VALID_RANGE[:num_sensors], dtype=np.float64)
+        self.low, self.high = ranges[:, 0], ranges[:, 1]
+        # Flatline lengths are tuned at the default rate; keep their duration
+        flat = np.array([scale_samples(count, 1.0 / interval)
+                         for count in QUALITY_FLATLINE_SAMPLES[:num_sensors]], dtype=np.int64)
+        self.flatline_samples = np.where(flat > 0, flat, np.iinfo(np.int64).max)
+        self.spike_warmup = max(scale_samples(QUALITY_SPIKE_WARMUP, 1.0 / interval), 1)
+        self._mask = np.zeros((capacity, num_sensors), dtype=np.uint8)
+        self.reset()
+
+    def reset(self):
+        self._size = 0
+        self._last_value = None
+        self._last_time = None
+        self._run = np.zeros(self.num_sensors, dtype=np.int64)
+        self._step_sum = np.zeros(self.num_sensors)    # |step| over the warm-up so far
+        self._step_count = np.zeros(self.num_sensors, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def mask(self) -> np.ndarray:
+        return self._mask[:self._size]
+
+    def check(self, times: np.ndarray, values: np.ndarray,
+              missing: Optional[np.ndarray] = None) -> np.ndarray:
+        """Flag a block of (n,) times and (n, channels) values; returns its mask
+
+        ``missing`` is an optional (n, channels) bool array of absent keys.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        n = len(times)
+        mask = np.zeros((n, self.num_sensors), dtype=np.uint8)
+        if n == 0:
+            return mask
+
+        mask[(values == FIRMWARE_INVALID) | (values == self.fallbacks)] |= SENTINEL
+        if missing is not None:
+            mask[np.asarray(missing, dtype=bool)] |= MISSING
+        mask[(values <= self.low) | (values > self.high) | ~np.isfinite(values)] |= RANGE
+
+        # Steps and run lengths continue from the previous block
+        previous = values[:1] if self._last_value is None else self._last_value[None, :]
+        steps = np.abs(np.diff(values, axis=0, prepend=previous))
+        same = steps == 0
+        if self._last_value is None:
+            same[0] = False
+        idx = np.arange(n)[:, None]
+        last_change = np.maximum.accumulate(np.where(~same, idx, -1), axis=0)
+        run = np.where(last_change >= 0, idx - last_change + 1, self._run + idx + 1)
+        mask[run >= self.flatline_samples] |= FLATLINE
+        self._run = run[-1]
+
+        # Spikes: each row against the mean clean step over the channel's
+        # warm-up, which only depends on earlier rows whatever the blocks
+        clean = (mask == 0) & np.isfinite(steps)
+        if self._last_value is None:
+            clean[0] = False  # the first sample has no step
+        counted = self._step_count + np.cumsum(clean, axis=0)
+        warmup = clean & (counted <= self.spike_warmup)
+        sums = self._step_sum + np.cumsum(np.where(warmup, steps, 0.0), axis=0)
+        # Once the warm-up is complete before a row, ``sums`` is its full total
+        ready = counted - clean >= self.spike_warmup
+        limit = np.maximum(QUALITY_SPIKE_FACTOR * sums / self.spike_warmup, QUALITY_SPIKE_MIN_JUMP)
+        mask[ready & (steps > limit)] |= SPIKE
+        self._step_sum = sums[-1]
+        self._step_count = np.minimum(counted[-1], self.spike_warmup)
+
+        prev_time = times[0] if self._last_time is None else self._last_time
+        dt = np.diff(times, prepend=prev_time)
+        mask[dt > QUALITY_GAP_FACTOR * self.interval] |= GAP
+
+        self._last_value = values[-1].copy()
+        self._last_time = times[-1]
+        self._append(mask)
+        return mask
+
+    def _append(self, mask: np.ndarray):
+        needed = self._size + len(mask)
+        if needed > len(self._mask):
+            grown = np.zeros((max(needed, 2 * len(self._mask)), self.num_sensors), dtype=np.uint8)
+            grown[:self._size] = self._mask[:self._size]
+            self._mask = grown
+        self._mask[self._size:needed] = mask
+        self._size = needed
+
+    def summary(self) -> Dict[str, np.ndarray]:
+        """Flagged-sample count per flag name, per channel"""
+        mask = self.mask
+        return {name: (mask & bit).astype(bool).sum(axis=0) for bit, name in FLAG_NAMES.items()}
+
+    def flagged_fraction(self) -> float:
+        """Fraction of samples with any flag on any channel"""
+        if not self._size:
+            return 0.0
+        return float(self.mask.any(axis=1).mean())
+
+    def save(self, filename: str, times: Optional[np.ndarray] = None,
+             rows: Optional[int] = None) -> Optional[str]:
+        """Write the mask (of the first ``rows`` samples) as a compressed ``.npz`` sidecar"""
+        rows = self._size if rows is None else min(rows, self._size)
+        times = np.empty(0) if times is None else np.asarray(times)[:rows]
+        return save_quality_mask(filename, self._mask[:rows], times, self.num_sensors)
+
+
+class QualityWriter:
+    """Export block writer for the ``.quality.npz`` sidecar of the exported rows
+
+    The mask of those rows is copied from the monitor when the export
+    starts; their times are collected from the export's blocks.
+    """
+
+    def __init__(self, filename: str, monitor: QualityMonitor, rows: int):
+        self.filename = filename
+        self.num_sensors = monitor.num_sensors
+        self.mask = monitor.mask[:rows].copy()
+        self._times = []
+
+    def append_block(self, times, values, states=None, levels=None):
+        self._times.append(np.array(times, dtype=np.float64))
+
+    def close(self) -> Optional[str]:
+        times = np.concatenate(self._times) if self._times else np.empty(0)
+        return save_quality_mask(self.filename, self.mask[:len(times)], times, self.num_sensors)
+
+    def abort(self):
+        self._times = []
+
+
+def save_quality_mask(filename: str, mask: np.ndarray, times: np.ndarray,
+                      num_sensors: int = NUM_SENSORS) -> Optional[str]:
+    try:
+        np.savez_compressed(
+            filename, mask=mask, times=times,
+            flag_bits=np.array(list(FLAG_NAMES)), flag_names=np.array(list(FLAG_NAMES.values())),
+            sensor_names=np.array(SENSOR_NAMES[:num_sensors]))
+        return filename
+    except Exception as e:
+        print(f"Error saving quality mask: {str(e)}")
+        return None
+
+
+def load_quality_mask(filename: str) -> Dict[str, np.ndarray]:
+    with np.load(filename) as data:
+        return {key: data[key] for key in data.files}
+
+
+def describe(flags: int) -> str:
+    """Human-readable list of the bits set in ``flags``"""
+    return ", ".join(name for bit, name in FLAG_NAMES.items() if flags & bit) or "ok"
@@ -0,0 +1,92 @@
+"""Per-session report data, independent of how the report is drawn
+
+``summarize_session`` loads one recorded session and reduces it to what a
+report page shows: a min/max envelope of every channel (a few thousand
+points, whatever the run length), the FSM phase segments for shading and
+per-level HOLD tables.
+"""
+
+import os
+import numpy as np
+
+from config.constants import SENSOR_NAMES, STATE_HOLD, NUM_LEVELS
+from utils.data_processor import DataProcessor
+from utils.file_handler import FileHandler
+from utils.protocol import FIRMWARE_INVALID
+
+
+def min_max_envelope(times: np.ndarray, values: np.ndarray, buckets: int):
+    """Thin (n,) times / (n, channels) values to a min and a max per bucket
+
+    Returns (times, values) with two rows per bucket, both at the bucket's
+    first time: drawn as a line they trace every excursion of the full
+    series at a fraction of the points. Short series are returned as is.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    n = len(times)
+    if n <= 2 * buckets:
+        return times, values
+    starts = np.linspace(0, n, buckets + 1).astype(np.int64)[:-1]
+    with np.errstate(invalid='ignore'):
+        low = np.fmin.reduceat(values, starts, axis=0)
+        high = np.fmax.reduceat(values, starts, axis=0)
+    out_values = np.empty((2 * buckets, values.shape[1]))
+    out_values[0::2], out_values[1::2] = low, high
+    return np.repeat(times[starts], 2), out_values
+
+
+def nice_ticks(low: float, high: float, count: int = 6) -> np.ndarray:
+    """About ``count`` round tick positions (1, 2, 2.5, 5 x 10^k) spanning [low, high]
+
+    The first tick is at or below ``low`` and the last at or above ``high``,
+    so they double as axis limits.
+    """
+    if not np.isfinite(low) or not np.isfinite(high):
+        return np.array([0.0])
+    if high <= low:
+        high = low + 1.0
+    raw = (high - low) / max(count - 1, 1)
+    magnitude = 10.0 ** np.floor(np.log10(raw))
+    step = magnitude * min((m for m in (1.0, 2.0, 2.5, 5.0, 10.0) if m * magnitude >= raw),
+                           default=10.0)
+    first = np.floor(low / step + 1e-9) * step
+    return first + step * np.arange(int(np.ceil((high - first) / step - 1e-9)) + 1)
+
+
+def summarize_session(filename: str, buckets: int = 2000) -> dict:
+    """Everything a report page needs for one session file"""
+    store = FileHandler.load_session(filename)
+    phases = FileHandler.load_phase_index(filename, store)
+    times, values = store.times, store.values
+    states, levels = store.states, store.levels
+
+    drawn = np.where(values == FIRMWARE_INVALID, np.nan, values)  # not drawn
+    env_times, env_values = min_max_envelope(times, drawn, buckets)
+
+    features = DataProcessor.extract_features(times, values, states, levels,
+                                              num_levels=NUM_LEVELS)
+    hold_seconds = np.zeros(NUM_LEVELS)
+    for state, level, start, end in phases.segments:
+        if state == STATE_HOLD and 0 <= level < NUM_LEVELS and end > start:
+            hold_seconds[level] += times[min(end, len(times)) - 1] - times[start]
+
+    metadata = dict(store.metadata)
+    return {
+        'file': filename,
+        'name': metadata.get('name') or os.path.splitext(os.path.basename(filename))[0],
+        'type': metadata.get('type', 'Unknown'),
+        'metadata': metadata,
+        'num_points': len(store),
+        'duration': float(times[-1] - times[0]) if len(store) else 0.0,
+        'sensor_names': list(SENSOR_NAMES[:store.num_sensors]),
+        'times': env_times,
+        'values': env_values,
+        'segments': phases.segments.copy(),
+        'segment_times': (times[np.minimum(phases.segments[:, 2:], max(len(times) - 1, 0))]
+                          if len(store) else np.empty((0, 2))),
+        'mean_response': features[:, 0],
+        'peak_response': features[:, 1],
+        'hold_seconds': hold_seconds,
+        'invalid_fraction': float((values == FIRMWARE_INVALID).mean()) if values.size else 0.0,
+    }
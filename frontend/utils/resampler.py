@@ -0,0 +1,143 @@
+"""Per-sample time bases and vectorized resampling onto uniform grids
+
+``MonotonicClock`` gives every live sample a session-relative time;
+``StreamingResampler`` puts block-fed samples on a uniform grid (the
+similarity signatures' time-aligned curves).
+"""
+
+import numpy as np
+from typing import Optional, Tuple
+
+METHODS = ('linear', 'zoh')
+
+
+class MonotonicClock:
+    """Turn backend timestamps into a monotonic, session-relative time axis
+
+    Samples without a timestamp advance by ``fallback_step``; timestamps that
+    jump backwards (clock adjustments, reordering) are clamped so the axis
+    never decreases.
+    """
+
+    def __init__(self, fallback_step: float = 0.25):
+        self.fallback_step = fallback_step
+        self.reset()
+
+    def reset(self):
+        self.origin = None
+        self.last = None
+        self.backsteps = 0  # timestamps clamped because they went backwards
+        self.missing = 0    # samples that had no usable timestamp
+
+    def stamp(self, timestamp: Optional[float]) -> float:
+        """Session-relative time in seconds for one sample"""
+        if timestamp is None:
+            self.missing += 1
+            t = 0.0 if self.last is None else self.last + self.fallback_step
+        else:
+            if self.origin is None:
+                # First real timestamp: carry on from any synthetic time so far
+                self.origin = timestamp - (0.0 if self.last is None else self.last + self.fallback_step)
+            t = timestamp - self.origin
+        if self.last is not None and t < self.last:
+            self.backsteps += 1
+            t = self.last
+        self.last = t
+        return t
+
+
+def _grid(t_start: float, t_end: float, rate_hz: float) -> np.ndarray:
+    step = 1.0 / rate_hz
+    count = int(np.floor((t_end - t_start) / step + 1e-9)) + 1
+    # Rounding must not put the last point past t_end (it would come out NaN)
+    return np.minimum(t_start + np.arange(max(count, 0)) * step, t_end)
+
+
+def interpolate(times: np.ndarray, values: np.ndarray, grid: np.ndarray,
+                method: str = 'linear', max_gap: Optional[float] = None) -> np.ndarray:
+    """Evaluate (n,) / (n, channels) samples at ``grid`` times
+
+    ``times`` must be non-decreasing. Grid points inside a gap longer than
+    ``max_gap`` seconds are NaN.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown resampling method '{method}'")
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    squeeze = values.ndim == 1
+    if squeeze:
+        values = values[:, None]
+    grid = np.asarray(grid, dtype=np.float64)
+
+    if len(times) == 0:
+        out = np.full((len(grid), values.shape[1]), np.nan)
+        return out[:, 0] if squeeze else out
+
+    # Index of the last sample at or before each grid point
+    right = np.searchsorted(times, grid, side='right')
+    left = np.clip(right - 1, 0, len(times) - 1)
+    if method == 'zoh':
+        out = values[left]
+    else:
+        nxt = np.clip(right, 0, len(times) - 1)
+        t0, t1 = times[left], times[nxt]
+        span = t1 - t0
+        frac = np.divide(grid - t0, span, out=np.zeros_like(grid), where=span > 0)
+        frac = np.clip(frac, 0.0, 1.0)[:, None]
+        out = values[left] + (values[nxt] - values[left]) * frac
+
+    out = out.astype(np.float64, copy=True)
+    out[grid < times[0]] = np.nan
+    out[grid > times[-1]] = np.nan
+    if max_gap is not None and len(times) > 1:
+        nxt = np.clip(right, 0, len(times) - 1)
+        gap = times[nxt] - times[left]
+        out[gap > max_gap] = np.nan
+    return out[:, 0] if squeeze else out
+
+
+class StreamingResampler:
+    """Block-at-a-time resampling onto a uniform grid
+
+    Keeps the last input sample between blocks so grid points that fall
+    between two blocks are interpolated correctly. Each ``push`` returns
+    only the grid points that are now fully determined.
+    """
+
+    def __init__(self, rate_hz: float, method: str = 'linear', t_start: float = 0.0,
+                 max_gap: Optional[float] = None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown resampling method '{method}'")
+        self.rate_hz = rate_hz
+        self.step = 1.0 / rate_hz
+        self.method = method
+        self.max_gap = max_gap
+        self.next_index = 0  # next grid point to emit
+        self.t_start = t_start
+        self._last_time = None
+        self._last_value = None
+
+    def push(self, times, values) -> Tuple[np.ndarray, np.ndarray]:
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        if len(times) == 0:
+            return np.empty(0), np.empty((0, values.shape[1]))
+
+        if self._last_time is not None:
+            times = np.concatenate(([self._last_time], times))
+            values = np.concatenate((self._last_value[None, :], values))
+
+        # Emit every grid point up to the newest sample
+        first = self.t_start + self.next_index * self.step
+        if times[-1] < first:
+            grid = np.empty(0)
+        else:
+            grid = _grid(first, times[-1], self.rate_hz)
+        out = interpolate(times, values, grid, self.method, self.max_gap)
+
+        self.next_index += len(grid)
+        self._last_time = times[-1]
+        self._last_value = values[-1].copy()
+        return grid, out
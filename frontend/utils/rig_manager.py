@@ -0,0 +1,459 @@
+"""Multi-rig acquisition on one asyncio event loop
+
+One background thread runs an asyncio loop that drives every rig: backend
+TCP connections (port 8082 of each Rust bridge) and direct serial links.
+Each rig gets its own SessionStore, health record and command route, so a
+single process can sample dozens of e-noses without one QThread and one
+blocking socket per device.
+
+Callbacks (``on_sample``, ``on_status``, ``on_session_done``) are invoked
+on the loop thread; GUI code should forward them through a Qt signal.
+``headless.py --rig`` runs a sample queue on several rigs this way.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from config.constants import STATE_DONE, DATA_SAVE_PATH
+from utils.protocol import (
+    parse_backend_line, parse_sensor_line, sample_time, is_sensor_message, sensor_values
+)
+from utils.resampler import MonotonicClock
+from utils.session_store import SessionStore
+from utils.file_handler import SessionCSVWriter
+
+
+class RigHealth:
+    """Connection and data-flow health of one rig"""
+
+    def __init__(self):
+        self.connected = False
+        self.arduino_connected = False
+        self.samples = 0
+        self.last_sample_at = None  # time.monotonic()
+        self.rate_hz = 0.0  # smoothed sample rate
+        self.reconnects = 0
+        self.errors = 0
+        self.last_error = ""
+
+    def record_sample(self, now: float):
+        if self.last_sample_at is not None:
+            dt = now - self.last_sample_at
+            if dt > 0:
+                self.rate_hz = 0.9 * self.rate_hz + 0.1 * (1.0 / dt) if self.rate_hz else 1.0 / dt
+        self.last_sample_at = now
+        self.samples += 1
+
+    def record_error(self, msg: str):
+        self.errors += 1
+        self.last_error = msg
+
+    def to_dict(self) -> dict:
+        age = None if self.last_sample_at is None else time.monotonic() - self.last_sample_at
+        return {
+            'connected': self.connected,
+            'arduino_connected': self.arduino_connected,
+            'samples': self.samples,
+            'rate_hz': round(self.rate_hz, 2),
+            'last_sample_age': None if age is None else round(age, 2),
+            'reconnects': self.reconnects,
+            'errors': self.errors,
+            'last_error': self.last_error,
+        }
+
+
+class Rig(ABC):
+    """One e-nose: connection, session store and sampling state"""
+
+    RECONNECT_DELAY = 2.0
+    MAX_RECONNECT_DELAY = 30.0
+
+    def __init__(self, rig_id: str, manager: 'RigManager', max_samples: Optional[int]):
+        self.rig_id = rig_id
+        self.manager = manager
+        self.store = SessionStore(max_samples=max_samples)
+        self.health = RigHealth()
+        self.is_sampling = False
+        self.run_active = False
+        self.clock = MonotonicClock()
+        self.sample_info = None
+        self.writer = None
+        self.task = None
+        self.stopping = False
+
+    async def run(self):
+        """Connect, read until disconnected, back off and retry"""
+        delay = self.RECONNECT_DELAY
+        while True:
+            try:
+                await self.open()
+                self.health.connected = True
+                delay = self.RECONNECT_DELAY
+                self.manager._emit_status(self)
+                await self.read_loop()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.health.record_error(str(e))
+            finally:
+                await self.close()
+            if self.health.connected:
+                self.health.connected = False
+                self.health.arduino_connected = False
+                self.manager._emit_status(self)
+            if self.stopping:
+                return  # the cancel raced a failing connect and was swallowed
+            self.health.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+
+    @abstractmethod
+    async def open(self):
+        """Open the connection (raises on failure)"""
+
+    @abstractmethod
+    async def read_loop(self):
+        """Read and handle incoming lines until the link drops"""
+
+    @abstractmethod
+    async def write_line(self, line: str):
+        """Write one command line"""
+
+    async def close(self):
+        pass
+
+    async def send_command(self, command: str) -> bool:
+        if not self.health.connected:
+            self.health.record_error(f"not connected, dropped command {command}")
+            return False
+        try:
+            await self.write_line(command)
+            return True
+        except Exception as e:
+            self.health.record_error(f"send failed: {e}")
+            return False
+
+    def handle_sample(self, data: dict):
+        """Store one sample, stream it to disk and watch for DONE"""
+        now = time.monotonic()
+        self.health.record_sample(now)
+        if not self.is_sampling:
+            return
+
+        try:
+            values = sensor_values(data)
+            state = int(data.get('state', 0))
+            level = int(data.get('level', 0))
+        except (TypeError, ValueError) as e:
+            self.health.record_error(f"bad sample: {e}")
+            return
+
+        # Firmware device time when present; otherwise the bridge's receive
+        # time (serial samples are stamped on arrival by SerialRig)
+        t = self.clock.stamp(sample_time(data))
+        self.store.append(t, values, state, level)
+        if self.writer:
+            self.writer.write_row(t, values)
+        self.manager._emit_sample(self, t, values, state, level)
+
+        if 0 < state < STATE_DONE:
+            self.run_active = True
+        elif state == STATE_DONE and self.run_active:
+            self.manager._finish_session(self, success=True)
+
+
+class BackendRig(Rig):
+    """Rig reached through a Rust bridge (JSON lines on the frontend port)"""
+
+    def __init__(self, rig_id: str, manager: 'RigManager', max_samples: Optional[int],
+                 host: str = "127.0.0.1", port: int = 8082):
+        super().__init__(rig_id, manager, max_samples)
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer_stream = None
+
+    async def open(self):
+        self.reader, self.writer_stream = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout=5.0)
+
+    async def read_loop(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError("backend disconnected")
+            message = parse_backend_line(line.decode('utf-8', errors='replace'))
+            if message is None:
+                continue
+            if message.get('type') == 'connection_status':
+                self.health.arduino_connected = bool(message.get('arduino_connected', False))
+                self.manager._emit_status(self)
+            elif is_sensor_message(message):
+                self.handle_sample(message)
+
+    async def write_line(self, line: str):
+        self.writer_stream.write(f"{line}\n".encode('utf-8'))
+        await self.writer_stream.drain()
+
+    async def close(self):
+        if self.writer_stream:
+            self.writer_stream.close()
+            try:
+                await self.writer_stream.wait_closed()
+            except Exception:
+                pass
+        self.reader = self.writer_stream = None
+
+
+class SerialRig(Rig):
+    """Rig on a serial port that prints raw ``SENSOR:`` lines
+
+    pyserial has no asyncio API, so its blocking calls run on the rig's
+    own two threads, one reading and one writing. The loop's default
+    executor is capped and shared, so dozens of ports blocked in
+    ``readline`` there would starve each other and every write.
+    """
+
+    def __init__(self, rig_id: str, manager: 'RigManager', max_samples: Optional[int],
+                 serial_port: str = "", baud_rate: int = 9600):
+        super().__init__(rig_id, manager, max_samples)
+        self.serial_port = serial_port
+        self.baud_rate = baud_rate
+        self.serial_connection = None
+        self.reader_thread = None
+        self.writer_thread = None
+
+    async def open(self):
+        import serial
+        self.reader_thread = ThreadPoolExecutor(max_workers=1,
+                                                thread_name_prefix=f"rig-{self.rig_id}-read")
+        self.writer_thread = ThreadPoolExecutor(max_workers=1,
+                                                thread_name_prefix=f"rig-{self.rig_id}-write")
+        loop = asyncio.get_running_loop()
+        self.serial_connection = await loop.run_in_executor(
+            self.reader_thread, lambda: serial.Serial(self.serial_port, self.baud_rate, timeout=1))
+        self.health.arduino_connected = True
+
+    async def read_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            raw = await loop.run_in_executor(self.reader_thread, self.serial_connection.readline)
+            if not raw:
+                continue  # read timeout
+            data = parse_sensor_line(raw.decode('utf-8', errors='replace'))
+            if data is not None:
+                data['timestamp'] = time.time()
+                self.handle_sample(data)
+
+    async def write_line(self, line: str):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self.writer_thread, self.serial_connection.write, f"{line}\n".encode('utf-8'))
+
+    async def close(self):
+        if self.serial_connection:
+            self.serial_connection.close()
+        self.serial_connection = None
+        # A readline still in flight ends within the port's 1 s timeout
+        for executor in (self.reader_thread, self.writer_thread):
+            if executor:
+                executor.shutdown(wait=False)
+        self.reader_thread = self.writer_thread = None
+
+
+class RigManager:
+    """Drive many rigs from one asyncio loop running off the GUI thread"""
+
+    RIG_TYPES = {'backend': BackendRig, 'serial': SerialRig}
+
+    def __init__(self, max_samples_per_rig: Optional[int] = None,
+                 output_dir: Optional[str] = DATA_SAVE_PATH,
+                 on_sample: Optional[Callable] = None,
+                 on_status: Optional[Callable] = None,
+                 on_session_done: Optional[Callable] = None):
+        self.max_samples_per_rig = max_samples_per_rig
+        self.output_dir = output_dir
+        self.on_sample = on_sample
+        self.on_status = on_status
+        self.on_session_done = on_session_done
+        self.rigs: Dict[str, Rig] = {}
+        self.loop = None
+        self.thread = None
+
+    # ---- lifecycle (any thread) ----
+
+    def start(self):
+        """Start the I/O loop thread and connect every configured rig"""
+        if self.thread:
+            return
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run_loop():
+            asyncio.set_event_loop(self.loop)
+            self.loop.call_soon(ready.set)
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run_loop, name="RigManager", daemon=True)
+        self.thread.start()
+        ready.wait()
+        for rig in self.rigs.values():
+            self._call(self._start_rig, rig)
+        print(f"✅ Rig manager started with {len(self.rigs)} rig(s)")
+
+    def stop(self, timeout: float = 5.0):
+        """Finalize open sessions, cancel all rigs and stop the loop"""
+        if not self.thread:
+            return
+        try:
+            self._run(self._shutdown(), timeout)
+        except Exception as e:
+            print(f"⚠️ Rig manager shutdown: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        self.loop.close()
+        self.thread = None
+        self.loop = None
+
+    def add_rig(self, rig_id: str, kind: str = 'backend', **settings) -> str:
+        """Register a rig; ``kind`` is 'backend' (host, port) or 'serial' (serial_port, baud_rate)"""
+        if rig_id in self.rigs:
+            raise ValueError(f"Rig '{rig_id}' already exists")
+        if kind not in self.RIG_TYPES:
+            raise ValueError(f"Unknown rig type '{kind}'")
+        rig = self.RIG_TYPES[kind](rig_id, self, self.max_samples_per_rig, **settings)
+        self.rigs[rig_id] = rig
+        if self.loop:
+            self._call(self._start_rig, rig)
+        return rig_id
+
+    def remove_rig(self, rig_id: str):
+        rig = self.rigs.pop(rig_id)
+        if self.loop:
+            self._run(self._stop_rig(rig))
+
+    # ---- command routing (any thread) ----
+
+    def send_command(self, rig_id: str, command: str, timeout: float = 5.0) -> bool:
+        """Send a raw command to one rig and wait for it to be written"""
+        return self._run(self.rigs[rig_id].send_command(command), timeout)
+
+    def broadcast_command(self, command: str, timeout: float = 5.0) -> Dict[str, bool]:
+        """Send the same command to every rig concurrently"""
+        async def send_all():
+            results = await asyncio.gather(
+                *(rig.send_command(command) for rig in self.rigs.values()))
+            return dict(zip(self.rigs.keys(), results))
+        return self._run(send_all(), timeout)
+
+    def start_sampling(self, rig_id: str, sample_info: dict, timeout: float = 5.0) -> bool:
+        """Reset the rig's session, open its CSV stream and send START_SAMPLING"""
+        return self._run(self._start_session(self.rigs[rig_id], sample_info), timeout)
+
+    def stop_sampling(self, rig_id: str, timeout: float = 5.0):
+        rig = self.rigs[rig_id]
+
+        async def stop():
+            if rig.is_sampling:
+                self._finish_session(rig, success=False)
+        self._run(stop(), timeout)
+
+    # ---- inspection (any thread) ----
+
+    def health(self) -> Dict[str, dict]:
+        """Health snapshot of every rig"""
+        def snapshot():
+            return {rig_id: dict(rig.health.to_dict(), sampling=rig.is_sampling,
+                                 session_points=len(rig.store),
+                                 memory_bytes=rig.store.memory_bytes())
+                    for rig_id, rig in self.rigs.items()}
+        if not self.loop:
+            return snapshot()
+
+        async def run():
+            return snapshot()
+        return self._run(run())
+
+    def snapshot(self, rig_id: str) -> SessionStore:
+        """Copy of a rig's session store, taken on the loop thread"""
+        rig = self.rigs[rig_id]
+        if not self.loop:
+            return rig.store.copy()
+
+        async def run():
+            return rig.store.copy()
+        return self._run(run())
+
+    # ---- loop-thread internals ----
+
+    def _call(self, fn, *args):
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    def _run(self, coro, timeout: float = 5.0):
+        if not self.loop:
+            coro.close()
+            raise RuntimeError("Rig manager is not running")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def _start_rig(self, rig: Rig):
+        rig.task = self.loop.create_task(rig.run(), name=f"rig-{rig.rig_id}")
+
+    async def _stop_rig(self, rig: Rig):
+        if rig.is_sampling:
+            self._finish_session(rig, success=False)
+        if rig.task:
+            rig.stopping = True
+            rig.task.cancel()
+            try:
+                await rig.task
+            except asyncio.CancelledError:
+                pass
+            rig.task = None
+
+    async def _shutdown(self):
+        for rig in list(self.rigs.values()):
+            await self._stop_rig(rig)
+
+    async def _start_session(self, rig: Rig, sample_info: dict) -> bool:
+        if rig.is_sampling:
+            return False
+        rig.store.clear()
+        rig.store.metadata = dict(sample_info, rig=rig.rig_id)
+        if self.output_dir:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            name = sample_info.get('name', rig.rig_id).replace(' ', '_')
+            filename = os.path.join(self.output_dir, f"{rig.rig_id}_{name}_{timestamp}.csv")
+            rig.writer = SessionCSVWriter(filename, sample_info)
+        rig.clock.reset()
+        rig.run_active = False
+        rig.is_sampling = True
+        if await rig.send_command("START_SAMPLING"):
+            return True
+        # The rig never started; drop the half-open session and its file
+        rig.is_sampling = False
+        if rig.writer:
+            rig.writer.abort()
+            rig.writer = None
+        return False
+
+    def _finish_session(self, rig: Rig, success: bool):
+        rig.is_sampling = False
+        self.loop.create_task(rig.send_command("STOP_SAMPLING"))
+        filename = rig.writer.close() if rig.writer else None
+        rig.writer = None
+        if self.on_session_done:
+            self.on_session_done(rig.rig_id, filename, success)
+
+    def _emit_sample(self, rig: Rig, t: float, values: List[float], state: int, level: int):
+        if self.on_sample:
+            self.on_sample(rig.rig_id, t, values, state, level)
+
+    def _emit_status(self, rig: Rig):
+        if self.on_status:
+            self.on_status(rig.rig_id, rig.health.to_dict())
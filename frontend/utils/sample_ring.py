@@ -0,0 +1,177 @@
+"""Single-producer / multi-consumer sample ring in shared memory
+
+The acquisition thread writes fixed-size records into a NumPy view over a
+``multiprocessing.shared_memory`` block. Any number of consumers, in this
+process or in others that ``attach`` by name, keep their own read cursor
+and get zero-copy views of new records.
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Optional
+
+from config.constants import NUM_SENSORS
+
+SAMPLE_DTYPE = np.dtype([
+    ('time', '<f8'),                        # acquisition time, seconds
+    ('sensors', '<f4', (NUM_SENSORS,)),     # readings in SENSOR_NAMES order
+    ('state', 'i1'),                        # Arduino FSM state (STATE_NAMES)
+    ('level', 'i1'),                        # fan level 0-4
+], align=True)
+
+# Header: magic, capacity, record size, total records written
+_HEADER_DTYPE = np.dtype([('magic', '<u8'), ('capacity', '<i8'),
+                          ('itemsize', '<i8'), ('write_count', '<i8')])
+_HEADER_SIZE = 64
+_MAGIC = 0x454E4F5345524E47  # "ENOSERNG"
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Attach without letting this process's resource tracker unlink the block at exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+class SampleRing:
+    """Ring buffer of SAMPLE_DTYPE records in shared memory
+
+    Only one thread may write. ``write_count`` only ever increases; record
+    ``k`` lives in slot ``k % capacity``.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self._header = np.ndarray((), dtype=_HEADER_DTYPE, buffer=shm.buf)
+        if int(self._header['magic']) != _MAGIC:
+            raise ValueError(f"Shared memory '{shm.name}' is not a sample ring")
+        if int(self._header['itemsize']) != SAMPLE_DTYPE.itemsize:
+            raise ValueError("Sample ring record layout mismatch")
+        self.capacity = int(self._header['capacity'])
+        self.records = np.ndarray((self.capacity,), dtype=SAMPLE_DTYPE,
+                                  buffer=shm.buf, offset=_HEADER_SIZE)
+
+    @classmethod
+    def create(cls, capacity: int = 16384, name: Optional[str] = None) -> 'SampleRing':
+        """Allocate a new ring (the creator is responsible for ``unlink``)"""
+        size = _HEADER_SIZE + capacity * SAMPLE_DTYPE.itemsize
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((), dtype=_HEADER_DTYPE, buffer=shm.buf)
+        header['magic'] = _MAGIC
+        header['capacity'] = capacity
+        header['itemsize'] = SAMPLE_DTYPE.itemsize
+        header['write_count'] = 0
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'SampleRing':
+        """Open an existing ring created by another thread or process"""
+        return cls(attach_shared_memory(name), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def write_count(self) -> int:
+        return int(self._header['write_count'])
+
+    def push(self, t: float, sensor_values, state: int = 0, level: int = 0):
+        """Write one record (producer only)"""
+        count = int(self._header['write_count'])
+        record = self.records[count % self.capacity]
+        record['time'] = t
+        record['sensors'] = sensor_values[:NUM_SENSORS]
+        record['state'] = state
+        record['level'] = level
+        # Publish after the record is complete
+        self._header['write_count'] = count + 1
+
+    def push_block(self, block: np.ndarray):
+        """Write a block of SAMPLE_DTYPE records (producer only)"""
+        n = len(block)
+        if n > self.capacity:
+            block = block[-self.capacity:]
+            skipped = n - self.capacity
+            n = self.capacity
+        else:
+            skipped = 0
+        count = int(self._header['write_count']) + skipped
+        start = count % self.capacity
+        first = min(n, self.capacity - start)
+        self.records[start:start + first] = block[:first]
+        if first < n:
+            self.records[:n - first] = block[first:]
+        self._header['write_count'] = count + n
+
+    def cursor(self, from_start: bool = False) -> 'RingCursor':
+        """New independent read cursor, at the oldest retained record or at the head"""
+        return RingCursor(self, from_start)
+
+    def close(self):
+        """Release this process's mapping (views from ``read`` become invalid)"""
+        self.records = None
+        self._header = None
+        self.shm.close()
+
+    def unlink(self):
+        """Destroy the shared block (creator only, after all consumers closed)"""
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingCursor:
+    """One consumer's position in a SampleRing"""
+
+    def __init__(self, ring: SampleRing, from_start: bool = False):
+        self.ring = ring
+        head = ring.write_count
+        self.position = max(0, head - ring.capacity) if from_start else head
+        self.dropped = 0  # records overwritten before this cursor read them
+        self._last_start = self.position
+
+    def available(self) -> int:
+        return self.ring.write_count - self.position
+
+    def read(self, max_records: Optional[int] = None) -> np.ndarray:
+        """Zero-copy view of the next contiguous run of unread records
+
+        A view stays valid until the producer laps it; check ``still_valid``
+        after using it (or copy) when consumers can fall behind.
+        """
+        head = self.ring.write_count
+        lag = head - self.position
+        if lag > self.ring.capacity:
+            self.dropped += lag - self.ring.capacity
+            self.position = head - self.ring.capacity
+            lag = self.ring.capacity
+        if lag <= 0:
+            return self.ring.records[:0]
+
+        start = self.position % self.ring.capacity
+        n = min(lag, self.ring.capacity - start)
+        if max_records is not None:
+            n = min(n, max_records)
+        self.position += n
+        self._last_start = self.position - n
+        return self.ring.records[start:start + n]
+
+    def read_all(self) -> np.ndarray:
+        """All unread records as one array (copies only if the range wraps)"""
+        first = self.read()
+        if not self.available():
+            return first
+        return np.concatenate([first, self.read()])
+
+    def still_valid(self) -> bool:
+        """True if the records returned by the last ``read`` have not been overwritten"""
+        return self.ring.write_count - self._last_start <= self.ring.capacity
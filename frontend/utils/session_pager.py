@@ -0,0 +1,247 @@
+"""Paged, out-of-core access to recorded sessions for the history viewer
+
+Sessions on disk (CSV or ``.aroma`` archives) are split into chunks that
+are decoded on demand and kept in a byte-bounded LRU cache. Several
+sessions can be laid end to end on one timeline. ``window`` returns only
+the visible time range, min/max-decimated to the requested point count,
+so browsing hours of data never needs the whole timeline in memory.
+"""
+
+import os
+import numpy as np
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+from utils.file_handler import ArchiveReader, ARCHIVE_EXTENSION
+from utils.csv_index import CSVSeekIndex
+
+Block = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+class ArchiveSource:
+    """Chunks of an ``.aroma`` archive (already independently decodable)"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.reader = ArchiveReader(filename)
+        self.metadata = self.reader.metadata
+        self.num_sensors = self.reader.num_sensors
+        self.num_points = self.reader.num_points
+        self.t_start = np.array([c['t_start'] for c in self.reader.chunks], dtype=np.float64)
+        self.t_end = np.array([c['t_end'] for c in self.reader.chunks], dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.t_start)
+
+    def read_chunk(self, i: int) -> Block:
+        return self.reader.read_chunk(i)
+
+
+class CSVSource:
+    """Row-range chunks of a session CSV
+
+    Chunk boundaries come from the file's seek index (``.seek.npz``,
+    built in one pass the first time and reused afterwards); each chunk is
+    read with a seek and parsed in one ``np.loadtxt`` call. States come
+    from the ``.phases.json`` sidecar when there is one, else zeros.
+    """
+
+    def __init__(self, filename: str, rows_per_chunk: int = 2048):
+        self.filename = filename
+        self.index = CSVSeekIndex.open(filename)
+        step = max(1, rows_per_chunk // self.index.every)
+        self.rows_per_chunk = step * self.index.every
+        self.metadata = {'name': self.index.header.get("Sample Name", os.path.basename(filename)),
+                         'type': self.index.header.get("Herbal Type", "Unknown")}
+        self.num_sensors = self.index.num_sensors
+        self.num_points = self.index.num_rows
+        self.t_start = self.index.times[::step].copy()
+        self.t_end = np.append(self.t_start[1:], self.index.last_time if self.num_points else 0.0)
+
+    def __len__(self) -> int:
+        return len(self.t_start)
+
+    def read_chunk(self, i: int) -> Block:
+        start = i * self.rows_per_chunk
+        return self.index.read_rows(start, start + self.rows_per_chunk)
+
+
+def open_source(filename: str):
+    if filename.endswith(ARCHIVE_EXTENSION):
+        return ArchiveSource(filename)
+    return CSVSource(filename)
+
+
+class SessionPager:
+    """One timeline over one or more sessions, paged through an LRU chunk cache
+
+    Sessions follow each other with ``gap`` seconds in between. The cache
+    holds decoded chunks up to ``cache_bytes``; a tiny min/max overview of
+    every chunk ever decoded is kept separately so zoomed-out views that
+    span more chunks than the cache can hold stay cheap after the first pass.
+    """
+
+    OVERVIEW_BUCKETS = 16
+
+    def __init__(self, filenames: Sequence[str], cache_bytes: int = 64 * 1024 * 1024,
+                 gap: float = 1.0):
+        self.sources = [open_source(f) for f in filenames]
+        if not self.sources:
+            raise ValueError("No sessions to open")
+        self.num_sensors = max(s.num_sensors for s in self.sources)
+        self.cache_bytes = cache_bytes
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._overview = {}
+        self.hits = 0
+        self.misses = 0
+
+        # Global chunk table: (source, chunk, start, end) on the joined timeline
+        entries, offset = [], 0.0
+        self.sessions = []
+        for k, source in enumerate(self.sources):
+            if not len(source):
+                continue
+            base = offset - source.t_start[0]
+            for i in range(len(source)):
+                entries.append((k, i, source.t_start[i] + base, source.t_end[i] + base, base))
+            self.sessions.append({
+                'label': source.metadata.get('name', os.path.basename(source.filename)),
+                'filename': source.filename,
+                'start': offset,
+                'end': source.t_end[-1] + base,
+                'offset': base,
+            })
+            offset = source.t_end[-1] + base + gap
+        self._chunks = [(e[0], e[1]) for e in entries]
+        self._starts = np.array([e[2] for e in entries], dtype=np.float64)
+        self._ends = np.array([e[3] for e in entries], dtype=np.float64)
+        self._offsets = np.array([e[4] for e in entries], dtype=np.float64)
+
+    @property
+    def num_points(self) -> int:
+        return sum(s.num_points for s in self.sources)
+
+    def time_range(self) -> Tuple[float, float]:
+        if not len(self._starts):
+            return 0.0, 0.0
+        return float(self._starts[0]), float(self._ends[-1])
+
+    def cache_info(self) -> dict:
+        return {'chunks': len(self._cache), 'bytes': self._cached_bytes,
+                'limit': self.cache_bytes, 'hits': self.hits, 'misses': self.misses}
+
+    def _chunk(self, g: int) -> Block:
+        """Decoded chunk ``g`` of the global table, times shifted onto the timeline"""
+        block = self._cache.get(g)
+        if block is not None:
+            self.hits += 1
+            self._cache.move_to_end(g)
+            return block
+
+        self.misses += 1
+        k, i = self._chunks[g]
+        times, values, states, levels = self.sources[k].read_chunk(i)
+        if values.shape[1] < self.num_sensors:
+            values = np.pad(values, ((0, 0), (0, self.num_sensors - values.shape[1])),
+                            constant_values=np.nan)
+        block = (times + self._offsets[g], values, states, levels)
+        if g not in self._overview:
+            self._overview[g] = self._decimate(block[0], block[1], self.OVERVIEW_BUCKETS)
+
+        size = sum(a.nbytes for a in block)
+        self._cache[g] = block
+        self._cached_bytes += size
+        while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+            _, old = self._cache.popitem(last=False)
+            self._cached_bytes -= sum(a.nbytes for a in old)
+        return block
+
+    def chunks_in(self, t0: float, t1: float) -> np.ndarray:
+        """Global indices of the chunks overlapping [t0, t1]"""
+        first = max(0, int(np.searchsorted(self._ends, t0, side='left')))
+        last = int(np.searchsorted(self._starts, t1, side='right'))
+        return np.arange(first, max(first, last))
+
+    @staticmethod
+    def _decimate(times: np.ndarray, values: np.ndarray,
+                  buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Min/max per bucket (two points each) so peaks survive downsampling"""
+        n = len(times)
+        if n <= 2 * buckets:
+            return times, values
+        edges = (np.arange(buckets) * n) // buckets
+        lo = np.minimum.reduceat(values, edges, axis=0)
+        hi = np.maximum.reduceat(values, edges, axis=0)
+        mid = np.append(edges[1:], n) - 1
+        out_t = np.column_stack([times[edges], times[mid]]).ravel()
+        out_v = np.stack([lo, hi], axis=1).reshape(-1, values.shape[1])
+        return out_t, out_v
+
+    def window(self, t0: float, t1: float, max_points: int = 2000
+               ) -> Tuple[np.ndarray, np.ndarray]:
+        """Samples in [t0, t1], at most ~``max_points`` per channel
+
+        Sessions are separated by a NaN row so plot lines break between them.
+        """
+        chunks = self.chunks_in(t0, t1)
+        if not len(chunks):
+            return np.empty(0), np.empty((0, self.num_sensors))
+
+        # Far zoomed out: use per-chunk overviews instead of decoding everything
+        rows = sum(self._chunk_rows(g) for g in chunks)
+        budget_chunks = max(1, self.cache_bytes // max(1, self._chunk_bytes_estimate()))
+        if len(chunks) > budget_chunks and rows > 4 * max_points:
+            parts = []
+            for g in chunks:
+                if g not in self._overview:
+                    self._chunk(g)
+                parts.append((g, *self._overview[g]))
+        else:
+            parts = [(g, *self._chunk(g)[:2]) for g in chunks]
+
+        times_list, values_list, previous = [], [], None
+        for g, times, values in parts:
+            source = self._chunks[g][0]
+            if previous is not None and source != previous:
+                times_list.append(np.array([np.nan]))
+                values_list.append(np.full((1, self.num_sensors), np.nan))
+            previous = source
+            mask = (times >= t0) & (times <= t1)
+            times_list.append(times[mask])
+            values_list.append(values[mask])
+        times = np.concatenate(times_list)
+        values = np.concatenate(values_list)
+
+        if len(times) > max_points:
+            breaks = np.flatnonzero(np.isnan(times))
+            if len(breaks):
+                # Decimate each session on its own, keep the separators
+                pieces_t, pieces_v, start = [], [], 0
+                for b in list(breaks) + [len(times)]:
+                    share = max(1, (max_points * (b - start)) // (2 * len(times)))
+                    seg_t, seg_v = self._decimate(times[start:b], values[start:b], share)
+                    pieces_t += [seg_t, times[b:b + 1]]
+                    pieces_v += [seg_v, values[b:b + 1]]
+                    start = b + 1
+                times, values = np.concatenate(pieces_t), np.concatenate(pieces_v)
+            else:
+                times, values = self._decimate(times, values, max_points // 2)
+        return times, values
+
+    def _chunk_rows(self, g: int) -> int:
+        k, i = self._chunks[g]
+        source = self.sources[k]
+        if isinstance(source, CSVSource):
+            return source.rows_per_chunk
+        return source.reader.chunks[i]['rows']
+
+    def _chunk_bytes_estimate(self) -> int:
+        rows = max((self._chunk_rows(g) for g in range(min(len(self._chunks), 4))), default=1)
+        return rows * (8 + 8 * self.num_sensors + 2)
+
+    def session_at(self, t: float) -> Optional[dict]:
+        for session in self.sessions:
+            if session['start'] <= t <= session['end']:
+                return session
+        return None
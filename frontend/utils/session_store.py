@@ -0,0 +1,395 @@
+"""Columnar storage for sampling sessions
+
+``SessionStore`` keeps everything in RAM. ``SpillingSessionStore`` keeps
+only the newest rows in RAM and moves older chunks, compressed, to a
+temporary file, so a run of any length uses a bounded amount of memory.
+Both read ranges with ``select`` and stream with ``iter_blocks``.
+"""
+
+import tempfile
+import threading
+import zlib
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config.constants import (
+    NUM_SENSORS, SESSION_RAM_BUDGET, SESSION_SPILL_CHUNK, SESSION_SPILL_DIR
+)
+
+Block = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+COLUMNS = ('_times', '_values', '_states', '_levels')
+
+
+class SessionStore:
+    """Growable column arrays for time, the sensor channels, FSM state and level
+
+    Appends are amortized O(1). With ``max_samples`` set the store keeps a
+    rolling window of the most recent samples so memory per session stays
+    bounded.
+    """
+
+    def __init__(self, num_sensors: int = NUM_SENSORS, capacity: int = 1024,
+                 max_samples: Optional[int] = None, metadata: Optional[Dict] = None):
+        self.num_sensors = num_sensors
+        self.max_samples = max_samples
+        self.metadata = dict(metadata or {})
+        self.dropped = 0  # samples discarded by the rolling window
+        self._allocate(max(16, min(capacity, max_samples or capacity)))
+
+    def _allocate(self, capacity: int):
+        self._times = np.empty(capacity, dtype=np.float64)
+        self._values = np.empty((capacity, self.num_sensors), dtype=np.float64)
+        self._states = np.empty(capacity, dtype=np.int8)
+        self._levels = np.empty(capacity, dtype=np.int8)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._times)
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._times[:self._size]
+
+    @property
+    def values(self) -> np.ndarray:
+        """(n, num_sensors) view"""
+        return self._values[:self._size]
+
+    @property
+    def states(self) -> np.ndarray:
+        return self._states[:self._size]
+
+    @property
+    def levels(self) -> np.ndarray:
+        return self._levels[:self._size]
+
+    def column(self, sensor_id: int) -> np.ndarray:
+        return self._values[:self._size, sensor_id]
+
+    def select(self, start: int = 0, stop: Optional[int] = None) -> Block:
+        """(times, values, states, levels) for rows ``start:stop``"""
+        stop = self._size if stop is None else min(stop, self._size)
+        return (self._times[start:stop], self._values[start:stop],
+                self._states[start:stop], self._levels[start:stop])
+
+    def iter_blocks(self) -> Iterator[Block]:
+        """Stream the session as (times, values, states, levels) blocks"""
+        if self._size:
+            yield self.select()
+
+    def _reserve(self, extra: int):
+        """Make room for ``extra`` more rows, growing or sliding the window"""
+        needed = self._size + extra
+        if needed <= self.capacity:
+            return
+
+        limit = self.max_samples
+        if limit is None or self.capacity < limit:
+            new_capacity = max(needed, self.capacity * 2)
+            if limit is not None:
+                new_capacity = min(new_capacity, limit)
+            for name in COLUMNS:
+                old = getattr(self, name)
+                new = np.empty((new_capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:self._size] = old[:self._size]
+                setattr(self, name, new)
+            if needed <= new_capacity:
+                return
+
+        # Rolling window: keep the newest rows, drop the oldest (at least half
+        # of the buffer so the shift cost is amortized over many appends)
+        keep = max(0, min(self._size, self.capacity - extra, self.capacity // 2))
+        drop = self._size - keep
+        for name in COLUMNS:
+            arr = getattr(self, name)
+            arr[:keep] = arr[drop:self._size]
+        self._size = keep
+        self.dropped += drop
+
+    def append(self, t: float, sensor_values: List[float], state: int = 0, level: int = 0):
+        """Append one sample"""
+        self._reserve(1)
+        i = self._size
+        self._times[i] = t
+        self._values[i, :] = sensor_values[:self.num_sensors]
+        self._states[i] = state
+        self._levels[i] = level
+        self._size += 1
+
+    def append_block(self, times, sensor_values, states=None, levels=None):
+        """Append a block of samples; ``sensor_values`` is (n, num_sensors)"""
+        times = np.asarray(times, dtype=np.float64)
+        n = len(times)
+        if n == 0:
+            return
+        if self.max_samples is not None and n > self.max_samples:
+            skip = n - self.max_samples
+            self.dropped += skip + self._size
+            self._size = 0
+            times = times[skip:]
+            sensor_values = np.asarray(sensor_values)[skip:]
+            states = None if states is None else np.asarray(states)[skip:]
+            levels = None if levels is None else np.asarray(levels)[skip:]
+            n = len(times)
+
+        self._reserve(n)
+        i, j = self._size, self._size + n
+        self._times[i:j] = times
+        self._values[i:j] = sensor_values
+        self._states[i:j] = 0 if states is None else states
+        self._levels[i:j] = 0 if levels is None else levels
+        self._size = j
+
+    def clear(self):
+        """Drop all samples, keep metadata and allocated capacity"""
+        self._size = 0
+        self.dropped = 0
+
+    def copy(self) -> 'SessionStore':
+        """Independent compact copy (e.g. to hand to another thread)"""
+        other = SessionStore(self.num_sensors, capacity=max(16, self._size),
+                             metadata=self.metadata)
+        other.append_block(self.times, self.values, self.states, self.levels)
+        other.dropped = self.dropped
+        return other
+
+    @property
+    def duration(self) -> float:
+        return float(self._times[self._size - 1] - self._times[0]) if self._size else 0.0
+
+    def memory_bytes(self) -> int:
+        return (self._times.nbytes + self._values.nbytes
+                + self._states.nbytes + self._levels.nbytes)
+
+
+class SpillingSessionStore(SessionStore):
+    """SessionStore with a RAM budget; older rows spill to a temporary file
+
+    The newest rows stay in the in-memory columns ("hot"). Once they would
+    exceed ``ram_budget`` bytes, the oldest whole chunks of ``chunk_rows``
+    rows are compressed with zlib and appended to an anonymous temporary
+    file. Reads that reach into spilled rows decompress just the chunks
+    they need (the last few are cached). The ``times``/``values``/...
+    properties still return the whole session, as a copy; prefer
+    ``select`` and ``iter_blocks`` on long runs.
+    """
+
+    def __init__(self, num_sensors: int = NUM_SENSORS, ram_budget: int = SESSION_RAM_BUDGET,
+                 chunk_rows: int = SESSION_SPILL_CHUNK, spill_dir: Optional[str] = SESSION_SPILL_DIR,
+                 metadata: Optional[Dict] = None, cached_chunks: int = 4):
+        row_bytes = 8 + 8 * num_sensors + 2
+        self.chunk_rows = chunk_rows
+        # Hot rows: at least two chunks so one can spill while the next fills
+        self.hot_rows = max(2 * chunk_rows, ram_budget // row_bytes)
+        self.spill_dir = spill_dir
+        self._file = None
+        self._chunks = []      # (offset, nbytes, rows) per spilled chunk
+        self._spilled = 0      # rows in the file
+        self._first_time = None
+        self._cache = OrderedDict()
+        self._cached_chunks = cached_chunks
+        # Spill file position and chunk cache, shared with reader threads (exports)
+        self._io_lock = threading.Lock()
+        self._shared_file = False  # a snapshot reads its session's spill file
+        super().__init__(num_sensors, capacity=min(1024, self.hot_rows), metadata=metadata)
+
+    def __len__(self) -> int:
+        return self._spilled + self._size
+
+    @property
+    def spilled_rows(self) -> int:
+        return self._spilled
+
+    @property
+    def spilled_bytes(self) -> int:
+        return sum(nbytes for _, nbytes, _ in self._chunks)
+
+    # Whole-session columns (copies when anything has spilled)
+    @property
+    def times(self) -> np.ndarray:
+        return self._gather(0)
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._gather(1)
+
+    @property
+    def states(self) -> np.ndarray:
+        return self._gather(2)
+
+    @property
+    def levels(self) -> np.ndarray:
+        return self._gather(3)
+
+    def column(self, sensor_id: int) -> np.ndarray:
+        return self.values[:, sensor_id]
+
+    def _gather(self, field: int) -> np.ndarray:
+        hot = super().select()[field]
+        if not self._spilled:
+            return hot
+        return np.concatenate([self._load_chunk(i)[field] for i in range(len(self._chunks))]
+                              + [hot])
+
+    def select(self, start: int = 0, stop: Optional[int] = None) -> Block:
+        total = len(self)
+        stop = total if stop is None else min(stop, total)
+        start = min(max(start, 0), stop)
+        if start >= self._spilled:
+            return super().select(start - self._spilled, stop - self._spilled)
+        parts = []
+        first = start // self.chunk_rows
+        last = min((stop - 1) // self.chunk_rows, len(self._chunks) - 1)
+        for i in range(first, last + 1):
+            base = i * self.chunk_rows
+            block = self._load_chunk(i)
+            parts.append(tuple(a[max(start - base, 0):stop - base] for a in block))
+        if stop > self._spilled:
+            parts.append(super().select(0, stop - self._spilled))
+        return tuple(np.concatenate([p[f] for p in parts]) for f in range(4))
+
+    def iter_blocks(self) -> Iterator[Block]:
+        for i in range(len(self._chunks)):
+            yield self._load_chunk(i)
+        if self._size:
+            yield super().select()
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        if needed > self.hot_rows and self._size >= self.chunk_rows:
+            # Spill enough whole chunks to free half the hot buffer
+            target = max(needed - self.hot_rows, self.hot_rows // 2)
+            chunks = min(-(-target // self.chunk_rows), self._size // self.chunk_rows)
+            rows = chunks * self.chunk_rows
+            for k in range(chunks):
+                self._spill(k * self.chunk_rows)
+            for name in COLUMNS:
+                arr = getattr(self, name)
+                arr[:self._size - rows] = arr[rows:self._size]
+            self._size -= rows
+        # Grow up to hot_rows; beyond that only a block larger than the
+        # budget can force a bigger buffer, which the next spill trims
+        if self._size + extra > self.capacity:
+            new_capacity = min(max(self._size + extra, self.capacity * 2),
+                               max(self.hot_rows, self._size + extra))
+            for name in COLUMNS:
+                old = getattr(self, name)
+                new = np.empty((new_capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:self._size] = old[:self._size]
+                setattr(self, name, new)
+
+    def append_block(self, times, sensor_values, states=None, levels=None):
+        times = np.asarray(times, dtype=np.float64)
+        sensor_values = np.asarray(sensor_values)
+        # Feed very large blocks a chunk at a time so RAM stays near the budget
+        for i in range(0, len(times), self.hot_rows):
+            super().append_block(
+                times[i:i + self.hot_rows], sensor_values[i:i + self.hot_rows],
+                None if states is None else np.asarray(states)[i:i + self.hot_rows],
+                None if levels is None else np.asarray(levels)[i:i + self.hot_rows])
+
+    def _spill(self, row: int):
+        """Compress hot rows ``row:row+chunk_rows`` and append them to the file"""
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix="aromasense-", suffix=".spill",
+                                                dir=self.spill_dir)
+        end = row + self.chunk_rows
+        if self._first_time is None:
+            self._first_time = float(self._times[row])
+        payload = b"".join(np.ascontiguousarray(getattr(self, name)[row:end]).tobytes()
+                           for name in COLUMNS)
+        payload = zlib.compress(payload, 1)
+        with self._io_lock:
+            self._file.seek(0, 2)
+            offset = self._file.tell()
+            self._file.write(payload)
+        self._chunks.append((offset, len(payload), self.chunk_rows))
+        self._spilled += self.chunk_rows
+
+    def _load_chunk(self, i: int) -> Block:
+        i %= len(self._chunks)
+        with self._io_lock:
+            block = self._cache.get(i)
+            if block is not None:
+                self._cache.move_to_end(i)
+                return block
+            offset, nbytes, rows = self._chunks[i]
+            self._file.seek(offset)
+            payload = self._file.read(nbytes)
+        raw = zlib.decompress(payload)
+        n = self.num_sensors
+        times = np.frombuffer(raw, np.float64, rows, 0)
+        values = np.frombuffer(raw, np.float64, rows * n, rows * 8).reshape(rows, n)
+        states = np.frombuffer(raw, np.int8, rows, rows * 8 * (n + 1))
+        levels = np.frombuffer(raw, np.int8, rows, rows * (8 * (n + 1) + 1))
+        block = (times, values, states, levels)
+        with self._io_lock:
+            self._cache[i] = block
+            if len(self._cache) > self._cached_chunks:
+                self._cache.popitem(last=False)
+        return block
+
+    def clear(self):
+        super().clear()
+        self.close()
+
+    def close(self):
+        """Drop the spilled rows and delete the temporary file"""
+        if self._file is not None and not self._shared_file:
+            self._file.close()
+        self._file = None
+        self._shared_file = False
+        self._chunks = []
+        self._spilled = 0
+        self._first_time = None
+        self._cache.clear()
+
+    def snapshot(self) -> 'SpillingSessionStore':
+        """The rows present now, without decompressing the spilled ones
+
+        Spilled chunks never change, so the snapshot reads them from this
+        store's spill file and copies only the hot rows. This store must
+        not be cleared or closed while the snapshot is in use.
+        """
+        other = SpillingSessionStore(self.num_sensors, chunk_rows=self.chunk_rows,
+                                     spill_dir=self.spill_dir, metadata=self.metadata,
+                                     cached_chunks=self._cached_chunks)
+        other.hot_rows = self.hot_rows
+        other._allocate(max(16, self._size))
+        for name in COLUMNS:
+            getattr(other, name)[:self._size] = getattr(self, name)[:self._size]
+        other._size = self._size
+        other.dropped = self.dropped
+        other._file = self._file
+        other._chunks = list(self._chunks)
+        other._spilled = self._spilled
+        other._first_time = self._first_time
+        other._io_lock = self._io_lock
+        other._shared_file = self._file is not None
+        return other
+
+    def copy(self) -> SessionStore:
+        """Compact in-memory copy of the whole session"""
+        other = SessionStore(self.num_sensors, capacity=max(16, len(self)),
+                             metadata=self.metadata)
+        for block in self.iter_blocks():
+            other.append_block(*block)
+        return other
+
+    @property
+    def duration(self) -> float:
+        if not self._spilled:
+            return super().duration
+        last = self._times[self._size - 1] if self._size else self._load_chunk(-1)[0][-1]
+        return float(last - self._first_time)
+
+    def memory_bytes(self) -> int:
+        """Hot columns plus the decompressed-chunk cache"""
+        row_bytes = 8 + 8 * self.num_sensors + 2
+        cached = sum(len(block[0]) * row_bytes for block in self._cache.values())
+        return super().memory_bytes() + cached
@@ -0,0 +1,369 @@
+"""Session-to-session similarity search over a catalog of recorded runs
+
+Every session is reduced once to a signature: a response feature vector
+(per-level HOLD features plus whole-run statistics) and time-aligned,
+baseline-subtracted curves per fan level (plus one whole-run curve, so
+CSV captures without FSM states are still comparable). Signatures and
+the LB_Keogh envelopes of the curves are cached in one ``.npz`` next to
+the sessions and only recomputed for new or changed files.
+
+A top-k query ranks the whole catalog by NaN-aware feature distance,
+then refines the closest candidates with banded DTW on the curves,
+visiting them in LB_Keogh order and skipping any whose lower bound
+cannot beat the current k-th best. DTW runs vectorized over candidates
+and levels. Catalog-to-catalog DTW results are cached pairwise.
+"""
+
+import os
+import numpy as np
+from typing import Dict, List, Optional, Union
+
+from config.constants import (
+    SIMILARITY_CURVE_POINTS, SIMILARITY_BAND, SIMILARITY_TOP_K,
+    SIMILARITY_CANDIDATES, SIMILARITY_CACHE, STATE_HOLD, NUM_LEVELS
+)
+from utils.data_processor import RunningAnalysis
+from utils.dataset import session_label
+from utils.file_handler import FileHandler, find_sessions
+from utils.resampler import StreamingResampler
+from utils.session_store import SessionStore
+
+# Bumped when signatures change meaning; caches of another version are rebuilt
+SIGNATURE_VERSION = 2
+
+
+def envelope(curves: np.ndarray, band: int = SIMILARITY_BAND):
+    """Running max/min over +-``band`` rows along axis -2 (LB_Keogh envelope)"""
+    upper, lower = curves.copy(), curves.copy()
+    n = curves.shape[-2]
+    for shift in range(1, band + 1):
+        if shift >= n:
+            break
+        for a, b in ((slice(shift, None), slice(None, -shift)), (slice(None, -shift), slice(shift, None))):
+            np.maximum(upper[..., a, :], curves[..., b, :], out=upper[..., a, :])
+            np.minimum(lower[..., a, :], curves[..., b, :], out=lower[..., a, :])
+    return upper, lower
+
+
+def signature(store: SessionStore, points: int = SIMILARITY_CURVE_POINTS) -> dict:
+    """Feature vector and time-aligned curves of one session
+
+    ``curves`` is (NUM_LEVELS + 1, points, channels): per-level HOLD curves
+    (NaN for levels never reached) followed by the whole-run curve, each
+    resampled at ``points`` evenly spaced times over its own span. The
+    store is read twice in blocks (running sums, then the resamplers), so
+    memory does not grow with the session.
+    """
+    channels = store.num_sensors
+    curves = np.full((NUM_LEVELS + 1, points, channels), np.nan)
+    analysis = RunningAnalysis(channels, spectral=False)
+    for block in store.iter_blocks():
+        analysis.push(*block)
+    if analysis.num_rows < 2:
+        return {'features': np.full(NUM_LEVELS * 3 * channels + 3 * channels, np.nan),
+                'curves': curves}
+
+    baseline = analysis.baseline()
+    starts = np.append(analysis.hold_start, analysis.first_time)
+    ends = np.append(analysis.hold_end, analysis.last_time)
+    counts = np.append(analysis.hold_count, analysis.num_rows)
+    # A slot whose samples all share one time has no span to resample over
+    resamplers = {slot: StreamingResampler((points - 1) / (ends[slot] - starts[slot]),
+                                           t_start=starts[slot])
+                  for slot in range(NUM_LEVELS + 1) if counts[slot] >= 2 and ends[slot] > starts[slot]}
+    parts = {slot: [] for slot in resamplers}
+    for times, values, states, levels in store.iter_blocks():
+        response = values - baseline
+        hold = states == STATE_HOLD
+        for slot, resampler in resamplers.items():
+            rows = hold & (levels == slot) if slot < NUM_LEVELS else slice(None)
+            parts[slot].append(resampler.push(times[rows], response[rows])[1])
+    for slot, blocks in parts.items():
+        curve = np.concatenate(blocks)[:points]
+        curves[slot, :len(curve)] = curve
+
+    stats = analysis.statistics()
+    whole = np.concatenate((stats['mean'] - baseline, stats['max'] - baseline, stats['std']))
+    return {'features': np.concatenate((analysis.features().ravel(), whole)), 'curves': curves}
+
+
+def feature_distances(query: np.ndarray, features: np.ndarray) -> np.ndarray:
+    """RMS z-scored distance over the dimensions both vectors have"""
+    stacked = np.vstack((features, query[None, :]))
+    # nanstd warns on all-NaN columns (levels nobody reached); leave those at 1
+    present = ~np.isnan(stacked).all(axis=0)
+    scale = np.ones(stacked.shape[1])
+    scale[present] = np.nanstd(stacked[:, present], axis=0)
+    scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+    diff = (features - query) / scale
+    valid = ~np.isnan(diff)
+    counts = valid.sum(axis=1)
+    total = np.where(valid, diff * diff, 0.0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counts > 0, np.sqrt(total / counts), np.inf)
+
+
+def _shared_levels(query_curves: np.ndarray, curves: np.ndarray) -> np.ndarray:
+    """(m, levels) mask of curve slots present in both query and candidate"""
+    return ~np.isnan(curves[:, :, 0, 0]) & ~np.isnan(query_curves[:, 0, 0])[None, :]
+
+
+def lb_keogh(query_curves: np.ndarray, upper: np.ndarray, lower: np.ndarray) -> np.ndarray:
+    """Lower bound of ``dtw_distances`` for m candidates with cached envelopes"""
+    shared = _shared_levels(query_curves, upper)
+    q = query_curves[None]
+    above = np.where(q > upper, q - upper, 0.0)
+    below = np.where(q < lower, lower - q, 0.0)
+    per_level = np.nan_to_num(above * above + below * below).sum(axis=(2, 3))
+    return _combine(per_level, shared, query_curves.shape[1])
+
+
+def dtw_distances(query_curves: np.ndarray, curves: np.ndarray,
+                  band: int = SIMILARITY_BAND) -> np.ndarray:
+    """Banded multivariate DTW between the query and m candidates
+
+    Cost is the squared Euclidean distance across channels; rows are
+    swept one at a time, vectorized over candidates and levels.
+    """
+    m, slots, n, _ = curves.shape
+    shared = _shared_levels(query_curves, curves)
+    q = np.nan_to_num(query_curves)[None, :, :, None, :]         # (1, slots, n, 1, ch)
+    c = np.nan_to_num(curves)[:, :, None, :, :]                   # (m, slots, 1, n, ch)
+    cost = ((q - c) ** 2).sum(axis=-1)                            # (m, slots, n, n)
+    acc = np.full((m, slots, n + 1, n + 1), np.inf)
+    acc[:, :, 0, 0] = 0.0
+    for i in range(1, n + 1):
+        lo, hi = max(1, i - band), min(n, i + band)
+        # Diagonal and vertical moves come from the previous row in one shot
+        acc[:, :, i, lo:hi + 1] = cost[:, :, i - 1, lo - 1:hi] + np.minimum(
+            acc[:, :, i - 1, lo - 1:hi], acc[:, :, i - 1, lo:hi + 1])
+        # Horizontal moves chain along the row
+        for j in range(lo + 1, hi + 1):
+            np.minimum(acc[:, :, i, j], acc[:, :, i, j - 1] + cost[:, :, i - 1, j - 1],
+                       out=acc[:, :, i, j])
+    return _combine(acc[:, :, n, n], shared, n)
+
+
+def _combine(per_level: np.ndarray, shared: np.ndarray, points: int) -> np.ndarray:
+    """Mean over shared levels of the per-point RMS distance; inf if none shared"""
+    counts = shared.sum(axis=1)
+    total = np.where(shared, per_level, 0.0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counts > 0, np.sqrt(total / (counts * points)), np.inf)
+
+
+class SimilarityIndex:
+    """Cached signatures of every session in a directory
+
+    ``refresh`` loads only files that are new or changed since the cache
+    was written; ``query`` answers top-k searches from memory. Channel
+    scales (median whole-run std) are fixed when the cache is first built
+    so cached pairwise distances stay valid; ``rebuild`` recomputes them.
+    """
+
+    def __init__(self, directory: str, cache_file: Optional[str] = None,
+                 points: int = SIMILARITY_CURVE_POINTS, band: int = SIMILARITY_BAND):
+        self.directory = directory
+        self.cache_file = cache_file or os.path.join(directory, SIMILARITY_CACHE)
+        self.points = points
+        self.band = band
+        self.files: List[str] = []
+        self.mtimes = np.empty(0)
+        self.labels: List[str] = []
+        self.features = np.empty((0, 0))
+        self.curves = np.empty((0, NUM_LEVELS + 1, points, 0))
+        self.upper = self.curves
+        self.lower = self.curves
+        self.scale: Optional[np.ndarray] = None
+        self.pairs: Dict[str, float] = {}
+        self.dirty = False
+        self._load_cache()
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with np.load(self.cache_file, allow_pickle=False) as cache:
+                if int(cache['points']) != self.points or int(cache['band']) != self.band:
+                    return
+                if 'version' not in cache.files or int(cache['version']) != SIGNATURE_VERSION:
+                    return
+                self.files = [str(f) for f in cache['files']]
+                self.mtimes = cache['mtimes']
+                self.labels = [str(label) for label in cache['labels']]
+                self.features = cache['features']
+                self.curves = cache['curves']
+                self.upper = cache['upper']
+                self.lower = cache['lower']
+                self.scale = cache['scale'] if cache['scale'].size else None
+                self.pairs = dict(zip((str(k) for k in cache['pair_keys']),
+                                      cache['pair_values'].tolist()))
+        except Exception as e:
+            print(f"⚠️ Ignoring similarity cache {self.cache_file}: {e}")
+
+    def save(self) -> Optional[str]:
+        if not self.dirty:
+            return self.cache_file
+        try:
+            # Write next to the target and swap, so a reader never sees half a cache
+            partial = self.cache_file + ".tmp.npz"
+            np.savez(partial, version=SIGNATURE_VERSION, points=self.points, band=self.band,
+                     files=np.array(self.files, dtype=str), mtimes=self.mtimes,
+                     labels=np.array(self.labels, dtype=str), features=self.features,
+                     curves=self.curves, upper=self.upper, lower=self.lower,
+                     scale=np.empty(0) if self.scale is None else self.scale,
+                     pair_keys=np.array(list(self.pairs), dtype=str),
+                     pair_values=np.array(list(self.pairs.values()), dtype=np.float64))
+            os.replace(partial, self.cache_file)
+            self.dirty = False
+            return self.cache_file
+        except Exception as e:
+            print(f"Error saving similarity cache: {str(e)}")
+            return None
+
+    def refresh(self, rebuild: bool = False) -> int:
+        """Sync with the directory; returns the number of sessions (re)loaded"""
+        # One file per run: Save Data writes a CSV and an archive of each
+        names = [os.path.basename(f) for f in find_sessions([self.directory])]
+        mtimes = {f: os.path.getmtime(os.path.join(self.directory, f)) for f in names}
+        cached = dict(zip(self.files, range(len(self.files))))
+        keep = [] if rebuild else [f for f in names
+                                   if f in cached and self.mtimes[cached[f]] == mtimes[f]]
+        rows = [cached[f] for f in keep]
+        new = [f for f in names if f not in set(keep)]
+
+        features, curves, labels, loaded = [], [], [], []
+        for name in new:
+            try:
+                store = FileHandler.load_session(os.path.join(self.directory, name))
+            except Exception as e:
+                print(f"⚠️ Skipping {name} for similarity: {e}")
+                continue
+            sig = signature(store, self.points)
+            features.append(sig['features'])
+            curves.append(sig['curves'])
+            labels.append(session_label(store.metadata, name))
+            loaded.append(name)
+
+        if not loaded and len(keep) == len(self.files):
+            return 0
+        self.dirty = True
+        self.files = keep + loaded
+        self.mtimes = np.array([mtimes[f] for f in self.files])
+        self.labels = [self.labels[r] for r in rows] + labels
+        self.features = self._stack([self.features[rows]] if rows else [], features, 0)
+        self.curves = self._stack([self.curves[rows]] if rows else [], curves, 1)
+        if loaded:
+            upper, lower = envelope(np.stack(curves), self.band)
+            self.upper = np.concatenate((self.upper[rows], upper)) if rows else upper
+            self.lower = np.concatenate((self.lower[rows], lower)) if rows else lower
+        else:
+            self.upper, self.lower = self.upper[rows], self.lower[rows]
+
+        if rebuild or self.scale is None:
+            self.scale = self._channel_scale()
+            self.pairs = {}
+        else:
+            valid = {self._key(f) for f in self.files}
+            self.pairs = {k: v for k, v in self.pairs.items()
+                          if all(part in valid for part in k.split('|'))}
+        return len(loaded)
+
+    @staticmethod
+    def _stack(kept: list, new: list, extra_dims: int) -> np.ndarray:
+        parts = kept + ([np.stack(new)] if new else [])
+        return np.concatenate(parts) if parts else np.empty((0,) * (2 + extra_dims))
+
+    def _channel_scale(self) -> Optional[np.ndarray]:
+        if not len(self.files):
+            return None
+        std = self.features[:, -self.curves.shape[-1]:]
+        with np.errstate(all='ignore'):
+            scale = np.nanmedian(std, axis=0)
+        return np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+
+    def _key(self, name: str) -> str:
+        return f"{name}@{self.mtimes[self.files.index(name)]:.3f}"
+
+    def query(self, source: Union[str, SessionStore, dict], k: int = SIMILARITY_TOP_K,
+              candidates: int = SIMILARITY_CANDIDATES) -> List[dict]:
+        """The ``k`` catalog sessions most similar to ``source``
+
+        ``source`` is a SessionStore, a file or a ``signature`` computed
+        with this index's ``points``; a catalog file is excluded
+        from its own results and its DTW distances are cached pairwise.
+        Results are sorted by DTW distance (feature distance for ties or
+        sessions with no comparable curves).
+        """
+        own = None
+        if isinstance(source, str):
+            own = os.path.basename(source)
+            if own in self.files and os.path.dirname(os.path.abspath(source)) == \
+                    os.path.abspath(self.directory):
+                row = self.files.index(own)
+                sig = {'features': self.features[row], 'curves': self.curves[row]}
+            else:
+                own = None
+                sig = signature(FileHandler.load_session(source), self.points)
+        elif isinstance(source, dict):
+            sig = source
+        else:
+            sig = signature(source, self.points)
+        if not len(self.files):
+            return []
+
+        fdist = feature_distances(sig['features'], self.features)
+        if own is not None:
+            fdist[self.files.index(own)] = np.nan
+        order = [i for i in np.argsort(fdist) if not np.isnan(fdist[i])][:max(candidates, k)]
+        if not order:
+            return []
+
+        scale = self.scale if self.scale is not None else 1.0
+        query_curves = sig['curves'] / scale
+        idx = np.array(order)
+        bounds = lb_keogh(query_curves, self.upper[idx] / scale, self.lower[idx] / scale)
+
+        dtw = np.full(len(idx), np.inf)
+        keys = [None] * len(idx)
+        if own is not None:
+            own_key = self._key(own)
+            for n, i in enumerate(idx):
+                keys[n] = '|'.join(sorted((own_key, self._key(self.files[i]))))
+                if keys[n] in self.pairs:
+                    dtw[n] = self.pairs[keys[n]]
+
+        # Refine in lower-bound order, a batch at a time, until no bound can win
+        pending = [n for n in np.argsort(bounds, kind='stable') if np.isinf(dtw[n])
+                   and np.isfinite(bounds[n])]
+        step = max(k, 8)
+        while pending:
+            best = np.sort(dtw)[k - 1] if len(dtw) >= k else np.inf
+            batch = [n for n in pending[:step] if bounds[n] < best]
+            if not batch:
+                break
+            pending = pending[step:]
+            dtw[batch] = dtw_distances(query_curves, self.curves[idx[batch]] / scale, self.band)
+            for n in batch:
+                if keys[n] is not None:
+                    self.pairs[keys[n]] = float(dtw[n])
+                    self.dirty = True
+
+        ranked = sorted(range(len(idx)), key=lambda n: (dtw[n], fdist[idx[n]]))[:k]
+        return [{'file': self.files[idx[n]], 'label': self.labels[idx[n]],
+                 'feature_distance': float(fdist[idx[n]]),
+                 'dtw_distance': float(dtw[n]) if np.isfinite(dtw[n]) else None}
+                for n in ranked]
+
+
+def find_similar(directory: str, source: Union[str, SessionStore, dict],
+                 k: int = SIMILARITY_TOP_K) -> List[dict]:
+    """Refresh the directory's cache, answer one query and persist the cache"""
+    index = SimilarityIndex(directory)
+    index.refresh()
+    results = index.query(source, k)
+    index.save()
+    return results
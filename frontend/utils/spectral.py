@@ -0,0 +1,142 @@
+"""Batched short-time spectra of the sensor channels
+
+All channels of every due frame go through a single ``np.fft.rfft`` call
+with a precomputed window, so the cost of one hop depends only on the
+frame length, never on how long the session has been running.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Optional, Sequence, Tuple
+
+from config.constants import (
+    NUM_SENSORS, UPDATE_INTERVAL, SPECTRAL_WINDOW, SPECTRAL_HOP,
+    SPECTRAL_HISTORY, SPECTRAL_BANDS
+)
+
+DEFAULT_RATE = 1000.0 / UPDATE_INTERVAL
+
+
+def hann_window(length: int) -> Tuple[np.ndarray, float]:
+    """Periodic Hann window and its power normalisation (sum of squares)"""
+    window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(length) / length)
+    return window, float((window * window).sum())
+
+
+def frame_psd(frames: np.ndarray, window: np.ndarray, norm: float, rate_hz: float) -> np.ndarray:
+    """One-sided PSD of (frames, length, channels) in one FFT call"""
+    frames = frames - frames.mean(axis=1, keepdims=True)  # drop DC per frame
+    spectrum = np.fft.rfft(frames * window[None, :, None], axis=1)
+    psd = (spectrum.real ** 2 + spectrum.imag ** 2) / (norm * rate_hz)
+    psd[:, 1:-1 if frames.shape[1] % 2 == 0 else None] *= 2
+    return psd
+
+
+def welch(values: np.ndarray, rate_hz: float = DEFAULT_RATE, length: int = SPECTRAL_WINDOW,
+          hop: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Welch PSD estimate of an (n, channels) series -> (freqs, (F, channels))
+
+    Frames are strided views of ``values`` (no copies before the FFT).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    length = min(length, len(values))
+    hop = hop or max(1, length // 2)
+    freqs = np.fft.rfftfreq(max(length, 1), d=1.0 / rate_hz)
+    if length < 2:
+        return freqs, np.full((len(freqs), values.shape[1]), np.nan)
+    frames = sliding_window_view(values, length, axis=0)[::hop]  # (k, channels, length)
+    window, norm = hann_window(length)
+    psd = frame_psd(frames.transpose(0, 2, 1), window, norm, rate_hz)
+    return freqs, psd.mean(axis=0)
+
+
+def band_powers(freqs: np.ndarray, psd: np.ndarray,
+                bands: Sequence[Tuple[float, float]] = SPECTRAL_BANDS) -> np.ndarray:
+    """Integrate a PSD over frequency bands -> (bands, ...) for psd shaped (F, ...)"""
+    df = freqs[1] - freqs[0] if len(freqs) > 1 else 1.0
+    masks = np.array([(freqs >= lo) & (freqs < hi) for lo, hi in bands], dtype=np.float64)
+    return np.tensordot(masks, np.nan_to_num(psd), axes=(1, 0)) * df
+
+
+class RollingSpectrum:
+    """Incremental STFT over a live multi-channel stream
+
+    ``push`` buffers new samples; every ``hop`` samples one frame of the
+    last ``length`` samples becomes due, and all frames due in a push are
+    transformed together. Frames land in a fixed-size spectrogram ring.
+    """
+
+    def __init__(self, rate_hz: float = DEFAULT_RATE, length: int = SPECTRAL_WINDOW,
+                 hop: int = SPECTRAL_HOP, num_sensors: int = NUM_SENSORS,
+                 history: int = SPECTRAL_HISTORY):
+        self.rate_hz = rate_hz
+        self.length = length
+        self.hop = hop
+        self.num_sensors = num_sensors
+        self.history = history
+        self.window, self.norm = hann_window(length)
+        self.freqs = np.fft.rfftfreq(length, d=1.0 / rate_hz)
+        # Samples: the last frame plus up to one push worth of new ones
+        self._samples = np.zeros((length, num_sensors))
+        self._spectra = np.zeros((history, len(self.freqs), num_sensors))
+        self.reset()
+
+    def reset(self):
+        self.total_samples = 0
+        self.frames = 0          # frames computed so far
+        self._filled = 0         # valid rows in _samples
+        self._since_frame = 0    # samples pushed since the last frame
+
+    def push(self, values: np.ndarray) -> int:
+        """Add an (n, channels) block; returns the number of new frames"""
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[None, :]
+        n = len(values)
+        if n == 0:
+            return 0
+
+        buffer = np.concatenate((self._samples[self.length - self._filled:], values))
+
+        # Frame ends (exclusive indices into buffer) that became due
+        first_due = self.hop - self._since_frame
+        ends = np.arange(len(buffer) - n + first_due, len(buffer) + 1, self.hop)
+        ends = ends[ends >= self.length]
+        # Only the newest ``history`` frames can be kept; skip computing the rest
+        skipped = max(len(ends) - self.history, 0)
+        psd = None
+        if len(ends):
+            frames = sliding_window_view(buffer, self.length, axis=0)[ends[skipped:] - self.length]
+            psd = frame_psd(frames.transpose(0, 2, 1), self.window, self.norm, self.rate_hz)
+
+        self.total_samples += n
+        self._filled = min(self.length, len(buffer))
+        self._since_frame = (self._since_frame + n) % self.hop
+        self._samples = buffer[-self.length:] if len(buffer) >= self.length else \
+            np.concatenate((np.zeros((self.length - len(buffer), self.num_sensors)), buffer))
+        if psd is None:
+            return 0
+
+        self.frames += skipped
+        slots = (self.frames + np.arange(len(psd))) % self.history
+        self._spectra[slots] = psd
+        self.frames += len(psd)
+        return len(ends)
+
+    def spectrogram(self, channel: int) -> np.ndarray:
+        """(frames, F) PSD history of one channel, oldest first"""
+        count = min(self.frames, self.history)
+        order = (self.frames - count + np.arange(count)) % self.history
+        return self._spectra[order, :, channel]
+
+    def latest(self) -> Optional[np.ndarray]:
+        """(F, channels) PSD of the newest frame"""
+        if not self.frames:
+            return None
+        return self._spectra[(self.frames - 1) % self.history]
+
+    def latest_band_powers(self, bands=SPECTRAL_BANDS) -> Optional[np.ndarray]:
+        psd = self.latest()
+        return None if psd is None else band_powers(self.freqs, psd, bands)
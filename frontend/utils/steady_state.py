@@ -0,0 +1,130 @@
+"""Online steady-state detection for adaptive HOLD phases
+
+The firmware holds every fan level for a fixed time. ``HoldEarlyExit``
+watches the streamed samples; once each channel's least-squares slope and
+spread over the last ``window`` samples are within tolerance it asks for
+``ADVANCE_PHASE <level>``, which the firmware honours only while still in
+HOLD of that level. Tolerances are relative to the channel's level above
+the HOLD start, with absolute floors at the reading resolution, so quiet
+channels do not hold a run back.
+"""
+
+import numpy as np
+from typing import List, Optional
+
+from config.constants import (
+    NUM_SENSORS, STEADY_WINDOW, STEADY_SLOPE_TOL, STEADY_STD_TOL, STEADY_ABS_TOL,
+    STEADY_MIN_HOLD, STEADY_CONFIRM, STATE_HOLD
+)
+from utils.data_processor import DataProcessor
+
+ADVANCE_COMMAND = "ADVANCE_PHASE"
+
+
+class SteadyStateDetector:
+    """Rolling slope and spread of the newest ``window`` samples per channel"""
+
+    def __init__(self, num_sensors: int = NUM_SENSORS, window: int = STEADY_WINDOW,
+                 slope_tol: float = STEADY_SLOPE_TOL, std_tol: float = STEADY_STD_TOL,
+                 abs_tol: Optional[List[float]] = None):
+        self.num_sensors = num_sensors
+        self.window = window
+        self.slope_tol = slope_tol
+        self.std_tol = std_tol
+        self.abs_tol = np.array((abs_tol or STEADY_ABS_TOL)[:num_sensors], dtype=np.float64)
+        self._times = np.empty(window)
+        self._values = np.empty((window, num_sensors))
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._pos = 0
+        self.reference = None  # first reading, responses are measured from it
+
+    def push(self, times: np.ndarray, values: np.ndarray):
+        """Fold in an (n, channels) block; only the newest ``window`` rows matter"""
+        times = np.asarray(times, dtype=np.float64)[-self.window:]
+        values = np.asarray(values, dtype=np.float64)[-self.window:]
+        n = len(times)
+        if n == 0:
+            return
+        if self.reference is None:
+            self.reference = values[0].copy()
+        idx = (self._pos + np.arange(n)) % self.window
+        self._times[idx] = times
+        self._values[idx] = values
+        self._pos = (self._pos + n) % self.window
+        self.count += n
+
+    def steady_channels(self) -> np.ndarray:
+        """Bool per channel; channels with invalid (negative) readings count as steady"""
+        if self.count < self.window:
+            return np.zeros(self.num_sensors, dtype=bool)
+        t = self._times - self._times.mean()
+        denom = (t * t).sum()
+        centered = self._values - self._values.mean(axis=0)
+        slope = (t @ centered) / denom if denom > 0 else np.zeros(self.num_sensors)
+        # Change the trend would still make over one window, and the spread
+        drift = np.abs(slope) * (self._times.max() - self._times.min())
+        spread = centered.std(axis=0)
+        response = np.abs(self._values.mean(axis=0) - self.reference)
+        tolerance = np.maximum(self.abs_tol, response)
+        steady = (drift <= self.slope_tol * tolerance) & (spread <= self.std_tol * tolerance)
+        return steady | (self._values < 0).any(axis=0)
+
+    def is_steady(self) -> bool:
+        return bool(self.steady_channels().all())
+
+
+class HoldEarlyExit:
+    """Decide when a HOLD phase has plateaued
+
+    ``push`` takes blocks of session rows (with FSM state and level) and
+    returns the levels whose HOLD should end now. A level is released at
+    most once, no earlier than ``min_hold`` seconds into HOLD and only
+    after ``confirm`` consecutive steady checks.
+    """
+
+    def __init__(self, num_sensors: int = NUM_SENSORS, min_hold: float = STEADY_MIN_HOLD,
+                 confirm: int = STEADY_CONFIRM, **detector_settings):
+        self.min_hold = min_hold
+        self.confirm = confirm
+        self.detector = SteadyStateDetector(num_sensors, **detector_settings)
+        self.reset()
+
+    def reset(self):
+        self.detector.reset()
+        self.level = None        # level of the HOLD being watched
+        self.hold_start = None
+        self.streak = 0
+        self.released = set()
+        self.exits = []          # (level, seconds held) per early exit
+
+    def push(self, times: np.ndarray, values: np.ndarray, states: np.ndarray,
+             levels: np.ndarray) -> List[int]:
+        advance = []
+        for state, level, start, end in DataProcessor.segment_phases(states, levels):
+            if state != STATE_HOLD:
+                self.level = None
+                continue
+            if level != self.level:
+                self.level = int(level)
+                self.hold_start = float(times[start])
+                self.streak = 0
+                self.detector.reset()
+            self.detector.push(times[start:end], values[start:end])
+            if self.level in self.released:
+                continue
+            held = float(times[end - 1]) - self.hold_start
+            if held < self.min_hold:
+                continue
+            self.streak = self.streak + 1 if self.detector.is_steady() else 0
+            if self.streak >= self.confirm:
+                self.released.add(self.level)
+                self.exits.append((self.level, held))
+                advance.append(self.level)
+        return advance
+
+    @staticmethod
+    def command(level: int) -> str:
+        return f"{ADVANCE_COMMAND} {level}"
@@ -52,9 +52,25 @@ const unsigned long T_RAMP     = 3000;   // 3 seconds
 const unsigned long T_HOLD     = 20000;  // 20 seconds 
 const unsigned long T_PURGE    = 40000;  // 40 seconds 
 const unsigned long T_RECOVERY = 5000;   // 5 seconds
-unsigned long lastSend = 0;
+const unsigned long T_HOLD_MIN = 5000;   // ADVANCE_PHASE never cuts HOLD shorter
 unsigned long lastReconnect = 0;
 
+// ==================== SAMPLE RATE ====================
+// Set per session with "SET_RATE <hz>" (only while not sampling). Every
+// change, START_SAMPLING and (re)connect send the header "RATE:<hz>,<us>".
+const int RATE_MIN_HZ = 1;
+const int RATE_MAX_HZ = 100;
+int sampleRateHz = 4;
+unsigned long sampleIntervalUs = 250000UL;
+unsigned long lastSendUs = 0;
+
+// ==================== COMMAND ACK ====================
+// Commands may carry an id ("#<id> START_SAMPLING"); the answer is
+// "ACK:<id>:<OK|IGNORED|UNKNOWN>". A retried id is acknowledged again
+// without running the command twice.
+String lastCommandId = "";
+String lastCommandStatus = "";
+
 // ==================== MOTOR CONTROL ====================
 void kipas(int speed, bool buang = false) {
   digitalWrite(DIR_KIPAS_1, buang ? LOW : HIGH);
@@ -118,6 +134,7 @@ void ensureConnected() {
   if (client.connect(RUST_IP, RUST_PORT)) {
     Serial.println("✅ Connected to backend!");
     client.println("HELLO:Arduino E-NOSE ZIZU");
+    sendRateHeader();
   } else {
     Serial.println("❌ Connection failed, will retry...");
   }
@@ -186,8 +203,7 @@ void loop() {
     String cmd = client.readStringUntil('\n');
     cmd.trim();
     Serial.println("📥 Command from backend: " + cmd);
-    if (cmd == "START_SAMPLING") startSampling();
-    else if (cmd == "STOP_SAMPLING") stopSampling();
+    handleCommand(cmd, client);
   }
   
   // Also check Serial for local commands
@@ -195,16 +211,14 @@ void loop() {
     String cmd = Serial.readStringUntil('\n'); 
     cmd.trim();
     Serial.println("📥 Command received: " + cmd);
-    
-    if (cmd == "START_SAMPLING") { startSampling(); }
-    else if (cmd == "STOP_SAMPLING") { stopSampling(); }
-    else { Serial.println("❌ Unknown command: " + cmd); }
+    handleCommand(cmd, Serial);
   }
 
-  // Send sensor data periodically
-  if (millis() - lastSend >= 250) { 
-    lastSend = millis(); 
-    sendSensorData(); 
+  // Send sensor data on the session's sample clock (no drift; skip ahead if late)
+  if (micros() - lastSendUs >= sampleIntervalUs) {
+    lastSendUs += sampleIntervalUs;
+    if (micros() - lastSendUs >= sampleIntervalUs) lastSendUs = micros();
+    sendSensorData();
   }
   
   // Run FSM
@@ -213,22 +227,52 @@ void loop() {
   }
 }
 
+// ==================== COMMANDS ====================
+void handleCommand(String cmd, Print &out) {
+  String id = "";
+  if (cmd.startsWith("#")) {
+    int space = cmd.indexOf(' ');
+    if (space < 0) return;
+    id = cmd.substring(1, space);
+    cmd = cmd.substring(space + 1);
+    cmd.trim();
+  }
+
+  String status;
+  if (id.length() > 0 && id == lastCommandId) {
+    status = lastCommandStatus;  // retry of a command already run
+  } else {
+    if (cmd == "START_SAMPLING") status = startSampling() ? "OK" : "IGNORED";
+    else if (cmd == "STOP_SAMPLING") status = stopSampling() ? "OK" : "IGNORED";
+    else if (cmd.startsWith("ADVANCE_PHASE")) status = advancePhase(cmd) ? "OK" : "IGNORED";
+    else if (cmd.startsWith("SET_RATE")) status = setRate(cmd) ? "OK" : "IGNORED";
+    else { Serial.println("❌ Unknown command: " + cmd); status = "UNKNOWN"; }
+    if (id.length() > 0) { lastCommandId = id; lastCommandStatus = status; }
+  }
+
+  if (id.length() > 0) {
+    out.print("ACK:"); out.print(id); out.print(":"); out.println(status);
+  }
+}
+
 // ==================== FSM LOGIC ====================
-void startSampling() {
+bool startSampling() {
   if (!samplingActive) {
     samplingActive = true;
     currentLevel = 0;
     changeState(PRE_COND);
+    sendRateHeader();
     Serial.println("\n🎯 ========================================");
     Serial.println("🎯 SAMPLING STARTED!");
     Serial.println("🎯 5 Levels | Hold: 30s | Purge: 30s (TESTING)");
     Serial.println("🎯 ========================================\n");
-  } else {
-    Serial.println("⚠  Sampling already active!");
+    return true;
   }
+  Serial.println("⚠  Sampling already active!");
+  return false;
 }
 
-void stopSampling() {
+bool stopSampling() {
   if (samplingActive) {
     samplingActive = false;
     currentLevel = 0;
@@ -237,9 +281,49 @@ void stopSampling() {
     Serial.println("\n🛑 ========================================");
     Serial.println("🛑 SAMPLING STOPPED!");
     Serial.println("🛑 ========================================\n");
-  } else {
-    Serial.println("⚠  No active sampling to stop!");
+    return true;
+  }
+  Serial.println("⚠  No active sampling to stop!");
+  return false;
+}
+
+// "ADVANCE_PHASE <level>": GUI saw the response plateau, end HOLD early.
+// Ignored unless still in HOLD of that level (a late command must not cut
+// the next level short) and past T_HOLD_MIN.
+bool advancePhase(String cmd) {
+  int level = cmd.substring(String("ADVANCE_PHASE").length()).toInt();
+  if (!samplingActive || currentState != HOLD || level != currentLevel) {
+    Serial.println("⚠  ADVANCE_PHASE ignored (not in HOLD of that level)");
+    return false;
+  }
+  if (millis() - stateTime < T_HOLD_MIN) {
+    Serial.println("⚠  ADVANCE_PHASE ignored (below minimum HOLD)");
+    return false;
+  }
+  Serial.print("⏩ HOLD steady after "); Serial.print((millis() - stateTime) / 1000.0, 1);
+  Serial.println(" s, advancing to PURGE");
+  changeState(PURGE);
+  return true;
+}
+
+// "SET_RATE <hz>": sample rate of the next session, 1-100 Hz
+bool setRate(String cmd) {
+  int hz = cmd.substring(String("SET_RATE").length()).toInt();
+  if (samplingActive || hz < RATE_MIN_HZ || hz > RATE_MAX_HZ) {
+    Serial.println("⚠  SET_RATE ignored (sampling active or outside 1-100 Hz)");
+    return false;
   }
+  sampleRateHz = hz;
+  sampleIntervalUs = 1000000UL / hz;
+  lastSendUs = micros();
+  Serial.print("⏱  Sample rate: "); Serial.print(hz); Serial.println(" Hz");
+  sendRateHeader();
+  return true;
+}
+
+void sendRateHeader() {
+  if (!client.connected()) { return; }
+  client.print("RATE:"); client.print(sampleRateHz); client.print(","); client.println(sampleIntervalUs);
 }
 
 void changeState(State s) {
@@ -341,11 +425,17 @@ void runFSM() {
 void sendSensorData() {
   if (!client.connected()) { return; }
   
-  // GM-XXX
-  float no2 = (gas.measure_NO2()  < 30000) ? gas.measure_NO2()  / 1000.0 : -1.0;
-  float eth = (gas.measure_C2H5OH()< 30000) ? gas.measure_C2H5OH()/ 1000.0 : -1.0;
-  float voc = (gas.measure_VOC()  < 30000) ? gas.measure_VOC()  / 1000.0 : -1.0;
-  float co  = (gas.measure_CO()   < 30000) ? gas.measure_CO()   / 1000.0 : -1.0;
+  unsigned long sampleMs = millis();
+
+  // GM-XXX (one I2C read per channel)
+  uint32_t rawNo2 = gas.measure_NO2();
+  uint32_t rawEth = gas.measure_C2H5OH();
+  uint32_t rawVoc = gas.measure_VOC();
+  uint32_t rawCo  = gas.measure_CO();
+  float no2 = (rawNo2 < 30000) ? rawNo2 / 1000.0 : -1.0;
+  float eth = (rawEth < 30000) ? rawEth / 1000.0 : -1.0;
+  float voc = (rawVoc < 30000) ? rawVoc / 1000.0 : -1.0;
+  float co  = (rawCo  < 30000) ? rawCo  / 1000.0 : -1.0;
 
   // MiCS-5524
   float Rs = calculateRs();
@@ -357,7 +447,8 @@ void sendSensorData() {
   String data = "SENSOR:";
   data += String(no2,3) + "," + String(eth,3) + "," + String(voc,3) + "," + String(co,3) + ",";
   data += String(co_mics,3) + "," + String(eth_mics,3) + "," + String(voc_mics,3) + ",";
-  data += String(currentState) + "," + String(currentLevel);
+  data += String(currentState) + "," + String(currentLevel) + ",";
+  data += String(sampleMs);  // device time: exact spacing at high rates
 
   client.println(data);
   
@@ -5,6 +5,9 @@ use tokio::net::TcpListener;
 use tokio::sync::{broadcast, Mutex};
 use tokio::io::{AsyncBufReadExt, AsyncWriteExt, BufReader};
 use std::collections::HashMap;
+use std::sync::atomic::{AtomicU64, Ordering};
+
+static SAMPLES_SENT: AtomicU64 = AtomicU64::new(0);
 
 // Struktur data Sensor
 #[derive(Debug, Serialize, Deserialize, Clone)]
@@ -19,26 +22,36 @@ struct SensorData {
     voc_mics: f64,
     state: i32,
     level: i32,
+    // Firmware millis() of the reading (exact spacing at high sample rates)
+    #[serde(skip_serializing_if = "Option::is_none")]
+    device_ms: Option<u64>,
 }
 
 #[derive(Debug, Clone)]
 struct ConnectionState {
     pub arduino_connected: bool,
     pub frontend_connected: bool,
+    pub sample_rate_hz: f64,  // from the firmware's latest "RATE:" header
 }
 
+// One second of samples at the 100 Hz maximum rate, so a busy GUI is
+// not lagged (and skipped) during short stalls
+const SENSOR_CHANNEL_CAPACITY: usize = 1024;
+const DEFAULT_SAMPLE_RATE_HZ: f64 = 4.0;
+
 #[tokio::main]
 async fn main() -> Result<(), Box<dyn std::error::Error>> {
     println!("🚀 Starting E-Nose Backend System (Bidirectional - No DB)...");
 
     // Channel untuk komunikasi
-    let (tx_sensor, _rx_sensor) = broadcast::channel::<String>(100);
+    let (tx_sensor, _rx_sensor) = broadcast::channel::<String>(SENSOR_CHANNEL_CAPACITY);
     let (tx_cmd, _rx_cmd) = broadcast::channel::<String>(100);
     
     // State management
     let connection_state = Arc::new(Mutex::new(ConnectionState {
         arduino_connected: false,
         frontend_connected: false,
+        sample_rate_hz: DEFAULT_SAMPLE_RATE_HZ,
     }));
 
     let arduino_listener = TcpListener::bind("0.0.0.0:8081").await?;
@@ -76,12 +89,14 @@ async fn main() -> Result<(), Box<dyn std::error::Error>> {
                     let handle = tokio::spawn(async move {
                         let (reader, mut writer) = socket.into_split();
                         let mut line_reader = BufReader::new(reader).lines();
+                        let sample_rate_hz = state.lock().await.sample_rate_hz;
 
                         // Send initial connection status to frontend
                         let connection_msg = serde_json::json!({
                             "type": "connection_status",
                             "arduino_connected": false,
-                            "backend_connected": true
+                            "backend_connected": true,
+                            "sample_rate_hz": sample_rate_hz
                         });
                         
                         if let Ok(msg) = serde_json::to_string(&connection_msg) {
@@ -100,8 +115,24 @@ async fn main() -> Result<(), Box<dyn std::error::Error>> {
                                 // 2. Baca Command dari Frontend
                                 Ok(Some(line)) = line_reader.next_line() => {
                                     println!("🔧 Command from UI: {}", line);
-                                    if line.starts_with("START_SAMPLING") || line.starts_with("STOP_SAMPLING") {
-                                        let _ = tx_cmd.send(line);
+                                    let (cmd_id, cmd) = split_command_id(&line);
+                                    let known = cmd.starts_with("START_SAMPLING") || cmd.starts_with("STOP_SAMPLING")
+                                        || cmd.starts_with("ADVANCE_PHASE") || cmd.starts_with("SET_RATE");
+                                    // send() fails when no Arduino is subscribed
+                                    let forwarded = known && tx_cmd.send(line.trim().to_string()).is_ok();
+                                    if let Some(id) = cmd_id {
+                                        let ack = serde_json::json!({
+                                            "type": "command_ack",
+                                            "stage": "backend",
+                                            "id": id,
+                                            "command": cmd,
+                                            "accepted": forwarded,
+                                            "timestamp": Utc::now(),
+                                        });
+                                        let msg = ack.to_string();
+                                        if writer.write_all(msg.as_bytes()).await.is_err() || writer.write_all(b"\n").await.is_err() {
+                                            break;
+                                        }
                                     }
                                 }
                                 else => break,
@@ -165,6 +196,12 @@ async fn main() -> Result<(), Box<dyn std::error::Error>> {
                             Ok(Some(line)) = line_reader.next_line() => {
                                 if line.starts_with("SENSOR:") {
                                     process_sensor_data(&line, &tx_sensor).await;
+                                } else if line.starts_with("ACK:") {
+                                    process_command_ack(&line, &tx_sensor);
+                                } else if line.starts_with("RATE:") {
+                                    if let Some(hz) = process_rate_header(&line, &tx_sensor) {
+                                        state.lock().await.sample_rate_hz = hz;
+                                    }
                                 } else if line.contains("CONNECTED") || line.contains("Connected") {
                                     println!("✅ Arduino ready: {}", line);
                                 }
@@ -207,6 +244,58 @@ async fn main() -> Result<(), Box<dyn std::error::Error>> {
     }
 }
 
+// "#<id> COMMAND args" -> (Some(id), "COMMAND args"); lines without an id pass through
+fn split_command_id(line: &str) -> (Option<&str>, &str) {
+    let line = line.trim();
+    if let Some(rest) = line.strip_prefix('#') {
+        if let Some((id, cmd)) = rest.split_once(' ') {
+            return (Some(id), cmd.trim());
+        }
+    }
+    (None, line)
+}
+
+// Firmware acknowledgement "ACK:<id>:<status>" -> JSON for every frontend
+fn process_command_ack(line: &str, tx: &broadcast::Sender<String>) {
+    let mut parts = line.trim().trim_start_matches("ACK:").splitn(2, ':');
+    let id = parts.next().unwrap_or("");
+    let status = parts.next().unwrap_or("OK");
+    if id.is_empty() {
+        eprintln!("⚠️ Invalid ack format: {}", line);
+        return;
+    }
+    let ack = serde_json::json!({
+        "type": "command_ack",
+        "stage": "arduino",
+        "id": id,
+        "status": status,
+        "timestamp": Utc::now(),
+    });
+    let _ = tx.send(ack.to_string());
+    println!("✅ Arduino ack {}: {}", id, status);
+}
+
+// Firmware sample-rate header "RATE:<hz>,<interval_us>" -> JSON for every frontend
+fn process_rate_header(line: &str, tx: &broadcast::Sender<String>) -> Option<f64> {
+    let mut parts = line.trim().trim_start_matches("RATE:").split(',');
+    let hz: f64 = parts.next()?.trim().parse().ok()?;
+    if hz <= 0.0 {
+        eprintln!("⚠️ Invalid rate header: {}", line);
+        return None;
+    }
+    let interval_us: u64 = parts.next().and_then(|p| p.trim().parse().ok())
+        .unwrap_or((1_000_000.0 / hz) as u64);
+    let msg = serde_json::json!({
+        "type": "sample_rate",
+        "rate_hz": hz,
+        "interval_us": interval_us,
+        "timestamp": Utc::now(),
+    });
+    let _ = tx.send(msg.to_string());
+    println!("⏱️ Arduino sample rate: {} Hz", hz);
+    Some(hz)
+}
+
 async fn process_sensor_data(line: &str, tx: &broadcast::Sender<String>) {
     let content = line.trim_start_matches("SENSOR:");
     let parts: Vec<&str> = content.split(',').collect();
@@ -223,12 +312,17 @@ async fn process_sensor_data(line: &str, tx: &broadcast::Sender<String>) {
             voc_mics: parts[6].parse().unwrap_or(0.0),
             state: parts[7].parse().unwrap_or(0),
             level: parts[8].parse().unwrap_or(0),
+            device_ms: parts.get(9).and_then(|p| p.trim().parse().ok()),
         };
 
         // Kirim data sensor ke Frontend
         if let Ok(json_str) = serde_json::to_string(&data) {
             let _ = tx.send(json_str);
-            println!("📊 Sensor data sent to GUI");
+            // Log every 100th sample: per-sample printing throttles high rates
+            let sent = SAMPLES_SENT.fetch_add(1, Ordering::Relaxed) + 1;
+            if sent % 100 == 0 {
+                println!("📊 Sensor data sent to GUI ({} samples)", sent);
+            }
         }
     } else {
         eprintln!("⚠️ Invalid sensor data format: {}", line);